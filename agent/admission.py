@@ -0,0 +1,399 @@
+"""
+Per-organization admission control, so that one organization's runs and model calls cannot
+starve everyone else's interactive turns.
+
+`FairScheduler` hands out a server worker's run slots (`FLAME_SERVER_MAX_CONCURRENCY`) using
+weighted fair queuing over organizations, keyed by `activeOrganizationId` in the run's state:
+
+- Each waiting run gets a virtual finish time. It is the later of the organization's
+  previous finish and the scheduler clock, plus the run's expected time divided by the
+  organization's weight (`FLAME_TENANT_WEIGHTS`, e.g. `12=2,40=0.5`; default 1).
+- The earliest finish runs first.
+- Expected time is the organization's moving average. It is corrected by the actual time
+  when the run ends, so an organization running long plans uses up its share sooner.
+
+Limits on top of that:
+
+- `FLAME_TENANT_MAX_RUNS`: runs of one organization at once (0 = half the worker's slots)
+- `FLAME_TENANT_MAX_QUEUE`: runs of one organization waiting. Beyond it, its new runs get
+  429 with `Retry-After` before the worker-wide queue (503) fills up for everyone.
+- `FLAME_TENANT_MAX_LLM_CALLS`: model calls of one organization in flight in this process
+  (0 = no cap); further calls wait for one of theirs to finish
+- `FLAME_MAX_PLAN_HOPS`: `chat_node` hops per run while a plan is in progress, whether
+  they follow tool results or auto-continue (0 = no cap). The run then ends with the plan
+  still in progress and a note that the user can say "continue".
+
+Runs without an organization share the "" tenant. It is queued fairly against the others,
+but the per-organization caps do not apply to it. With `FLAME_TENANT_ADMISSION=0`, every
+run belongs to that one tenant, so slots are granted first come, first served. Queue
+depth, waits, run times and shed runs per organization are exported to the metrics
+registry; `stats()` has the totals and the busiest organizations.
+"""
+
+import asyncio
+import math
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+import instrumentation
+
+TENANT_ADMISSION = os.getenv("FLAME_TENANT_ADMISSION", "1") not in ("0", "false", "False", "")
+TENANT_MAX_RUNS = int(os.getenv("FLAME_TENANT_MAX_RUNS", "0"))
+TENANT_MAX_QUEUE = int(os.getenv("FLAME_TENANT_MAX_QUEUE", "16"))
+TENANT_MAX_LLM_CALLS = int(os.getenv("FLAME_TENANT_MAX_LLM_CALLS", "0"))
+TENANT_WEIGHTS = os.getenv("FLAME_TENANT_WEIGHTS", "")
+MAX_PLAN_HOPS = int(os.getenv("FLAME_MAX_PLAN_HOPS", "40"))
+
+# Expected run time of an organization not seen yet, and how fast the average follows
+DEFAULT_RUN_SECONDS = 1.0
+RUN_SECONDS_ALPHA = 0.2
+# Idle organizations forgotten past this many; threads whose plan hops are counted
+MAX_TENANTS = 4096
+MAX_THREADS = 8192
+STATS_TOP = 10
+
+_ORGANIZATION_FIELD = re.compile(rb'"activeOrganizationId"\s*:\s*"?([^",}\s]*)')
+
+
+def tenant_of(state: Optional[Dict[str, Any]]) -> str:
+    """The organization a run or model call is accounted to ("" when none is active)."""
+    if not TENANT_ADMISSION:
+        return ""
+    value = (state or {}).get("activeOrganizationId")
+    return "" if value in (None, "", "null") else str(value)
+
+
+def tenant_from_body(body: bytes) -> str:
+    """`activeOrganizationId` of an AG-UI run request, found without parsing the (large) body."""
+    if not TENANT_ADMISSION:
+        return ""
+    # quotes inside message strings are escaped, so only the state's own field matches
+    match = _ORGANIZATION_FIELD.search(body)
+    value = match.group(1).decode("utf-8", "replace") if match else ""
+    return "" if value == "null" else value
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        try:
+            if name.strip() and float(weight) > 0:
+                weights[name.strip()] = float(weight)
+        except ValueError:
+            continue
+    return weights
+
+
+class Tenant:
+    """One organization's queue, in-flight work and counters."""
+
+    __slots__ = (
+        "name", "weight", "running", "waiting", "finish", "run_estimate", "llm_running", "llm_waiting",
+        "admitted", "completed", "shed", "wait_seconds", "max_wait_seconds", "run_seconds", "llm_waits", "plan_hops_capped",
+    )
+
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.weight = weight
+        self.running = 0
+        self.waiting: Deque["Ticket"] = deque()
+        self.finish = 0.0
+        self.run_estimate = DEFAULT_RUN_SECONDS
+        self.llm_running = 0
+        self.llm_waiting: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.completed = 0
+        self.shed = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self.llm_waits = 0
+        self.plan_hops_capped = 0
+
+    @property
+    def idle(self) -> bool:
+        return not (self.running or self.waiting or self.llm_running or self.llm_waiting)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "waiting": len(self.waiting),
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "shed": self.shed,
+            "avg_wait_ms": (self.wait_seconds / self.admitted * 1000) if self.admitted else 0.0,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "avg_run_ms": (self.run_seconds / self.completed * 1000) if self.completed else 0.0,
+            "llm_running": self.llm_running,
+            "llm_waits": self.llm_waits,
+            "plan_hops_capped": self.plan_hops_capped,
+        }
+
+
+class Ticket:
+    """A run's place in the fair queue; pass it back to `FairScheduler.release`."""
+
+    __slots__ = ("tenant", "estimate", "start", "finish", "future", "enqueued")
+
+    def __init__(self, tenant: Tenant, estimate: float, start: float):
+        self.tenant = tenant
+        self.estimate = estimate
+        self.start = start
+        self.finish = start + estimate / tenant.weight
+        self.future: Optional[asyncio.Future] = None
+        self.enqueued = time.monotonic()
+
+
+class TenantShed(Exception):
+    """An organization already has `FLAME_TENANT_MAX_QUEUE` runs waiting."""
+
+    def __init__(self, tenant: str, retry_after: int):
+        super().__init__(f"organization {tenant or '(none)'} has too many requests waiting")
+        self.tenant = tenant
+        self.retry_after = retry_after
+
+
+class TenantAdmission:
+    """Organizations known to this process: weights, model-call caps and plan hop counts."""
+
+    def __init__(self, max_llm_calls: int = TENANT_MAX_LLM_CALLS, max_plan_hops: int = MAX_PLAN_HOPS, weights: str = TENANT_WEIGHTS):
+        self.max_llm_calls = max_llm_calls
+        self.max_plan_hops = max_plan_hops
+        self.weights = parse_weights(weights)
+        self._tenants: "OrderedDict[str, Tenant]" = OrderedDict()
+        self._plan_hops: "OrderedDict[str, int]" = OrderedDict()
+        self.shed = 0
+        self.plan_hops_capped = 0
+
+    def tenant(self, name: str) -> Tenant:
+        tenant = self._tenants.get(name)
+        if tenant is None:
+            tenant = self._tenants[name] = Tenant(name, self.weights.get(name, 1.0))
+            if len(self._tenants) > MAX_TENANTS:
+                for stale in [n for n, t in self._tenants.items() if t.idle][: len(self._tenants) - MAX_TENANTS]:
+                    del self._tenants[stale]
+        return tenant
+
+    def publish(self, tenant: Tenant) -> None:
+        metrics = instrumentation.metrics
+        metrics.set("flame_tenant_runs_running", tenant.running, "Runs in progress per organization", tenant=tenant.name)
+        metrics.set("flame_tenant_runs_waiting", len(tenant.waiting), "Runs queued per organization", tenant=tenant.name)
+
+    # -- model calls --
+
+    @asynccontextmanager
+    async def llm_call(self, name: str) -> AsyncIterator[None]:
+        """Hold one of the organization's model-call slots for the duration of the block."""
+        if not self.max_llm_calls:
+            yield
+            return
+        tenant = self.tenant(name)
+        if tenant.llm_running >= self.max_llm_calls or tenant.llm_waiting:
+            future = asyncio.get_running_loop().create_future()
+            tenant.llm_waiting.append(future)
+            tenant.llm_waits += 1
+            started = time.monotonic()
+            try:
+                await future
+            except BaseException:
+                if future.done() and not future.cancelled():
+                    # granted while being cancelled: pass the slot on
+                    self._next_llm_call(tenant)
+                else:
+                    future.cancel()
+                raise
+            instrumentation.metrics.observe("flame_tenant_llm_wait_seconds", time.monotonic() - started,
+                                            "Time model calls waited for their organization's cap", tenant=name)
+        else:
+            tenant.llm_running += 1
+        try:
+            yield
+        finally:
+            self._next_llm_call(tenant)
+
+    def _next_llm_call(self, tenant: Tenant) -> None:
+        # the slot passes straight to the next waiter, so llm_running stays as it is then
+        while tenant.llm_waiting:
+            future = tenant.llm_waiting.popleft()
+            if not future.done():
+                future.set_result(True)
+                return
+        tenant.llm_running -= 1
+
+    # -- plan hops --
+
+    def start_run(self, thread_id: Optional[str]) -> None:
+        """A new run of the thread begins: its auto-continue hops count from zero."""
+        if thread_id and self.max_plan_hops:
+            self._plan_hops.pop(thread_id, None)
+
+    def plan_hop(self, thread_id: Optional[str], name: str) -> bool:
+        """Count a plan hop of the thread's run; False once the run is over the cap."""
+        if not thread_id or not self.max_plan_hops:
+            return True
+        hops = self._plan_hops.pop(thread_id, 0) + 1
+        self._plan_hops[thread_id] = hops
+        while len(self._plan_hops) > MAX_THREADS:
+            self._plan_hops.popitem(last=False)
+        if hops <= self.max_plan_hops:
+            return True
+        self.plan_hops_capped += 1
+        self.tenant(name).plan_hops_capped += 1
+        instrumentation.metrics.inc("flame_tenant_plan_hops_capped_total", 1, "Runs paused at the plan hop cap", tenant=name)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        tenants = list(self._tenants.values())
+        busiest = sorted(tenants, key=lambda t: (t.running + len(t.waiting), t.admitted), reverse=True)[:STATS_TOP]
+        return {
+            "tenants": len(tenants),
+            "running": sum(t.running for t in tenants),
+            "waiting": sum(len(t.waiting) for t in tenants),
+            "llm_running": sum(t.llm_running for t in tenants),
+            "llm_waits": sum(t.llm_waits for t in tenants),
+            "shed": self.shed,
+            "plan_hops_capped": self.plan_hops_capped,
+            "max_llm_calls": self.max_llm_calls,
+            "max_plan_hops": self.max_plan_hops,
+            "busiest": {t.name or "(none)": t.stats() for t in busiest},
+        }
+
+
+tenant_admission = TenantAdmission()
+
+
+class FairScheduler:
+    """
+    `slots` run slots shared by weighted fair queuing over organizations, at most
+    `max_runs` of them to one organization. One event loop (a server worker's) only.
+    """
+
+    def __init__(self, slots: int, max_runs: int = TENANT_MAX_RUNS, max_queue: int = TENANT_MAX_QUEUE,
+                 admission: Optional[TenantAdmission] = None):
+        self.slots = max(1, slots)
+        self.max_runs = self.slots if not TENANT_ADMISSION else (max_runs or max(1, -(-self.slots // 2)))
+        self.max_queue = max_queue
+        self.admission = admission or tenant_admission
+        self.clock = 0.0
+        self.running = 0
+        self.waiting = 0
+        self._backlogged: Dict[str, Tenant] = {}
+
+    def check(self, name: str) -> None:
+        """Raise `TenantShed` if the organization's queue is full (before reading anything else)."""
+        if not TENANT_ADMISSION or not self.max_queue or not name:
+            return
+        tenant = self.admission.tenant(name)
+        if len(tenant.waiting) >= self.max_queue:
+            tenant.shed += 1
+            self.admission.shed += 1
+            instrumentation.metrics.inc("flame_tenant_shed_total", 1, "Runs turned away at the organization queue cap", tenant=name)
+            average = tenant.run_seconds / tenant.completed if tenant.completed else tenant.run_estimate
+            raise TenantShed(name, max(1, math.ceil(average * (len(tenant.waiting) + 1) / self.max_runs)))
+
+    async def acquire(self, name: str) -> Ticket:
+        """Wait for a slot in fair order. Cancel the wait (e.g. by a timeout) to give up the place."""
+        tenant = self.admission.tenant(name)
+        ticket = Ticket(tenant, tenant.run_estimate, max(self.clock, tenant.finish))
+        tenant.finish = ticket.finish
+        if not self.waiting and self.running < self.slots and tenant.running < self._cap(tenant):
+            self._start(ticket)
+            return ticket
+        ticket.future = asyncio.get_running_loop().create_future()
+        tenant.waiting.append(ticket)
+        self._backlogged[name] = tenant
+        self.waiting += 1
+        self.admission.publish(tenant)
+        # free slots held back only by other organizations' caps can go to this one
+        self._dispatch()
+        try:
+            await ticket.future
+        except BaseException:
+            if ticket.future.done() and not ticket.future.cancelled():
+                self.release(ticket, 0.0, charge=False)
+            else:
+                ticket.future.cancel()
+                self._withdraw(ticket)
+            raise
+        return ticket
+
+    def _cap(self, tenant: Tenant) -> int:
+        # runs without an organization are not one customer's
+        return self.max_runs if tenant.name else self.slots
+
+    def _start(self, ticket: Ticket) -> None:
+        tenant = ticket.tenant
+        self.running += 1
+        tenant.running += 1
+        tenant.admitted += 1
+        self.clock = max(self.clock, ticket.start)
+        waited = time.monotonic() - ticket.enqueued
+        tenant.wait_seconds += waited
+        tenant.max_wait_seconds = max(tenant.max_wait_seconds, waited)
+        instrumentation.metrics.observe("flame_tenant_queue_wait_seconds", waited, "Time runs queued for a slot, per organization",
+                                        tenant=tenant.name)
+        self.admission.publish(tenant)
+
+    def _withdraw(self, ticket: Ticket) -> None:
+        tenant = ticket.tenant
+        try:
+            tenant.waiting.remove(ticket)
+        except ValueError:
+            return
+        self.waiting -= 1
+        # its share was never used
+        tenant.finish -= ticket.finish - ticket.start
+        if not tenant.waiting:
+            self._backlogged.pop(tenant.name, None)
+        self.admission.publish(tenant)
+        self._dispatch()
+
+    def release(self, ticket: Ticket, seconds: float, charge: bool = True) -> None:
+        """End a run started with `acquire`; `seconds` it took replaces the estimate it was queued with."""
+        tenant = ticket.tenant
+        self.running -= 1
+        tenant.running -= 1
+        if charge:
+            tenant.completed += 1
+            tenant.run_seconds += seconds
+            tenant.finish += (seconds - ticket.estimate) / tenant.weight
+            tenant.run_estimate += RUN_SECONDS_ALPHA * (seconds - tenant.run_estimate)
+            instrumentation.metrics.observe("flame_tenant_run_seconds", seconds, "Run time per organization", tenant=tenant.name)
+        self.admission.publish(tenant)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.running < self.slots and self._backlogged:
+            best: Optional[Ticket] = None
+            for tenant in list(self._backlogged.values()):
+                while tenant.waiting and tenant.waiting[0].future.done():
+                    tenant.waiting.popleft()
+                    self.waiting -= 1
+                if not tenant.waiting:
+                    del self._backlogged[tenant.name]
+                    continue
+                head = tenant.waiting[0]
+                if tenant.running < self._cap(tenant) and (best is None or head.finish < best.finish):
+                    best = head
+            if best is None:
+                return  # every backlogged organization is at its cap
+            best.tenant.waiting.popleft()
+            self.waiting -= 1
+            if not best.tenant.waiting:
+                self._backlogged.pop(best.tenant.name, None)
+            self._start(best)
+            best.future.set_result(True)
+
+    @property
+    def backlogged(self) -> int:
+        """Organizations with runs waiting."""
+        return len(self._backlogged)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self.running, "waiting": self.waiting, "slots": self.slots, "max_runs_per_tenant": self.max_runs,
+                "max_queue_per_tenant": self.max_queue, "backlogged_tenants": len(self._backlogged)}
@@ -3,57 +3,69 @@ This is the main entry point for the agent.
 It defines the workflow graph, state, tools, nodes and edges.
 """
 
-# Apply patch for CopilotKit import issue before any other imports
-# This fixes the incorrect import path in copilotkit.langgraph_agent (bug in v0.1.63)
-import sys
-
-# Only apply the patch if the module doesn't already exist
-if 'langgraph.graph.graph' not in sys.modules:
-    # Create a mock module for the incorrect import path that CopilotKit expects
-    class _MockModule:
-        pass
-
-    # Import the necessary modules first
-    import langgraph
-    import langgraph.graph
-    import langgraph.graph.state
-
-    # Import CompiledStateGraph from the correct location
-    from langgraph.graph.state import CompiledStateGraph
-
-    # Create the fake module path that CopilotKit incorrectly expects
-    _mock_graph_module = _MockModule()
-    _mock_graph_module.CompiledGraph = CompiledStateGraph
+# Stand-ins for module paths some CopilotKit/LangChain combinations import (see compat.py);
+# registered before anything that could import CopilotKit
+from compat import install_import_shims
 
-    # Add it to sys.modules so CopilotKit's incorrect import will work
-    sys.modules['langgraph.graph.graph'] = _mock_graph_module
-
-# Patch for missing langchain.agents.middleware (bug in some copilotkit/langchain version combos)
-if 'langchain.agents.middleware' not in sys.modules:
-    class _MockMiddleware:
-        def __getitem__(self, _): return object
-    
-    _mock_middleware_module = type('Module', (), {
-        'AgentMiddleware': _MockMiddleware(),
-        'AgentState': object,
-        'ModelRequest': object,
-        'ModelResponse': object,
-    })
-    sys.modules['langchain.agents.middleware'] = _mock_middleware_module
+install_import_shims()
 
 import os
-from typing import Any, List, Optional, Dict
-from typing_extensions import Literal
-from langchain_groq import ChatGroq
-from langchain_core.messages import SystemMessage, BaseMessage, HumanMessage, AIMessage, ToolMessage
+import time
+from collections import OrderedDict
+from typing import Any, List, NamedTuple, Optional, Dict, Tuple
+from typing_extensions import Annotated, Literal, TypedDict
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_core.runnables import RunnableConfig
-from langchain.tools import tool
-from langgraph.graph import StateGraph, END
+from langchain_core.tools import tool
+from langgraph.graph import MessagesState, StateGraph, END
 from langgraph.types import Command
-from copilotkit.langgraph import CopilotKitState
 from langgraph.prebuilt import ToolNode
 from langgraph.types import interrupt
 
+from admission import tenant_admission, tenant_of
+from checkpointer import build_checkpointer
+from entity_cache import entity_cache
+from flame_api import caller_credential, flame_api
+from history import compact_history, message_tokens, summary_message
+import instrumentation
+from intent_router import (
+    INTENT_ROUTER_ENABLED,
+    answered_router_calls,
+    confirmation_for,
+    intent_router,
+    intent_tool_call,
+    tool_result_succeeded,
+)
+from llm_scheduler import BACKGROUND, INTERACTIVE, SCHEDULER_ENABLED, llm_scheduler
+from model_registry import model_registry
+from model_tiers import FAST_TIER, TierChoice, invalid_tool_calls, tier_router
+from plan_state import PLAN_TOOL_NAMES, PlanMachine
+from prefetch import context_prefetcher
+from prompts import FirstTokenTimer, prompt_cache_stats, prompt_messages
+from response_cache import response_cache
+from state_updates import SHARED_STATE_DEFAULTS, plan_steps_reducer, state_update
+from streaming import StreamInterrupted, emit_intermediate_state, emit_response, emit_tool_call, quiet_config, stream_model_response
+from tool_results import tool_result_compactor
+from tool_selection import LOAD_TOOLS_NAME, is_unbound_tool_error, tool_selector
+from tracing import trace_recorder
+
+class CopilotKitProperties(TypedDict):
+    """Same shape as copilotkit.langgraph.CopilotKitProperties."""
+    actions: List[Any]
+    context: List[Any]
+    intercepted_tool_calls: Any
+    original_ai_message_id: Any
+
+
+class CopilotKitState(MessagesState):
+    """
+    Same shape as copilotkit.langgraph.CopilotKitState, declared here because importing
+    that module runs copilotkit/__init__ (FastAPI, ag-ui, the LangSmith client), which
+    is about a third of a second of cold start the graph never uses.
+    """
+    copilotkit: CopilotKitProperties
+
+
 class AgentState(CopilotKitState):
     """
     State for the Flame Assistant
@@ -70,11 +82,15 @@ class AgentState(CopilotKitState):
     lastAction: str = ""
     itemsCreated: int = 0
     
-    # Planning state
-    planSteps: List[Dict[str, Any]] = []
+    # Planning state (chat_node sends per-step patches, the frontend sends full lists)
+    planSteps: Annotated[List[Dict[str, Any]], plan_steps_reducer] = []
     currentStepIndex: int = -1
     planStatus: str = ""
 
+    # Rolling summary of turns evicted from the prompt window (see history.py)
+    historySummary: str = ""
+    historySummaryCount: int = 0
+
 
 @tool
 def set_plan(steps: List[str]):
@@ -109,11 +125,34 @@ backend_tools = [
     complete_plan,
 ]
 
-# Extract tool names from backend_tools for comparison
-backend_tool_names = [tool.name for tool in backend_tools]
+if flame_api.enabled:
+    # server-side reads, analytics and bulk writes against the Flame REST API, when
+    # FLAME_API_BASE_URL is configured (imported only then: building their schemas is
+    # measurable at startup)
+    from analytics import ANALYTICS_TOOLS, ledger_cache
+    from api_tools import API_TOOLS
+    from bulk_tools import BULK_TOOLS, bulk_writer
+
+    backend_tools.extend([*API_TOOLS, *ANALYTICS_TOOLS, *BULK_TOOLS])
+    context_prefetcher.register(API_TOOLS)
+    # they act as the run's user, so they are bound only when the run carries that user's key
+    api_backend_tool_names = frozenset(tool.name for tool in [*API_TOOLS, *ANALYTICS_TOOLS, *BULK_TOOLS])
+else:
+    api_backend_tool_names = frozenset()
+
+# Extract tool names from backend_tools for comparison (plus `load_tools`, defined below)
+backend_tool_names = frozenset([*(tool.name for tool in backend_tools), LOAD_TOOLS_NAME])
+
+# Opt-in: let the model emit several tool calls per response. Backend calls then run
+# concurrently in tool_node and frontend calls reach the client as one batch.
+PARALLEL_TOOL_CALLS = os.getenv("FLAME_PARALLEL_TOOL_CALLS", "0") not in ("0", "false", "False", "")
+
+# Stream model output (astream) and emit predicted plan state as each plan tool call completes.
+# Only attempts whose response is used stream live (see streaming.py)
+STREAMING = os.getenv("FLAME_STREAMING", "1") not in ("0", "false", "False", "")
 
 # Frontend tool allowlist to keep tool count under API limits and avoid noise
-FRONTEND_TOOL_ALLOWLIST = set([
+FRONTEND_TOOL_ALLOWLIST = frozenset([
     # Query tools (Read)
     "listOrganizations",
     "listProjects",
@@ -167,42 +206,38 @@ FRONTEND_TOOL_ALLOWLIST = set([
     "navigateWorkspace",
 ])
 
+# Cap on bound frontend tools: well under 128 (OpenAI tools limit), leaving room for backend tools
+MAX_FRONTEND_TOOLS = 110
 
-async def chat_node(state: AgentState, config: RunnableConfig) -> Command[Literal["tool_node", "__end__"]]:
-    print(f"state: {state}")
-    """
-    Standard chat node based on the ReAct design pattern. It handles:
-    - The model to use (and binds in CopilotKit actions and the tools defined above)
-    - The system prompt
-    - Getting a response from the model
-    - Handling tool calls
+# Ends a run that reached FLAME_MAX_PLAN_HOPS plan hops (see admission.py)
+PLAN_HOPS_CAPPED_REPLY = (
+    "I've paused the plan after {hops} automatic steps so other requests aren't held up. "
+    "Say \"continue\" and I'll pick up from the current step."
+)
 
-    For more about the ReAct design pattern, see:
-    https://www.perplexity.ai/search/react-agents-NcXLQhreS0WDzpVaS4m9Cg
-    """
 
-    # 1. Define the model
-    model = ChatGroq(model=os.getenv("GROQ_MODEL", "moonshotai/kimi-k2-instruct-0905"))
 
-    # 2. Prepare and bind tools to the model (dedupe, allowlist, and cap)
-    def _extract_tool_name(tool: Any) -> Optional[str]:
-        """Extract a tool name from either a LangChain tool or an OpenAI function spec dict."""
-        try:
-            # OpenAI tool spec dict: { "type": "function", "function": { "name": "..." } }
-            if isinstance(tool, dict):
-                fn = tool.get("function", {}) if isinstance(tool.get("function", {}), dict) else {}
-                name = fn.get("name") or tool.get("name")
-                if isinstance(name, str) and name.strip():
-                    return name
-                return None
-            # LangChain tool object or @tool-decorated function
-            name = getattr(tool, "name", None)
+def _extract_tool_name(tool: Any) -> Optional[str]:
+    """Extract a tool name from either a LangChain tool or an OpenAI function spec dict."""
+    try:
+        # OpenAI tool spec dict: { "type": "function", "function": { "name": "..." } }
+        if isinstance(tool, dict):
+            fn = tool.get("function", {}) if isinstance(tool.get("function", {}), dict) else {}
+            name = fn.get("name") or tool.get("name")
             if isinstance(name, str) and name.strip():
                 return name
             return None
-        except Exception:
-            return None
+        # LangChain tool object or @tool-decorated function
+        name = getattr(tool, "name", None)
+        if isinstance(name, str) and name.strip():
+            return name
+        return None
+    except Exception:
+        return None
+
 
+def allowed_frontend_tools(state: AgentState) -> List[Any]:
+    """Allowlisted frontend tools the client registered, deduplicated by name."""
     # Frontend tools may arrive either under state["tools"] or within the CopilotKit envelope
     raw_tools = (state.get("tools", []) or [])
     try:
@@ -225,83 +260,133 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> Command[Litera
             continue
         seen.add(name)
         deduped_frontend_tools.append(t)
+    return deduped_frontend_tools
+
+
+class ToolBinding(NamedTuple):
+    frontend_names: frozenset
+    bound_tools: List[Any]
+    bound_names: frozenset
+
 
-    # cap to well under 128 (OpenAI tools limit), leaving room for backend tools
-    MAX_FRONTEND_TOOLS = 110
-    if len(deduped_frontend_tools) > MAX_FRONTEND_TOOLS:
-        deduped_frontend_tools = deduped_frontend_tools[:MAX_FRONTEND_TOOLS]
-
-    model_with_tools = model.bind_tools(
-        [
-            *deduped_frontend_tools,
-            *backend_tools,
-        ],
-        parallel_tool_calls=False,
+# The client's tool lists are the same objects on every hop of a run, so the binding is
+# memoized by their identity (the entry keeps them alive, so ids cannot be reused)
+_tool_bindings: "OrderedDict[Tuple[int, int, bool], Tuple[Any, Any, ToolBinding]]" = OrderedDict()
+_TOOL_BINDING_CACHE_SIZE = 64
+
+
+def tool_binding(state: AgentState, api_access: bool = False) -> ToolBinding:
+    """
+    Allowlisted frontend tool names plus the capped tool list to bind, with its names.
+    The Flame API tools are left out unless the run has `api_access` (its user's key).
+    """
+    tools = state.get("tools")
+    actions = (state.get("copilotkit") or {}).get("actions") if isinstance(state.get("copilotkit"), dict) else None
+    key = (id(tools), id(actions), api_access)
+    cached = _tool_bindings.get(key)
+    if cached is not None and cached[0] is tools and cached[1] is actions:
+        return cached[2]
+    frontend = allowed_frontend_tools(state)
+    backend = backend_tools if api_access else [t for t in backend_tools if t.name not in api_backend_tool_names]
+    bound = [*frontend[:MAX_FRONTEND_TOOLS], *backend]
+    binding = ToolBinding(
+        frozenset(_extract_tool_name(t) for t in frontend),
+        bound,
+        frozenset(_extract_tool_name(t) for t in bound),
     )
+    _tool_bindings[key] = (tools, actions, binding)
+    while len(_tool_bindings) > _TOOL_BINDING_CACHE_SIZE:
+        _tool_bindings.popitem(last=False)
+    return binding
 
-    # 3. Define the system message by which the chat model will be run
-    userContext = state.get("userContext", "Unknown User Context")
-    activeOrganizationId = state.get("activeOrganizationId", "None")
-    activeProjectId = state.get("activeProjectId", "None")
-    activeCycleId = state.get("activeCycleId", "None")
-    currentView = state.get("currentView", "Unknown")
-    lastAction = state.get("lastAction", "None")
-    
-    post_tool_guidance = state.get("__last_tool_guidance", None)
+
+# Lets the model ask for tools the per-hop selection left out (see tool_selection.py);
+# bound only alongside a partial selection. It loads only what the run's own binding has
+load_tools = tool_selector.load_tools_tool(
+    [*FRONTEND_TOOL_ALLOWLIST, *backend_tool_names],
+    lambda state, config: tool_binding(state, api_access=caller_credential(config) is not None).bound_names,
+)
+
+
+async def intent_router_node(state: AgentState, config: RunnableConfig) -> Command[Literal["chat_node", "__end__"]]:
+    """
+    Graph entry: answer trivial form-open / navigation / detail-view requests without the
+    LLM (see intent_router.py) and hand everything else to chat_node.
+
+    A matched request ends the run with the frontend tool call. When the client's result
+    comes back, the follow-up run is closed with a canned confirmation; failed results go
+    to chat_node so the model can explain them.
+    """
+    hop = instrumentation.hop("intent_router", measure=trace_recorder.active)
+    tenant_admission.start_run((config.get("configurable") or {}).get("thread_id"))
+    with trace_recorder.node("intent_router", state, config, hop, entry=True) as traced:
+        command = Command(goto="chat_node")
+        messages = state.get("messages", []) or []
+        try:
+            if INTENT_ROUTER_ENABLED and messages and state.get("planStatus", "") != "in_progress":
+                last = messages[-1]
+                if isinstance(last, HumanMessage):
+                    available = tool_binding(state).frontend_names
+                    match = intent_router.route(str(last.content), state, available=available)
+                    if match is not None:
+                        call = intent_tool_call(match)
+                        hop.set(rule=match.rule, confidence=match.confidence)
+                        await emit_tool_call(config, call)
+                        command = Command(goto=END, update=state_update(state, messages=[AIMessage(content="", tool_calls=[call])]))
+                elif isinstance(last, ToolMessage):
+                    answered = answered_router_calls(messages)
+                    if answered and all(tool_result_succeeded(result) for _, result in answered):
+                        reply = " ".join(confirmation_for(call) for call, _ in answered)
+                        command = Command(goto=END, update=state_update(state, messages=[AIMessage(content=reply)], guidance=None))
+        except Exception:
+            command = Command(goto="chat_node")
+        traced.route(command)
+    hop.finish(route=command.goto)
+    return command
+
+
+async def chat_node(state: AgentState, config: RunnableConfig) -> Command[Literal["tool_node", "__end__"]]:
+    """
+    Graph entry for the chat node: runs `_chat_node` inside an instrumentation hop
+    and records its routing decision.
+    """
+    hop = instrumentation.hop("chat_node", measure=trace_recorder.active)
+    with trace_recorder.node("chat_node", state, config, hop) as traced:
+        command = await _chat_node(state, config, hop)
+        traced.route(command)
+    hop.finish(route=command.goto)
+    return command
+
+
+async def _chat_node(state: AgentState, config: RunnableConfig, hop: Any) -> Command[Literal["tool_node", "__end__"]]:
+    """
+    Standard chat node based on the ReAct design pattern. It handles:
+    - The model to use (and binds in CopilotKit actions and the tools defined above)
+    - The system prompt
+    - Getting a response from the model
+    - Handling tool calls
+
+    For more about the ReAct design pattern, see:
+    https://www.perplexity.ai/search/react-agents-NcXLQhreS0WDzpVaS4m9Cg
+    """
+
+    # 1. The model is chosen per hop from the configured tiers (step 4.4, see model_tiers.py);
+    #    clients are pooled and shared across hops and threads
+
+    # 2. Prepare the tools to bind (dedupe, allowlist, and cap), then keep the ones ranked
+    #    relevant to this request, view and plan step (see tool_selection.py)
+    with hop.span("tool_binding"):
+        binding = tool_binding(state, api_access=caller_credential(config) is not None)
+        selection = tool_selector.select(binding.bound_tools, state, state.get("messages", []) or [], extra=[load_tools])
+        bound_tools = selection.tools
+    hop.set(tools_bound=len(bound_tools), schema_tokens_saved=selection.full_tokens - selection.bound_tokens)
+
+    # 3. The system prompt is a static, cache-friendly prefix (prompts.STATIC_SYSTEM_MESSAGE);
+    #    volatile context goes into the ground-truth message after the history (step 4.3)
     plan_steps = state.get("planSteps", []) or []
     current_step_index = state.get("currentStepIndex", -1)
     plan_status = state.get("planStatus", "")
 
-    system_message = SystemMessage(
-        content=(
-            "IDENTITY & PURPOSE:\n"
-            "You are Flame, an elite AI financial assistant integrated deeply into the Flame Sales and Expense Tracker application. "
-            "Your singular goal is to help your User efficiently manage their workspaces, track sales, log expenses, monitor inventory, and analyze financial data. "
-            "You communicate concisely, professionally, and always prioritize completing the user's financial tasks quickly.\n\n"
-            
-            "GLOBAL CONTEXT (LATEST GROUND TRUTH):\n"
-            f"User Context: {userContext}\n"
-            f"Active Organization ID: {activeOrganizationId}\n"
-            f"Active Project ID: {activeProjectId}\n"
-            f"Active Cycle ID: {activeCycleId}\n"
-            f"Current Dashboard URL/View: {currentView}\n"
-            f"Last Action Completed: {lastAction}\n"
-            f"Plan Status: {plan_status}\n"
-            f"Current Step Index: {current_step_index}\n"
-            f"Plan Steps: {[s.get('title', s) for s in plan_steps]}\n\n"
-            
-            "APPLICATION DOMAIN & ARCHITECTURE:\n"
-            "The Flame app is a hierarchical CRM and financial tracker organized as follows:\n"
-            "1. WORKSPACES: Organizations contain Projects. Projects contain Cycles (time-bound periods like 'Q1 2026'). All financial data belongs to a Cycle.\n"
-            "2. SALES & INVOICING: Users input Sales (tied to Customers, Products, Variants) and generate Invoices. Sales must track payment methods and amounts.\n"
-            "3. EXPENSES: Users log Expenses (tied to Vendors and Expense Categories) with dates, amounts, and descriptions. Includes receipt tracking.\n"
-            "4. INVENTORY: The system tracks Items (Finished Goods vs Raw Materials), current stock levels, and production orders. Inventory decreases when Sales occur.\n"
-            "5. ANALYTICS & REPORTS: The app generates real-time dashboards (Total Sales, Net Profit) and downloadable reports for chosen Cycles/Projects.\n\n"
-            
-            "TOOL EXECUTION POLICY:\n"
-            "- You have access to specialized tools (e.g., `createProject`, `logExpense`, `recordSale`).\n"
-            "- You must ALWAYS use these tools to perform actions requested by the user. "
-            "Never tell the user you 'updated their data' if you did not successfully call a tool.\n"
-            "- If a user makes a vague request (e.g., 'Log $50 for supplies'), use the specific `open...Form` tools (e.g. `openExpenseForm`, `openSaleForm`) to open the relevant creation form for them to fill out themselves, OR if you have a direct API tool and only need one or two pieces of missing data, ask for it and then execute the API tool.\n"
-            "- You do NOT manage a generic 'Canvas' of cards. You are managing real financial database records.\n"
-            "- Do not loop the same tool call. Execute the tool, summarize the result based on the Ground Truth update, and wait for the user.\n\n"
-            
-            "PLANNING POLICY (MULTI-STEP REQUESTS):\n"
-            "- If the user makes a complex request ('Set up a new Org, create a Project, and log 3 initial expenses'), you must propose a plan.\n"
-            "- Call the `set_plan` tool to outline the steps.\n"
-            "- Use `update_plan_progress` as you execute the required Tools for each step (e.g., calling `createOrganization`).\n"
-            "- Call `complete_plan` only when every step is successfully executed against the database.\n\n"
-            
-            "STRICT GROUNDING RULES:\n"
-            "1. ALWAYS read the GLOBAL CONTEXT provided above to know what the user is currently looking at.\n"
-            "2. If the user says 'Delete this project', use `activeProjectId`. If it is 'None', ask the user which project they mean.\n"
-            "3. If you lack required information to execute a financial log (e.g., missing an Expense Category ID), ask the user for it or use a tool to fetch available categories.\n"
-            "4. NEVER invent or hallucinate financial quantities, prices, or IDs. Only use data provided in the Ground Truth or via Tool outputs.\n"
-            "5. If a user asks a question entirely unrelated to financial tracking, inventory, or CRM management, politely remind them you are Flame, the Sales and Expense Tracker assistant.\n"
-            + (f"\nPOST-TOOL POLICY:\n{post_tool_guidance}\n" if post_tool_guidance else "")
-        )
-    )
-
     # 4. Run the model to generate a response
     # If the user asked to modify an item but did not specify which, interrupt to choose
     try:
@@ -315,192 +400,224 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> Command[Litera
     except Exception:
         pass
 
-    # 4.1 If the latest message contains unresolved FRONTEND tool calls, do not call the LLM yet.
+    # 4.1 If the latest AIMessage still has unresolved FRONTEND tool calls, do not call the LLM yet.
     #     End the turn and wait for the client to execute tools and append ToolMessage responses.
+    #     With parallel tool calls the client answers the whole batch, possibly after tool_node
+    #     has already answered the backend calls of the same message.
     full_messages = state.get("messages", []) or []
+    # Cache list results the client just returned; successful mutations invalidate cached reads
+    entity_cache.observe_tool_results(full_messages, state, config)
     try:
-        if full_messages:
-            last_msg = full_messages[-1]
-            if isinstance(last_msg, AIMessage):
-                pending_frontend_call = False
-                for tc in getattr(last_msg, "tool_calls", []) or []:
-                    name = tc.get("name") if isinstance(tc, dict) else getattr(tc, "name", None)
-                    if name and name not in backend_tool_names:
-                        pending_frontend_call = True
-                        break
-                if pending_frontend_call:
-                    return Command(
-                        goto=END,
-                        update={
-                            # no changes; just wait for the client to respond with ToolMessage(s)
-                            "userContext": state.get("userContext", ""),
-                            "activeOrganizationId": state.get("activeOrganizationId", ""),
-                            "activeProjectId": state.get("activeProjectId", ""),
-                            "activeCycleId": state.get("activeCycleId", ""),
-                            "currentView": state.get("currentView", ""),
-                            "lastAction": state.get("lastAction", ""),
-                            "itemsCreated": state.get("itemsCreated", 0),
-                            "planSteps": state.get("planSteps", []),
-                            "currentStepIndex": state.get("currentStepIndex", -1),
-                            "planStatus": state.get("planStatus", ""),
-                        },
-                    )
+        if pending_frontend_calls(full_messages):
+            # no changes; just wait for the client to respond with ToolMessage(s)
+            return Command(goto=END, update={})
     except Exception:
         pass
 
-    # 4.2 Trim long histories to reduce stale context influence and suppress typing flicker
-    trimmed_messages = full_messages[-12:]
-
-    # 4.3 Append a final, authoritative state snapshot after chat history
-    #
-    # Ensure the latest shared state takes priority over chat history and
-    # stale tool results. This enforces state-first grounding, reduces drift, and makes
-    # precedence explicit. Optional post-tool guidance confirms successful actions
-    # (e.g., deletion) instead of re-stating absence.
-    latest_state_system = SystemMessage(
-        content=(
-            "LATEST GROUND TRUTH (authoritative):\n"
-            f"- User Context: {userContext}\n"
-            f"- Active Organization ID: {activeOrganizationId}\n"
-            f"- Active Project ID: {activeProjectId}\n"
-            f"- Active Cycle ID: {activeCycleId}\n"
-            f"- Current Dashboard URL/View: {currentView}\n"
-            f"- Last Action Completed: {lastAction}\n\n"
-            f"- planStatus: {plan_status}\n"
-            f"- currentStepIndex: {current_step_index}\n"
-            f"- planSteps: {[s.get('title', s) for s in plan_steps]}\n\n"
-            "Resolution policy: If ANY prior message mentions values that conflict with the above,\n"
-            "those earlier mentions are obsolete and MUST be ignored.\n"
-            "When asked 'what is it now', ALWAYS read from this LATEST GROUND TRUTH.\n"
-            + ("\nIf the last tool result indicated success (e.g., 'deleted:ID'), confirm the action rather than re-stating absence." if post_tool_guidance else "")
+    # Hops of an in-progress plan (after tool results or auto-continue) are capped per run, so
+    # one organization's long plan cannot hold a worker slot indefinitely (see admission.py)
+    if plan_status == "in_progress" and not tenant_admission.plan_hop((config.get("configurable") or {}).get("thread_id"), tenant_of(state)):
+        return Command(
+            goto=END,
+            update=state_update(
+                state,
+                messages=[AIMessage(content=PLAN_HOPS_CAPPED_REPLY.format(hops=tenant_admission.max_plan_hops))],
+                guidance=None,
+            ),
         )
-    )
-
-    response = await model_with_tools.ainvoke([
-        system_message,
-        *trimmed_messages,
-        latest_state_system,
-    ], config)
 
-    # Predictive plan state updates based on imminent tool calls (for UI rendering)
-    try:
-        tool_calls = getattr(response, "tool_calls", []) or []
-        predicted_plan_steps = plan_steps.copy()
-        predicted_current_index = current_step_index
-        predicted_plan_status = plan_status
-        for tc in tool_calls:
-            name = tc.get("name") if isinstance(tc, dict) else getattr(tc, "name", None)
-            args = tc.get("args") if isinstance(tc, dict) else getattr(tc, "args", {})
-            if not isinstance(args, dict):
-                try:
-                    import json as _json
-                    args = _json.loads(args)  # sometimes args can be a json string
-                except Exception:
-                    args = {}
-            if name == "set_plan":
-                raw_steps = args.get("steps") or []
-                predicted_plan_steps = [{"title": s if isinstance(s, str) else str(s), "status": "pending"} for s in raw_steps]
-                if predicted_plan_steps:
-                    predicted_plan_steps[0]["status"] = "in_progress"
-                    predicted_current_index = 0
-                    predicted_plan_status = "in_progress"
-                else:
-                    predicted_current_index = -1
-                    predicted_plan_status = ""
-            elif name == "update_plan_progress":
-                idx = args.get("step_index")
-                status = args.get("status")
-                note = args.get("note")
-                if isinstance(idx, int) and 0 <= idx < len(predicted_plan_steps) and isinstance(status, str):
-                    if note:
-                        predicted_plan_steps[idx]["note"] = note
-                    predicted_plan_steps[idx]["status"] = status
-                    if status == "in_progress":
-                        predicted_current_index = idx
-                        predicted_plan_status = "in_progress"
-                    if status == "completed" and idx >= predicted_current_index:
-                        predicted_current_index = idx
-            elif name == "complete_plan":
-                for i in range(len(predicted_plan_steps)):
-                    if predicted_plan_steps[i].get("status") != "completed":
-                        predicted_plan_steps[i]["status"] = "completed"
-                predicted_plan_status = "completed"
-        # Aggregate overall plan status conservatively and manage progression
-        if predicted_plan_steps:
-            statuses = [str(s.get("status", "")) for s in predicted_plan_steps]
-            # Do NOT auto-mark overall plan completed unless complete_plan is called.
-            # We still reflect failure if any step failed.
-            if any(st == "failed" for st in statuses):
-                predicted_plan_status = "failed"
-            elif any(st == "in_progress" for st in statuses):
-                predicted_plan_status = "in_progress"
-            elif any(st == "blocked" for st in statuses):
-                predicted_plan_status = "blocked"
-            else:
-                predicted_plan_status = predicted_plan_status or ""
-
-            # Only promote a new step when the previously active step transitioned to completed
-            active_idx = next((i for i, s in enumerate(predicted_plan_steps) if str(s.get("status", "")) == "in_progress"), -1)
-            if active_idx == -1:
-                # find last completed and promote the next pending, else first pending
-                last_completed = -1
-                for i, s in enumerate(predicted_plan_steps):
-                    if str(s.get("status", "")) == "completed":
-                        last_completed = i
-                # Prefer the immediate next step after the last completed
-                promote_idx = next((i for i in range(last_completed + 1, len(predicted_plan_steps)) if str(predicted_plan_steps[i].get("status", "")) == "pending"), -1)
-                if promote_idx == -1:
-                    promote_idx = next((i for i, s in enumerate(predicted_plan_steps) if str(s.get("status", "")) == "pending"), -1)
-                if promote_idx != -1:
-                    predicted_plan_steps[promote_idx]["status"] = "in_progress"
-                    predicted_current_index = promote_idx
-                    predicted_plan_status = "in_progress"
-        # If we predicted changes, persist them before routing or ending
-        plan_updates = {}
-        if predicted_plan_steps != plan_steps:
-            plan_updates["planSteps"] = predicted_plan_steps
-        if predicted_current_index != current_step_index:
-            plan_updates["currentStepIndex"] = predicted_current_index
-        if predicted_plan_status != plan_status:
-            plan_updates["planStatus"] = predicted_plan_status
-    except Exception:
-        plan_updates = {}
+    # Repeated read-only questions in the same scope are answered from the response cache (opt-in)
+    with hop.span("response_cache"):
+        cached_answer = response_cache.lookup(full_messages, state, config)
+    if cached_answer is not None:
+        hop.set(response_cache="hit")
+        return Command(goto=END, update=state_update(state, messages=[AIMessage(content=cached_answer)], guidance=None))
+
+    with hop.span("prompt_build"):
+        # 4.2 Keep the newest turns that fit the token budget; older turns are folded into a rolling summary
+        history = compact_history(
+            # large list* results are re-encoded as compact tables for the prompt only
+            tool_result_compactor.compact_messages(full_messages),
+            previous_summary=state.get("historySummary", "") or "",
+            summarized_count=state.get("historySummaryCount", 0) or 0,
+        )
+        trimmed_messages = history.messages
+        history_updates = {}
+        if history.summarized_count != (state.get("historySummaryCount", 0) or 0):
+            history_updates = {
+                "historySummary": history.summary,
+                "historySummaryCount": history.summarized_count,
+            }
+        history_summary_message = summary_message(history.summary)
+
+        # 4.3 Append a final, authoritative state snapshot after chat history
+        #
+        # Ensure the latest shared state takes priority over chat history and
+        # stale tool results. This enforces state-first grounding, reduces drift, and makes
+        # precedence explicit. Optional post-tool guidance confirms successful actions
+        # (e.g., deletion) instead of re-stating absence.
+        model_input = prompt_messages(trimmed_messages, state, summary=history_summary_message)
+
+    emitted_plan: Dict[str, Any] = {}
+
+    async def emit_plan_prediction(call: Dict[str, Any], completed: List[Dict[str, Any]]) -> None:
+        # Show plan progress in the UI while the rest of the response is still generating
+        if call.get("name") not in PLAN_TOOL_NAMES:
+            return
+        try:
+            machine = PlanMachine(plan_steps, current_step_index, plan_status).apply_all(completed)
+            predicted = machine.updates()
+            if predicted and predicted != emitted_plan:
+                emitted_plan.clear()
+                emitted_plan.update(predicted)
+                shared = {key: state.get(key, default) for key, default in SHARED_STATE_DEFAULTS.items()}
+                await emit_intermediate_state(config, {
+                    **shared,
+                    "planSteps": machine.to_list(),
+                    "currentStepIndex": machine.current_index,
+                    "planStatus": machine.status,
+                })
+        except Exception:
+            pass
+
+    # What of the accepted attempt was held back from the client: "" (nothing), "tool_calls"
+    # (text streamed live) or "all"
+    held_back = ""
+    text_shown = False
+
+    async def call_model(choice: TierChoice):
+        nonlocal held_back
+        # Reuse the bound model when the CopilotKit action list is unchanged since a previous turn
+        model_with_tools = model_registry.get_bound_model(
+            # retries happen in llm_scheduler, under the shared rate-limit budget
+            model_registry.get_model(choice.model_name, **({"max_retries": 0} if SCHEDULER_ENABLED else {})),
+            bound_tools,
+            parallel_tool_calls=PARALLEL_TOOL_CALLS,
+        )
+        timer = FirstTokenTimer()
+        model_with_callbacks = model_with_tools.with_config(callbacks=[timer])
+        # A fast attempt may be escalated and must not reach the client at all. A partial tool
+        # selection may be rejected for calling a tool left out of it: its text streams, its
+        # tool calls wait until the provider accepts them. A full-set retry after streamed
+        # text stays quiet. Held-back output is emitted once accepted (see streaming.py)
+        if choice.tier == FAST_TIER or text_shown:
+            held_back = "all"
+        else:
+            held_back = "tool_calls" if selection.partial else ""
+        attempt_config = quiet_config(config, text=held_back == "tool_calls") if held_back else config
+
+        async def invoke():
+            nonlocal text_shown
+            try:
+                if STREAMING:
+                    return await stream_model_response(
+                        model_with_callbacks, model_input, attempt_config,
+                        on_tool_call=None if held_back == "all" else emit_plan_prediction,
+                    )
+                return await model_with_callbacks.ainvoke(model_input, attempt_config)
+            except Exception as exc:
+                # held-back tool call chunks never reached the client; streamed text did
+                reached = {"": timer.first_token_at, "tool_calls": timer.first_text_at}.get(held_back)
+                if reached is not None:
+                    if held_back == "tool_calls":
+                        text_shown = True
+                        if is_unbound_tool_error(exc):
+                            raise
+                    raise StreamInterrupted(f"model stream failed after output reached the client: {exc!r}") from exc
+                raise
+
+        started = time.perf_counter()
+        # Queued behind the organization's call cap, then the process-wide rate-limit
+        # budget; user turns go ahead of plan hops
+        async with tenant_admission.llm_call(tenant_of(state)):
+            response = await llm_scheduler.run(
+                choice.model_name,
+                invoke,
+                tokens=prompt_tokens,
+                priority=INTERACTIVE if choice.turn_type == "user_request" else BACKGROUND,
+            )
+        elapsed = time.perf_counter() - started
+        prompt_cache_stats.record(response, elapsed, timer.ttft, timer.queue_wait)
+        tier_router.record(choice, response, elapsed)
+        response_cache.add_cost(config, elapsed)
+        trace_recorder.model_call(config, response, elapsed, choice.model_name, choice.tier, bound_tools)
+        return response, timer
+
+    async def call_with_tools(choice: TierChoice):
+        # A provider that validates tool calls rejects one to a tool left out of the
+        # selection; retry once with the full set bound
+        nonlocal selection, bound_tools
+        try:
+            return await call_model(choice)
+        except Exception as exc:
+            if not (selection.partial and is_unbound_tool_error(exc)):
+                raise
+        selection = tool_selector.expand(binding.bound_tools, selection, extra=[load_tools])
+        bound_tools = selection.tools
+        return await call_model(choice)
+
+    # Reads this hop will probably make (active cycle's expenses, categories, ...) are fetched
+    # while the model call is in flight; tool_node then takes them instead of calling the API
+    prefetched = context_prefetcher.start(state, config, full_messages)
+    if prefetched:
+        hop.set(prefetched=prefetched)
+
+    with hop.span("llm_call"):
+        # 4.4 Cheap hops (plan continuation, tool summaries, small talk) run on the fast tier;
+        #     a fast response without usable tool calls is retried once on the large tier
+        thread_id = (config.get("configurable") or {}).get("thread_id")
+        prompt_tokens = sum(message_tokens(m) for m in model_input)
+        choice = tier_router.choose(full_messages, plan_status, thread_id=thread_id, prompt_tokens=prompt_tokens)
+        try:
+            response, timer = await call_with_tools(choice)
+            problems = invalid_tool_calls(response, selection.known_names) if choice.tier == FAST_TIER else []
+        except Exception:
+            if choice.tier != FAST_TIER:
+                raise
+            problems = ["provider_error"]
+        if problems:
+            choice = tier_router.escalate(choice, thread_id)
+            response, timer = await call_with_tools(choice)
+        # Calls to existing tools outside the selection stand; they stay bound for the turn
+        tool_selector.unbound_calls(response, selection)
+        if held_back == "all":
+            calls = getattr(response, "tool_calls", None) or []
+            for index, call in enumerate(calls):
+                await emit_plan_prediction(call, calls[:index + 1])
+        if held_back:
+            await emit_response(config, response, text=held_back == "all" and not text_shown)
+    # prefetched reads still in flight that the response does not call are dropped
+    context_prefetcher.settle(config, response)
+    hop.set(tier=choice.tier, turn_type=choice.turn_type)
+    hop.record_response(response, timer.ttft)
+    if timer.queue_wait is not None:
+        hop.set(queue_wait=timer.queue_wait)
+
+    with hop.span("plan_prediction"):
+        # Predictive plan state updates based on imminent tool calls (for UI rendering).
+        # Calls are applied in the order the model emitted them, so a batch such as
+        # set_plan + update_plan_progress(0, completed) lands in one update.
+        plan = PlanMachine(plan_steps, current_step_index, plan_status).apply_all(getattr(response, "tool_calls", []) or [])
+        plan_updates = plan.updates()
 
     # only route to tool node if tool is not in the tools list
     if route_to_tool_node(response):
-        print("routing to tool node")
         return Command(
             goto="tool_node",
-            update={
-                "messages": [response],
-                # persist shared state keys so UI edits survive across runs
-                "userContext": state.get("userContext", ""),
-                "activeOrganizationId": state.get("activeOrganizationId", ""),
-                "activeProjectId": state.get("activeProjectId", ""),
-                "activeCycleId": state.get("activeCycleId", ""),
-                "currentView": state.get("currentView", ""),
-                "lastAction": state.get("lastAction", ""),
-                "itemsCreated": state.get("itemsCreated", 0),
-                "planSteps": state.get("planSteps", []),
-                "currentStepIndex": state.get("currentStepIndex", -1),
-                "planStatus": state.get("planStatus", ""),
+            update=state_update(
+                state,
+                messages=[response],
                 **plan_updates,
+                **history_updates,
                 # guidance for follow-up after tool execution
-                "__last_tool_guidance": "If a deletion tool reports success (deleted:ID), acknowledge deletion even if the item no longer exists afterwards."
-            }
+                guidance="If a deletion tool reports success (deleted:ID), acknowledge deletion even if the item no longer exists afterwards.",
+            ),
         )
 
     # 5. If there are remaining steps, auto-continue; otherwise end the graph.
-    try:
-        effective_steps = plan_updates.get("planSteps", plan_steps)
-        effective_plan_status = plan_updates.get("planStatus", plan_status)
-        has_remaining = bool(effective_steps) and any(
-            (s.get("status") not in ("completed", "failed")) for s in effective_steps
-        )
-    except Exception:
-        effective_steps = plan_steps
-        effective_plan_status = plan_status
-        has_remaining = False
+    #    (the machine keeps status counts, so these checks do not rescan the plan)
+    effective_plan_status = plan.status
+    has_remaining = plan.has_remaining()
 
     # Determine if this response contains frontend tool calls that must be delivered to the client
     try:
@@ -519,106 +636,122 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> Command[Litera
     if has_frontend_tool_calls:
         return Command(
             goto=END,
-            update={
-                "messages": [response],
-                "userContext": state.get("userContext", ""),
-                "activeOrganizationId": state.get("activeOrganizationId", ""),
-                "activeProjectId": state.get("activeProjectId", ""),
-                "activeCycleId": state.get("activeCycleId", ""),
-                "currentView": state.get("currentView", ""),
-                "lastAction": state.get("lastAction", ""),
-                "itemsCreated": state.get("itemsCreated", 0),
-                "planSteps": state.get("planSteps", []),
-                "currentStepIndex": state.get("currentStepIndex", -1),
-                "planStatus": state.get("planStatus", ""),
+            update=state_update(
+                state,
+                messages=[response],
                 **plan_updates,
-                "__last_tool_guidance": (
-                    "Frontend tool calls issued. Waiting for client tool results before continuing."
-                ),
-            },
+                **history_updates,
+                guidance="Frontend tool calls issued. Waiting for client tool results before continuing.",
+            ),
         )
 
     if has_remaining and effective_plan_status != "completed":
         # Auto-continue; include response only if it carries frontend tool calls
+        # At this point there should be no frontend tool calls; ensure we don't pass any unresolved ones back to the model
         return Command(
             goto="chat_node",
-            update={
-                # At this point there should be no frontend tool calls; ensure we don't pass any unresolved ones back to the model
-                "messages": ([]),
-                # persist shared state keys so UI edits survive across runs
-                "userContext": state.get("userContext", ""),
-                "activeOrganizationId": state.get("activeOrganizationId", ""),
-                "activeProjectId": state.get("activeProjectId", ""),
-                "activeCycleId": state.get("activeCycleId", ""),
-                "currentView": state.get("currentView", ""),
-                "lastAction": state.get("lastAction", ""),
-                "itemsCreated": state.get("itemsCreated", 0),
-                "planSteps": state.get("planSteps", []),
-                "currentStepIndex": state.get("currentStepIndex", -1),
-                "planStatus": state.get("planStatus", ""),
+            update=state_update(
+                state,
                 **plan_updates,
-                "__last_tool_guidance": (
+                **history_updates,
+                guidance=(
                     "Plan is in progress. Proceed to the next step automatically. "
                     "Update the step status to in_progress, call necessary tools, and mark it completed when done."
                 ),
-            }
+            ),
         )
 
     # If all steps look completed but planStatus is not yet 'completed', nudge the model to call complete_plan
-    try:
-        all_steps_completed = bool(effective_steps) and all((s.get("status") == "completed") for s in effective_steps)
-        plan_marked_completed = (effective_plan_status == "completed")
-    except Exception:
-        all_steps_completed = False
-        plan_marked_completed = False
+    all_steps_completed = plan.all_completed()
+    plan_marked_completed = (effective_plan_status == "completed")
 
     if all_steps_completed and not plan_marked_completed:
         return Command(
             goto="chat_node",
-            update={
-                "messages": [response] if has_frontend_tool_calls else ([]),
-                # persist shared state keys so UI edits survive across runs
-                "userContext": state.get("userContext", ""),
-                "activeOrganizationId": state.get("activeOrganizationId", ""),
-                "activeProjectId": state.get("activeProjectId", ""),
-                "activeCycleId": state.get("activeCycleId", ""),
-                "currentView": state.get("currentView", ""),
-                "lastAction": state.get("lastAction", ""),
-                "itemsCreated": state.get("itemsCreated", 0),
-                "planSteps": state.get("planSteps", []),
-                "currentStepIndex": state.get("currentStepIndex", -1),
-                "planStatus": state.get("planStatus", ""),
+            update=state_update(
+                state,
+                messages=[response] if has_frontend_tool_calls else [],
                 **plan_updates,
-                "__last_tool_guidance": (
+                **history_updates,
+                guidance=(
                     "All steps are completed. Call complete_plan to mark the plan as finished, "
                     "then present a concise summary of outcomes."
                 ),
-            }
+            ),
         )
 
     # Only show chat messages when not actively in progress; always deliver frontend tool calls
-    currently_in_progress = (plan_updates.get("planStatus", plan_status) == "in_progress")
+    currently_in_progress = (plan.status == "in_progress")
     final_messages = [response] if (has_frontend_tool_calls or not currently_in_progress) else ([])
+    if final_messages and not tool_calls:
+        # only stored when every tool call of the turn was a read
+        response_cache.store(full_messages, response, state, config)
     return Command(
         goto=END,
-        update={
-            "messages": final_messages,
-            # persist shared state keys so UI edits survive across runs
-            "userContext": state.get("userContext", ""),
-            "activeOrganizationId": state.get("activeOrganizationId", ""),
-            "activeProjectId": state.get("activeProjectId", ""),
-            "activeCycleId": state.get("activeCycleId", ""),
-            "currentView": state.get("currentView", ""),
-            "lastAction": state.get("lastAction", ""),
-            "itemsCreated": state.get("itemsCreated", 0),
-            "planSteps": state.get("planSteps", []),
-            "currentStepIndex": state.get("currentStepIndex", -1),
-            "planStatus": state.get("planStatus", ""),
+        update=state_update(
+            state,
+            messages=final_messages,
             **plan_updates,
-            "__last_tool_guidance": None,
-        }
+            **history_updates,
+            guidance=None,
+        ),
     )
 
+def pending_frontend_calls(messages: List[BaseMessage]) -> List[str]:
+    """
+    Ids of frontend tool calls on the latest AIMessage that have no ToolMessage yet.
+    Only ToolMessages may follow that AIMessage; a newer human turn means nothing is pending.
+    """
+    answered: set[str] = set()
+    for message in reversed(messages):
+        if isinstance(message, ToolMessage):
+            answered.add(message.tool_call_id)
+            continue
+        if not isinstance(message, AIMessage):
+            return []
+        return [
+            tc.get("id")
+            for tc in getattr(message, "tool_calls", []) or []
+            if tc.get("name") and tc.get("name") not in backend_tool_names and tc.get("id") not in answered
+        ]
+    return []
+
+
+_backend_tool_executor = ToolNode(tools=[*backend_tools, load_tools])
+
+
+async def tool_node(state: AgentState, config: RunnableConfig):
+    """
+    Execute the backend tool calls of the latest AIMessage (concurrently, via ToolNode).
+    Frontend calls in the same message are skipped here and left for the client.
+    """
+    hop = instrumentation.hop("tool_node", measure=trace_recorder.active)
+    with trace_recorder.node("tool_node", state, config, hop) as traced:
+        messages = state.get("messages", []) or []
+        # Replays of recorded runs (benchmarks/replay.py) serve the recorded results instead
+        replayed = trace_recorder.replayed_tool_results(config)
+        served: List[ToolMessage] = []
+        idx = next((i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], AIMessage)), -1)
+        if idx != -1:
+            ai = messages[idx]
+            backend_calls = [tc for tc in ai.tool_calls if tc.get("name") in backend_tool_names]
+            hop.set(tool_calls=len(backend_calls))
+            if replayed:
+                served = [replayed[tc["id"]] for tc in backend_calls if tc.get("id") in replayed]
+                backend_calls = [tc for tc in backend_calls if tc.get("id") not in replayed]
+            if len(backend_calls) != len(ai.tool_calls):
+                messages = [*messages[:idx], ai.model_copy(update={"tool_calls": backend_calls}), *messages[idx + 1:]]
+        if served and not backend_calls:
+            result = {"messages": served}
+        else:
+            result = await _backend_tool_executor.ainvoke({**state, "messages": messages}, config)
+            if served:
+                result = {**result, "messages": [*served, *result.get("messages", [])]}
+        traced.route(result, goto="chat_node")
+    hop.finish(route="chat_node")
+    return result
+
+
 def route_to_tool_node(response: BaseMessage):
     """
     Route to tool node if any tool call in the response matches a backend tool name.
@@ -633,11 +766,31 @@ def route_to_tool_node(response: BaseMessage):
             return True
     return False
 
+# Export component statistics alongside node metrics
+instrumentation.metrics.register_collector("model_registry", model_registry.stats)
+instrumentation.metrics.register_collector("tool_results", tool_result_compactor.stats)
+instrumentation.metrics.register_collector("prompt_cache", prompt_cache_stats.stats)
+instrumentation.metrics.register_collector("flame_api", flame_api.stats)
+instrumentation.metrics.register_collector("entity_cache", entity_cache.stats)
+instrumentation.metrics.register_collector("intent_router", intent_router.stats)
+instrumentation.metrics.register_collector("model_tiers", tier_router.stats)
+instrumentation.metrics.register_collector("llm_scheduler", llm_scheduler.stats)
+instrumentation.metrics.register_collector("response_cache", response_cache.stats)
+instrumentation.metrics.register_collector("tool_selection", tool_selector.stats)
+instrumentation.metrics.register_collector("tracing", trace_recorder.stats)
+instrumentation.metrics.register_collector("tenants", tenant_admission.stats)
+instrumentation.metrics.register_collector("prefetch", context_prefetcher.stats)
+if flame_api.enabled:
+    instrumentation.metrics.register_collector("bulk_writer", bulk_writer.stats)
+    instrumentation.metrics.register_collector("analytics", ledger_cache.stats)
+
 # Define the workflow graph
 workflow = StateGraph(AgentState)
+workflow.add_node("intent_router", intent_router_node)
 workflow.add_node("chat_node", chat_node)
-workflow.add_node("tool_node", ToolNode(tools=backend_tools))
+workflow.add_node("tool_node", tool_node)
 workflow.add_edge("tool_node", "chat_node")
-workflow.set_entry_point("chat_node")
+workflow.set_entry_point("intent_router")
 
-graph = workflow.compile()
+# Checkpointer is chosen via FLAME_CHECKPOINTER; unset keeps the LangGraph API's own persistence
+graph = workflow.compile(checkpointer=build_checkpointer())
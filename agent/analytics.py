@@ -0,0 +1,533 @@
+"""
+In-process analytics over sales and expenses: the `analyze_sales_expenses` backend tool.
+
+Questions like "net profit by month" or "top 5 expense categories" used to push every row
+through `listExpenses` / `listSales` and leave the arithmetic to the model: slow, thousands
+of tokens per answer, and sums the model gets wrong. Instead, the tool loads the records of
+a scope (the active cycle, a whole project, or the organization) from the Flame API once into
+a `Ledger`, which holds one NumPy array per field. Dimensions (category, vendor, customer, ...)
+are dictionary-encoded as integer codes. A query is then:
+
+- a boolean mask for the date range
+- `np.bincount` for grouped sums and counts
+- integer bucket indexes for day/week/month/year, from date columns decoded once at load
+- `np.argpartition` for top-N
+
+Only the aggregate rows go back to the model.
+
+Ledgers are cached per user and scope (`FLAME_ANALYTICS_TTL`, `FLAME_ANALYTICS_CACHE_SIZE`),
+never for a run without a per-user credential.
+Each is stamped with the entity cache's versions of the resources it was built from, so a
+logged expense, a recorded sale or a bulk import makes the next query reload. Concurrent
+queries of one scope share a single load. Mutations made in the browser only reach those
+versions while the entity cache is enabled; otherwise the TTL bounds staleness.
+
+`Ledger.from_records` and `analyze` are pure functions of the rows, so they can be checked
+against fixture data (see benchmarks/analytics.py).
+
+Registered in `backend_tools` only when `FLAME_API_BASE_URL` is set (see flame_api.py).
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool
+from langgraph.prebuilt import InjectedState
+from typing_extensions import Annotated
+
+from api_tools import _active_id, _api_key
+from entity_cache import cache_scope, entity_cache
+from flame_api import FlameApiError, flame_api
+
+ANALYTICS_TTL = float(os.getenv("FLAME_ANALYTICS_TTL", "300"))
+ANALYTICS_CACHE_SIZE = int(os.getenv("FLAME_ANALYTICS_CACHE_SIZE", "64"))
+# Records loaded per resource and scope; a larger scope is analyzed on these and marked truncated
+ANALYTICS_MAX_ROWS = int(os.getenv("FLAME_ANALYTICS_MAX_ROWS", "20000"))
+# Groups returned when no `top` is given; the rest are only counted
+MAX_GROUPS = 60
+
+# A ledger is stale once any of these changes in its organization
+LEDGER_RESOURCES = ("expenses", "sales", "expense_categories", "vendors", "payment_methods", "projects", "cycles")
+
+MEASURES = ("revenue", "expenses", "net_profit")
+TIME_UNITS = ("day", "week", "month", "year")
+SCOPES = ("cycle", "project", "organization")
+# Sales with these statuses do not count as revenue
+EXCLUDED_SALE_STATUSES = frozenset({"cancelled", "canceled", "void", "refunded"})
+
+_DAY = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+class DimSpec(NamedTuple):
+    # row key holding the id, resolved through `names[table]`
+    id_key: Optional[str]
+    # row keys that already hold a readable label
+    label_keys: Tuple[str, ...]
+    table: Optional[str]
+    missing: str
+
+
+_PROJECT_CYCLE_DIMS = {
+    "project": DimSpec("project_id", ("project_name",), "projects", "No project"),
+    "cycle": DimSpec("cycle_id", ("cycle_name",), "cycles", "No cycle"),
+}
+EXPENSE_DIMS: Dict[str, DimSpec] = {
+    "category": DimSpec("category_id", ("category_name",), "categories", "Uncategorized"),
+    "vendor": DimSpec("vendor_id", ("vendor_name",), "vendors", "No vendor"),
+    "payment_method": DimSpec("payment_method_id", ("payment_method_name", "method_name"), "payment_methods", "Unspecified"),
+    "expense_name": DimSpec(None, ("expense_name",), None, "Unnamed"),
+    **_PROJECT_CYCLE_DIMS,
+}
+SALE_DIMS: Dict[str, DimSpec] = {
+    "customer": DimSpec("customer_id", ("customer_name", "customer"), None, "No customer"),
+    "status": DimSpec(None, ("status",), None, "unknown"),
+    "product": DimSpec("product_id", ("product_name",), None, "No product"),
+    "payment_method": DimSpec("payment_method_id", ("payment_method_name", "method_name"), "payment_methods", "Unspecified"),
+    **_PROJECT_CYCLE_DIMS,
+}
+GROUPS = ("none", *TIME_UNITS, *dict.fromkeys([*EXPENSE_DIMS, *SALE_DIMS]))
+
+
+class Table(NamedTuple):
+    """One resource as columns: amounts, dates (NaT when missing) and encoded dimensions."""
+
+    amount: np.ndarray
+    day: np.ndarray
+    # `day` truncated to months once at build: calendar casts are the slow part of a query
+    month: np.ndarray
+    # dimension -> (int32 codes, labels indexed by code)
+    dims: Dict[str, Tuple[np.ndarray, np.ndarray]]
+
+    @property
+    def nbytes(self) -> int:
+        return self.amount.nbytes + self.day.nbytes + self.month.nbytes + sum(c.nbytes + l.nbytes for c, l in self.dims.values())
+
+
+def _number(value: Any) -> float:
+    if value is None or value == "" or isinstance(value, bool):
+        return float("nan")
+    try:
+        return float(value.replace(",", "")) if isinstance(value, str) else float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _first(row: Dict[str, Any], keys: Sequence[str]) -> Any:
+    for key in keys:
+        value = row.get(key)
+        if value is not None and value != "":
+            return value
+    return None
+
+
+def _label(row: Dict[str, Any], spec: DimSpec, names: Dict[str, Dict[str, str]]) -> str:
+    label = _first(row, spec.label_keys)
+    if isinstance(label, dict):
+        label = _first(label, ("name", "label"))
+    if label is not None and label != "":
+        return str(label)
+    ident = row.get(spec.id_key) if spec.id_key else None
+    if ident is None or ident == "":
+        return spec.missing
+    return names.get(spec.table or "", {}).get(str(ident)) or f"{spec.table or spec.id_key} #{ident}"
+
+
+def _table(rows: Sequence[Dict[str, Any]], amounts: List[float], date_keys: Sequence[str], dims: Dict[str, DimSpec],
+           names: Dict[str, Dict[str, str]]) -> Table:
+    # One pass in Python to pull the fields out of the JSON rows; everything after is vectorized
+    days: List[str] = []
+    labels: Dict[str, List[str]] = {dim: [] for dim in dims}
+    for row in rows:
+        day = _first(row, date_keys)
+        days.append(day[:10] if isinstance(day, str) and _DAY.match(day) else "NaT")
+        for dim, spec in dims.items():
+            labels[dim].append(_label(row, spec, names))
+    encoded = {}
+    for dim, values in labels.items():
+        uniques, codes = np.unique(np.array(values, dtype=str), return_inverse=True)
+        encoded[dim] = (codes.astype(np.int32).reshape(-1), uniques)
+    day = np.array(days, dtype="datetime64[D]")
+    return Table(np.array(amounts, dtype=np.float64), day, day.astype("datetime64[M]"), encoded)
+
+
+class Ledger:
+    """The sales and expenses of one scope in columnar form."""
+
+    def __init__(self, expenses: Table, sales: Table, truncated: bool = False):
+        self.expenses = expenses
+        self.sales = sales
+        self.truncated = truncated
+
+    @classmethod
+    def from_records(cls, expenses: Sequence[Dict[str, Any]], sales: Sequence[Dict[str, Any]],
+                     names: Optional[Dict[str, Dict[str, str]]] = None, truncated: bool = False) -> "Ledger":
+        """
+        Build from API rows. `names` maps a lookup table (`categories`, `vendors`,
+        `payment_methods`, `projects`, `cycles`) to {id: name} for rows that only carry ids.
+        Expenses and sales are both counted in the organization currency when the row has
+        it (`amount_org_ccy`), else in the project's; sales with an excluded status
+        (cancelled, ...) are dropped.
+        """
+        names = names or {}
+        sales = [s for s in sales if str(s.get("status") or "").lower() not in EXCLUDED_SALE_STATUSES]
+        expense_amounts = [_number(_first(e, ("amount_org_ccy", "amount"))) for e in expenses]
+        sale_amounts = []
+        for sale in sales:
+            amount = _number(_first(sale, ("amount_org_ccy", "amount", "total_amount", "total")))
+            if amount != amount:
+                amount = _number(sale.get("quantity")) * _number(sale.get("price"))
+            sale_amounts.append(amount)
+        return cls(
+            _table(expenses, expense_amounts, ("expense_date", "date_time_created", "created_at"), EXPENSE_DIMS, names),
+            _table(sales, sale_amounts, ("sale_date", "date", "date_time_created", "created_at"), SALE_DIMS, names),
+            truncated,
+        )
+
+    @property
+    def records(self) -> int:
+        return len(self.expenses.amount) + len(self.sales.amount)
+
+    @property
+    def nbytes(self) -> int:
+        return self.expenses.nbytes + self.sales.nbytes
+
+
+def _date(value: Optional[str], name: str) -> Optional[np.datetime64]:
+    if value in (None, ""):
+        return None
+    if not _DAY.match(str(value)):
+        raise ValueError(f"{name} must be YYYY-MM-DD")
+    return np.datetime64(str(value)[:10], "D")
+
+
+_BUCKET_UNITS = {"day": ("datetime64[D]", 1), "week": ("datetime64[D]", 7), "month": ("datetime64[M]", 1), "year": ("datetime64[Y]", 1)}
+
+
+def _buckets(day: np.ndarray, month: np.ndarray, unit: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(every bucket from the first to the last, bucket index of each record) for dated records."""
+    dtype, step = _BUCKET_UNITS[unit]
+    if unit in ("day", "week"):
+        ticks = day.view(np.int64)
+        if unit == "week":
+            # weeks start on Monday; 1970-01-01 was a Thursday
+            ticks = ticks - (ticks + 3) % 7
+    else:
+        # calendar units come from the month column built with the ledger: integer math only
+        ticks = month.view(np.int64)
+        if unit == "year":
+            ticks = ticks // 12
+    if not ticks.size:
+        return np.zeros(0, dtype=dtype), np.zeros(0, dtype=np.int64)
+    # buckets are a dense integer range, so indexing is a subtraction rather than a sort
+    first = ticks.min()
+    index = (ticks - first) // step
+    keys = (first + step * np.arange(int(index.max()) + 1)).astype(dtype)
+    return keys, index
+
+
+def _group(table: Table, mask: np.ndarray, group_by: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """(labels, sums, counts, records left out for lacking a date) of the masked rows."""
+    amount = table.amount[mask]
+    if group_by == "none":
+        return np.array(["all"]), np.array([amount.sum()]), np.array([amount.size]), 0
+    undated = 0
+    if group_by in TIME_UNITS:
+        day = table.day[mask]
+        dated = ~np.isnat(day)
+        undated = int(amount.size - dated.sum())
+        keys, index = _buckets(day[dated], table.month[mask][dated], group_by)
+        amount = amount[dated]
+    else:
+        codes, keys = table.dims[group_by]
+        index = codes[mask]
+    sums = np.bincount(index, weights=amount, minlength=len(keys))
+    counts = np.bincount(index, minlength=len(keys))
+    present = counts > 0
+    labels = np.datetime_as_string(keys[present]) if group_by in TIME_UNITS else keys[present]
+    return labels, sums[present], counts[present], undated
+
+
+def _order(values: np.ndarray, top: Optional[int], ascending: bool, chronological: bool) -> np.ndarray:
+    """Indices to report: the top-N by value, everything by value, or everything in time order."""
+    if top is not None and 0 < top < len(values):
+        keyed = values if ascending else -values
+        picked = np.argpartition(keyed, top - 1)[:top]
+        return picked[np.argsort(keyed[picked], kind="stable")]
+    if chronological:
+        return np.arange(len(values))
+    return np.argsort(values if ascending else -values, kind="stable")
+
+
+def _money(values: np.ndarray) -> List[float]:
+    return np.round(values, 2).tolist()
+
+
+def analyze(ledger: Ledger, measure: str = "net_profit", group_by: str = "none", top: Optional[int] = None,
+            ascending: bool = False, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, Any]:
+    """Aggregate a ledger; raises ValueError for arguments it cannot answer."""
+    if measure not in MEASURES:
+        raise ValueError(f"measure must be one of {', '.join(MEASURES)}")
+    if group_by not in GROUPS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPS)}")
+    tables = {"revenue": [("revenue", ledger.sales, SALE_DIMS)], "expenses": [("expenses", ledger.expenses, EXPENSE_DIMS)]}.get(
+        measure, [("revenue", ledger.sales, SALE_DIMS), ("expenses", ledger.expenses, EXPENSE_DIMS)]
+    )
+    for name, _, dims in tables:
+        if group_by not in ("none", *TIME_UNITS) and group_by not in dims:
+            raise ValueError(f"{name} cannot be grouped by {group_by}")
+    start, end = _date(start_date, "start_date"), _date(end_date, "end_date")
+
+    grouped = {}
+    records = undated = 0
+    for name, table, _ in tables:
+        mask = np.isfinite(table.amount)
+        if start is not None:
+            mask &= table.day >= start
+        if end is not None:
+            mask &= table.day <= end
+        labels, sums, counts, left_out = _group(table, mask, group_by)
+        grouped[name] = (labels, sums, counts)
+        records += int(mask.sum())
+        undated += left_out
+
+    result: Dict[str, Any] = {"success": True, "measure": measure, "group_by": group_by}
+    if start_date or end_date:
+        result["period"] = {"from": start_date, "to": end_date}
+    if measure == "net_profit":
+        # outer join of the revenue and expense groups on their labels
+        (rev_labels, rev_sums, rev_counts), (exp_labels, exp_sums, exp_counts) = grouped["revenue"], grouped["expenses"]
+        labels = np.union1d(rev_labels, exp_labels)
+        revenue, expenses = np.zeros(len(labels)), np.zeros(len(labels))
+        revenue[np.searchsorted(labels, rev_labels)] = rev_sums
+        expenses[np.searchsorted(labels, exp_labels)] = exp_sums
+        values = revenue - expenses
+        result.update(revenue=round(float(revenue.sum()), 2), expenses=round(float(expenses.sum()), 2),
+                      net_profit=round(float(values.sum()), 2), sales=int(rev_counts.sum()), expense_records=int(exp_counts.sum()))
+        columns = {"revenue": _money(revenue), "expenses": _money(expenses), "net_profit": _money(values)}
+    else:
+        labels, values, counts = grouped[measure]
+        result.update(total=round(float(values.sum()), 2), count=int(counts.sum()))
+        columns = {"total": _money(values), "count": counts.tolist(), "average": _money(values / np.maximum(counts, 1))}
+
+    if group_by != "none":
+        picked = _order(values, top, ascending, group_by in TIME_UNITS)
+        shown = picked[:MAX_GROUPS]
+        result["groups"] = [
+            {group_by: str(labels[i]), **{column: series[i] for column, series in columns.items()}} for i in shown.tolist()
+        ]
+        if len(picked) > len(shown):
+            result["more_groups"] = int(len(picked) - len(shown))
+    if undated:
+        result["undated_records"] = undated
+    if ledger.truncated:
+        result["truncated"] = True
+        result["note"] = f"Only the first {ANALYTICS_MAX_ROWS} records of each kind were analyzed."
+    result["records_analyzed"] = records
+    return result
+
+
+class LedgerKey(NamedTuple):
+    principal: str
+    organization: str
+    project_id: Optional[str]
+    cycle_id: Optional[str]
+
+
+class _CachedLedger(NamedTuple):
+    ledger: Ledger
+    expires: float
+    versions: Tuple[int, ...]
+
+
+class LedgerCache:
+    """Ledgers per caller and scope, with TTL, LRU bound, version checks and shared loads."""
+
+    def __init__(self, ttl: float = ANALYTICS_TTL, max_entries: int = ANALYTICS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[LedgerKey, _CachedLedger]" = OrderedDict()
+        self._loading: Dict[LedgerKey, Tuple[asyncio.AbstractEventLoop, "asyncio.Future[Ledger]"]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.shared_loads = 0
+        self.stale = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    async def ledger(self, key: LedgerKey, load: Callable[[], Awaitable[Ledger]]) -> Ledger:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                if cached.expires >= time.monotonic() and cached.versions == entity_cache.versions(key.organization, LEDGER_RESOURCES):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return cached.ledger
+                del self._entries[key]
+                self.stale += 1
+            pending = self._loading.get(key)
+            if pending is not None and pending[0] is loop:
+                self.shared_loads += 1
+                future = pending[1]
+            else:
+                future = None
+                own = loop.create_future()
+                self._loading[key] = (loop, own)
+                # stamped before loading: a mutation while the rows are in flight makes it stale
+                versions = entity_cache.versions(key.organization, LEDGER_RESOURCES)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        started = time.perf_counter()
+        try:
+            ledger = await load()
+        except asyncio.CancelledError:
+            own.cancel()
+            raise
+        except BaseException as exc:
+            own.set_exception(exc)
+            # retrieved here so an unshared failure is not reported as never retrieved
+            own.exception()
+            raise
+        finally:
+            with self._lock:
+                if self._loading.get(key, (None, None))[1] is own:
+                    del self._loading[key]
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += time.perf_counter() - started
+            self._entries[key] = _CachedLedger(ledger, time.monotonic() + self.ttl, versions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        own.set_result(ledger)
+        return ledger
+
+    def query(self, ledger: Ledger, **kwargs: Any) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return analyze(ledger, **kwargs)
+        finally:
+            with self._lock:
+                self.queries += 1
+                self.query_seconds += time.perf_counter() - started
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ledgers": len(self._entries),
+                "records": sum(e.ledger.records for e in self._entries.values()),
+                "bytes": sum(e.ledger.nbytes for e in self._entries.values()),
+                "hits": self.hits,
+                "loads": self.loads,
+                "shared_loads": self.shared_loads,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "load_ms": (self.load_seconds / self.loads * 1000) if self.loads else 0.0,
+                "queries": self.queries,
+                "query_ms": (self.query_seconds / self.queries * 1000) if self.queries else 0.0,
+            }
+
+
+ledger_cache = LedgerCache()
+
+
+async def _names(path: str, params: Dict[str, Any], records_key: str, label_keys: Sequence[str], api_key: Optional[str]) -> Dict[str, str]:
+    """{id: name} of a lookup resource; empty when it cannot be read (rows then show ids)."""
+    try:
+        body = await flame_api.get(path, params, api_key=api_key)
+    except FlameApiError:
+        return {}
+    return {str(r.get("id")): str(_first(r, label_keys)) for r in body.get(records_key) or [] if _first(r, label_keys) is not None}
+
+
+async def load_ledger(key: LedgerKey, scope: str, api_key: Optional[str]) -> Ledger:
+    """Fetch a scope's expenses, sales and lookup names concurrently and build its ledger."""
+    params = {"project_id": key.project_id, "cycle_id": key.cycle_id, "limit": ANALYTICS_MAX_ROWS}
+    lookups = {
+        "categories": _names("/api/expense-categories", {"projectId": key.project_id}, "categories", ("category_name", "name"), api_key),
+        "vendors": _names("/api/vendors", {}, "vendors", ("vendor_name", "name"), api_key),
+        "payment_methods": _names("/api/payment-methods", {}, "payment_methods", ("method_name", "name"), api_key),
+    }
+    if scope != "cycle":
+        lookups["cycles"] = _names("/api/cycles", {"project_id": key.project_id}, "cycles", ("cycle_name", "name"), api_key)
+    if scope == "organization":
+        lookups["projects"] = _names("/api/projects", {"org_id": key.organization}, "projects", ("project_name", "name"), api_key)
+    expenses, sales, *names = await asyncio.gather(
+        flame_api.get("/api/expenses", params, api_key=api_key),
+        flame_api.get("/api/sales", params, api_key=api_key),
+        *lookups.values(),
+    )
+    expense_rows, sale_rows = expenses.get("expenses") or [], sales.get("sales") or []
+    truncated = len(expense_rows) >= ANALYTICS_MAX_ROWS or len(sale_rows) >= ANALYTICS_MAX_ROWS
+    return Ledger.from_records(expense_rows, sale_rows, dict(zip(lookups, names)), truncated)
+
+
+@tool
+async def analyze_sales_expenses(
+    measure: str = "net_profit",
+    group_by: str = "none",
+    top: Optional[int] = None,
+    ascending: bool = False,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    scope: str = "cycle",
+    project_id: Optional[int] = None,
+    cycle_id: Optional[int] = None,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+) -> Dict[str, Any]:
+    """
+    Totals, breakdowns, trends and rankings of sales and expenses, computed on the server.
+    Use it for any question that needs arithmetic over records ("net profit by month",
+    "top 5 expense categories", "how much went on fuel in March") instead of fetching rows
+    and adding them up yourself; report its numbers as returned.
+    measure: revenue, expenses, or net_profit (revenue minus expenses; cancelled sales excluded).
+    group_by: none, day, week, month, year, project, cycle; for expenses also category, vendor,
+    payment_method, expense_name; for revenue also customer, status, product.
+    top: only the N largest groups (smallest with ascending=true).
+    start_date / end_date: YYYY-MM-DD, inclusive.
+    scope: cycle (default: the active cycle), project (every cycle of the active project)
+    or organization (every project). project_id / cycle_id override the active ones.
+    """
+    if scope not in SCOPES:
+        return {"success": False, "error": f"scope must be one of {', '.join(SCOPES)}"}
+    project = _active_id(project_id, state, "activeProjectId") if scope != "organization" else None
+    cycle = _active_id(cycle_id, state, "activeCycleId") if scope == "cycle" else None
+    if scope == "cycle" and cycle is None:
+        scope = "project"
+    caller = cache_scope(state, config)
+    key = LedgerKey(caller.principal, caller.organization, None if project is None else str(project), None if cycle is None else str(cycle))
+    try:
+        if caller.cacheable:
+            ledger = await ledger_cache.ledger(key, lambda: load_ledger(key, scope, _api_key(config)))
+        else:
+            # no per-user principal: load for this call only, never into the shared cache
+            ledger = await load_ledger(key, scope, _api_key(config))
+        result = ledger_cache.query(
+            ledger, measure=measure, group_by=group_by, top=top, ascending=ascending, start_date=start_date, end_date=end_date
+        )
+    except FlameApiError as exc:
+        return {"success": False, "error": str(exc)}
+    except ValueError as exc:
+        return {"success": False, "error": str(exc)}
+    result["scope"] = {"scope": scope, "project_id": project, "cycle_id": cycle}
+    return result
+
+
+ANALYTICS_TOOLS: List[Any] = [analyze_sales_expenses]
@@ -0,0 +1,292 @@
+"""
+Backend read tools backed by the Flame REST API.
+
+Unlike the frontend `list*` actions, these run inside `tool_node`, so a data question is
+answered within a single graph run (chat_node -> tool_node -> chat_node) with no browser
+round trip. Filters default to the active project/cycle from shared state. Results use
+the same `{success, <records>, count}` shape as the frontend tools.
+
+Reads go through `entity_cache`. A hit whose original result is still among the recent
+messages of the thread, and is in the model's prompt whole (not row-capped by
+tool_results.py, nor truncated or dropped by history.py), returns a short pointer instead
+of the rows again; otherwise the rows come back. A miss takes
+the thread's prefetched result of the same read, if `chat_node` started one while the
+model was deciding (see prefetch.py).
+
+Registered in `backend_tools` only when `FLAME_API_BASE_URL` is set (see flame_api.py), and
+bound only for runs that carry their user's API key.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import InjectedToolCallId, tool
+from langgraph.prebuilt import InjectedState
+from typing_extensions import Annotated
+
+from entity_cache import cache_scope, entity_cache, read_filters
+from flame_api import FlameApiError, caller_credential, flame_api
+from history import compact_history
+from prefetch import context_prefetcher
+from tool_results import shows_all_rows, tool_result_compactor
+
+# A cached result is only referenced, not repeated, if its ToolMessage is this recent
+POINTER_WINDOW = 12
+
+
+def _active_id(value: Optional[int], state: Optional[Dict[str, Any]], key: str) -> Optional[Any]:
+    if value is not None:
+        return value
+    active = (state or {}).get(key)
+    return active if active not in (None, "", "None") else None
+
+
+def _api_key(config: Optional[RunnableConfig]) -> Optional[str]:
+    # the run's own user; without one the API refuses the call (see flame_api.py)
+    credential = caller_credential(config)
+    return credential.key if credential is not None else None
+
+
+def _shown_whole(state: Optional[Dict[str, Any]], tool_name: str, tool_call_id: Optional[str]) -> bool:
+    """Whether that earlier result is recent and in the model's prompt in full, as chat_node builds it."""
+    if not tool_call_id:
+        return False
+    messages = (state or {}).get("messages", []) or []
+    original = next((m for m in messages[-POINTER_WINDOW:] if isinstance(m, ToolMessage) and m.tool_call_id == tool_call_id), None)
+    if original is None or not isinstance(original.content, str) or not shows_all_rows(original.name or tool_name, original.content):
+        return False
+    prompt_form = tool_result_compactor.compact_messages(messages, record=False)
+    expected = next(m for m in prompt_form if isinstance(m, ToolMessage) and m.tool_call_id == tool_call_id)
+    history = compact_history(
+        prompt_form,
+        previous_summary=(state or {}).get("historySummary", "") or "",
+        summarized_count=(state or {}).get("historySummaryCount", 0) or 0,
+    )
+    return any(isinstance(m, ToolMessage) and m.tool_call_id == tool_call_id and m.content == expected.content for m in history.messages)
+
+
+async def _fetch(
+    tool_name: str,
+    args: Dict[str, Any],
+    path: str,
+    params: Dict[str, Any],
+    state: Optional[Dict[str, Any]],
+    config: Optional[RunnableConfig],
+    tool_call_id: Optional[str],
+    records_key: Optional[str] = None,
+    source_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    scope = cache_scope(state, config)
+    filters = read_filters(tool_name, args, state) or {}
+    # a speculative read (prefetch.py) goes straight to the API; it is cached once claimed
+    prefetching = context_prefetcher.prefetching()
+    if not prefetching:
+        cached = entity_cache.get(scope, tool_name, filters)
+        if cached is not None:
+            if _shown_whole(state, tool_name, cached.origin):
+                return {
+                    "success": True,
+                    "unchanged": True,
+                    "same_as_tool_call": cached.origin,
+                    "count": cached.value.get("count"),
+                    "note": "Identical to that earlier result above; reuse it.",
+                }
+            return cached.value
+        prefetched = await context_prefetcher.claim(config, scope, tool_name, filters)
+        if prefetched is not None:
+            entity_cache.put(scope, tool_name, filters, prefetched, origin=tool_call_id)
+            return prefetched
+
+    try:
+        body = await flame_api.get(path, params, api_key=_api_key(config))
+    except FlameApiError as exc:
+        return {"success": False, "error": str(exc)}
+    if records_key is None:
+        result = {"success": True, **{k: v for k, v in body.items() if k != "status"}}
+    else:
+        records = body.get(source_key or records_key) or []
+        result = {"success": True, records_key: records, "count": len(records)}
+    if not prefetching:
+        entity_cache.put(scope, tool_name, filters, result, origin=tool_call_id)
+    return result
+
+
+@tool
+async def fetch_expenses(
+    project_id: Optional[int] = None,
+    cycle_id: Optional[int] = None,
+    search: Optional[str] = None,
+    limit: int = 100,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch expense records directly from the database. Defaults to the active project and cycle.
+    Prefer this over listExpenses when you only need the data to answer a question.
+    """
+    args = {"project_id": project_id, "cycle_id": cycle_id, "search": search, "limit": limit}
+    return await _fetch("fetch_expenses", args, "/api/expenses", {
+        "project_id": _active_id(project_id, state, "activeProjectId"),
+        "cycle_id": _active_id(cycle_id, state, "activeCycleId"),
+        "search": search,
+        "limit": limit,
+    }, state, config, tool_call_id, "expenses")
+
+
+@tool
+async def fetch_sales(
+    project_id: Optional[int] = None,
+    cycle_id: Optional[int] = None,
+    product_id: Optional[int] = None,
+    status: Optional[str] = None,
+    limit: int = 100,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch sales records directly from the database. Defaults to the active project and cycle.
+    Prefer this over listSales when you only need the data to answer a question.
+    """
+    args = {"project_id": project_id, "cycle_id": cycle_id, "product_id": product_id, "status": status, "limit": limit}
+    return await _fetch("fetch_sales", args, "/api/sales", {
+        "project_id": _active_id(project_id, state, "activeProjectId"),
+        "cycle_id": _active_id(cycle_id, state, "activeCycleId"),
+        "product_id": product_id,
+        "status": status,
+        "limit": limit,
+    }, state, config, tool_call_id, "sales")
+
+
+@tool
+async def fetch_cycles(
+    project_id: Optional[int] = None,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch the cycles of a project (defaults to the active project), with dates and budgets.
+    """
+    return await _fetch("fetch_cycles", {"project_id": project_id}, "/api/cycles", {
+        "project_id": _active_id(project_id, state, "activeProjectId"),
+    }, state, config, tool_call_id, "cycles")
+
+
+@tool
+async def fetch_projects(
+    organization_id: Optional[int] = None,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch the projects of an organization (defaults to the active organization).
+    """
+    return await _fetch("fetch_projects", {"organization_id": organization_id}, "/api/projects", {
+        "org_id": _active_id(organization_id, state, "activeOrganizationId"),
+    }, state, config, tool_call_id, "projects")
+
+
+@tool
+async def fetch_organizations(
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch the organizations the user has access to.
+    """
+    return await _fetch("fetch_organizations", {}, "/api/organizations/all", {}, state, config, tool_call_id, "organizations")
+
+
+@tool
+async def fetch_expense_categories(
+    project_id: Optional[int] = None,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch the expense categories available for a project (defaults to the active project).
+    Use it to resolve a category_id before logging an expense.
+    """
+    return await _fetch("fetch_expense_categories", {"project_id": project_id}, "/api/expense-categories", {
+        "projectId": _active_id(project_id, state, "activeProjectId"),
+    }, state, config, tool_call_id, "categories")
+
+
+@tool
+async def fetch_payment_methods(
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch the organization's payment methods (to resolve a payment_method_id).
+    """
+    return await _fetch("fetch_payment_methods", {}, "/api/payment-methods", {}, state, config, tool_call_id, "payment_methods")
+
+
+@tool
+async def fetch_vendors(
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch the organization's vendors (to resolve a vendor_id).
+    """
+    return await _fetch("fetch_vendors", {}, "/api/vendors", {}, state, config, tool_call_id, "vendors")
+
+
+@tool
+async def fetch_expenses_by_category(
+    project_id: Optional[int] = None,
+    cycle_id: Optional[int] = None,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Total expenses per category for a project/cycle (defaults to the active ones),
+    or for the whole organization when no project is active.
+    """
+    return await _fetch("fetch_expenses_by_category", {"project_id": project_id, "cycle_id": cycle_id}, "/api/analytics/expenses-by-category", {
+        "projectId": _active_id(project_id, state, "activeProjectId"),
+        "cycleId": _active_id(cycle_id, state, "activeCycleId"),
+    }, state, config, tool_call_id, "categories", source_key="data")
+
+
+@tool
+async def fetch_report_summary(
+    project_id: Optional[int] = None,
+    cycle_id: Optional[int] = None,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+    tool_call_id: Annotated[str, InjectedToolCallId] = None,
+) -> Dict[str, Any]:
+    """
+    Financial summary (total revenue, total expenses, net profit, budget, monthly trends)
+    for a project/cycle (defaults to the active ones).
+    """
+    return await _fetch("fetch_report_summary", {"project_id": project_id, "cycle_id": cycle_id}, "/api/reports/summary", {
+        "projectId": _active_id(project_id, state, "activeProjectId"),
+        "cycleId": _active_id(cycle_id, state, "activeCycleId"),
+    }, state, config, tool_call_id)
+
+
+API_TOOLS: List[Any] = [
+    fetch_expenses,
+    fetch_sales,
+    fetch_cycles,
+    fetch_projects,
+    fetch_organizations,
+    fetch_expense_categories,
+    fetch_payment_methods,
+    fetch_vendors,
+    fetch_expenses_by_category,
+    fetch_report_summary,
+]
@@ -0,0 +1,5 @@
+"""
+Offline benchmarks for the Flame Assistant graph.
+
+Run from the `agent/` directory, e.g. `python -m benchmarks.run_graph --help`.
+"""
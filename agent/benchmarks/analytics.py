@@ -0,0 +1,295 @@
+"""
+`analyze_sales_expenses` against fixture data, then end to end over a local stub API.
+
+Fixture part: builds a `Ledger` from generated sales and expenses of two projects, one
+in the organization currency and one in another, and runs a set of queries. Each result is checked against a plain-Python reference aggregation over the
+same rows, and reports the time per query next to the reference's. It also compares the
+tokens of the aggregate result with the tokens of the raw rows the model would otherwise
+have read. A two-currency case checks revenue per project against the organization-currency
+prices the rows were generated from.
+
+Stub part: the tool's first call (which loads the ledger), a cached call, a call after an
+expense mutation (a reload), and concurrent calls of a cold scope (which share one load).
+
+    python -m benchmarks.analytics --rows 20000 --api-rows 2000
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.stub_api import STUB_API_KEY, StubApiServer
+
+CATEGORIES = {1: "Fuel", 2: "Supplies", 3: "Rent", 4: "Wages", 5: "Repairs", 6: "Marketing", 7: "Utilities", 8: "Other"}
+VENDORS = {1: "Shell", 2: "Metro", 3: "City Power", 4: "Print Co"}
+# project id -> (name, project-currency units per organization-currency unit)
+PROJECTS = {3: ("Main shop", 1.0), 4: ("Export line", 3700.0)}
+PRICE = 25.0  # organization currency
+
+
+def fixture_rows(count: int, seed: int = 7) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    (expenses, sales) over 2025-07..2026-06 in the Flame API's row shapes, with a few awkward
+    rows. Every third row belongs to project 4, whose `amount` and `price` are in its own
+    currency; `amount_org_ccy` is always the organization-currency value.
+    """
+    rng = random.Random(seed)
+    start = datetime.date(2025, 7, 1)
+    expenses, sales = [], []
+    for i in range(count):
+        project = 4 if i % 3 == 0 else 3
+        rate = PROJECTS[project][1]
+        day = start + datetime.timedelta(days=rng.randrange(365))
+        amount = round(rng.uniform(2, 900), 2)
+        expenses.append({
+            "id": i,
+            "project_id": project,
+            "cycle_id": 7,
+            "category_id": rng.choice([*CATEGORIES, None]),
+            "vendor_id": rng.choice([*VENDORS, None]),
+            "payment_method_id": rng.choice([1, 2]),
+            "expense_name": rng.choice(["Fuel", "Stock", "Rent", "Staff", "Ads"]),
+            "amount": f"{amount * rate:,.2f}",
+            # only missing where the project currency is the organization's
+            "amount_org_ccy": f"{amount:.2f}" if i % 50 or rate != 1.0 else None,
+            "date_time_created": f"{day.isoformat()}T09:00:00.000Z" if i % 97 else None,
+        })
+        quantity = rng.randint(1, 6)
+        sale = {
+            "id": i,
+            "project_id": project,
+            "cycle_id": 7,
+            "customer_name": f"Customer {rng.randrange(40)}",
+            "product_id": rng.randrange(1, 15),
+            "quantity": quantity,
+            "price": f"{PRICE * rate:.2f}",
+            "status": rng.choice(["completed"] * 8 + ["pending", "cancelled"]),
+            "sale_date": (start + datetime.timedelta(days=rng.randrange(365))).isoformat(),
+        }
+        if i % 13 or rate != 1.0:
+            sale["amount"] = f"{PRICE * rate * quantity:.2f}"
+            sale["amount_org_ccy"] = f"{PRICE * quantity:.2f}"
+        sales.append(sale)
+    return expenses, sales
+
+
+# -- plain-Python reference: what the model (or a naive tool) would have to do per question --
+
+def _amount(value: Any) -> Optional[float]:
+    if value in (None, ""):
+        return None
+    return float(str(value).replace(",", ""))
+
+
+def _reference_rows(kind: str, expenses, sales, start: Optional[str], end: Optional[str]):
+    rows = []
+    if kind == "expenses":
+        for e in expenses:
+            amount = _amount(e["amount_org_ccy"]) if e["amount_org_ccy"] is not None else _amount(e["amount"])
+            day = (e["date_time_created"] or "")[:10] or None
+            rows.append((amount, day, e))
+    else:
+        for s in sales:
+            if s["status"] == "cancelled":
+                continue
+            recorded = s.get("amount_org_ccy") or s.get("amount")
+            amount = _amount(recorded) if recorded else s["quantity"] * float(s["price"])
+            rows.append((amount, s["sale_date"], s))
+    return [(a, d, r) for a, d, r in rows if (not start or (d and d >= start)) and (not end or (d and d <= end))]
+
+
+def _key(group_by: str, day: Optional[str], row: Dict[str, Any]) -> Optional[str]:
+    if group_by == "none":
+        return "all"
+    if group_by in ("day", "week", "month", "year"):
+        if not day:
+            return None
+        date = datetime.date.fromisoformat(day)
+        return {
+            "day": day,
+            "week": (date - datetime.timedelta(days=date.weekday())).isoformat(),
+            "month": day[:7],
+            "year": day[:4],
+        }[group_by]
+    if group_by == "category":
+        return CATEGORIES[row["category_id"]] if row["category_id"] else "Uncategorized"
+    if group_by == "vendor":
+        return VENDORS[row["vendor_id"]] if row["vendor_id"] else "No vendor"
+    if group_by == "customer":
+        return row["customer_name"]
+    if group_by == "project":
+        return PROJECTS[row["project_id"]][0]
+    raise ValueError(group_by)
+
+
+def reference(expenses, sales, measure: str, group_by: str = "none", start_date=None, end_date=None, **_) -> Dict[str, float]:
+    totals: Dict[str, float] = defaultdict(float)
+    for kind, sign in (("revenue", 1.0), ("expenses", -1.0)):
+        if measure not in (kind, "net_profit"):
+            continue
+        for amount, day, row in _reference_rows(kind, expenses, sales, start_date, end_date):
+            key = _key(group_by, day, row)
+            if key is not None:
+                totals[key] += amount * (sign if measure == "net_profit" else 1.0)
+    return dict(totals)
+
+
+QUERIES: List[Dict[str, Any]] = [
+    {"measure": "net_profit", "group_by": "month"},
+    {"measure": "expenses", "group_by": "category", "top": 5},
+    {"measure": "revenue", "group_by": "customer", "top": 10},
+    {"measure": "revenue", "group_by": "week", "start_date": "2026-01-01", "end_date": "2026-03-31"},
+    {"measure": "expenses", "start_date": "2026-03-01", "end_date": "2026-03-31"},
+    {"measure": "net_profit"},
+    {"measure": "expenses", "group_by": "vendor", "top": 3, "ascending": True},
+    {"measure": "net_profit", "group_by": "year"},
+    {"measure": "net_profit", "group_by": "project"},
+]
+
+
+def currency_check(ledger, sales) -> Optional[str]:
+    """None if revenue per project is in the organization currency, computed from quantity x PRICE."""
+    from analytics import analyze
+
+    expected: Dict[str, float] = defaultdict(float)
+    for s in sales:
+        if s["status"] != "cancelled":
+            expected[PROJECTS[s["project_id"]][0]] += s["quantity"] * PRICE
+    got = {g["project"]: g["total"] for g in analyze(ledger, measure="revenue", group_by="project")["groups"]}
+    for label, value in expected.items():
+        if abs(got.get(label, float("nan")) - value) > 0.011:
+            return f"{label}: {got.get(label)} != {value:.2f}"
+    return None
+
+
+def check(result: Dict[str, Any], expected: Dict[str, float], query: Dict[str, Any]) -> Optional[str]:
+    """None if `result` agrees with the reference totals, else what differs."""
+    column = "net_profit" if query["measure"] == "net_profit" else "total"
+    group_by = query.get("group_by", "none")
+    if group_by == "none":
+        got = result[column] if column == "net_profit" else result["total"]
+        return None if abs(got - round(expected.get("all", 0.0), 2)) < 0.011 else f"total {got} != {expected.get('all')}"
+    groups = {g[group_by]: g[column] for g in result["groups"]}
+    for label, value in groups.items():
+        if abs(value - expected.get(label, float("nan"))) > 0.011:
+            return f"{label}: {value} != {expected.get(label)}"
+    top = query.get("top")
+    if top:
+        ranked = sorted(expected.values(), reverse=not query.get("ascending"))[:top]
+        values = [g[column] for g in result["groups"]]
+        if len(values) != len(ranked) or any(abs(a - b) > 0.011 for a, b in zip(values, ranked)):
+            return f"top {top}: {values} != {[round(v, 2) for v in ranked]}"
+    elif query.get("group_by") in ("day", "week", "month", "year"):
+        if list(groups) != sorted(expected):
+            return f"buckets {list(groups)} != {sorted(expected)}"
+    elif set(groups) != set(expected):
+        return f"groups {sorted(groups)} != {sorted(expected)}"
+    return None
+
+
+def _timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def fixture_part(rows: int, repeat: int) -> bool:
+    from analytics import Ledger, analyze
+    from history import estimate_tokens
+
+    expenses, sales = fixture_rows(rows)
+    names = {
+        "categories": {str(k): v for k, v in CATEGORIES.items()},
+        "vendors": {str(k): v for k, v in VENDORS.items()},
+        "projects": {str(k): name for k, (name, _) in PROJECTS.items()},
+    }
+    started = time.perf_counter()
+    ledger = Ledger.from_records(expenses, sales, names)
+    built = time.perf_counter() - started
+    raw_tokens = estimate_tokens(json.dumps({"expenses": expenses})) + estimate_tokens(json.dumps({"sales": sales}))
+    print(f"fixture   {rows} expenses + {rows} sales   ledger built in {built * 1000:.0f} ms   "
+          f"{ledger.nbytes / 1024:.0f} KiB columnar   raw rows ~{raw_tokens:,} tokens")
+    print(f"  {'query':<62} {'check':<6} {'numpy':>9} {'python':>9} {'tokens':>7}")
+    ok = True
+    for query in QUERIES:
+        result = analyze(ledger, **query)
+        problem = check(result, reference(expenses, sales, **query), query)
+        ok &= problem is None
+        vectorized = _timed(lambda: analyze(ledger, **query), repeat)
+        python = _timed(lambda: reference(expenses, sales, **query), max(1, repeat // 10))
+        label = ", ".join(f"{k}={v}" for k, v in query.items())
+        print(f"  {label:<62} {'ok' if problem is None else 'FAIL':<6} {vectorized * 1000:7.2f}ms {python * 1000:7.1f}ms "
+              f"{estimate_tokens(json.dumps(result)):>7}")
+        if problem:
+            print(f"      {problem}")
+    problem = currency_check(ledger, sales)
+    ok &= problem is None
+    print(f"  {'two currencies: revenue by project in org currency':<62} {'ok' if problem is None else 'FAIL':<6}")
+    if problem:
+        print(f"      {problem}")
+    return ok
+
+
+async def stub_part(rows: int, api_latency: float, concurrency: int) -> None:
+    with StubApiServer(latency=api_latency, rows=rows) as stub:
+        from analytics import analyze_sales_expenses, ledger_cache
+        from entity_cache import entity_cache
+        from flame_api import flame_api, parse_api_key
+
+        # the client was configured at import; point it at this stub
+        flame_api.base_url = stub.url
+        user = {"configurable": {"flame_credential": parse_api_key(STUB_API_KEY)}}
+        state = {"activeOrganizationId": "1", "activeProjectId": 3, "activeCycleId": 7, "messages": []}
+
+        async def call(query: Dict[str, Any], cycle: int = 7) -> Tuple[float, Dict[str, Any]]:
+            started = time.perf_counter()
+            result = await analyze_sales_expenses.ainvoke({**query, "state": {**state, "activeCycleId": cycle}}, user)
+            return time.perf_counter() - started, result
+
+        print(f"\nstub API  {rows} expenses + {rows} sales per scope, {api_latency * 1000:.0f} ms per request")
+        for label, action in (
+            ("first call (loads the ledger)", None),
+            ("same scope, other question", None),
+            ("after an expense was logged", lambda: entity_cache.invalidate("1", ("expenses",))),
+        ):
+            if action:
+                action()
+            before = stub.requests
+            seconds, result = await call({"measure": "expenses", "group_by": "category", "top": 5} if "other" not in label
+                                         else {"measure": "net_profit", "group_by": "month"})
+            print(f"  {label:<32} {seconds * 1000:7.1f} ms   API requests {stub.requests - before}   success {result.get('success')}")
+        before = stub.requests
+        started = time.perf_counter()
+        results = await asyncio.gather(*(call({"measure": "revenue", "group_by": "status"}, cycle=8) for _ in range(concurrency)))
+        print(f"  {concurrency} concurrent calls, cold scope  {(time.perf_counter() - started) * 1000:7.1f} ms   "
+              f"API requests {stub.requests - before}   all succeeded {all(r.get('success') for _, r in results)}")
+        print(f"analytics {ledger_cache.stats()}")
+        await flame_api.aclose()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="fixture expenses (and as many sales)")
+    parser.add_argument("--repeat", type=int, default=50, help="timed repetitions per query")
+    parser.add_argument("--api-rows", type=int, default=2000, help="rows the stub API serves per resource")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="stub API latency per request, seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    ok = fixture_part(args.rows, args.repeat)
+    asyncio.run(stub_part(args.api_rows, args.api_latency, args.concurrency))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
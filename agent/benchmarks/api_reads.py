@@ -0,0 +1,71 @@
+"""
+Compare answering a data question through the frontend `listExpenses` action (the client
+runs it and starts a second graph run) with the backend `fetch_expenses` tool served by
+a local stub API (one graph run).
+
+Also exercises retries: the stub fails the first requests with 503.
+
+    python -m benchmarks.api_reads --latency 0.3 --api-latency 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List, Optional
+
+from benchmarks.fake_model import ScriptedChatModel, text_reply, tool_call_reply
+from benchmarks.scenarios import SCENARIOS, Scenario
+from benchmarks.stub_api import STUB_API_KEY, StubApiServer
+
+
+def _backend_read(messages, thread_id, index):
+    if index == 0:
+        return tool_call_reply("fetch_expenses", {"cycle_id": 7})
+    return text_reply("You have 120 expenses this cycle, mostly fuel.")
+
+
+BACKEND_READ = Scenario("backend_read", _backend_read, ["Show my expenses"])
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.3, help="scripted model latency per call, seconds")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="stub API latency per request, seconds")
+    parser.add_argument("--client-latency", type=float, default=0.15, help="browser round trip for a frontend action, seconds")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with StubApiServer(latency=args.api_latency, fail_first=2) as stub:
+        os.environ["FLAME_API_BASE_URL"] = stub.url
+        import agent
+        from benchmarks.run_graph import compile_graph, run_conversation
+        from entity_cache import entity_cache
+        from flame_api import flame_api, parse_api_key
+
+        user = {"flame_credential": parse_api_key(STUB_API_KEY)}
+
+        for scenario in (SCENARIOS["frontend_tool"], BACKEND_READ):
+            agent.model_registry.set_model_factory(
+                lambda model_name, **settings: ScriptedChatModel(responder=scenario.responder, latency=args.latency)
+            )
+            graph, _ = compile_graph("memory")
+            # the frontend scenario needs one client round trip per tool result turn
+            round_trips = sum(1 for turn in scenario.turns[1:] if not isinstance(turn, str))
+            samples = []
+            for _ in range(args.iterations):
+                # measure the API path, not reads answered by the entity cache
+                entity_cache.clear()
+                started = time.perf_counter()
+                result = await run_conversation(graph, scenario, checkpointed=True, configurable=user)
+                samples.append(time.perf_counter() - started + round_trips * args.client_latency)
+            print(f"{scenario.name:<16} graph runs {len(scenario.turns)}   super-steps {result['steps']}   "
+                  f"p50 {statistics.median(samples) * 1000:.0f} ms (incl. {round_trips} client round trip(s))")
+        agent.model_registry.set_model_factory(None)
+        print(f"flame_api        {flame_api.stats()}   stub requests {stub.requests}")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
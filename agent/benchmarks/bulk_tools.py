@@ -0,0 +1,93 @@
+"""
+Ingesting many expenses: one `logExpense` frontend call per record (a model hop plus a
+client round trip each) vs. a single `bulk_log_expenses` call, which validates the rows
+locally and posts them to a local stub API in concurrent chunks.
+
+A few deliberately invalid rows show per-row errors; they are rejected before any request.
+
+    python -m benchmarks.bulk_tools --rows 1000 --api-latency 0.02 --latency 0.3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_model import ScriptedChatModel, text_reply, tool_call_reply
+from benchmarks.scenarios import TOOL_RESULT, Scenario
+from benchmarks.stub_api import STUB_API_KEY, StubApiServer
+
+
+def receipt_rows(count: int, invalid_every: int = 0) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for i in range(count):
+        row: Dict[str, Any] = {"amount": round(3.5 + i % 40, 2), "expense_name": f"Receipt line {i}", "category_id": 1 + i % 5, "expense_date": "2026-03-14"}
+        if invalid_every and i % invalid_every == invalid_every - 1:
+            row["amount"] = "n/a"
+        rows.append(row)
+    return rows
+
+
+def per_record_scenario(count: int) -> Scenario:
+    rows = receipt_rows(count)
+
+    def responder(messages, thread_id, index):
+        if index < count:
+            return tool_call_reply("logExpense", rows[index])
+        return text_reply(f"Logged {count} expenses.")
+
+    return Scenario("per_record", responder, ["Log these receipt lines", *([TOOL_RESULT] * count)])
+
+
+def bulk_scenario(count: int, invalid_every: int) -> Scenario:
+    rows = receipt_rows(count, invalid_every)
+
+    def responder(messages, thread_id, index):
+        if index == 0:
+            return tool_call_reply("bulk_log_expenses", {"expenses": rows})
+        return text_reply("Saved the receipt lines.")
+
+    return Scenario("bulk", responder, ["Log these receipt lines"])
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000, help="rows in the bulk call")
+    parser.add_argument("--per-record", type=int, default=10, help="records logged one by one (extrapolated to rows/min)")
+    parser.add_argument("--latency", type=float, default=0.3, help="scripted model latency per call, seconds")
+    parser.add_argument("--client-latency", type=float, default=0.15, help="browser round trip for a frontend action, seconds")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="stub API latency per request, seconds")
+    parser.add_argument("--invalid-every", type=int, default=100, help="make every Nth bulk row invalid (0: none)")
+    args = parser.parse_args(argv)
+
+    with StubApiServer(latency=args.api_latency) as stub:
+        os.environ["FLAME_API_BASE_URL"] = stub.url
+        import agent
+        from benchmarks.run_graph import compile_graph, run_conversation
+        from bulk_tools import bulk_writer
+        from flame_api import parse_api_key
+
+        user = {"flame_credential": parse_api_key(STUB_API_KEY)}
+
+        for scenario, records, round_trips in (
+            (per_record_scenario(args.per_record), args.per_record, args.per_record),
+            (bulk_scenario(args.rows, args.invalid_every), args.rows, 0),
+        ):
+            agent.model_registry.set_model_factory(
+                lambda model_name, **settings: ScriptedChatModel(responder=scenario.responder, latency=args.latency)
+            )
+            graph, _ = compile_graph("memory")
+            started = time.perf_counter()
+            result = await run_conversation(graph, scenario, checkpointed=True, configurable=user)
+            seconds = time.perf_counter() - started + round_trips * args.client_latency
+            print(f"{scenario.name:<11} records {records:>5}   graph runs {len(scenario.turns):>3}   super-steps {result['steps']:>3}   "
+                  f"{seconds:6.2f} s   {records / seconds * 60:>8.0f} records/min")
+        agent.model_registry.set_model_factory(None)
+        print(f"bulk_writer {bulk_writer.stats()}")
+        print(f"stub        requests {stub.requests}   created {stub.created}")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,100 @@
+"""
+Measure checkpoint bytes written per client turn, with minimal state updates versus the
+old full-state echo (`state_updates.ECHO_UNCHANGED`).
+
+Counts the serialized size of every channel blob stored by `put` (only channels whose
+version changed), the part of it spent on the shared UI/plan keys, and pending writes recorded by
+`put_writes`.
+
+    python -m benchmarks.checkpoint_bytes
+    python -m benchmarks.checkpoint_bytes --scenario plan_loop
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+import agent
+import state_updates
+from benchmarks.fake_model import ScriptedChatModel
+from benchmarks.run_graph import run_conversation
+from benchmarks.scenarios import SCENARIOS, Scenario
+
+
+class CountingSaver(InMemorySaver):
+    """InMemorySaver that tallies serialized bytes and blob counts."""
+
+    def __init__(self):
+        super().__init__()
+        self.blob_bytes = 0
+        self.state_bytes = 0
+        self.blob_count = 0
+        self.write_bytes = 0
+        self.checkpoints = 0
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        values = checkpoint["channel_values"]
+        for channel in new_versions:
+            if channel in values:
+                size = len(self.serde.dumps_typed(values[channel])[1])
+                self.blob_bytes += size
+                self.blob_count += 1
+                if channel in state_updates.SHARED_STATE_DEFAULTS:
+                    self.state_bytes += size
+        self.checkpoints += 1
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        for _, value in writes:
+            self.write_bytes += len(self.serde.dumps_typed(value)[1])
+        return super().put_writes(config, writes, task_id, task_path)
+
+
+async def measure(scenario: Scenario, echo: bool, iterations: int) -> Dict[str, Any]:
+    state_updates.ECHO_UNCHANGED = echo
+    saver = CountingSaver()
+    graph = agent.workflow.compile(checkpointer=saver)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(iterations):
+                await run_conversation(graph, scenario, checkpointed=True)
+    finally:
+        state_updates.ECHO_UNCHANGED = False
+    turns = iterations * len(scenario.turns)
+    return {
+        "blob_bytes_per_turn": saver.blob_bytes / turns,
+        "state_bytes_per_turn": saver.state_bytes / turns,
+        "write_bytes_per_turn": saver.write_bytes / turns,
+        "blobs_per_turn": saver.blob_count / turns,
+        "checkpoints_per_turn": saver.checkpoints / turns,
+    }
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="all", help=f"one of {', '.join(SCENARIOS)} or 'all'")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args(argv)
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    for name in names:
+        scenario = SCENARIOS[name]
+        agent.model_registry.set_model_factory(lambda model_name, **settings: ScriptedChatModel(responder=scenario.responder))
+        try:
+            echo = await measure(scenario, True, args.iterations)
+            delta = await measure(scenario, False, args.iterations)
+        finally:
+            agent.model_registry.set_model_factory(None)
+        print(f"\n== {name} ==")
+        for key in echo:
+            before, after = echo[key], delta[key]
+            change = (1 - after / before) * 100 if before else 0.0
+            print(f"  {key:<22} echo {before:>10.1f}   delta {after:>10.1f}   (-{change:.0f}%)")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,126 @@
+"""
+Deterministic stand-in for ChatGroq used by the benchmarks.
+
+`ScriptedChatModel` answers each call with the next AIMessage produced by a responder
+function after a configurable delay, so graph overhead can be measured without network
+calls. Tool binding goes through the real OpenAI-schema conversion to keep its cost.
+`astream` spreads the latency over text chunks (`stream_chunks` of them) and split tool
+call arguments the way a provider stream would. With `validate_tools` it rejects a call to
+a tool that was not bound, after the text, as a provider validating tool calls does.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.config import get_config
+
+# (messages, thread_id, call_index) -> AIMessage
+Responder = Callable[[Sequence[BaseMessage], str, int], AIMessage]
+
+
+def text_reply(text: str) -> AIMessage:
+    return AIMessage(content=text, id=f"run-{uuid.uuid4()}")
+
+
+def tool_calls_reply(calls: Sequence[Tuple[str, Dict[str, Any]]], content: str = "") -> AIMessage:
+    return AIMessage(
+        content=content,
+        id=f"run-{uuid.uuid4()}",
+        tool_calls=[
+            {"name": name, "args": args or {}, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+            for name, args in calls
+        ],
+    )
+
+
+def tool_call_reply(name: str, args: Optional[Dict[str, Any]] = None, content: str = "") -> AIMessage:
+    return tool_calls_reply([(name, args or {})], content)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model returning scripted responses after `latency` seconds."""
+
+    responder: Callable[..., AIMessage]
+    latency: float = 0.0
+    stream_chunks: int = 0
+    validate_tools: bool = False
+    calls: Dict[str, int] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        formatted = [convert_to_openai_tool(t) if not isinstance(t, dict) else t for t in tools]
+        return self.bind(tools=formatted, **kwargs)
+
+    def _next(self, messages: List[BaseMessage], run_manager: Any) -> ChatResult:
+        metadata = getattr(run_manager, "metadata", None) or {}
+        thread_id = metadata.get("thread_id")
+        if thread_id is None:
+            # the streaming path does not hand a run manager to _astream
+            try:
+                thread_id = get_config().get("configurable", {}).get("thread_id")
+            except RuntimeError:
+                thread_id = None
+        thread_id = str(thread_id or "")
+        index = self.calls.get(thread_id, 0)
+        self.calls[thread_id] = index + 1
+        message = self.responder(messages, thread_id, index)
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        message.usage_metadata = {
+            "input_tokens": prompt_chars // 4,
+            "output_tokens": max(1, len(str(message.content)) // 4),
+            "total_tokens": prompt_chars // 4 + max(1, len(str(message.content)) // 4),
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._next(messages, run_manager)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._next(messages, run_manager)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._next(messages, run_manager).generations[0].message
+        parts = max(1, self.stream_chunks)
+        text = str(message.content)
+        step = max(1, -(-len(text) // parts)) if text else 1
+        pieces: List[AIMessageChunk] = [
+            AIMessageChunk(content=text[i:i + step], id=message.id) for i in range(0, len(text), step)
+        ]
+        for index, tc in enumerate(message.tool_calls):
+            args = json.dumps(tc["args"])
+            half = len(args) // 2
+            pieces.append(AIMessageChunk(content="", id=message.id, tool_call_chunks=[
+                {"name": tc["name"], "id": tc["id"], "args": args[:half], "index": index, "type": "tool_call_chunk"}
+            ]))
+            pieces.append(AIMessageChunk(content="", id=message.id, tool_call_chunks=[
+                {"name": None, "id": None, "args": args[half:], "index": index, "type": "tool_call_chunk"}
+            ]))
+        for offset, tc in enumerate(message.invalid_tool_calls, start=len(message.tool_calls)):
+            # malformed arguments, as a model that failed to produce valid JSON would stream them
+            pieces.append(AIMessageChunk(content="", id=message.id, tool_call_chunks=[
+                {"name": tc["name"], "id": tc["id"], "args": tc["args"], "index": offset, "type": "tool_call_chunk"}
+            ]))
+        pieces.append(AIMessageChunk(content="", id=message.id, usage_metadata=message.usage_metadata))
+        bound = {t["function"]["name"] for t in kwargs.get("tools") or []}
+        unbound = next((tc["name"] for tc in message.tool_calls if tc["name"] not in bound), None) if self.validate_tools else None
+        delay = self.latency / len(pieces) if self.latency else 0.0
+        for piece in pieces:
+            if unbound and piece.tool_call_chunks:
+                raise ValueError(f"tool call validation failed: attempted to call tool '{unbound}' which was not in request.tools")
+            if delay:
+                await asyncio.sleep(delay)
+            yield ChatGenerationChunk(message=piece)
@@ -0,0 +1,94 @@
+"""
+Cold-start profile of `import agent` (what a new pod pays before serving), plus the
+per-hop cost of preparing the tool binding.
+
+Each run imports the agent in a fresh interpreter with `-X importtime` and reports the
+wall time and the slowest imports, grouped by top-level package. The first run also
+writes the bytecode caches, so it is reported separately (`--runs` counts the rest).
+
+    python -m benchmarks.import_time --runs 5 --top 15
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+_CHILD = "import time; t = time.perf_counter(); import agent; print(time.perf_counter() - t)"
+
+
+def import_profile(cwd: str, env: Dict[str, str]) -> Tuple[float, List[Tuple[str, int, int, int]]]:
+    """(seconds, [(module, self us, cumulative us, depth)]) for one fresh `import agent`."""
+    proc = subprocess.run(
+        [sys.executable, "-W", "ignore", "-X", "importtime", "-c", _CHILD],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return float(proc.stdout.strip().splitlines()[-1]), modules
+
+
+def by_package(modules: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """Self time per top-level package, in microseconds."""
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in modules:
+        totals[name.split(".")[0]] += self_us
+    return totals
+
+
+def tool_binding_cost(hops: int) -> Tuple[float, float]:
+    """Seconds per hop to build the tool binding from scratch vs. the memoized lookup."""
+    import agent
+    from benchmarks.scenarios import frontend_actions
+
+    state = {"messages": [], "copilotkit": {"actions": frontend_actions(agent.FRONTEND_TOOL_ALLOWLIST)}}
+    started = time.perf_counter()
+    for _ in range(hops):
+        frontend = agent.allowed_frontend_tools(state)
+        bound = [*frontend[:agent.MAX_FRONTEND_TOOLS], *agent.backend_tools]
+        {agent._extract_tool_name(t) for t in bound}
+    rebuilt = (time.perf_counter() - started) / hops
+    started = time.perf_counter()
+    for _ in range(hops):
+        agent.tool_binding(state)
+    return rebuilt, (time.perf_counter() - started) / hops
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="warm-cache import runs")
+    parser.add_argument("--top", type=int, default=15, help="packages / modules to list")
+    parser.add_argument("--hops", type=int, default=20000, help="iterations for the per-hop tool binding timing")
+    args = parser.parse_args(argv)
+
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": cwd + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    first, _ = import_profile(cwd, env)
+    runs = [import_profile(cwd, env) for _ in range(args.runs)]
+    seconds = [s for s, _ in runs]
+    print(f"import agent   first run {first * 1000:.0f} ms   warm p50 {statistics.median(seconds) * 1000:.0f} ms   "
+          f"min {min(seconds) * 1000:.0f} ms   ({args.runs} runs)")
+
+    modules = min(runs)[1]
+    print(f"\nself time by top-level package (fastest run, {len(modules)} modules)")
+    for package, self_us in sorted(by_package(modules).items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {package:<28} {self_us / 1000:7.1f} ms")
+    print("\nslowest imports by cumulative time")
+    for name, self_us, cumulative_us, depth in sorted(modules, key=lambda m: -m[2])[:args.top]:
+        print(f"  {'  ' * min(depth, 6)}{name:<{44 - 2 * min(depth, 6)}} {cumulative_us / 1000:7.1f} ms  (self {self_us / 1000:.1f})")
+
+    rebuilt, memoized = tool_binding_cost(args.hops)
+    print(f"\ntool binding per hop   rebuilt {rebuilt * 1e6:.1f} us   memoized {memoized * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
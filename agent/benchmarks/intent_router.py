@@ -0,0 +1,100 @@
+"""
+Fast-path intent router: end-to-end latency and LLM calls for trivial UI requests with
+the router on and off, plus routing precision over a labelled phrase set.
+
+    python -m benchmarks.intent_router --latency 0.6
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import agent
+from benchmarks.fake_model import ScriptedChatModel
+from benchmarks.run_graph import compile_graph, run_conversation
+from benchmarks.scenarios import SCENARIOS
+from intent_router import IntentRouter
+
+# (message, expected tool or None when the LLM should handle it)
+LABELLED: List[Tuple[str, Optional[str]]] = [
+    ("Open the expense form", "openExpenseForm"),
+    ("please open the vendor form", "openVendorForm"),
+    ("Can you bring up the payment method form?", "openPaymentMethodForm"),
+    ("show the sales form", "openSaleForm"),
+    ("Open a new project form for me", "openProjectForm"),
+    ("launch the inventory item form", "openInventoryForm"),
+    ("go to sales", "navigateWorkspace"),
+    ("Take me to the reports page", "navigateWorkspace"),
+    ("navigate to the dashboard", "navigateWorkspace"),
+    ("go back to expenses please", "navigateWorkspace"),
+    ("show project 12", "viewProjectDetails"),
+    ("view sale #88", "viewSaleDetails"),
+    ("show me this cycle", "viewCycleDetails"),
+    ("open the expense form and log fuel 40", None),
+    ("go to sales, then record a sale of 3 burgers", None),
+    ("why did my expenses go up this month?", None),
+    ("log an expense of 25 for parking", None),
+    ("show my expenses", None),
+    ("show this project", None),  # no active project in the labelled state
+    ("what's on the reports page?", None),
+    ("create a project called Food truck", None),
+]
+
+
+def precision(router: IntentRouter) -> Tuple[int, int, int]:
+    handled = correct = wrong = 0
+    state = {"activeCycleId": "7"}
+    for text, expected in LABELLED:
+        match = router.classify(text, state)
+        if match is None or match.confidence < router.threshold:
+            continue
+        handled += 1
+        if match.tool == expected:
+            correct += 1
+        else:
+            wrong += 1
+    return handled, correct, wrong
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.6, help="scripted model latency per call, seconds")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    scenario = SCENARIOS["open_form"]
+    llm_calls = [0]
+
+    def responder(messages, thread_id, index):
+        llm_calls[0] += 1
+        return scenario.responder(messages, thread_id, index)
+
+    agent.model_registry.set_model_factory(
+        lambda model_name, **settings: ScriptedChatModel(responder=responder, latency=args.latency)
+    )
+    graph, _ = compile_graph("memory")
+    try:
+        for enabled in (False, True):
+            agent.INTENT_ROUTER_ENABLED = enabled
+            llm_calls[0] = 0
+            samples = []
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                await run_conversation(graph, scenario, checkpointed=True)
+                samples.append(time.perf_counter() - started)
+            print(f"router={'on ' if enabled else 'off'}   p50 {statistics.median(samples) * 1000:.0f} ms   "
+                  f"LLM calls/request {llm_calls[0] / args.iterations:.1f}")
+    finally:
+        agent.INTENT_ROUTER_ENABLED = True
+        agent.model_registry.set_model_factory(None)
+
+    handled, correct, wrong = precision(IntentRouter())
+    print(f"labelled phrases {len(LABELLED)}   routed {handled}   correct {correct}   wrong {wrong}")
+    print(f"intent_router    {agent.intent_router.stats()}")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
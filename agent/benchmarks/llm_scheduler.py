@@ -0,0 +1,167 @@
+"""
+LLM scheduler against a fake rate-limited provider.
+
+`FakeLimitedProvider` enforces request and token limits over a sliding window (scaled
+down from a minute so the run is short) and answers over-limit calls with 429 plus
+Groq-style `retry-after` / `x-ratelimit-*` headers; a fraction of calls fail with 503.
+Successful calls carry the same `x-ratelimit-*` headers. A burst of sessions (one
+interactive user turn followed by plan-continuation hops each) is run uncoordinated (each
+call retried on its own, like the provider SDK does) and through `LLMScheduler`: with
+the limits configured, and with no limits configured, learning them from the headers of
+failed calls only or of every call (what model_registry's httpx hook does).
+
+    python -m benchmarks.llm_scheduler --sessions 12 --rpm 20 --tpm 30000 --window 2
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from llm_scheduler import BACKGROUND, INTERACTIVE, LLMScheduler
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int, headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"provider error {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"status_code": status_code, "headers": headers or {}})()
+
+
+class FakeLimitedProvider:
+    """Sliding-window request/token limits with 429s, and random 503s."""
+
+    def __init__(self, rpm: int, tpm: int, window: float, latency: float, error_rate: float = 0.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.latency = latency
+        self.error_rate = error_rate
+        self._log: deque = deque()  # (time, tokens)
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def _headers(self, now: float) -> Dict[str, str]:
+        reset = (self._log[0][0] + self.window - now) if self._log else 0.0
+        used_tokens = sum(t for _, t in self._log)
+        return {
+            "retry-after": f"{max(reset, 0.01):.2f}",
+            "x-ratelimit-limit-tokens": str(self.tpm),
+            "x-ratelimit-remaining-tokens": str(max(0, self.tpm - used_tokens)),
+            "x-ratelimit-reset-tokens": f"{max(reset, 0.01):.2f}s",
+            "x-ratelimit-remaining-requests": str(max(0, self.rpm - len(self._log))),
+            "x-ratelimit-reset-requests": f"{max(reset, 0.01):.2f}s",
+        }
+
+    async def complete(self, tokens: int) -> Any:
+        now = time.monotonic()
+        self.requests += 1
+        while self._log and self._log[0][0] <= now - self.window:
+            self._log.popleft()
+        if len(self._log) + 1 > self.rpm or sum(t for _, t in self._log) + tokens > self.tpm:
+            self.rejected += 1
+            raise ProviderError(429, self._headers(now))
+        self._log.append((now, tokens))
+        await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            raise ProviderError(503)
+        # like Groq: the x-ratelimit-* headers on every response, retry-after only on a 429
+        headers = {k: v for k, v in self._headers(time.monotonic()).items() if k != "retry-after"}
+        return type("Response", (), {"usage_metadata": {"total_tokens": tokens}, "headers": headers})()
+
+
+async def _uncoordinated(call, retries: int = 2, backoff: float = 0.5):
+    # provider SDK default: a couple of retries with exponential backoff, no shared budget
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except ProviderError as error:
+            if attempt == retries or error.status_code not in (429, 503):
+                raise
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+
+async def run(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    provider = FakeLimitedProvider(args.rpm, args.tpm, args.window, args.latency, args.error_rate)
+    configured = not mode.startswith("learned")
+    scheduler = LLMScheduler(rpm=args.rpm if configured else 0, tpm=args.tpm if configured else 0,
+                             window=args.window, backoff=0.1, max_backoff=args.window)
+    latencies: Dict[str, List[float]] = {"interactive": [], "background": []}
+    failures = 0
+
+    async def complete() -> Any:
+        response = await provider.complete(args.tokens)
+        if mode == "learned_all":
+            # the response hook: every call's headers, not just a failure's
+            scheduler.observe_headers("fake-model", response.headers)
+        return response
+
+    async def one_call(priority: int) -> None:
+        nonlocal failures
+        call = complete
+        started = time.perf_counter()
+        try:
+            if mode != "uncoordinated":
+                # the fifo run drops the priorities to show what ranking user turns buys
+                await scheduler.run("fake-model", call, tokens=args.tokens - 400, priority=priority if mode == "scheduler" else INTERACTIVE)
+            else:
+                await _uncoordinated(call)
+        except ProviderError:
+            failures += 1
+            return
+        latencies["interactive" if priority == INTERACTIVE else "background"].append(time.perf_counter() - started)
+
+    async def session(index: int) -> None:
+        await asyncio.sleep(index * args.stagger)
+        await one_call(INTERACTIVE)
+        for _ in range(args.hops):
+            await one_call(BACKGROUND)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(args.sessions)))
+    result = {
+        "mode": mode,
+        "seconds": time.perf_counter() - started,
+        "failures": failures,
+        "provider_429": provider.rejected,
+        "provider_503": provider.errors,
+    }
+    for kind, samples in latencies.items():
+        samples.sort()
+        result[kind] = (statistics.median(samples), samples[int(len(samples) * 0.95) - 1]) if samples else (0.0, 0.0)
+    if mode != "uncoordinated":
+        result["stats"] = scheduler.stats()
+    return result
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=12)
+    parser.add_argument("--hops", type=int, default=4, help="plan-continuation calls per session")
+    parser.add_argument("--stagger", type=float, default=0.15, help="seconds between session starts")
+    parser.add_argument("--rpm", type=int, default=20, help="requests per window")
+    parser.add_argument("--tpm", type=int, default=30000, help="tokens per window")
+    parser.add_argument("--window", type=float, default=2.0, help="rate-limit window, seconds (a minute, scaled)")
+    parser.add_argument("--tokens", type=int, default=1800, help="tokens per call")
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    for mode in ("uncoordinated", "scheduler_fifo", "scheduler", "learned_errors", "learned_all"):
+        random.seed(7)
+        r = await run(mode, args)
+        print(f"{mode:<14} {r['seconds']:.1f} s   failed calls {r['failures']}   provider 429s {r['provider_429']}   503s {r['provider_503']}   "
+              f"interactive p50/p95 {r['interactive'][0] * 1000:.0f}/{r['interactive'][1] * 1000:.0f} ms   "
+              f"background p50/p95 {r['background'][0] * 1000:.0f}/{r['background'][1] * 1000:.0f} ms")
+        if "stats" in r:
+            print(f"{'':<14} {r['stats']}")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
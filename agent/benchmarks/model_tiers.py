@@ -0,0 +1,81 @@
+"""
+Tiered model routing: plan_loop latency with a single large model vs. large + fast
+tiers, plus an escalation run where the fast model emits an unparseable tool call.
+
+    python -m benchmarks.model_tiers --large-latency 0.6 --fast-latency 0.15
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage
+
+import agent
+from benchmarks.fake_model import ScriptedChatModel
+from benchmarks.run_graph import compile_graph, run_conversation
+from benchmarks.scenarios import SCENARIOS
+from model_tiers import tier_router
+
+FAST_MODEL = "llama-3.1-8b-instant"
+
+
+def _broken_tool_call(messages, thread_id, index):
+    return AIMessage(content="", invalid_tool_calls=[
+        {"name": "update_plan_progress", "args": '{"step_index": 0, "status": completed}', "id": "call_bad", "error": "bad json", "type": "invalid_tool_call"},
+    ])
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--large-latency", type=float, default=0.6, help="scripted large model latency per call, seconds")
+    parser.add_argument("--fast-latency", type=float, default=0.15, help="scripted fast model latency per call, seconds")
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    scenario = SCENARIOS["plan_loop"]
+    broken_fast = [False]
+    # both tiers advance one shared script per thread (each model instance counts its own calls)
+    steps: Dict[str, int] = {}
+
+    def scripted(messages, thread_id, index):
+        step = steps.get(thread_id, 0)
+        steps[thread_id] = step + 1
+        return scenario.responder(messages, thread_id, step)
+
+    def factory(model_name, **settings):
+        fast = model_name == FAST_MODEL
+        # a failed fast attempt does not advance the script; the large-tier retry replays the step
+        responder = _broken_tool_call if fast and broken_fast[0] else scripted
+        return ScriptedChatModel(responder=responder, latency=args.fast_latency if fast else args.large_latency)
+
+    agent.model_registry.set_model_factory(factory)
+    graph, _ = compile_graph("memory")
+    try:
+        for label, fast_model, broken in (("large only", "", False), ("large + fast", FAST_MODEL, False), ("fast broken", FAST_MODEL, True)):
+            os.environ["GROQ_FAST_MODEL"] = fast_model
+            broken_fast[0] = broken
+            agent.model_registry.set_model_factory(factory)
+            before = tier_router.stats()
+            samples = []
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                await run_conversation(graph, scenario, checkpointed=True)
+                samples.append(time.perf_counter() - started)
+            after = tier_router.stats()
+            calls = {tier: (after.get(f"{tier}_calls", 0) - before.get(f"{tier}_calls", 0)) / args.iterations for tier in ("large", "fast")}
+            escalations = (after["escalations"] - before["escalations"]) / args.iterations
+            print(f"{label:<13} p50 {statistics.median(samples) * 1000:.0f} ms   large calls/req {calls['large']:.1f}   "
+                  f"fast calls/req {calls['fast']:.1f}   escalations/req {escalations:.1f}")
+    finally:
+        os.environ.pop("GROQ_FAST_MODEL", None)
+        agent.model_registry.set_model_factory(None)
+    print(f"model_tiers   {tier_router.stats()}")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,198 @@
+"""
+Plan prediction: the inline list-copying implementation chat_node used before
+plan_state.PlanMachine vs. the machine, on plans of 10 to 500 steps.
+
+First checks that both produce the same plan state on random tool call sequences
+(set_plan, update_plan_progress, complete_plan, malformed args), then times one hop:
+prediction, the Command update and the remaining/completed checks.
+
+    python -m benchmarks.plan_state --steps 10 100 500 --hops 2000
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from plan_state import PlanMachine
+from state_updates import plan_steps_reducer, state_update
+
+STATUSES = ["pending", "in_progress", "completed", "blocked", "failed"]
+
+
+def legacy_predict_plan_updates(plan_steps: List[Dict[str, Any]], current_step_index: int, plan_status: str, tool_calls: List[Any]) -> Dict[str, Any]:
+    """The pre-PlanMachine implementation, kept verbatim for comparison."""
+    predicted_plan_steps = [dict(s) if isinstance(s, dict) else s for s in plan_steps]
+    predicted_current_index = current_step_index
+    predicted_plan_status = plan_status
+    for tc in tool_calls:
+        name = tc.get("name") if isinstance(tc, dict) else getattr(tc, "name", None)
+        args = tc.get("args") if isinstance(tc, dict) else getattr(tc, "args", {})
+        if not isinstance(args, dict):
+            try:
+                args = json.loads(args)
+            except Exception:
+                args = {}
+        if name == "set_plan":
+            raw_steps = args.get("steps") or []
+            predicted_plan_steps = [{"title": s if isinstance(s, str) else str(s), "status": "pending"} for s in raw_steps]
+            if predicted_plan_steps:
+                predicted_plan_steps[0]["status"] = "in_progress"
+                predicted_current_index = 0
+                predicted_plan_status = "in_progress"
+            else:
+                predicted_current_index = -1
+                predicted_plan_status = ""
+        elif name == "update_plan_progress":
+            idx = args.get("step_index")
+            status = args.get("status")
+            note = args.get("note")
+            if isinstance(idx, int) and 0 <= idx < len(predicted_plan_steps) and isinstance(status, str):
+                if note:
+                    predicted_plan_steps[idx]["note"] = note
+                predicted_plan_steps[idx]["status"] = status
+                if status == "in_progress":
+                    predicted_current_index = idx
+                    predicted_plan_status = "in_progress"
+                if status == "completed" and idx >= predicted_current_index:
+                    predicted_current_index = idx
+        elif name == "complete_plan":
+            for i in range(len(predicted_plan_steps)):
+                if predicted_plan_steps[i].get("status") != "completed":
+                    predicted_plan_steps[i]["status"] = "completed"
+            predicted_plan_status = "completed"
+    if predicted_plan_steps:
+        statuses = [str(s.get("status", "")) for s in predicted_plan_steps]
+        if any(st == "failed" for st in statuses):
+            predicted_plan_status = "failed"
+        elif any(st == "in_progress" for st in statuses):
+            predicted_plan_status = "in_progress"
+        elif any(st == "blocked" for st in statuses):
+            predicted_plan_status = "blocked"
+        else:
+            predicted_plan_status = predicted_plan_status or ""
+        active_idx = next((i for i, s in enumerate(predicted_plan_steps) if str(s.get("status", "")) == "in_progress"), -1)
+        if active_idx == -1:
+            last_completed = -1
+            for i, s in enumerate(predicted_plan_steps):
+                if str(s.get("status", "")) == "completed":
+                    last_completed = i
+            promote_idx = next((i for i in range(last_completed + 1, len(predicted_plan_steps)) if str(predicted_plan_steps[i].get("status", "")) == "pending"), -1)
+            if promote_idx == -1:
+                promote_idx = next((i for i, s in enumerate(predicted_plan_steps) if str(s.get("status", "")) == "pending"), -1)
+            if promote_idx != -1:
+                predicted_plan_steps[promote_idx]["status"] = "in_progress"
+                predicted_current_index = promote_idx
+                predicted_plan_status = "in_progress"
+    plan_updates: Dict[str, Any] = {}
+    if predicted_plan_steps != plan_steps:
+        plan_updates["planSteps"] = predicted_plan_steps
+    if predicted_current_index != current_step_index:
+        plan_updates["currentStepIndex"] = predicted_current_index
+    if predicted_plan_status != plan_status:
+        plan_updates["planStatus"] = predicted_plan_status
+    return plan_updates
+
+
+def random_plan(rng: random.Random, size: int) -> Dict[str, Any]:
+    steps = [{"title": f"Step {i}", "status": rng.choice(STATUSES)} for i in range(size)]
+    if steps and rng.random() < 0.3:
+        steps[rng.randrange(size)]["note"] = "earlier note"
+    if steps and rng.random() < 0.1:
+        del steps[rng.randrange(size)]["status"]
+    return {"planSteps": steps, "currentStepIndex": rng.randrange(-1, size) if size else -1, "planStatus": rng.choice(["", *STATUSES])}
+
+
+def random_calls(rng: random.Random, size: int) -> List[Dict[str, Any]]:
+    calls: List[Dict[str, Any]] = []
+    for _ in range(rng.randint(0, 4)):
+        roll = rng.random()
+        if roll < 0.1:
+            calls.append({"name": "set_plan", "args": {"steps": [f"New {i}" for i in range(rng.randint(0, 5))]}})
+        elif roll < 0.18:
+            calls.append({"name": "complete_plan", "args": {}})
+        elif roll < 0.25:
+            calls.append({"name": "update_plan_progress", "args": json.dumps({"step_index": rng.randrange(max(size, 1)), "status": "completed"})})
+        elif roll < 0.3:
+            calls.append({"name": "update_plan_progress", "args": {"step_index": "1", "status": "completed"}})
+        elif roll < 0.35:
+            calls.append({"name": "getExpenses", "args": {}})
+        else:
+            args: Dict[str, Any] = {"step_index": rng.randrange(-1, size + 1), "status": rng.choice(STATUSES)}
+            if rng.random() < 0.3:
+                args["note"] = "done"
+            calls.append({"name": "update_plan_progress", "args": args})
+    return calls
+
+
+def resolved(state: Dict[str, Any], updates: Dict[str, Any]) -> Dict[str, Any]:
+    """Plan state after a Command carrying `updates` is applied."""
+    update = state_update(state, **updates)
+    return {
+        "planSteps": plan_steps_reducer(state["planSteps"], update.get("planSteps")),
+        "currentStepIndex": update.get("currentStepIndex", state["currentStepIndex"]),
+        "planStatus": update.get("planStatus", state["planStatus"]),
+    }
+
+
+def check_equivalence(cases: int, seed: int) -> int:
+    rng = random.Random(seed)
+    for case in range(cases):
+        state = random_plan(rng, rng.choice([0, 1, 3, 8, 20]))
+        calls = random_calls(rng, len(state["planSteps"]))
+        args = (state["planSteps"], state["currentStepIndex"], state["planStatus"], calls)
+        legacy = resolved(state, legacy_predict_plan_updates(*args))
+        machine = PlanMachine(*args[:3]).apply_all(calls)
+        current = resolved(state, machine.updates())
+        if current != legacy or machine.to_list() != legacy["planSteps"]:
+            raise AssertionError(f"case {case} differs:\nstate={state}\ncalls={calls}\nlegacy={legacy}\nmachine={current}")
+    return cases
+
+
+def legacy_hop(state: Dict[str, Any], calls: List[Dict[str, Any]]) -> Any:
+    updates = legacy_predict_plan_updates(state["planSteps"], state["currentStepIndex"], state["planStatus"], calls)
+    steps = updates.get("planSteps", state["planSteps"])
+    has_remaining = bool(steps) and any(s.get("status") not in ("completed", "failed") for s in steps)
+    all_completed = bool(steps) and all(s.get("status") == "completed" for s in steps)
+    return state_update(state, **updates), has_remaining, all_completed
+
+
+def machine_hop(state: Dict[str, Any], calls: List[Dict[str, Any]]) -> Any:
+    plan = PlanMachine(state["planSteps"], state["currentStepIndex"], state["planStatus"]).apply_all(calls)
+    return state_update(state, **plan.updates()), plan.has_remaining(), plan.all_completed()
+
+
+def time_hops(hop, size: int, hops: int) -> float:
+    """Mean seconds per hop walking a `size`-step plan: complete the active step, start the next."""
+    state = {"planSteps": [{"title": f"Step {i}", "status": "pending"} for i in range(size)], "currentStepIndex": 0, "planStatus": "in_progress"}
+    state["planSteps"][0]["status"] = "in_progress"
+    started = time.perf_counter()
+    for n in range(hops):
+        index = n % size
+        calls = [
+            {"name": "update_plan_progress", "args": {"step_index": index, "status": "completed", "note": "ok"}},
+            {"name": "getExpenses", "args": {}},
+        ]
+        hop(state, calls)
+    return (time.perf_counter() - started) / hops
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--hops", type=int, default=2000)
+    parser.add_argument("--cases", type=int, default=5000, help="random sequences for the equivalence check")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    print(f"equivalence: {check_equivalence(args.cases, args.seed)} random cases match the inline implementation")
+    print(f"{'steps':>6} {'inline_us':>10} {'machine_us':>11} {'speedup':>8}")
+    for size in args.steps:
+        legacy = time_hops(legacy_hop, size, args.hops)
+        machine = time_hops(machine_hop, size, args.hops)
+        print(f"{size:>6} {legacy * 1e6:>10.1f} {machine * 1e6:>11.1f} {legacy / machine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Measure speculative context prefetch (prefetch.py) against a local stub API.
+
+Each case is one user turn on the expense page of an active cycle, answered by a scripted
+model: most call a backend read (or two) and then answer, one is small talk, and one
+reads with filters the prefetch did not predict. Every case runs with prefetch off, then
+on. The report shows per-case turn latency (p50), API requests per turn and, with
+prefetch on, what the prefetched reads became: hits (joined in flight), cancelled,
+expired unclaimed. The entity cache is cleared before every turn, so each read goes to
+the API or the prefetch.
+
+    python -m benchmarks.prefetch --latency 0.3 --api-latency 0.15
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.fake_model import ScriptedChatModel, text_reply, tool_calls_reply
+from benchmarks.stub_api import STUB_API_KEY, StubApiServer
+
+
+class Case(NamedTuple):
+    name: str
+    question: str
+    # backend reads the model makes before answering (one hop, possibly parallel calls)
+    reads: Sequence[Tuple[str, Dict[str, Any]]]
+
+
+CASES = [
+    Case("expense_question", "How much did I spend on fuel this cycle?", [("fetch_expenses", {})]),
+    Case("log_expense", "Log a $40 fuel expense paid by card", [("fetch_expense_categories", {}), ("fetch_payment_methods", {})]),
+    Case("profit_report", "What's my profit this cycle?", [("fetch_report_summary", {})]),
+    Case("unpredicted_read", "Which sales of product 4 are still pending?", [("fetch_sales", {"product_id": 4, "status": "pending"})]),
+    Case("small_talk", "Thanks, that's all for now", []),
+]
+
+STATE = {"activeOrganizationId": "1", "activeProjectId": "3", "activeCycleId": "7", "currentView": "/expense-management"}
+
+
+def _responder(cases: Dict[str, Case]):
+    def respond(messages, thread_id, index):
+        case = cases[thread_id.split(":")[0]]
+        if index == 0 and case.reads:
+            return tool_calls_reply(case.reads)
+        return text_reply("Here you go.")
+
+    return respond
+
+
+async def run_case(graph, case: Case, user: Dict[str, Any]) -> float:
+    config = {"configurable": {**user, "thread_id": f"{case.name}:{uuid.uuid4()}"}, "recursion_limit": 20}
+    payload = {"messages": [HumanMessage(content=case.question)], "copilotkit": {"actions": []}, **STATE}
+    started = time.perf_counter()
+    await graph.ainvoke(payload, config)
+    return time.perf_counter() - started
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.3, help="scripted model latency per call, seconds")
+    parser.add_argument("--api-latency", type=float, default=0.15, help="stub API latency per request, seconds")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with StubApiServer(latency=args.api_latency) as stub:
+        os.environ["FLAME_API_BASE_URL"] = stub.url
+        import agent
+        from entity_cache import entity_cache
+        from flame_api import parse_api_key
+        from langgraph.checkpoint.memory import InMemorySaver
+        from prefetch import context_prefetcher
+
+        agent.model_registry.set_model_factory(
+            lambda model_name, **settings: ScriptedChatModel(responder=_responder({c.name: c for c in CASES}), latency=args.latency)
+        )
+        graph = agent.workflow.compile(checkpointer=InMemorySaver())
+        user = {"flame_credential": parse_api_key(STUB_API_KEY)}
+        devnull = open(os.devnull, "w")
+        print(f"model latency {args.latency * 1000:.0f} ms   API latency {args.api_latency * 1000:.0f} ms")
+        try:
+            for case in CASES:
+                row = []
+                for enabled in (False, True):
+                    context_prefetcher.set_enabled(enabled)
+                    context_prefetcher.clear()
+                    before = context_prefetcher.stats()
+                    requests = stub.requests
+                    samples = []
+                    with contextlib.redirect_stdout(devnull):
+                        for _ in range(args.iterations):
+                            entity_cache.clear()
+                            samples.append(await run_case(graph, case, user))
+                            # let cancelled reads settle before counting requests
+                            await asyncio.sleep(args.api_latency)
+                    context_prefetcher.clear()
+                    after = context_prefetcher.stats()
+                    delta = {key: after[key] - before[key] for key in ("started", "hits", "joined_in_flight", "cancelled", "expired", "stale", "failed")}
+                    row.append((statistics.median(samples) * 1000, (stub.requests - requests) / args.iterations, delta))
+                (off_ms, off_requests, _), (on_ms, on_requests, delta) = row
+                print(f"{case.name:<17} off p50 {off_ms:5.0f} ms  {off_requests:.1f} req/turn   "
+                      f"on p50 {on_ms:5.0f} ms  {on_requests:.1f} req/turn  ({(on_ms - off_ms) / off_ms * 100:+.0f}%)   "
+                      f"prefetched {delta['started']} hits {delta['hits']} (joined {delta['joined_in_flight']}) "
+                      f"cancelled {delta['cancelled']} expired {delta['expired']}")
+        finally:
+            devnull.close()
+            context_prefetcher.set_enabled(True)
+            agent.model_registry.set_model_factory(None)
+        stats = context_prefetcher.stats()
+        print(f"prefetch total   hit rate {stats['hit_rate']:.0%}   wasted {stats['wasted']} of {stats['started']}   "
+              f"API time saved {stats['saved_seconds']:.2f} s")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,271 @@
+"""
+Replay recorded graph runs (see tracing.py) against the current `graph`, offline.
+
+Each trace is re-executed on a fresh in-memory thread. Its model responses come back in
+recorded order from a scripted model, and its backend tool results are served by
+`tool_node` instead of calling the Flame API. The replayed run is recorded too, and the
+two are compared:
+
+- per node and span, the time the graph itself spent: recorded vs. replayed. Model time
+  is subtracted, since the replay answers instantly. Tool-node times are listed but are
+  not comparable, because the recorded ones include the API.
+- divergences: a different route (node sequence / `Command.goto`), plan state, number
+  of model calls per hop, or set of tools bound for a call
+
+Recorded timings come from another machine and load, so compare a change against a
+replay of the same traces on the baseline code (`--json`, then `--baseline`).
+
+Only runs that start at the graph entry are replayed. A run resumed mid-graph depends on
+checkpointed state that is not in its trace.
+
+    FLAME_TRACE=1 python server.py ...                  # record
+    python -m benchmarks.replay .flame_traces --json before.json   # on the baseline commit
+    python -m benchmarks.replay .flame_traces --baseline before.json
+    python -m benchmarks.replay --demo                  # record the benchmark scenarios, then replay them
+"""
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+
+from benchmarks.fake_model import ScriptedChatModel, text_reply
+
+
+class ReplayResponder:
+    """Recorded responses per thread, in call order; counts calls past the recording."""
+
+    def __init__(self):
+        self.responses: Dict[str, List[AIMessage]] = {}
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.extra: Dict[str, int] = defaultdict(int)
+
+    def __call__(self, messages, thread_id: str, index: int) -> AIMessage:
+        # the scripted model counts calls per model instance; tiers use separate instances
+        call = self.calls[thread_id]
+        self.calls[thread_id] += 1
+        recorded = self.responses.get(thread_id, [])
+        if call < len(recorded):
+            return recorded[call].model_copy(deep=True)
+        self.extra[thread_id] += 1
+        return text_reply("")
+
+
+def trace_paths(inputs: List[str]) -> List[str]:
+    paths: List[str] = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "*.jsonl.gz"))))
+        else:
+            paths.append(item)
+    return paths
+
+
+def _model_ms(event: Dict[str, Any]) -> float:
+    return sum(call["ms"] for call in event.get("llm", []))
+
+
+def compare(recorded: Dict[str, Any], replayed: Dict[str, Any]) -> List[str]:
+    """Divergences of `replayed` from `recorded`, first ones first."""
+    problems: List[str] = []
+    before, after = recorded["events"], replayed["events"]
+    route_a = [(e["node"], e["goto"]) for e in before]
+    route_b = [(e["node"], e["goto"]) for e in after]
+    if route_a != route_b:
+        hop = next((i for i, (a, b) in enumerate(zip(route_a, route_b)) if a != b), min(len(route_a), len(route_b)))
+        show = lambda route: " -> ".join(f"{n}>{g}" for n, g in route[hop:hop + 2]) or "(ended)"
+        problems.append(f"route differs at hop {hop}: recorded {show(route_a)}, replayed {show(route_b)}")
+    for hop, (a, b) in enumerate(zip(before, after)):
+        if a["node"] != b["node"]:
+            break
+        if a.get("plan") != b.get("plan"):
+            problems.append(f"plan state differs after hop {hop} ({a['node']}): recorded {a.get('plan')}, replayed {b.get('plan')}")
+        calls_a, calls_b = a.get("llm", []), b.get("llm", [])
+        if len(calls_a) != len(calls_b):
+            problems.append(f"model calls at hop {hop}: recorded {len(calls_a)}, replayed {len(calls_b)}")
+        for n, (x, y) in enumerate(zip(calls_a, calls_b)):
+            if x["tools"] != y["tools"]:
+                added = sorted(set(y["tool_names"]) - set(x["tool_names"]))
+                removed = sorted(set(x["tool_names"]) - set(y["tool_names"]))
+                change = " ".join([*(f"+{t}" for t in added), *(f"-{t}" for t in removed)]) or "same names, other schemas"
+                problems.append(f"tool binding of call {n} at hop {hop}: {change}")
+    if recorded["outcome"] != replayed["outcome"]:
+        problems.append(f"outcome: recorded {recorded['outcome']}, replayed {replayed['outcome']}")
+    return problems
+
+
+class Timings:
+    """Graph time per node and span, recorded vs. replayed, over hops that lined up."""
+
+    def __init__(self):
+        self.samples: Dict[Tuple[str, str], Tuple[List[float], List[float]]] = defaultdict(lambda: ([], []))
+
+    def add(self, recorded: Dict[str, Any], replayed: Dict[str, Any]) -> None:
+        for a, b in zip(recorded["events"], replayed["events"]):
+            if a["node"] != b["node"]:
+                break
+            self._sample(a["node"], "(graph)", a["ms"] - _model_ms(a), b["ms"] - _model_ms(b))
+            for span, ms in a.get("spans", {}).items():
+                if span in b.get("spans", {}) and span != "llm_call":
+                    self._sample(a["node"], span, ms, b["spans"][span])
+
+    def _sample(self, node: str, span: str, before: float, after: float) -> None:
+        samples = self.samples[(node, span)]
+        samples[0].append(before)
+        samples[1].append(after)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        rows = []
+        for (node, span), (before, after) in sorted(self.samples.items()):
+            p50_a, p50_b = statistics.median(before), statistics.median(after)
+            rows.append({
+                "node": node,
+                "span": span,
+                "hops": len(before),
+                "recorded_p50_ms": p50_a,
+                "replayed_p50_ms": p50_b,
+                "delta_pct": (p50_b - p50_a) / p50_a * 100 if p50_a > 0 else 0.0,
+            })
+        return rows
+
+
+async def replay(paths: List[str], show: int, latency: float) -> Dict[str, Any]:
+    import agent
+    from langgraph.checkpoint.memory import InMemorySaver
+    from tracing import read_traces, trace_input, trace_recorder, trace_responses, trace_tool_results
+
+    responder = ReplayResponder()
+    agent.model_registry.set_model_factory(lambda model_name, **settings: ScriptedChatModel(responder=responder, latency=latency))
+    graph = agent.workflow.compile(checkpointer=InMemorySaver())
+    timings = Timings()
+    replayed = skipped = failed = 0
+    diverged: List[Tuple[str, List[str]]] = []
+    devnull = open(os.devnull, "w")
+    try:
+        with trace_recorder.capture() as capture:
+            for run in read_traces(paths):
+                if run["entry"] != "intent_router":
+                    skipped += 1
+                    continue
+                thread_id = f"replay-{run['id']}-{uuid.uuid4().hex[:6]}"
+                responder.responses[thread_id] = trace_responses(run)
+                capture.substitute(thread_id, trace_tool_results(run))
+                config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 100}
+                try:
+                    with contextlib.redirect_stdout(devnull):
+                        await graph.ainvoke(trace_input(run), config)
+                except Exception as exc:
+                    failed += 1
+                    diverged.append((run["id"], [f"replay raised {type(exc).__name__}: {exc}"]))
+                    continue
+                replayed += 1
+                result = capture.runs[-1]
+                problems = compare(run, result)
+                if responder.extra.get(thread_id):
+                    problems.append(f"{responder.extra[thread_id]} model call(s) past the recorded ones")
+                if problems:
+                    diverged.append((run["id"], problems))
+                timings.add(run, result)
+                if replayed <= show:
+                    route = " ".join(f"{e['node']}({e['ms']:.1f}ms)" for e in result["events"])
+                    print(f"trace {run['id']}  recorded {run['ms']:.1f} ms  replayed {result['ms']:.1f} ms  {route}")
+    finally:
+        devnull.close()
+        agent.model_registry.set_model_factory(None)
+    return {"replayed": replayed, "skipped_resumed": skipped, "failed": failed, "diverged": diverged, "timings": timings.rows()}
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    before = {(row["node"], row["span"]): row["replayed_p50_ms"] for row in (baseline or {}).get("timings", [])}
+    print(f"\nreplayed {report['replayed']}   skipped (resumed mid-graph) {report['skipped_resumed']}   "
+          f"failed {report['failed']}   diverged {len(report['diverged'])}")
+    reference = "baseline p50" if baseline else "recorded p50"
+    print(f"  {'node':<14} {'span':<18} {'hops':>5} {reference:>13} {'replayed p50':>13} {'delta':>8}")
+    for row in report["timings"]:
+        key = (row["node"], row["span"])
+        if baseline:
+            if key not in before:
+                continue
+            earlier, note = before[key], ""
+        else:
+            earlier = row["recorded_p50_ms"]
+            note = "  (recorded incl. API)" if row["node"] == "tool_node" and row["span"] == "(graph)" else ""
+        delta = (row["replayed_p50_ms"] - earlier) / earlier * 100 if earlier > 0 else 0.0
+        print(f"  {row['node']:<14} {row['span']:<18} {row['hops']:>5} {earlier:>10.3f} ms "
+              f"{row['replayed_p50_ms']:>10.3f} ms {delta:>+7.1f}%{note}")
+    for trace_id, problems in report["diverged"]:
+        print(f"  trace {trace_id}:")
+        for problem in problems:
+            print(f"      {problem}")
+
+
+async def record_demo(directory: str) -> None:
+    """Record the run_graph scenarios (scripted model, in-memory checkpointer) to `directory`."""
+    import agent
+    from benchmarks.run_graph import compile_graph, run_conversation
+    from benchmarks.scenarios import SCENARIOS
+    from tracing import trace_recorder
+
+    trace_recorder.enabled, trace_recorder.directory = True, directory
+    devnull = open(os.devnull, "w")
+    try:
+        for scenario in SCENARIOS.values():
+            agent.model_registry.set_model_factory(
+                lambda model_name, _s=scenario, **settings: ScriptedChatModel(responder=_s.responder, latency=0.002)
+            )
+            graph, checkpointed = compile_graph("memory")
+            with contextlib.redirect_stdout(devnull):
+                for _ in range(3):
+                    await run_conversation(graph, scenario, checkpointed)
+        trace_recorder.flush()
+    finally:
+        devnull.close()
+        trace_recorder.enabled = False
+        agent.model_registry.set_model_factory(None)
+    stats = trace_recorder.stats()
+    print(f"recorded {stats['written']} runs to {directory}   {stats['bytes_written'] / 1024:.1f} KiB compressed   "
+          f"{stats['bytes_per_run']:.0f} bytes/run   writer {stats['write_ms']:.2f} ms/run (off the graph's path)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="trace files or directories of them")
+    parser.add_argument("--demo", action="store_true", help="record the benchmark scenarios to a temp dir first")
+    parser.add_argument("--show", type=int, default=0, help="print the first N replayed runs")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per replayed model call")
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    parser.add_argument("--baseline", help="a --json report to compare timings against, instead of the recording")
+    args = parser.parse_args(argv)
+
+    paths = list(args.paths)
+    if args.demo:
+        directory = tempfile.mkdtemp(prefix="flame-traces-")
+        asyncio.run(record_demo(directory))
+        paths.append(directory)
+    paths = trace_paths(paths)
+    if not paths:
+        parser.error("no trace files (pass paths, or --demo)")
+    report = asyncio.run(replay(paths, args.show, args.latency))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["diverged"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Response cache: one user asks overlapping read-only questions across threads (exact
+repeats, paraphrases, a different cycle number), with an expense logged halfway through. Reports end-to-end time, LLM calls and cache hit rate with the cache off and on,
+then checks that near-miss questions (paid/unpaid, ascending/descending, operands swapped, ...) asked after
+their counterpart are not answered from the cache.
+
+    python -m benchmarks.response_cache --latency 0.5
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage
+
+import agent
+from benchmarks.fake_model import ScriptedChatModel, text_reply, tool_call_reply
+from benchmarks.run_graph import compile_graph
+from benchmarks.scenarios import answer_frontend_calls, frontend_actions
+from benchmarks.stub_api import STUB_API_KEY
+from entity_cache import entity_cache
+from flame_api import parse_api_key
+from response_cache import response_cache
+
+QUESTIONS: List[str] = [
+    "What's my net profit this cycle?",
+    "what is my net profit this cycle",
+    "Tell me my net profit for this cycle please",
+    "Total expenses by category",
+    "show total expenses by category",
+    "total spending by category?",
+    "Expenses by category, total please",
+    "How much did we spend in cycle 3?",
+    "How much did we spend in cycle 4?",
+    "how much have we spent in cycle 3",
+    "LOG",  # logExpense: invalidates cached expense answers
+    "Total expenses by category",
+    "total expenses by category",
+    "What's my net profit this cycle?",
+]
+
+# (cached question, question that needs a different answer; cosine 0.90-0.95, above the threshold)
+NEAR_MISSES: List[Tuple[str, str]] = [
+    ("What is the total amount of all paid sales this cycle grouped by customer name",
+     "What is the total amount of all unpaid sales this cycle grouped by customer name"),
+    ("List all expenses this cycle with vendor and category sorted by amount ascending",
+     "List all expenses this cycle with vendor and category sorted by amount descending"),
+    ("How much did we spend on travel this cycle across all projects and payment methods",
+     "How much did we spend on fuel this cycle across all projects and payment methods"),
+    ("Show total sales this cycle and last cycle broken down by week for top customers",
+     "Show total sales this cycle and last cycle broken down by week for top vendors"),
+    ("Which sales this cycle are pending payment and which customers still owe balances",
+     "Which sales this cycle are not pending payment and which customers still owe balances"),
+    # same words, operands swapped
+    ("What is sales minus expenses this cycle across all projects and customers",
+     "What is expenses minus sales this cycle across all projects and customers"),
+    ("Compare sales this cycle to sales last cycle broken down by customer",
+     "Compare sales last cycle to sales this cycle broken down by customer"),
+    ("How much did expenses grow from cycle 3 to cycle 4 for each project",
+     "How much did expenses grow from cycle 4 to cycle 3 for each project"),
+]
+
+
+def _responder(messages, thread_id, index):
+    question = next(m.content for m in reversed(messages) if m.type == "human")
+    if question == "Log fuel 40":
+        return tool_call_reply("logExpense", {"amount": 40, "expense_name": "Fuel"}) if index == 0 else text_reply("Logged.")
+    if index == 0:
+        return tool_call_reply("listExpenses", {})
+    return text_reply(f"Answer to: {question}")
+
+
+async def ask(graph, text: str) -> None:
+    # answers are only cached per user, so every thread runs as the same one
+    config = {"configurable": {"thread_id": f"rc-{uuid.uuid4()}", "flame_credential": parse_api_key(STUB_API_KEY)}}
+    payload = {"messages": [HumanMessage(content=text)], "copilotkit": {"actions": frontend_actions(agent.FRONTEND_TOOL_ALLOWLIST)}}
+    values = await graph.ainvoke(payload, config)
+    results = answer_frontend_calls(values["messages"])
+    if results:
+        await graph.ainvoke({"messages": results}, config)
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="scripted model latency per call, seconds")
+    args = parser.parse_args(argv)
+
+    llm_calls = [0]
+
+    def responder(messages, thread_id, index):
+        llm_calls[0] += 1
+        return _responder(messages, thread_id, index)
+
+    agent.model_registry.set_model_factory(lambda model_name, **settings: ScriptedChatModel(responder=responder, latency=args.latency))
+    graph, _ = compile_graph("memory")
+    try:
+        for enabled in (False, True):
+            response_cache.set_enabled(enabled)
+            response_cache.clear()
+            entity_cache.clear()
+            llm_calls[0] = 0
+            started = time.perf_counter()
+            answered_from_cache = []
+            for question in QUESTIONS:
+                text = "Log fuel 40" if question == "LOG" else question
+                before = response_cache.stats()
+                # one thread per question; a cached answer has no tool calls, so there is no
+                # client round trip to make
+                await ask(graph, text)
+                after = response_cache.stats()
+                hit = (after["exact_hits"] + after["similar_hits"]) > (before["exact_hits"] + before["similar_hits"])
+                answered_from_cache.append("H" if hit else ".")
+            total = time.perf_counter() - started
+            print(f"cache={'on ' if enabled else 'off'}   {total:.2f} s for {len(QUESTIONS)} questions   LLM calls {llm_calls[0]}   "
+                  f"hits {''.join(answered_from_cache)}")
+        print(f"response_cache {response_cache.stats()}")
+        response_cache.set_enabled(True)
+        wrong = []
+        for cached, other in NEAR_MISSES:
+            await ask(graph, cached)
+            before = response_cache.stats()["similar_hits"] + response_cache.stats()["exact_hits"]
+            await ask(graph, other)
+            if response_cache.stats()["similar_hits"] + response_cache.stats()["exact_hits"] > before:
+                wrong.append(other)
+        print(f"near misses  {len(NEAR_MISSES) - len(wrong)}/{len(NEAR_MISSES)} answered by the model" + "".join(f"\n  cached answer reused for: {q}" for q in wrong))
+    finally:
+        response_cache.set_enabled(False)
+        agent.model_registry.set_model_factory(None)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,190 @@
+"""
+Benchmark the compiled `graph` against a scripted fake model.
+
+Reports, per scenario: per-node latency, super-steps per request, final state size
+(serialized as a checkpoint would be), peak Python allocations, and throughput at
+several levels of concurrent threads.
+
+    python -m benchmarks.run_graph
+    python -m benchmarks.run_graph --scenario plan_loop --latency 0.05 --concurrency 1,16,64
+    python -m benchmarks.run_graph --checkpointer sqlite --json results.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+import agent
+from benchmarks.fake_model import ScriptedChatModel
+from benchmarks.scenarios import SCENARIOS, TOOL_RESULT, Scenario, answer_frontend_calls, frontend_actions
+
+NODE_NAMES = ("intent_router", "chat_node", "tool_node")
+_serde = JsonPlusSerializer()
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Collects wall-clock duration of every graph node execution."""
+
+    run_inline = True
+
+    def __init__(self):
+        self._started: Dict[Any, tuple] = {}
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, name=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if name in NODE_NAMES and node == name:
+            self._started[run_id] = (name, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started:
+            self.durations[started[0]].append(time.perf_counter() - started[1])
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+
+def compile_graph(checkpointer: str):
+    if checkpointer == "none":
+        return agent.workflow.compile(), False
+    if checkpointer == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        return agent.workflow.compile(checkpointer=InMemorySaver()), True
+    from checkpointer import SQLiteCheckpointer
+
+    path = os.path.join(tempfile.mkdtemp(prefix="flame-bench-"), "checkpoints.sqlite")
+    return agent.workflow.compile(checkpointer=SQLiteCheckpointer(path)), True
+
+
+async def run_conversation(
+    graph, scenario: Scenario, checkpointed: bool, timer: Optional[NodeTimer] = None, configurable: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Drive one thread through every client turn of `scenario` (extra `configurable`, e.g. the user's credential)."""
+    thread_id = f"bench-{uuid.uuid4()}"
+    config: Dict[str, Any] = {"configurable": {**(configurable or {}), "thread_id": thread_id}, "recursion_limit": 50}
+    if timer is not None:
+        config["callbacks"] = [timer]
+    actions = frontend_actions(agent.FRONTEND_TOOL_ALLOWLIST)
+    messages = list(scenario.history)
+    values: Dict[str, Any] = {}
+    steps = 0
+    started = time.perf_counter()
+    for i, turn in enumerate(scenario.turns):
+        new = answer_frontend_calls(messages) if turn is TOOL_RESULT else [HumanMessage(content=turn)]
+        if checkpointed and i > 0:
+            payload: Dict[str, Any] = {"messages": new}
+        else:
+            payload = {"messages": [*messages, *new], "copilotkit": {"actions": actions}}
+        async for mode, chunk in graph.astream(payload, config, stream_mode=["updates", "values"]):
+            if mode == "updates":
+                steps += len(chunk)
+            else:
+                values = chunk
+        messages = list(values.get("messages", []))
+    elapsed = time.perf_counter() - started
+    state_bytes = len(_serde.dumps_typed(values)[1])
+    return {"seconds": elapsed, "steps": steps, "state_bytes": state_bytes}
+
+
+async def bench_scenario(scenario: Scenario, args: argparse.Namespace) -> Dict[str, Any]:
+    agent.model_registry.set_model_factory(
+        lambda model_name, **settings: ScriptedChatModel(responder=scenario.responder, latency=args.latency)
+    )
+    graph, checkpointed = compile_graph(args.checkpointer)
+    devnull = open(os.devnull, "w")
+    result: Dict[str, Any] = {"scenario": scenario.name}
+    try:
+        with contextlib.redirect_stdout(devnull):
+            await run_conversation(graph, scenario, checkpointed)  # warm-up
+
+            timer = NodeTimer()
+            runs = [await run_conversation(graph, scenario, checkpointed, timer) for _ in range(args.iterations)]
+            result["latency_ms"] = {
+                "p50": statistics.median(r["seconds"] for r in runs) * 1000,
+                "max": max(r["seconds"] for r in runs) * 1000,
+            }
+            result["steps_per_request"] = statistics.mean(r["steps"] for r in runs)
+            result["state_bytes"] = runs[-1]["state_bytes"]
+            result["node_ms"] = {
+                node: {
+                    "calls": len(samples) / args.iterations,
+                    "p50": statistics.median(samples) * 1000,
+                    "mean": statistics.mean(samples) * 1000,
+                }
+                for node, samples in timer.durations.items()
+            }
+
+            tracemalloc.start()
+            await run_conversation(graph, scenario, checkpointed)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result["alloc_peak_kb"] = peak / 1024
+
+            result["throughput_rps"] = {}
+            for concurrency in args.concurrency:
+                started = time.perf_counter()
+                await asyncio.gather(*(run_conversation(graph, scenario, checkpointed) for _ in range(concurrency)))
+                result["throughput_rps"][concurrency] = concurrency / (time.perf_counter() - started)
+    finally:
+        devnull.close()
+        agent.model_registry.set_model_factory(None)
+    return result
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    print(f"\n== {result['scenario']} ==")
+    print(f"  request latency  p50 {result['latency_ms']['p50']:.2f} ms   max {result['latency_ms']['max']:.2f} ms")
+    print(f"  super-steps/req  {result['steps_per_request']:.1f}")
+    print(f"  final state      {result['state_bytes'] / 1024:.1f} KiB")
+    print(f"  alloc peak       {result['alloc_peak_kb']:.1f} KiB")
+    for node, stats in sorted(result["node_ms"].items()):
+        print(f"  {node:<16} {stats['calls']:.1f} calls/req   p50 {stats['p50']:.2f} ms   mean {stats['mean']:.2f} ms")
+    for concurrency, rps in result["throughput_rps"].items():
+        print(f"  throughput @{concurrency:<4} {rps:.1f} req/s")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="all", help=f"one of {', '.join(SCENARIOS)} or 'all'")
+    parser.add_argument("--latency", type=float, default=0.0, help="scripted model latency per call, seconds")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated thread counts for throughput")
+    parser.add_argument("--checkpointer", choices=("none", "memory", "sqlite"), default="none")
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args(argv)
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    return args
+
+
+async def main(argv: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    args = parse_args(argv)
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = []
+    for name in names:
+        result = await bench_scenario(SCENARIOS[name], args)
+        print_result(result)
+        results.append(result)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()) and 0)
@@ -0,0 +1,171 @@
+"""
+Scripted conversations for the graph benchmarks.
+
+Each scenario pairs a responder (what the fake model says on its Nth call in a thread)
+with the client turns that drive it: user messages, or `TOOL_RESULT` to answer the
+frontend tool calls of the last AIMessage the way CopilotKit would.
+"""
+
+import json
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from benchmarks.fake_model import Responder, text_reply, tool_call_reply, tool_calls_reply
+
+TOOL_RESULT = object()
+
+
+class Scenario(NamedTuple):
+    name: str
+    responder: Responder
+    turns: List[Any]
+    history: List[BaseMessage] = []
+
+
+def expense_rows(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": i,
+            "project_id": 3,
+            "cycle_id": 7,
+            "category_id": 1 + i % 5,
+            "vendor_id": None,
+            "payment_method_id": 2,
+            "description": f"Fuel top-up #{i}",
+            "amount": f"{12.5 + i:.2f}",
+            "date_time_created": f"2026-01-{1 + i % 28:02d}T09:00:00.000Z",
+            "created_by": "user_123",
+            "organization_id": 1,
+            "amount_org_ccy": f"{12.5 + i:.2f}",
+            "expense_name": "Fuel",
+        }
+        for i in range(count)
+    ]
+
+
+def tool_result_content(name: str) -> str:
+    if name == "listExpenses":
+        rows = expense_rows(120)
+        return json.dumps({"success": True, "expenses": rows, "count": len(rows)})
+    return json.dumps({"success": True})
+
+
+def frontend_actions(names: Sequence[str]) -> List[Dict[str, Any]]:
+    """CopilotKit-style action specs, as they arrive in state["copilotkit"]["actions"]."""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": f"Frontend action {name}",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "number", "description": "Record ID"},
+                        "project_id": {"type": "number", "description": "Project ID"},
+                        "cycle_id": {"type": "number", "description": "Cycle ID"},
+                    },
+                    "required": [],
+                },
+            },
+        }
+        for name in sorted(names)
+    ]
+
+
+def answer_frontend_calls(messages: Sequence[BaseMessage]) -> List[ToolMessage]:
+    last_ai = next((m for m in reversed(messages) if isinstance(m, AIMessage)), None)
+    if last_ai is None:
+        return []
+    answered = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    return [
+        ToolMessage(content=tool_result_content(tc["name"]), tool_call_id=tc["id"], name=tc["name"])
+        for tc in last_ai.tool_calls
+        if tc["id"] not in answered
+    ]
+
+
+def _single_chat(messages, thread_id, index):
+    return text_reply("I can help you track sales, log expenses and review reports for your active cycle.")
+
+
+def _frontend_tool(messages, thread_id, index):
+    if index == 0:
+        return tool_call_reply("listExpenses", {"cycle_id": 7})
+    return text_reply("You have 120 expenses this cycle, mostly fuel.")
+
+
+def _open_form(messages, thread_id, index):
+    # what the LLM path does for "Open the expense form" (skipped when the intent router answers)
+    if index == 0:
+        return tool_call_reply("openExpenseForm")
+    return text_reply("I've opened the expense form for you.")
+
+
+PLAN_STEPS = ["Create project", "Create cycle", "Log expense 1", "Log expense 2"]
+
+
+def _plan_loop(messages, thread_id, index):
+    if index == 0:
+        return tool_call_reply("set_plan", {"steps": PLAN_STEPS})
+    if index <= len(PLAN_STEPS):
+        return tool_call_reply("update_plan_progress", {"step_index": index - 1, "status": "completed"})
+    if index == len(PLAN_STEPS) + 1:
+        return tool_call_reply("complete_plan")
+    return text_reply("All steps are done: project, cycle and two expenses were created.")
+
+
+BATCH_EXPENSES = [
+    {"amount": 40, "expense_name": "Fuel", "cycle_id": 7},
+    {"amount": 15, "expense_name": "Parking", "cycle_id": 7},
+    {"amount": 60, "expense_name": "Supplies", "cycle_id": 7},
+]
+
+
+def _batch_sequential(messages, thread_id, index):
+    # parallel_tool_calls=False: one logExpense per model call and client round trip
+    if index < len(BATCH_EXPENSES):
+        return tool_call_reply("logExpense", BATCH_EXPENSES[index])
+    return text_reply("Logged 3 expenses.")
+
+
+def _batch_parallel(messages, thread_id, index):
+    # FLAME_PARALLEL_TOOL_CALLS=1: the plan and all three expenses in one response
+    if index == 0:
+        return tool_calls_reply([
+            ("set_plan", {"steps": [f"Log {e['expense_name']}" for e in BATCH_EXPENSES]}),
+            *(("logExpense", e) for e in BATCH_EXPENSES),
+            *(("update_plan_progress", {"step_index": i, "status": "completed"}) for i in range(len(BATCH_EXPENSES))),
+        ])
+    if index == 1:
+        return tool_call_reply("complete_plan")
+    return text_reply("Logged 3 expenses.")
+
+
+def long_history(turns: int) -> List[BaseMessage]:
+    history: List[BaseMessage] = []
+    for i in range(turns):
+        history.append(HumanMessage(content=f"Show my expenses for week {i}"))
+        call = tool_call_reply("listExpenses", {"cycle_id": 7})
+        history.append(call)
+        history.append(ToolMessage(
+            content=tool_result_content("listExpenses"),
+            tool_call_id=call.tool_calls[0]["id"],
+            name="listExpenses",
+        ))
+        history.append(text_reply(f"Week {i}: 120 expenses, mostly fuel."))
+    return history
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "single_chat": Scenario("single_chat", _single_chat, ["What can you do?"]),
+    "frontend_tool": Scenario("frontend_tool", _frontend_tool, ["Show my expenses", TOOL_RESULT]),
+    "open_form": Scenario("open_form", _open_form, ["Open the expense form", TOOL_RESULT]),
+    "plan_loop": Scenario("plan_loop", _plan_loop, ["Set up a project, a cycle and log two expenses"]),
+    "batch_sequential": Scenario(
+        "batch_sequential", _batch_sequential, ["Log fuel 40, parking 15 and supplies 60", *[TOOL_RESULT] * len(BATCH_EXPENSES)]
+    ),
+    "batch_parallel": Scenario("batch_parallel", _batch_parallel, ["Log fuel 40, parking 15 and supplies 60", TOOL_RESULT]),
+    "long_history": Scenario("long_history", _single_chat, ["Summarize my spending"], history=long_history(40)),
+}
@@ -0,0 +1,305 @@
+"""
+Load test for the multi-worker server (server.py) against the scripted fake model.
+
+For each worker count it starts `server.py` on a local port with a fresh SQLite
+checkpoint file, waits until every worker answers, then keeps `--clients` concurrent
+conversations going for `--duration` seconds. A conversation is two AG-UI runs on one
+thread: the user asks, the model calls the `listExpenses` frontend action, the client
+posts the result and the model answers. The second run often lands on another worker,
+which only works because the workers share the checkpointer.
+
+With a model that only sleeps and a small per-worker cap (`--per-worker`), throughput
+grows with the worker count only because the slots do: 4 workers x 2 slots serve twice
+what 2 x 2 do, on any number of cores. That measures the cap, not the workers. To see
+real scaling, make the model CPU-bound with `--cpu-ms` (each model call burns that much
+CPU in the worker's event loop) and leave the workers uncapped (`--per-worker 0`). Then
+one worker saturates one core, and more workers only help up to `cpus`.
+
+Each worker reports its `/metrics` port on `/readyz` (one port per worker, see
+instrumentation.py); the test lists them. With `--drain`, the last server gets SIGTERM
+while runs are in flight, and the test reports whether they finished.
+
+    python -m benchmarks.server_load --workers 1,2,4 --clients 16 --per-worker 0 --cpu-ms 20 --latency 0.05
+    python -m benchmarks.server_load --workers 1,2,4 --clients 24 --per-worker 2 --latency 2 --drain
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.fake_model import text_reply, tool_call_reply
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOLS = [{"name": "listExpenses", "description": "List expenses", "parameters": {"type": "object", "properties": {"cycle_id": {"type": "number"}}}}]
+
+
+def _burn(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def _responder(messages, thread_id, index):
+    # Decided from the messages alone: the fake model's per-thread call counter lives in
+    # one worker, and the two runs of a conversation may be served by different workers
+    _burn(float(os.getenv("FLAME_BENCH_CPU_MS", "0")) / 1000)
+    last = next(m for m in reversed(messages) if m.type != "system")
+    if last.type == "tool":
+        return text_reply("You have 120 expenses this cycle, mostly fuel.")
+    return tool_call_reply("listExpenses", {"cycle_id": 7})
+
+
+def create_app():
+    """App factory for the server workers: `server.create_app` with the scripted model."""
+    import agent
+    import server
+    from benchmarks.fake_model import ScriptedChatModel
+
+    latency = float(os.getenv("FLAME_BENCH_LATENCY", "0.2"))
+    agent.model_registry.set_model_factory(lambda model_name, **settings: ScriptedChatModel(responder=_responder, latency=latency))
+    return server.create_app()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, per_worker: int, latency: float, cpu_ms: float, metrics_port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "FLAME_CHECKPOINTER": "sqlite",
+        "FLAME_CHECKPOINT_PATH": os.path.join(tempfile.mkdtemp(prefix="flame-server-"), "checkpoints.sqlite"),
+        "FLAME_SERVER_MAX_CONCURRENCY": str(per_worker),
+        # a short queue: a worker that is full answers 503 and closes the connection, and the
+        # retry is accepted afresh, which spreads load the kernel's accept() did not
+        "FLAME_SERVER_MAX_QUEUE": str(per_worker),
+        "FLAME_SERVER_LOG_LEVEL": "warning",
+        "FLAME_BENCH_LATENCY": str(latency),
+        "FLAME_BENCH_CPU_MS": str(cpu_ms),
+        "FLAME_METRICS": "1",
+        "FLAME_METRICS_SAMPLE_RATE": "0",
+        "FLAME_METRICS_PORT": str(metrics_port),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-W", "ignore", os.path.join(ROOT, "server.py"), "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--app", "benchmarks.server_load:create_app"],
+        cwd=ROOT, env=env,
+    )
+
+
+def server_cpu_seconds(pid: int) -> Optional[float]:
+    """User+system CPU of the server and its worker processes (Linux /proc; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids = [pid, *map(int, f.read().split())]
+        total = 0
+        for p in pids:
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        return total / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError):
+        return None
+
+
+async def wait_ready(client: httpx.AsyncClient, workers: int, timeout: float = 60.0) -> Dict[int, Optional[int]]:
+    """Poll /readyz on fresh connections until every worker process has answered; {pid: metrics port}."""
+    seen: Dict[int, Optional[int]] = {}
+    deadline = time.monotonic() + timeout
+    while len(seen) < workers:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"only {len(seen)} of {workers} workers became ready")
+        try:
+            response = await client.get("/readyz", headers={"Connection": "close"})
+            if response.status_code == 200:
+                body = response.json()
+                seen[body["pid"]] = body.get("metrics_port")
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    return seen
+
+
+async def run_once(client: httpx.AsyncClient, thread_id: str, messages: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    One AG-UI run; returns (worker pid, decoded events). A 503 is retried on a new
+    connection with jittered backoff from 50 ms up to Retry-After, so a slot freed on
+    another worker is not left idle for whole seconds.
+    """
+    body = {
+        "threadId": thread_id,
+        "runId": str(uuid.uuid4()),
+        "state": {},
+        "messages": messages,
+        "tools": TOOLS,
+        "context": [],
+        "forwardedProps": {},
+    }
+    attempt = 0
+    while True:
+        async with client.stream("POST", "/", json=body, headers={"Accept": "text/event-stream"}) as response:
+            if response.status_code == 503:
+                ceiling = float(response.headers.get("Retry-After", "1"))
+                await asyncio.sleep(min(ceiling, 0.05 * 2 ** attempt) * (0.5 + random.random()))
+                attempt += 1
+                continue
+            response.raise_for_status()
+            events = [json.loads(line[5:]) async for line in response.aiter_lines() if line.startswith("data:")]
+            return response.headers.get("X-Flame-Worker", ""), events
+
+
+async def conversation(client: httpx.AsyncClient) -> Tuple[float, bool]:
+    """(seconds, served by two different workers) for one ask / tool result / answer exchange."""
+    thread_id = str(uuid.uuid4())
+    started = time.perf_counter()
+    user = {"id": str(uuid.uuid4()), "role": "user", "content": "How many expenses do I have this cycle?"}
+    first_pid, events = await run_once(client, thread_id, [user])
+    call = next((e for e in events if e["type"] == "TOOL_CALL_START"), None)
+    if call is None:
+        raise RuntimeError(f"first run did not call a tool: {[e['type'] for e in events]}")
+    assistant = {
+        "id": call.get("parentMessageId") or str(uuid.uuid4()),
+        "role": "assistant",
+        "toolCalls": [{"id": call["toolCallId"], "type": "function", "function": {"name": call["toolCallName"], "arguments": '{"cycle_id": 7}'}}],
+    }
+    result = {"id": str(uuid.uuid4()), "role": "tool", "toolCallId": call["toolCallId"], "content": json.dumps({"success": True, "count": 120})}
+    second_pid, events = await run_once(client, thread_id, [user, assistant, result])
+    if not any(e["type"] == "TEXT_MESSAGE_CONTENT" for e in events):
+        raise RuntimeError(f"second run did not answer: {[e['type'] for e in events]}")
+    return time.perf_counter() - started, first_pid != second_pid
+
+
+async def load(client: httpx.AsyncClient, clients: int, duration: float, warmup: float) -> Dict[str, Any]:
+    """
+    Keep `clients` conversations going for `warmup + duration` seconds; throughput counts
+    the conversations finished in the last `duration` seconds, once every queue has filled,
+    and the ones still running at the end are abandoned rather than waited for.
+    """
+    latencies: List[float] = []
+    cross_worker = 0
+    errors: List[str] = []
+    window_start = time.perf_counter() + warmup
+
+    async def user_loop():
+        nonlocal cross_worker
+        while True:
+            try:
+                seconds, crossed = await conversation(client)
+            except Exception as exc:
+                errors.append(str(exc))
+                continue
+            if time.perf_counter() >= window_start:
+                latencies.append(seconds)
+                cross_worker += crossed
+
+    users = [asyncio.ensure_future(user_loop()) for _ in range(clients)]
+    await asyncio.sleep(warmup + duration)
+    for user in users:
+        user.cancel()
+    await asyncio.gather(*users, return_exceptions=True)
+    return {
+        "conversations": len(latencies),
+        "per_second": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "cross_worker": cross_worker,
+        "errors": errors,
+    }
+
+
+async def drain_check(client: httpx.AsyncClient, process: subprocess.Popen, runs: int, latency: float) -> Dict[str, int]:
+    """
+    SIGTERM the server while `runs` runs (one per slot) are in flight. Every run that
+    reached a worker, whether running or still queued, should finish; none should be cut
+    off mid-stream. Runs arriving after the signal would be turned away with 503.
+    """
+    outcomes = {"finished": 0, "rejected": 0, "cut_off": 0}
+
+    async def first_turn():
+        body = {"threadId": str(uuid.uuid4()), "runId": str(uuid.uuid4()), "state": {}, "tools": TOOLS, "context": [], "forwardedProps": {},
+                "messages": [{"id": str(uuid.uuid4()), "role": "user", "content": "How many expenses do I have this cycle?"}]}
+        try:
+            async with client.stream("POST", "/", json=body, headers={"Accept": "text/event-stream"}) as response:
+                if response.status_code == 503:
+                    outcomes["rejected"] += 1
+                    return
+                finished = False
+                async for line in response.aiter_lines():
+                    finished = finished or '"RUN_FINISHED"' in line
+        except httpx.TransportError:
+            finished = False
+        outcomes["finished" if finished else "cut_off"] += 1
+
+    tasks = [asyncio.ensure_future(first_turn()) for _ in range(runs)]
+    await asyncio.sleep(max(0.15, latency / 2))  # every run sent and waiting on the model
+    process.send_signal(signal.SIGTERM)
+    await asyncio.gather(*tasks)
+    return outcomes
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent conversations")
+    parser.add_argument("--per-worker", type=int, default=4, help="FLAME_SERVER_MAX_CONCURRENCY for each worker (0: uncapped)")
+    parser.add_argument("--latency", type=float, default=0.2, help="scripted model latency per call, seconds")
+    parser.add_argument("--cpu-ms", type=float, default=0.0, help="CPU the scripted model burns per call, milliseconds")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of measured load per worker count")
+    parser.add_argument("--warmup", type=float, default=10.0, help="seconds of load before measuring")
+    parser.add_argument("--drain", action="store_true", help="SIGTERM the last server under load and check in-flight runs finish")
+    args = parser.parse_args(argv)
+
+    counts = [int(n) for n in args.workers.split(",")]
+    per_worker = args.per_worker or args.clients
+    print(f"cpus {os.cpu_count()}   clients {args.clients}   per-worker limit {args.per_worker or 'none'}   "
+          f"model latency {args.latency * 1000:.0f} ms + {args.cpu_ms:.0f} ms CPU")
+    baseline = None
+    for i, workers in enumerate(counts):
+        port = _free_port()
+        process = start_server(workers, port, per_worker, args.latency, args.cpu_ms, _free_port())
+        # A connection per run, as behind a per-request load balancer: kept-alive connections
+        # stay on whichever worker accepted them, however busy it gets
+        limits = httpx.Limits(max_connections=args.clients * 2, max_keepalive_connections=0)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits) as client:
+                ready = await wait_ready(client, workers)
+                await conversation(client)  # warm-up
+                cpu_before = server_cpu_seconds(process.pid)
+                result = await load(client, args.clients, args.duration, args.warmup)
+                cpu_after = server_cpu_seconds(process.pid)
+                baseline = baseline or result["per_second"] / workers
+                print(f"workers {workers:>2}   {result['conversations']:>5} conversations   {result['per_second']:7.2f} /s   "
+                      f"x{result['per_second'] / baseline:5.2f} of 1 worker (ideal x{workers})   p50 {result['p50_ms']:7.0f} ms   "
+                      f"cross-worker threads {result['cross_worker']:>4}   errors {len(result['errors'])}")
+                if cpu_before is not None and cpu_after is not None and result["conversations"]:
+                    busy = (cpu_after - cpu_before) / (args.warmup + args.duration)
+                    print(f"            server cpu {busy * 100:4.0f}% of one core   ~{busy / result['per_second'] * 1000:.0f} ms per conversation")
+                print(f"            metrics ports {sorted(p for p in ready.values() if p)} for {len(ready)} worker(s)")
+                for error in sorted(set(result["errors"]))[:3]:
+                    print(f"    {error}")
+                if args.drain and i == len(counts) - 1:
+                    drained = await drain_check(client, process, workers * per_worker, args.latency)
+                    print(f"SIGTERM with {workers * per_worker} runs in flight   finished {drained['finished']}   "
+                          f"rejected {drained['rejected']}   cut off {drained['cut_off']}")
+        finally:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+            process.wait(timeout=90)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
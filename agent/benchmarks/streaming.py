@@ -0,0 +1,126 @@
+"""
+Perceived latency of one chat_node turn with and without the streaming path.
+
+Drives the graph through `astream_events` (as CopilotKit does) with a scripted model
+that spreads its latency over streamed chunks, and reports time to the first text
+token the client receives (streamed live, or emitted with an accepted quiet attempt), to
+the first intermediate plan state, and to the end of the run.
+
+It runs with the backend tools alone (every tool bound) and with the client's full action
+list (a partial tool selection, whose text streams while its tool calls wait for the
+provider to accept them; see streaming.py). A last run has the provider reject a call to
+a tool the selection left out, after the text streamed: the client must see the text and
+the tool call once each.
+
+    python -m benchmarks.streaming --latency 1.0
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage
+
+import agent
+from benchmarks.fake_model import ScriptedChatModel, text_reply, tool_call_reply, tool_calls_reply
+from benchmarks.scenarios import PLAN_STEPS, frontend_actions
+from streaming import INTERMEDIATE_STATE_EVENT, MESSAGE_EVENT, TOOL_CALL_EVENT
+
+
+REJECTED_TEXT = "Let me generate that invoice for you."
+
+
+def _unselected_tool_call(messages, thread_id, index):
+    # the first attempt is rejected (generateInvoice is not selected), the retry accepted
+    if index < 2:
+        return tool_call_reply("generateInvoice", {"id": 7}, content=REJECTED_TEXT)
+    return text_reply("Done.")
+
+
+def _plan_then_text(messages, thread_id, index):
+    if index == 0:
+        return tool_calls_reply(
+            [("set_plan", {"steps": PLAN_STEPS}), ("openProjectForm", {})],
+            content="I'll set up a plan: " + ", ".join(PLAN_STEPS) + ". Opening the project form first.",
+        )
+    return text_reply("Done.")
+
+
+async def run_once(graph, actions: List[Dict], text: str = "Set up a project, a cycle and log two expenses") -> Dict[str, Any]:
+    config = {"configurable": {"thread_id": f"stream-{uuid.uuid4()}"}}
+    started = time.perf_counter()
+    first_token = first_state = None
+    # what reached the client: text characters and tool call starts
+    text_chars = tool_calls = 0
+    payload = {"messages": [HumanMessage(content=text)], "copilotkit": {"actions": actions}}
+    async for event in graph.astream_events(payload, config, version="v2"):
+        now = time.perf_counter() - started
+        metadata = event.get("metadata") or {}
+        delivered = ""
+        if event["event"] == "on_chat_model_stream":
+            chunk = event["data"]["chunk"]
+            # chunks CopilotKit filters out never reach the client
+            if chunk.content and metadata.get("copilotkit:emit-messages") is not False:
+                delivered = chunk.content
+            if metadata.get("copilotkit:emit-tool-calls") is not False:
+                tool_calls += sum(1 for part in chunk.tool_call_chunks or [] if part.get("name"))
+        elif event["event"] == "on_custom_event" and event["name"] == MESSAGE_EVENT:
+            delivered = event["data"]["message"]
+        elif event["event"] == "on_custom_event" and event["name"] == TOOL_CALL_EVENT:
+            tool_calls += 1
+        elif event["event"] == "on_custom_event" and event["name"] == INTERMEDIATE_STATE_EVENT and first_state is None:
+            first_state = now
+        if delivered:
+            text_chars += len(delivered)
+            if first_token is None:
+                first_token = now
+    return {
+        "first_token": first_token,
+        "first_plan_state": first_state,
+        "total": time.perf_counter() - started,
+        "text_chars": text_chars,
+        "tool_calls": tool_calls,
+    }
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=1.0, help="scripted model latency per call, seconds")
+    parser.add_argument("--chunks", type=int, default=20, help="text chunks per streamed response")
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    agent.model_registry.set_model_factory(
+        lambda model_name, **settings: ScriptedChatModel(responder=_plan_then_text, latency=args.latency, stream_chunks=args.chunks)
+    )
+    graph = agent.workflow.compile()
+    try:
+        for label, actions in (("backend tools", []), ("client actions", frontend_actions(agent.FRONTEND_TOOL_ALLOWLIST))):
+            for streaming in (False, True):
+                agent.STREAMING = streaming
+                runs = [await run_once(graph, actions) for _ in range(args.iterations)]
+                line = [f"{label:<15} streaming={'on ' if streaming else 'off'}"]
+                for key in ("first_token", "first_plan_state", "total"):
+                    samples = [r[key] for r in runs if r[key] is not None]
+                    line.append(f"{key} {statistics.median(samples) * 1000:.0f} ms" if samples else f"{key} -")
+                print("   ".join(line))
+        agent.STREAMING = True
+        agent.model_registry.set_model_factory(
+            lambda model_name, **settings: ScriptedChatModel(
+                responder=_unselected_tool_call, latency=args.latency, stream_chunks=args.chunks, validate_tools=True
+            )
+        )
+        run = await run_once(graph, frontend_actions(agent.FRONTEND_TOOL_ALLOWLIST), "Show me the sales for this cycle")
+        print(f"rejected call   first_token {run['first_token'] * 1000:.0f} ms   total {run['total'] * 1000:.0f} ms   "
+              f"text shown {run['text_chars'] / len(REJECTED_TEXT):.0f}x   tool calls shown {run['tool_calls']}")
+    finally:
+        agent.STREAMING = True
+        agent.model_registry.set_model_factory(None)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,183 @@
+"""
+Local stand-in for the Flame REST API endpoints used by api_tools.py and bulk_tools.py.
+
+Serves the expenses, sales, cycles, projects, organizations, expense-categories,
+payment-methods, vendors, analytics and report-summary GET routes with generated rows
+in the same response shapes as the Next.js routes, plus POST /api/expenses and
+/api/sales, which return the created record. Requires a `flame_ak_...` key, can add latency, and can fail the first
+N requests with 503 to exercise retries.
+
+    python -m benchmarks.stub_api --port 3999
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.scenarios import expense_rows
+
+# What the web app would forward for the benchmark user (pass as `flame_credential`)
+STUB_API_KEY = "flame_ak_bench_secret"
+
+
+def sale_rows(count: int):
+    return [
+        {
+            "id": i,
+            "project_id": 3,
+            "cycle_id": 7,
+            "customer_name": f"Customer {i % 9}",
+            "quantity": 1 + i % 4,
+            "price": "25.00",
+            "amount": f"{25.0 * (1 + i % 4):.2f}",
+            "status": "paid" if i % 3 else "pending",
+            "sale_date": f"2026-01-{1 + i % 28:02d}",
+        }
+        for i in range(count)
+    ]
+
+
+def _payload(path: str, query: Dict[str, str], rows: int) -> Optional[Dict[str, Any]]:
+    if path == "/api/expenses":
+        return {"status": "success", "expenses": expense_rows(min(rows, int(query.get("limit", rows))))}
+    if path == "/api/sales":
+        return {"status": "success", "sales": sale_rows(min(rows, int(query.get("limit", rows))))}
+    if path == "/api/cycles":
+        return {"status": "success", "cycles": [
+            {"id": 7, "project_id": 3, "cycle_number": 1, "cycle_name": "Q1 2026", "start_date": "2026-01-01", "end_date": "2026-03-31", "budget_allotment": "5000.00"},
+        ]}
+    if path == "/api/projects":
+        return {"status": "success", "projects": [{"id": 3, "project_name": "Food truck", "organization_id": 1}]}
+    if path == "/api/organizations/all":
+        return {"status": "success", "organizations": [{"id": 1, "name": "Flame Foods"}]}
+    if path == "/api/expense-categories":
+        return {"status": "success", "categories": [{"id": i, "category_name": n} for i, n in enumerate(("Fuel", "Supplies", "Rent", "Wages", "Other"), 1)]}
+    if path == "/api/payment-methods":
+        return {"status": "success", "payment_methods": [{"id": 1, "method_name": "Cash"}, {"id": 2, "method_name": "Card"}]}
+    if path == "/api/vendors":
+        return {"status": "success", "vendors": [{"id": 1, "vendor_name": "Shell"}, {"id": 2, "vendor_name": "Metro"}]}
+    if path == "/api/analytics/expenses-by-category":
+        return {"status": "success", "data": [
+            {"category": "Fuel", "total": 1840.5},
+            {"category": "Supplies", "total": 620.0},
+        ]}
+    if path == "/api/reports/summary":
+        return {"status": "success", "totalRevenue": 9100.0, "totalExpenses": 2460.5, "netProfit": 6639.5, "totalBudgetAllotment": 5000.0, "monthlyTrends": []}
+    return None
+
+
+def _created(path: str, body: Dict[str, Any], record_id: int) -> Optional[Dict[str, Any]]:
+    if path == "/api/expenses":
+        return {"status": "success", "expense": {"id": record_id, **body}}
+    if path == "/api/sales":
+        return {"status": "success", "sale": {"id": record_id, **body}}
+    return None
+
+
+class StubApiServer:
+    """Threaded HTTP server; use as a context manager or call start()/stop()."""
+
+    def __init__(self, port: int = 0, latency: float = 0.0, fail_first: int = 0, rows: int = 120):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.rows = rows
+        self.requests = 0
+        self.created = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    failing = stub.requests <= stub.fail_first
+                if stub.latency:
+                    time.sleep(stub.latency)
+                url = urlparse(self.path)
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                auth = self.headers.get("Authorization") or self.headers.get("x-api-key") or ""
+                if failing:
+                    return self._send(503, {"status": "error", "message": "unavailable"})
+                if not auth.replace("Bearer ", "").startswith("flame_ak_"):
+                    return self._send(401, {"status": "error", "message": "API key required"})
+                payload = _payload(url.path, query, stub.rows)
+                if payload is None:
+                    return self._send(404, {"status": "error", "message": "not found"})
+                self._send(200, payload)
+
+            def do_POST(self):
+                with stub._lock:
+                    stub.requests += 1
+                    failing = stub.requests <= stub.fail_first
+                if stub.latency:
+                    time.sleep(stub.latency)
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._send(400, {"status": "error", "message": "invalid JSON"})
+                auth = self.headers.get("Authorization") or self.headers.get("x-api-key") or ""
+                if failing:
+                    return self._send(503, {"status": "error", "message": "unavailable"})
+                if not auth.replace("Bearer ", "").startswith("flame_ak_"):
+                    return self._send(401, {"status": "error", "message": "API key required"})
+                with stub._lock:
+                    stub.created += 1
+                    record_id = 10000 + stub.created
+                payload = _created(urlparse(self.path).path, body, record_id)
+                if payload is None:
+                    return self._send(404, {"status": "error", "message": "not found"})
+                self._send(201, payload)
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up, e.g. a cancelled prefetch (prefetch.py)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> "StubApiServer":
+        threading.Thread(target=self.server.serve_forever, name="flame-stub-api", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=3999)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--fail-first", type=int, default=0)
+    args = parser.parse_args()
+    stub = StubApiServer(args.port, args.latency, args.fail_first)
+    print(f"stub Flame API on {stub.url}")
+    stub.server.serve_forever()
@@ -0,0 +1,172 @@
+"""
+Noisy-neighbor load test for per-organization admission (admission.py).
+
+One worker app (`server.create_app`, in process, scripted model) serves:
+
+- one noisy organization: `--noisy-clients` clients (one pass per count), each back to back running a
+  `--plan-steps` step plan. That is a model call and a `tool_node` round trip per step.
+- `--light-orgs` light organizations: one client each, asking one-hop questions with a
+  little think time in between
+
+Each count runs twice: with fair queuing and per-organization caps, then with every run in
+one FIFO queue (`FLAME_TENANT_ADMISSION=0`, the previous behavior). Each pass reports
+light-tenant run latency (p50/p99/max), noisy runs finished, and runs turned away with 429
+or 503 (clients retry those after `Retry-After`, capped at 0.5 s here). Under fair queuing
+the light tenants' latency should stay flat as the noisy tenant adds clients. Under FIFO it
+grows with the noisy backlog.
+
+    python -m benchmarks.tenant_fairness --slots 4 --noisy-clients 6,12,24 --duration 10
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_model import ScriptedChatModel, text_reply, tool_call_reply
+
+
+def _responder(plan_steps: int):
+    def respond(messages, thread_id, index):
+        if not thread_id.startswith("noisy-"):
+            return text_reply("I can help you track sales, log expenses and review reports.")
+        if index == 0:
+            return tool_call_reply("set_plan", {"steps": [f"Step {i + 1}" for i in range(plan_steps)]})
+        if index <= plan_steps:
+            return tool_call_reply("update_plan_progress", {"step_index": index - 1, "status": "completed"})
+        if index == plan_steps + 1:
+            return tool_call_reply("complete_plan")
+        return text_reply("All steps are done.")
+
+    return respond
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def run_once(client: httpx.AsyncClient, thread_id: str, organization: str, text: str, rejected: Dict[int, int]) -> None:
+    body = {
+        "threadId": thread_id,
+        "runId": str(uuid.uuid4()),
+        "state": {"activeOrganizationId": organization},
+        "messages": [{"id": str(uuid.uuid4()), "role": "user", "content": text}],
+        "tools": [],
+        "context": [],
+        "forwardedProps": {},
+    }
+    while True:
+        response = await client.post("/", json=body, headers={"Accept": "text/event-stream"})
+        if response.status_code in (429, 503):
+            rejected[response.status_code] = rejected.get(response.status_code, 0) + 1
+            await asyncio.sleep(min(0.5, float(response.headers.get("Retry-After", "1"))))
+            continue
+        response.raise_for_status()
+        if "RUN_FINISHED" not in response.text:
+            raise RuntimeError("run did not finish")
+        return
+
+
+async def load(fair: bool, noisy_clients: int, args: argparse.Namespace) -> Dict[str, Any]:
+    import admission
+    import agent
+    import server
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    # read when the gate's scheduler is built and per request
+    admission.TENANT_ADMISSION = fair
+    admission.tenant_admission = admission.TenantAdmission(max_llm_calls=args.tenant_llm_calls)
+    agent.tenant_admission = admission.tenant_admission
+    gate = server.RunGate(max_concurrency=args.slots, max_queue=args.queue, queue_timeout=120)
+    app = server.create_app(graph=agent.workflow.compile(checkpointer=InMemorySaver()), gate=gate)
+    light_latencies: List[float] = []
+    noisy_runs = 0
+    rejected: Dict[int, int] = {}
+    errors: List[str] = []
+    deadline = time.perf_counter() + args.warmup + args.duration
+    measure_from = time.perf_counter() + args.warmup
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://worker", timeout=300) as client:
+        async def noisy():
+            nonlocal noisy_runs
+            while time.perf_counter() < deadline:
+                try:
+                    await run_once(client, f"noisy-{uuid.uuid4()}", "1", "Set up the season: run every step", rejected)
+                    noisy_runs += time.perf_counter() >= measure_from
+                except Exception as exc:
+                    errors.append(repr(exc))
+
+        async def light(organization: str):
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    await run_once(client, f"light-{uuid.uuid4()}", organization, "What can you do?", rejected)
+                except Exception as exc:
+                    errors.append(repr(exc))
+                    continue
+                if started >= measure_from:
+                    light_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(args.think)
+
+        users = [*(noisy() for _ in range(noisy_clients)), *(light(str(2 + i)) for i in range(args.light_orgs))]
+        await asyncio.gather(*users)
+    return {
+        "mode": "fair" if fair else "fifo",
+        "light_runs": len(light_latencies),
+        "light_p50_ms": statistics.median(light_latencies) * 1000 if light_latencies else 0.0,
+        "light_p99_ms": _percentile(light_latencies, 0.99) * 1000,
+        "light_max_ms": max(light_latencies, default=0.0) * 1000,
+        "noisy_runs_per_s": noisy_runs / args.duration,
+        "rejected": rejected,
+        "errors": errors[:3],
+        "tenants": admission.tenant_admission.stats()["busiest"],
+    }
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=4, help="FLAME_SERVER_MAX_CONCURRENCY of the worker")
+    parser.add_argument("--queue", type=int, default=64, help="FLAME_SERVER_MAX_QUEUE of the worker")
+    parser.add_argument("--noisy-clients", default="6,12,24", help="comma-separated client counts of the noisy organization")
+    parser.add_argument("--plan-steps", type=int, default=8)
+    parser.add_argument("--light-orgs", type=int, default=4)
+    parser.add_argument("--think", type=float, default=0.2, help="seconds between a light client's runs")
+    parser.add_argument("--latency", type=float, default=0.03, help="scripted model latency per call, seconds")
+    parser.add_argument("--tenant-llm-calls", type=int, default=0, help="FLAME_TENANT_MAX_LLM_CALLS")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    args = parser.parse_args(argv)
+
+    import agent
+
+    agent.model_registry.set_model_factory(
+        lambda model_name, **settings: ScriptedChatModel(responder=_responder(args.plan_steps), latency=args.latency)
+    )
+    print(f"slots {args.slots}   noisy organization running {args.plan_steps}-step plans   "
+          f"light orgs {args.light_orgs}   model latency {args.latency * 1000:.0f} ms")
+    devnull = open(os.devnull, "w")
+    try:
+        for noisy_clients in (int(n) for n in args.noisy_clients.split(",")):
+            for fair in (True, False):
+                with contextlib.redirect_stdout(devnull):
+                    result = await load(fair, noisy_clients, args)
+                print(f"noisy x{noisy_clients:<3} {result['mode']:<5} light runs {result['light_runs']:>5}   "
+                      f"p50 {result['light_p50_ms']:6.0f} ms   p99 {result['light_p99_ms']:6.0f} ms   max {result['light_max_ms']:6.0f} ms   "
+                      f"noisy {result['noisy_runs_per_s']:5.2f} runs/s   rejected {result['rejected'] or 0}   errors {len(result['errors'])}")
+                for error in result["errors"]:
+                    print(f"    {error}")
+    finally:
+        devnull.close()
+        agent.model_registry.set_model_factory(None)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,140 @@
+"""
+Per-hop tool subsetting: schema tokens bound vs. the full tool set, and recall against
+a labelled set of requests (is the tool the request needs among the bound ones?).
+
+Each case is a user message, the page it was sent from, an optional active plan step and
+the tool a correct answer calls. Misses are listed; in the graph they cost a `load_tools`
+round trip or, with a validating provider, a retry with the full set. Also reports how much
+of each hop's bound schema is the prefix shared with the previous hop (what a provider's
+prompt cache can reuse), and checks that `load_tools` only loads tools the client sent.
+
+    python -m benchmarks.tool_selection --top-k 12
+"""
+
+import argparse
+import os
+import time
+from typing import List, NamedTuple, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+
+class Case(NamedTuple):
+    text: str
+    view: str
+    expected: str
+    step: str = ""
+    previous: str = ""
+
+
+CASES: List[Case] = [
+    Case("How many expenses do I have this cycle?", "/dashboard", "listExpenses"),
+    Case("Show me all sales from last week", "/", "listSales"),
+    Case("Log $40 for fuel", "/expense-management", "logExpense"),
+    Case("Record a sale of 3 bags of rice to John", "/sales-management", "recordSale"),
+    Case("Delete expense 12", "/sales-management", "deleteExpense"),
+    Case("delete it", "/workspace-management?tab=projects&action=edit&project_id=4", "deleteProject"),
+    Case("Rename this project to Harvest 2026", "/workspace-management?tab=projects", "updateProject"),
+    Case("Change the amount of expense 7 to 55", "/expense-management", "updateExpense"),
+    Case("Edit the sale I just made", "/sales-management", "editSale"),
+    Case("Create a new cycle called Q2 2026", "/workspace-management?tab=cycles", "createCycle"),
+    Case("Start a new quarter for this project", "/workspace-management?tab=projects", "createCycle"),
+    Case("Create an organization named Acme Farms", "/", "createOrganization"),
+    Case("Open the vendor form", "/expense-management", "openVendorForm"),
+    Case("I need to add a new supplier", "/expense-management", "openVendorForm"),
+    Case("Add a payment method for mobile money", "/sales-management", "openPaymentMethodForm"),
+    Case("Generate an invoice for the last sale", "/sales-management", "generateInvoice"),
+    Case("Add a new customer", "/sales-management", "openCustomerForm"),
+    Case("Show details for customer 18", "/", "viewCustomerDetails"),
+    Case("Add stock for maize flour", "/inventory", "openInventoryForm"),
+    Case("Which cycle am I in?", "/", "getCurrentContext"),
+    Case("Go to the sales page", "/expense-management", "navigateWorkspace"),
+    Case("List my projects", "/", "listProjects"),
+    Case("Show cycle 3", "/workspace-management?tab=cycles", "viewCycleDetails"),
+    Case("Remove the Q1 cycle", "/", "deleteCycle"),
+    Case("Update the organization's currency to KES", "/workspace-management?tab=organizations", "updateOrganization"),
+    Case("yes please", "/expense-management", "deleteExpense", previous="Do you want me to delete expense 44 (Fuel, $40)?"),
+    Case("go ahead", "/", "createProject", previous="Shall I create the project 'Maize 2026' in Acme Farms?"),
+    Case("continue", "/", "createProject", step="Create project Maize 2026 in the new organization"),
+    Case("continue", "/", "logExpense", step="Log expense 2: seeds $120"),
+    Case("continue", "/", "recordSale", step="Record the opening sale of 20 crates"),
+    Case("What did I spend the most on?", "/", "listExpenses"),
+    Case("Fix the date on that sale", "/sales-management", "updateSale"),
+]
+
+
+def case_messages(case: Case) -> List[BaseMessage]:
+    history: List[BaseMessage] = []
+    if case.previous:
+        history = [HumanMessage(content="Can you help with my records?"), AIMessage(content=case.previous)]
+    return [*history, HumanMessage(content=case.text)]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top-k", type=int, default=None, help="override FLAME_TOOL_TOP_K")
+    parser.add_argument("--hops", type=int, default=2000, help="iterations for the per-hop timing")
+    args = parser.parse_args(argv)
+    if args.top_k is not None:
+        os.environ["FLAME_TOOL_TOP_K"] = str(args.top_k)
+
+    import agent
+    from benchmarks.scenarios import frontend_actions
+    from tool_selection import ToolSelector, tool_selector
+
+    selector = ToolSelector(top_k=tool_selector.top_k, enabled=True)
+    actions = frontend_actions(agent.FRONTEND_TOOL_ALLOWLIST)
+    misses = []
+    bound_counts = []
+    shared_prefix = []
+    previous: List[str] = []
+    for case in CASES:
+        state = {
+            "messages": case_messages(case),
+            "copilotkit": {"actions": actions},
+            "currentView": case.view,
+            "planStatus": "in_progress" if case.step else "",
+            "planSteps": [{"title": case.step, "status": "in_progress"}] if case.step else [],
+            "currentStepIndex": 0 if case.step else -1,
+        }
+        binding = agent.tool_binding(state)
+        selection = selector.select(binding.bound_tools, state, state["messages"], extra=[agent.load_tools])
+        bound_counts.append(len(selection.tools))
+        names = [agent._extract_tool_name(t) for t in selection.tools]
+        if previous:
+            shared_prefix.append(next((i for i, (a, b) in enumerate(zip(names, previous)) if a != b), min(len(names), len(previous))))
+        previous = names
+        if case.expected not in selection.names:
+            misses.append(case)
+
+    stats = selector.stats()
+    total = len(binding.bound_tools)
+    print(f"top-k {selector.top_k}   cases {len(CASES)}   tools in full set {total}   bound per hop {min(bound_counts)}..{max(bound_counts)}")
+    print(f"schema tokens per hop   full {stats['schema_tokens_full'] / len(CASES):.0f}   bound {stats['schema_tokens_bound'] / len(CASES):.0f}   "
+          f"saved {stats['saved_ratio'] * 100:.0f}%")
+    print(f"stable prefix   {stats['schema_tokens_stable_prefix'] / len(CASES):.0f} tokens per hop   "
+          f"tools shared with the previous hop {min(shared_prefix)}..{max(shared_prefix)}")
+    print(f"recall {1 - len(misses) / len(CASES):.1%}   misses {len(misses)}")
+    for case in misses:
+        print(f"    {case.text!r} on {case.view} -> needs {case.expected}")
+
+    state = {"messages": case_messages(CASES[0]), "copilotkit": {"actions": actions}, "currentView": "/"}
+    binding = agent.tool_binding(state)
+    started = time.perf_counter()
+    for _ in range(args.hops):
+        selector.select(binding.bound_tools, state, state["messages"], extra=[agent.load_tools])
+    memoized = (time.perf_counter() - started) / args.hops
+    fresh = [frontend_actions(agent.FRONTEND_TOOL_ALLOWLIST) for _ in range(200)]
+    started = time.perf_counter()
+    for run_actions in fresh:
+        run_state = {**state, "copilotkit": {"actions": run_actions}}
+        selector.select(agent.tool_binding(run_state).bound_tools, run_state, run_state["messages"], extra=[agent.load_tools])
+    first_hop = (time.perf_counter() - started) / len(fresh)
+    without_sales = {**state, "copilotkit": {"actions": [a for a in actions if agent._extract_tool_name(a) != "listSales"]}}
+    loaded = agent.load_tools.invoke({"names": ["listSales", "listExpenses", "noSuchTool"], "state": without_sales})
+    print(f"load_tools without listSales from the client   {loaded}")
+    print(f"selection cost   first hop of a run {first_hop * 1e6:.0f} us (incl. tool binding)   later hops {memoized * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Backend bulk write tools: many expenses or sales in one tool call.
+
+Logging records one by one costs a model hop and a browser round trip per
+`logExpense` / `recordSale` call. That is a few records a minute, which is no use for a
+200-line receipt. `bulk_log_expenses` and `bulk_record_sales` take an array of rows and
+validate every row locally first. Rejected rows never reach the API. The valid rows are
+posted in chunks of `FLAME_BULK_CHUNK_SIZE`, with at most `FLAME_BULK_CONCURRENCY` requests
+in flight, over the pooled Flame API client. The Next.js routes have no batch endpoint,
+so each row is still its own POST.
+
+After every chunk, progress is emitted as intermediate plan state: a note on the active
+plan step, or a one-step plan when none is active. The UI then shows "120/200 expenses
+saved" while the tool runs. The result has the created ids and the per-row errors.
+When a whole chunk fails with 401/403, the remaining rows are skipped instead of posted.
+
+Registered in `backend_tools` only when `FLAME_API_BASE_URL` is set (see flame_api.py).
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool
+from langgraph.prebuilt import InjectedState
+from typing_extensions import Annotated
+
+from api_tools import _active_id, _api_key
+from entity_cache import cache_scope, entity_cache
+from flame_api import FlameApiError, flame_api
+from state_updates import SHARED_STATE_DEFAULTS
+from streaming import emit_intermediate_state
+
+BULK_CHUNK_SIZE = int(os.getenv("FLAME_BULK_CHUNK_SIZE", "50"))
+BULK_CONCURRENCY = int(os.getenv("FLAME_BULK_CONCURRENCY", "8"))
+BULK_MAX_ROWS = int(os.getenv("FLAME_BULK_MAX_ROWS", "5000"))
+# Per-row errors and created ids listed in the result; the rest are only counted
+MAX_REPORTED_ERRORS = 50
+MAX_REPORTED_IDS = 200
+
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[T ][0-9:.]+(?:Z|[+-]\d{2}:?\d{2})?)?$")
+_AUTH_STATUSES = {401, 403}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _number(row: Dict[str, Any], key: str, required: bool = False, positive: bool = False) -> Optional[float]:
+    value = row.get(key)
+    if value is None or value == "":
+        if required:
+            raise RowError(f"{key} is required")
+        return None
+    if isinstance(value, bool):
+        raise RowError(f"{key} must be a number")
+    try:
+        number = float(str(value).replace(",", "")) if isinstance(value, str) else float(value)
+    except ValueError:
+        raise RowError(f"{key} must be a number") from None
+    if number != number or number in (float("inf"), float("-inf")):
+        raise RowError(f"{key} must be a number")
+    if positive and number <= 0:
+        raise RowError(f"{key} must be greater than 0")
+    if number < 0:
+        raise RowError(f"{key} must not be negative")
+    return int(number) if number.is_integer() else number
+
+
+def _id(row: Dict[str, Any], key: str) -> Optional[int]:
+    value = row.get(key)
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not str(value).isdigit() or int(value) <= 0:
+        raise RowError(f"{key} must be a positive integer id")
+    return int(value)
+
+
+def _text(row: Dict[str, Any], key: str, limit: int = 500) -> Optional[str]:
+    value = row.get(key)
+    if value is None:
+        return None
+    text = str(value).strip()
+    if len(text) > limit:
+        raise RowError(f"{key} is longer than {limit} characters")
+    return text or None
+
+
+def _date(row: Dict[str, Any], key: str) -> Optional[str]:
+    value = _text(row, key, 40)
+    if value is not None and not _DATE.match(value):
+        raise RowError(f"{key} must be YYYY-MM-DD")
+    return value
+
+
+def expense_body(row: Dict[str, Any]) -> Dict[str, Any]:
+    """POST /api/expenses body for one row (same fields as the logExpense action)."""
+    body = {
+        "amount": _number(row, "amount", required=True, positive=True),
+        "expense_name": _text(row, "expense_name", 200),
+        "description": _text(row, "description"),
+        "category_id": _id(row, "category_id"),
+        "vendor_id": _id(row, "vendor_id"),
+        "payment_method_id": _id(row, "payment_method_id"),
+        "project_id": _id(row, "project_id"),
+        "cycle_id": _id(row, "cycle_id"),
+        "expense_date": _date(row, "expense_date"),
+    }
+    return {k: v for k, v in body.items() if v is not None}
+
+
+SALE_STATUSES = {"completed", "pending", "cancelled"}
+
+
+def sale_body(row: Dict[str, Any]) -> Dict[str, Any]:
+    """POST /api/sales body for one row (same fields as the recordSale action)."""
+    body = {
+        "quantity": _number(row, "quantity", required=True, positive=True),
+        "price": _number(row, "price", required=True),
+        "customer": _text(row, "customer", 200),
+        "product_id": _id(row, "product_id"),
+        "variant_id": _id(row, "variant_id"),
+        "project_id": _id(row, "project_id"),
+        "cycle_id": _id(row, "cycle_id"),
+        "sale_date": _date(row, "sale_date"),
+        "status": _text(row, "status", 20),
+    }
+    if body["status"] is not None:
+        body["status"] = body["status"].lower()
+        if body["status"] not in SALE_STATUSES:
+            raise RowError(f"status must be one of {', '.join(sorted(SALE_STATUSES))}")
+    return {k: v for k, v in body.items() if v is not None}
+
+
+class BulkSpec(NamedTuple):
+    path: str
+    noun: str
+    record_key: str
+    resources: Tuple[str, ...]
+    build_body: Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+EXPENSES = BulkSpec("/api/expenses", "expenses", "expense", ("expenses",), expense_body)
+SALES = BulkSpec("/api/sales", "sales", "sale", ("sales",), sale_body)
+
+ProgressCallback = Callable[[int, int, int], Any]
+
+
+class BulkWriter:
+    """Validates and posts row batches; keeps throughput counters."""
+
+    def __init__(self, chunk_size: int = BULK_CHUNK_SIZE, concurrency: int = BULK_CONCURRENCY, max_rows: int = BULK_MAX_ROWS):
+        self.chunk_size = max(1, chunk_size)
+        self.concurrency = max(1, concurrency)
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.created = 0
+        self.invalid = 0
+        self.failed = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    def validate(self, spec: BulkSpec, rows: List[Any], defaults: Dict[str, Any]) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+        """(row index, request body) for valid rows and {row, error} for the rest."""
+        valid: List[Tuple[int, Dict[str, Any]]] = []
+        errors: List[Dict[str, Any]] = []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                errors.append({"row": index, "error": "row must be an object"})
+                continue
+            try:
+                body = spec.build_body({**defaults, **{k: v for k, v in row.items() if v is not None}})
+            except RowError as exc:
+                errors.append({"row": index, "error": str(exc)})
+                continue
+            valid.append((index, body))
+        return valid, errors
+
+    async def write(
+        self,
+        spec: BulkSpec,
+        rows: List[Any],
+        defaults: Dict[str, Any],
+        api_key: Optional[str] = None,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> Dict[str, Any]:
+        """Validate `rows`, post the valid ones and return the per-row outcome."""
+        started = time.perf_counter()
+        if len(rows) > self.max_rows:
+            return {"success": False, "error": f"At most {self.max_rows} rows per call; split the batch."}
+        valid, errors = self.validate(spec, rows, defaults)
+        invalid = len(errors)
+        created: List[Tuple[int, Any]] = []
+        skipped = 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def post(index: int, body: Dict[str, Any]) -> Tuple[int, Any, Optional[FlameApiError]]:
+            async with semaphore:
+                try:
+                    response = await flame_api.post(spec.path, body, api_key=api_key)
+                except FlameApiError as exc:
+                    return index, None, exc
+            record = response.get(spec.record_key)
+            return index, record.get("id") if isinstance(record, dict) else None, None
+
+        total = len(rows)
+        if on_progress is not None and valid:
+            await on_progress(0, invalid, total)
+        for start in range(0, len(valid), self.chunk_size):
+            chunk = valid[start:start + self.chunk_size]
+            results = await asyncio.gather(*(post(index, body) for index, body in chunk))
+            chunk_errors = [(index, exc) for index, _, exc in results if exc is not None]
+            created.extend((index, record_id) for index, record_id, exc in results if exc is None)
+            errors.extend({"row": index, "error": str(exc)} for index, exc in chunk_errors)
+            if chunk_errors and len(chunk_errors) == len(chunk) and all(exc.status in _AUTH_STATUSES for _, exc in chunk_errors):
+                # the key cannot write at all; posting the rest would fail the same way
+                remaining = valid[start + self.chunk_size:]
+                skipped = len(remaining)
+                errors.extend({"row": index, "error": "skipped after authorization failure"} for index, _ in remaining)
+                break
+            if on_progress is not None:
+                await on_progress(len(created), len(errors), total)
+
+        elapsed = time.perf_counter() - started
+        failed = len(errors) - invalid - skipped
+        with self._lock:
+            self.batches += 1
+            self.rows += total
+            self.created += len(created)
+            self.invalid += invalid
+            self.failed += failed
+            self.skipped += skipped
+            self.seconds += elapsed
+        errors.sort(key=lambda e: e["row"])
+        ids = [record_id for _, record_id in sorted(created)]
+        result: Dict[str, Any] = {
+            "success": not errors,
+            "rows": total,
+            "created": len(created),
+            "failed": len(errors),
+            f"{spec.record_key}_ids": ids[:MAX_REPORTED_IDS],
+            "errors": errors[:MAX_REPORTED_ERRORS],
+        }
+        if len(ids) > MAX_REPORTED_IDS:
+            result[f"more_{spec.record_key}_ids"] = len(ids) - MAX_REPORTED_IDS
+        if len(errors) > MAX_REPORTED_ERRORS:
+            result["more_errors"] = len(errors) - MAX_REPORTED_ERRORS
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "rows": self.rows,
+                "created": self.created,
+                "invalid": self.invalid,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "rows_per_second": (self.created / self.seconds) if self.seconds else 0.0,
+            }
+
+
+bulk_writer = BulkWriter()
+
+
+def _progress_emitter(state: Optional[Dict[str, Any]], config: Optional[RunnableConfig], noun: str) -> ProgressCallback:
+    """Emit progress as a note on the active plan step (or a one-step plan) for the UI."""
+    state = state or {}
+    shared = {key: state.get(key, default) for key, default in SHARED_STATE_DEFAULTS.items()}
+    steps = list(shared["planSteps"] or [])
+    index = shared["currentStepIndex"]
+    in_plan = shared["planStatus"] == "in_progress" and isinstance(index, int) and 0 <= index < len(steps) and isinstance(steps[index], dict)
+
+    async def emit(done: int, failed: int, total: int) -> None:
+        note = f"{done}/{total} {noun} saved" + (f", {failed} failed" if failed else "")
+        if in_plan:
+            plan = {"planSteps": [*steps[:index], {**steps[index], "note": note}, *steps[index + 1:]]}
+        else:
+            finished = done + failed >= total
+            plan = {
+                "planSteps": [{"title": f"Save {total} {noun}", "status": "completed" if finished else "in_progress", "note": note}],
+                "currentStepIndex": 0,
+                "planStatus": "completed" if finished else "in_progress",
+            }
+        try:
+            await emit_intermediate_state(config or {}, {**shared, **plan})
+        except Exception:
+            # progress is cosmetic; never fail the write because the UI event could not be sent
+            pass
+
+    return emit
+
+
+async def _bulk(spec: BulkSpec, rows: List[Dict[str, Any]], project_id: Optional[int], cycle_id: Optional[int], state, config) -> Dict[str, Any]:
+    defaults = {
+        "project_id": _active_id(project_id, state, "activeProjectId"),
+        "cycle_id": _active_id(cycle_id, state, "activeCycleId"),
+    }
+    result = await bulk_writer.write(
+        spec,
+        rows or [],
+        {k: v for k, v in defaults.items() if v is not None},
+        api_key=_api_key(config),
+        on_progress=_progress_emitter(state, config, spec.noun),
+    )
+    if result.get("created"):
+        entity_cache.invalidate(cache_scope(state, config).organization, spec.resources)
+    return result
+
+
+@tool
+async def bulk_log_expenses(
+    expenses: List[Dict[str, Any]],
+    project_id: Optional[int] = None,
+    cycle_id: Optional[int] = None,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+) -> Dict[str, Any]:
+    """
+    Log many expenses at once (e.g. every line of a receipt or an imported list).
+    Each item: amount (required), expense_name, description, category_id, vendor_id,
+    payment_method_id, expense_date (YYYY-MM-DD), and optionally project_id/cycle_id.
+    project_id/cycle_id default to the active ones. Use it instead of calling
+    logExpense repeatedly for more than a few records. Returns created ids and per-row errors.
+    """
+    return await _bulk(EXPENSES, expenses, project_id, cycle_id, state, config)
+
+
+@tool
+async def bulk_record_sales(
+    sales: List[Dict[str, Any]],
+    project_id: Optional[int] = None,
+    cycle_id: Optional[int] = None,
+    state: Annotated[Dict[str, Any], InjectedState] = None,
+    config: RunnableConfig = None,
+) -> Dict[str, Any]:
+    """
+    Record many sales at once. Each item: quantity and price (required), customer,
+    product_id, variant_id, sale_date (YYYY-MM-DD), status (completed, pending, cancelled),
+    and optionally project_id/cycle_id, which default to the active ones. Use it instead
+    of calling recordSale repeatedly for more than a few records. Returns created ids
+    and per-row errors.
+    """
+    return await _bulk(SALES, sales, project_id, cycle_id, state, config)
+
+
+BULK_TOOLS: List[Any] = [bulk_log_expenses, bulk_record_sales]
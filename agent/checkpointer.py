@@ -0,0 +1,673 @@
+"""
+Persistent checkpointing for the Flame Assistant graph.
+
+`SQLiteCheckpointer` stores LangGraph checkpoints in a local SQLite file so threads
+survive restarts. It is incremental:
+
+- only channels whose version changed in a super-step are written (LangGraph passes
+  these as `new_versions`)
+- append-only channels such as `messages` are stored as the new tail on top of the
+  previous version instead of the full list
+- a background sweep prunes old checkpoints, folds delta chains back into full values
+  and evicts idle threads from the in-memory hot cache
+
+Select it with `FLAME_CHECKPOINTER=sqlite` (see `build_checkpointer`). Note that
+`langgraph dev` refuses graphs compiled with a custom checkpointer, so leave the
+variable unset when running under the LangGraph API server. The multi-worker server
+(server.py) defaults to `sqlite`, and all of its worker processes share the one file.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+import instrumentation
+
+# Channels whose values only ever grow by appending (reducer: add_messages)
+DELTA_CHANNELS = frozenset({"messages"})
+DEFAULT_CHECKPOINT_PATH = ".flame_checkpoints/checkpoints.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    base_version TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    blob BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+def _message_key(message: Any) -> Any:
+    msg_id = getattr(message, "id", None)
+    return msg_id if msg_id else id(message)
+
+
+def _is_append_of(previous: Any, current: Any) -> bool:
+    """True when `current` is `previous` with zero or more items appended."""
+    if not isinstance(previous, list) or not isinstance(current, list):
+        return False
+    if len(current) < len(previous):
+        return False
+    for old, new in zip(previous, current):
+        if old is new:
+            continue
+        old_key, new_key = _message_key(old), _message_key(new)
+        if old_key != new_key:
+            return False
+        # Same id but edited in place (add_messages replaces by id) -> not an append
+        if old != new:
+            return False
+    return True
+
+
+class _HotThread:
+    """Latest channel values of one (thread, namespace), kept in RAM while the thread is active."""
+
+    __slots__ = ("values", "depths", "last_access")
+
+    def __init__(self):
+        # channel -> (version, value)
+        self.values: Dict[str, Tuple[str, Any]] = {}
+        # channel -> length of the delta chain behind the cached version
+        self.depths: Dict[str, int] = {}
+        self.last_access = time.monotonic()
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    """
+    SQLite-backed checkpoint saver that writes state deltas rather than full snapshots.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        keep_checkpoints: int = 20,
+        max_delta_chain: int = 50,
+        idle_ttl_seconds: float = 900.0,
+        max_hot_threads: int = 512,
+        compact_interval_seconds: float = 300.0,
+        busy_timeout_seconds: float = 30.0,
+        serde: Any = None,
+    ):
+        super().__init__(serde=serde)
+        self.path = path
+        self.keep_checkpoints = keep_checkpoints
+        self.max_delta_chain = max_delta_chain
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_hot_threads = max_hot_threads
+        self.compact_interval_seconds = compact_interval_seconds
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Several server workers may share the file: wait for their write locks instead of
+        # failing, and take the write lock up front (BEGIN IMMEDIATE) so a transaction never
+        # has to upgrade a stale read snapshot
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=busy_timeout_seconds)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._hot: "OrderedDict[Tuple[str, str], _HotThread]" = OrderedDict()
+        self._compactor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.bytes_written = 0
+        self.delta_blobs = 0
+        self.full_blobs = 0
+
+    # ------------------------------------------------------------------
+    # Hot cache
+    # ------------------------------------------------------------------
+
+    def _hot_thread(self, thread_id: str, checkpoint_ns: str) -> _HotThread:
+        key = (thread_id, checkpoint_ns)
+        hot = self._hot.get(key)
+        if hot is None:
+            hot = _HotThread()
+            self._hot[key] = hot
+            while len(self._hot) > self.max_hot_threads:
+                self._hot.popitem(last=False)
+        else:
+            self._hot.move_to_end(key)
+        hot.last_access = time.monotonic()
+        return hot
+
+    def evict_idle_threads(self, now: Optional[float] = None) -> int:
+        """Drop cached values of threads idle for longer than `idle_ttl_seconds`."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [k for k, hot in self._hot.items() if now - hot.last_access > self.idle_ttl_seconds]
+            for key in idle:
+                del self._hot[key]
+        return len(idle)
+
+    # ------------------------------------------------------------------
+    # Blobs
+    # ------------------------------------------------------------------
+
+    def _load_blob(self, thread_id: str, checkpoint_ns: str, channel: str, version: Any) -> Tuple[bool, Any, int]:
+        """Return (found, value, chain depth) for a channel version, resolving delta chains."""
+        hot = self._hot.get((thread_id, checkpoint_ns))
+        if hot is not None:
+            cached = hot.values.get(channel)
+            if cached is not None and cached[0] == str(version):
+                return True, list(cached[1]), hot.depths.get(channel, 0)
+
+        tails: List[Any] = []
+        current = str(version)
+        while True:
+            row = self._conn.execute(
+                "SELECT type, blob, base_version FROM blobs "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, current),
+            ).fetchone()
+            if row is None:
+                if tails:
+                    raise ValueError(f"Missing base blob {channel}@{current} for thread {thread_id}")
+                return False, None, 0
+            type_, blob, base_version = row
+            if type_ == "empty":
+                return False, None, 0
+            value = self.serde.loads_typed((type_, blob))
+            if base_version is None:
+                break
+            tails.append(value)
+            current = base_version
+
+        for tail in reversed(tails):
+            value = [*value, *tail]
+        return True, value, len(tails)
+
+    def _load_channel_values(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        for channel, version in versions.items():
+            found, value, depth = self._load_blob(thread_id, checkpoint_ns, channel, version)
+            if found:
+                values[channel] = value
+                if channel in DELTA_CHANNELS and isinstance(value, list):
+                    # Seed the delta base so the next write after a restart stays incremental
+                    hot = self._hot_thread(thread_id, checkpoint_ns)
+                    hot.values[channel] = (str(version), list(value))
+                    hot.depths[channel] = depth
+        return values
+
+    def _blob_exists(self, thread_id: str, checkpoint_ns: str, channel: str, version: str) -> bool:
+        # Another worker's compaction may have removed the version this process has cached
+        return self._conn.execute(
+            "SELECT 1 FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            (thread_id, checkpoint_ns, channel, version),
+        ).fetchone() is not None
+
+    def _write_blob(self, thread_id: str, checkpoint_ns: str, channel: str, version: Any, values: Dict[str, Any]) -> None:
+        version = str(version)
+        if channel not in values:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, 'empty', NULL, NULL)",
+                (thread_id, checkpoint_ns, channel, version),
+            )
+            return
+
+        value = values[channel]
+        base_version = None
+        payload = value
+        depth = 0
+        if channel in DELTA_CHANNELS and isinstance(value, list):
+            hot = self._hot_thread(thread_id, checkpoint_ns)
+            previous = hot.values.get(channel)
+            previous_depth = hot.depths.get(channel, 0)
+            if (
+                previous is not None
+                and previous[0] != version
+                and previous_depth < self.max_delta_chain
+                and _is_append_of(previous[1], value)
+                and self._blob_exists(thread_id, checkpoint_ns, channel, previous[0])
+            ):
+                base_version = previous[0]
+                payload = value[len(previous[1]):]
+                depth = previous_depth + 1
+
+        type_, blob = self.serde.dumps_typed(payload)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (thread_id, checkpoint_ns, channel, version, type_, blob, base_version),
+        )
+        self.bytes_written += len(blob or b"")
+        if base_version is None:
+            self.full_blobs += 1
+        else:
+            self.delta_blobs += 1
+        if channel in DELTA_CHANNELS and isinstance(value, list):
+            hot.values[channel] = (version, list(value))
+            hot.depths[channel] = depth
+
+    # ------------------------------------------------------------------
+    # BaseCheckpointSaver API
+    # ------------------------------------------------------------------
+
+    def _row_to_tuple(self, thread_id: str, checkpoint_ns: str, row: Tuple[Any, ...]) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint_blob, metadata_type, metadata_blob = row
+        checkpoint: Checkpoint = self.serde.loads_typed((type_, checkpoint_blob))
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, blob FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_channel_values(thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, b))) for task_id, channel, t, b in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._row_to_tuple(thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints"
+        )
+        clauses: List[str] = []
+        params: List[Any] = []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            results: List[CheckpointTuple] = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if filter:
+                    metadata = self.serde.loads_typed((row[4], row[5]))
+                    if not all(metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                if limit is not None and len(results) >= limit:
+                    break
+                results.append(self._row_to_tuple(thread_id, checkpoint_ns, tuple(row)))
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        stored = checkpoint.copy()
+        values: Dict[str, Any] = stored.pop("channel_values")  # type: ignore[misc]
+        type_, checkpoint_blob = self.serde.dumps_typed(stored)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for channel, version in new_versions.items():
+                    self._write_blob(thread_id, checkpoint_ns, channel, version, values)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        type_,
+                        checkpoint_blob,
+                        metadata_type,
+                        metadata_blob,
+                    ),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # Cached values may now be ahead of disk; reload from the database next time
+                self._hot.pop((thread_id, checkpoint_ns), None)
+                raise
+            self.bytes_written += len(checkpoint_blob or b"") + len(metadata_blob or b"")
+        self._ensure_compactor()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append((
+                thread_id,
+                checkpoint_ns,
+                checkpoint_id,
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                type_,
+                blob,
+                task_path,
+            ))
+        # Regular writes are idempotent per (task, idx); special writes (errors, interrupts) overwrite
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [r for r in rows if r[4] >= 0],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [r for r in rows if r[4] < 0],
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ("checkpoints", "blobs", "writes"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for key in [k for k in self._hot if k[0] == thread_id]:
+                del self._hot[key]
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: [*self.list(config, filter=filter, before=before, limit=limit)])
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def compact(self) -> Dict[str, int]:
+        """
+        Prune checkpoints beyond `keep_checkpoints` per thread, fold delta chains that would
+        lose their base into full blobs, and delete blobs no retained checkpoint references.
+
+        Each namespace is compacted in one write transaction: the retained set is read under
+        the write lock, so a checkpoint another worker commits on the same file is either
+        seen (and its blobs kept) or written after the deletes.
+        """
+        pruned = 0
+        folded = 0
+        removed_blobs = 0
+        with self._lock:
+            namespaces = self._conn.execute(
+                "SELECT thread_id, checkpoint_ns FROM checkpoints GROUP BY thread_id, checkpoint_ns "
+                "HAVING COUNT(*) > ?",
+                (self.keep_checkpoints,),
+            ).fetchall()
+
+        for thread_id, checkpoint_ns in namespaces:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    dropped, folds, removed = self._compact_namespace(thread_id, checkpoint_ns)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                pruned += dropped
+                folded += folds
+                removed_blobs += len(removed)
+                hot = self._hot.get((thread_id, checkpoint_ns))
+                for channel, version in removed:
+                    if hot is not None and hot.values.get(channel, (None,))[0] == version:
+                        hot.values.pop(channel, None)
+                        hot.depths.pop(channel, None)
+
+        evicted = self.evict_idle_threads()
+        return {"pruned_checkpoints": pruned, "folded_deltas": folded, "removed_blobs": removed_blobs, "evicted_threads": evicted}
+
+    def _compact_namespace(self, thread_id: str, checkpoint_ns: str) -> Tuple[int, int, List[Tuple[str, str]]]:
+        """(pruned checkpoints, folded deltas, removed blob keys); runs inside compact's transaction."""
+        rows = self._conn.execute(
+            "SELECT checkpoint_id, type, checkpoint FROM checkpoints "
+            "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        retained, dropped = rows[: self.keep_checkpoints], rows[self.keep_checkpoints:]
+        if not dropped:
+            return 0, 0, []
+        referenced = set()
+        for _, type_, blob in retained:
+            versions = self.serde.loads_typed((type_, blob))["channel_versions"]
+            referenced.update((channel, str(version)) for channel, version in versions.items())
+
+        # Materialize retained deltas before their bases disappear
+        folded = 0
+        for channel, version in referenced:
+            row = self._conn.execute(
+                "SELECT base_version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+                "AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, version),
+            ).fetchone()
+            if row is None or row[0] is None or (channel, row[0]) in referenced:
+                continue
+            found, value, _ = self._load_blob(thread_id, checkpoint_ns, channel, version)
+            if not found:
+                continue
+            type_, blob = self.serde.dumps_typed(value)
+            self._conn.execute(
+                "UPDATE blobs SET type = ?, blob = ?, base_version = NULL WHERE thread_id = ? "
+                "AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (type_, blob, thread_id, checkpoint_ns, channel, version),
+            )
+            folded += 1
+
+        for checkpoint_id, _, _ in dropped:
+            self._conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+            self._conn.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+
+        blob_keys = self._conn.execute(
+            "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        removed = [(channel, version) for channel, version in blob_keys if (channel, version) not in referenced]
+        for channel, version in removed:
+            self._conn.execute(
+                "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, version),
+            )
+        return len(dropped), folded, removed
+
+    def _ensure_compactor(self) -> None:
+        if self.compact_interval_seconds <= 0 or self._compactor is not None:
+            return
+        with self._lock:
+            if self._compactor is not None:
+                return
+            self._compactor = threading.Thread(target=self._compact_loop, name="flame-checkpoint-compactor", daemon=True)
+            self._compactor.start()
+
+    def _compact_loop(self) -> None:
+        while not self._stop.wait(self.compact_interval_seconds):
+            try:
+                self.compact()
+            except Exception as exc:
+                instrumentation.logger.warning("checkpoint compaction failed: %s", exc)
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hot_threads": len(self._hot),
+                "bytes_written": self.bytes_written,
+                "delta_blobs": self.delta_blobs,
+                "full_blobs": self.full_blobs,
+            }
+
+
+def build_checkpointer() -> Optional[BaseCheckpointSaver]:
+    """
+    Build the checkpointer selected by `FLAME_CHECKPOINTER`:
+    unset/"none" (platform-managed), "memory" or "sqlite".
+    """
+    kind = (os.getenv("FLAME_CHECKPOINTER", "") or "none").strip().lower()
+    if kind == "none":
+        return None
+    if kind == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        return InMemorySaver()
+    if kind == "sqlite":
+        return SQLiteCheckpointer(
+            os.getenv("FLAME_CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH),
+            keep_checkpoints=int(os.getenv("FLAME_CHECKPOINT_KEEP", "20")),
+            idle_ttl_seconds=float(os.getenv("FLAME_CHECKPOINT_IDLE_TTL", "900")),
+            compact_interval_seconds=float(os.getenv("FLAME_CHECKPOINT_COMPACT_INTERVAL", "300")),
+        )
+    raise ValueError(f"Unknown FLAME_CHECKPOINTER '{kind}' (expected none, memory or sqlite)")
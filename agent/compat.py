@@ -0,0 +1,52 @@
+"""
+Import shims for CopilotKit / LangChain version mismatches.
+
+Some CopilotKit releases import `langgraph.graph.graph.CompiledGraph`, which newer
+LangGraph moved to `langgraph.graph.state.CompiledStateGraph`. Some also import
+`langchain.agents.middleware`, which older LangChain lacks. `install_import_shims`
+registers stand-ins for both in `sys.modules`, once per process. It imports nothing
+itself: the graph shim resolves `CompiledGraph` only when something asks for it.
+"""
+
+import sys
+import types
+
+_installed = False
+
+
+def _compiled_graph_module() -> types.ModuleType:
+    module = types.ModuleType("langgraph.graph.graph")
+
+    def __getattr__(name: str):
+        if name == "CompiledGraph":
+            from langgraph.graph.state import CompiledStateGraph
+
+            return CompiledStateGraph
+        raise AttributeError(name)
+
+    module.__getattr__ = __getattr__
+    return module
+
+
+class _MockMiddleware:
+    def __getitem__(self, _):
+        return object
+
+
+def _middleware_module() -> types.ModuleType:
+    module = types.ModuleType("langchain.agents.middleware")
+    module.AgentMiddleware = _MockMiddleware()
+    module.AgentState = object
+    module.ModelRequest = object
+    module.ModelResponse = object
+    return module
+
+
+def install_import_shims() -> None:
+    """Register the stand-in modules unless real (or earlier) ones are already loaded."""
+    global _installed
+    if _installed:
+        return
+    sys.modules.setdefault("langgraph.graph.graph", _compiled_graph_module())
+    sys.modules.setdefault("langchain.agents.middleware", _middleware_module())
+    _installed = True
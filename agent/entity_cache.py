@@ -0,0 +1,353 @@
+"""
+Scoped TTL/LRU cache for Flame read results (organizations, projects, cycles, expenses,
+sales, categories, payment methods, vendors, reports).
+
+Entries are keyed by the calling user (the principal of the run's API key, see
+flame_api.ApiCredential), organization, resource and the normalized filters of the read,
+which resolve to the active project/cycle the same way the tools do.
+`listExpenses(cycle_id=7)` run by the browser and `fetch_expenses(cycle_id=7)` run on the
+server share one entry, and the same user's threads in one organization share them too.
+What one user may read (their project assignments) is never served to another. A run
+without a per-user credential is not cached at all: its reads and answers always go to
+the API and the model.
+
+Every entry records the version of the resources it depends on when it was stored.
+A successful mutating tool (`logExpense`, `recordSale`, `update*`, `delete*`, ...) bumps
+the versions of the resources it touches in its organization. Stale entries then miss
+without needing a scan.
+
+The versions are also the invalidation signal of the response cache, the analytics ledger
+cache and prefetched reads. With several server workers (server.py) each process has its
+own entries, but the versions must be common to all of them, or a mutation in one worker
+would leave the others serving stale data. `FLAME_CACHE_VERSIONS_PATH` keeps them in a
+SQLite file the workers share; server.py points it at the checkpoint file. Unset, they
+live in the process.
+
+Configure with `FLAME_ENTITY_CACHE_TTL` (seconds, 0 disables) and `FLAME_ENTITY_CACHE_SIZE`.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from flame_api import caller_credential
+
+ENTITY_CACHE_TTL = float(os.getenv("FLAME_ENTITY_CACHE_TTL", "120"))
+ENTITY_CACHE_SIZE = int(os.getenv("FLAME_ENTITY_CACHE_SIZE", "1024"))
+CACHE_VERSIONS_PATH = os.getenv("FLAME_CACHE_VERSIONS_PATH", "")
+
+
+class ReadSpec(NamedTuple):
+    resource: str
+    # resources whose mutation makes the result stale
+    depends: Tuple[str, ...]
+    # argument -> shared state key used when the argument is omitted
+    state_defaults: Dict[str, str] = {}
+    # argument -> value the API applies when the argument is omitted
+    defaults: Dict[str, Any] = {}
+
+
+_PROJECT_CYCLE = {"project_id": "activeProjectId", "cycle_id": "activeCycleId"}
+
+READ_TOOLS: Dict[str, ReadSpec] = {
+    "listExpenses": ReadSpec("expenses", ("expenses",), _PROJECT_CYCLE, {"limit": 100}),
+    "fetch_expenses": ReadSpec("expenses", ("expenses",), _PROJECT_CYCLE, {"limit": 100}),
+    "listSales": ReadSpec("sales", ("sales",), _PROJECT_CYCLE, {"limit": 100}),
+    "fetch_sales": ReadSpec("sales", ("sales",), _PROJECT_CYCLE, {"limit": 100}),
+    "listCycles": ReadSpec("cycles", ("cycles",), {"project_id": "activeProjectId"}),
+    "fetch_cycles": ReadSpec("cycles", ("cycles",), {"project_id": "activeProjectId"}),
+    "listProjects": ReadSpec("projects", ("projects",), {"organization_id": "activeOrganizationId"}),
+    "fetch_projects": ReadSpec("projects", ("projects",), {"organization_id": "activeOrganizationId"}),
+    "listOrganizations": ReadSpec("organizations", ("organizations",)),
+    "fetch_organizations": ReadSpec("organizations", ("organizations",)),
+    "fetch_expense_categories": ReadSpec("expense_categories", ("expense_categories",), {"project_id": "activeProjectId"}),
+    "fetch_payment_methods": ReadSpec("payment_methods", ("payment_methods",)),
+    "fetch_vendors": ReadSpec("vendors", ("vendors",)),
+    "fetch_expenses_by_category": ReadSpec("expenses_by_category", ("expenses", "expense_categories"), _PROJECT_CYCLE),
+    "fetch_report_summary": ReadSpec("report_summary", ("expenses", "sales", "cycles"), _PROJECT_CYCLE),
+}
+
+# Entity named in a mutating tool -> resources it invalidates
+MUTATION_RESOURCES: Dict[str, Tuple[str, ...]] = {
+    "Expense": ("expenses",),
+    "Sale": ("sales",),
+    "Invoice": ("sales",),
+    "Project": ("projects",),
+    "Cycle": ("cycles",),
+    "Organization": ("organizations",),
+    "Vendor": ("vendors",),
+    "PaymentMethod": ("payment_methods",),
+    "Category": ("expense_categories",),
+    "ExpenseCategory": ("expense_categories",),
+}
+
+_MUTATION_RE = re.compile(r"^(log|record|create|update|delete|generate)([A-Z]\w*)$")
+_ALL = "*"
+
+
+class CacheScope(NamedTuple):
+    principal: str
+    organization: str
+
+    @property
+    def cacheable(self) -> bool:
+        """Only a real per-user principal may be cached for; never the organization alone."""
+        return bool(self.principal)
+
+
+def cache_scope(state: Optional[Dict[str, Any]], config: Optional[Dict[str, Any]] = None) -> CacheScope:
+    credential = caller_credential(config)
+    principal = credential.principal if credential is not None else ""
+    return CacheScope(principal, str((state or {}).get("activeOrganizationId") or ""))
+
+
+def mutation_resources(tool_name: str) -> Optional[Tuple[str, ...]]:
+    """Resources a mutating tool invalidates, `("*",)` when unknown, None for non-mutating tools."""
+    match = _MUTATION_RE.match(tool_name or "")
+    if not match:
+        return None
+    return MUTATION_RESOURCES.get(match.group(2), (_ALL,))
+
+
+def read_filters(tool_name: str, args: Optional[Dict[str, Any]], state: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, str]]:
+    """Normalized filters of a read call (omitted args resolved like the tools do), or None."""
+    spec = READ_TOOLS.get(tool_name)
+    if spec is None:
+        return None
+    filters: Dict[str, str] = {}
+    for key, value in (args or {}).items():
+        if value is not None and value != "":
+            filters[key] = str(value)
+    for key, state_key in spec.state_defaults.items():
+        if key not in filters:
+            active = (state or {}).get(state_key)
+            if active not in (None, "", "None"):
+                filters[key] = str(active)
+    for key, value in spec.defaults.items():
+        filters.setdefault(key, str(value))
+    return filters
+
+
+def _succeeded(content: Any) -> bool:
+    try:
+        payload = json.loads(content) if isinstance(content, str) else content
+    except (TypeError, ValueError):
+        return "error" not in str(content).lower()
+    if isinstance(payload, dict):
+        return payload.get("success") is not False and not payload.get("error")
+    return True
+
+
+_VERSIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flame_cache_versions (
+    organization TEXT NOT NULL,
+    resource TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (organization, resource)
+) WITHOUT ROWID;
+"""
+
+
+class SharedVersions:
+    """Resource versions in a SQLite file, so every worker process sees every worker's mutations."""
+
+    def __init__(self, path: str, busy_timeout_seconds: float = 30.0):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=busy_timeout_seconds)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_VERSIONS_SCHEMA)
+        self._lock = threading.Lock()
+
+    def bump(self, organization: str, resources: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO flame_cache_versions VALUES (?, ?, 1) "
+                    "ON CONFLICT(organization, resource) DO UPDATE SET version = version + 1",
+                    [(organization, resource) for resource in resources],
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def get(self, organization: str, resources: Sequence[str]) -> Tuple[int, ...]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT resource, version FROM flame_cache_versions WHERE organization = ? AND resource IN ({','.join('?' * len(resources))})",
+                (organization, *resources),
+            ).fetchall()
+        versions = dict(rows)
+        return tuple(versions.get(resource, 0) for resource in resources)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires: float
+    versions: Tuple[int, ...]
+    origin: Optional[str]
+
+
+class EntityCache:
+    """Process-wide read-through cache with TTL, LRU bound and version-based invalidation."""
+
+    def __init__(self, ttl: float = ENTITY_CACHE_TTL, max_entries: int = ENTITY_CACHE_SIZE, versions_path: str = CACHE_VERSIONS_PATH):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._shared: Optional[SharedVersions] = SharedVersions(versions_path) if versions_path else None
+        self._observed: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _key(self, scope: CacheScope, tool_name: str, filters: Dict[str, str]) -> Tuple:
+        return (scope.principal, scope.organization, READ_TOOLS[tool_name].resource, tuple(sorted(filters.items())))
+
+    def _snapshot(self, organization: str, depends: Sequence[str]) -> Tuple[int, ...]:
+        if self._shared is not None:
+            return self._shared.get(organization, (_ALL, *depends))
+        return (self._versions.get((organization, _ALL), 0), *(self._versions.get((organization, r), 0) for r in depends))
+
+    def versions(self, organization: str, resources: Sequence[str]) -> Tuple[int, ...]:
+        """Current version stamp of `resources` in an organization (changes on any mutation of them)."""
+        with self._lock:
+            return self._snapshot(organization, resources)
+
+    def get(self, scope: CacheScope, tool_name: str, filters: Dict[str, str]) -> Optional[_Entry]:
+        if not self.enabled or not scope.cacheable or tool_name not in READ_TOOLS:
+            return None
+        key = self._key(scope, tool_name, filters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires < time.monotonic() or entry.versions != self._snapshot(scope.organization, READ_TOOLS[tool_name].depends):
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, scope: CacheScope, tool_name: str, filters: Dict[str, str]) -> bool:
+        """Whether a fresh entry exists, without counting a lookup or touching its LRU position."""
+        if not self.enabled or not scope.cacheable or tool_name not in READ_TOOLS:
+            return False
+        with self._lock:
+            entry = self._entries.get(self._key(scope, tool_name, filters))
+            return (
+                entry is not None
+                and entry.expires >= time.monotonic()
+                and entry.versions == self._snapshot(scope.organization, READ_TOOLS[tool_name].depends)
+            )
+
+    def put(self, scope: CacheScope, tool_name: str, filters: Dict[str, str], value: Any, origin: Optional[str] = None) -> None:
+        if not self.enabled or not scope.cacheable or tool_name not in READ_TOOLS:
+            return
+        key = self._key(scope, tool_name, filters)
+        with self._lock:
+            versions = self._snapshot(scope.organization, READ_TOOLS[tool_name].depends)
+            self._entries[key] = _Entry(value, time.monotonic() + self.ttl, versions, origin)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, organization: str, resources: Iterable[str]) -> None:
+        with self._lock:
+            if self._shared is not None:
+                self._shared.bump(organization, tuple(resources))
+            else:
+                for resource in resources:
+                    key = (organization, resource)
+                    self._versions[key] = self._versions.get(key, 0) + 1
+            self.invalidations += 1
+
+    def observe_tool_results(self, messages: Sequence[BaseMessage], state: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Feed the tool results answering the latest AIMessage into the cache: successful
+        mutations invalidate their resources, frontend list* results are stored.
+        Each tool_call_id is handled once, however many hops see it.
+        """
+        if not self.enabled:
+            return
+        results: List[ToolMessage] = []
+        calls: Dict[str, Dict[str, Any]] = {}
+        for message in reversed(messages):
+            if isinstance(message, ToolMessage):
+                results.append(message)
+                continue
+            if isinstance(message, AIMessage):
+                calls = {tc.get("id"): tc for tc in message.tool_calls or []}
+            break
+        scope = cache_scope(state, config)
+        for message in reversed(results):
+            call = calls.get(message.tool_call_id)
+            if call is None:
+                continue
+            with self._lock:
+                if message.tool_call_id in self._observed:
+                    continue
+                self._observed[message.tool_call_id] = None
+                while len(self._observed) > self.max_entries:
+                    self._observed.popitem(last=False)
+            name = call.get("name", "")
+            if not _succeeded(message.content):
+                continue
+            resources = mutation_resources(name)
+            if resources is not None:
+                self.invalidate(scope.organization, resources)
+            elif name.startswith("list") and isinstance(message.content, str):
+                filters = read_filters(name, call.get("args"), state)
+                try:
+                    payload = json.loads(message.content)
+                except ValueError:
+                    payload = None
+                if filters is not None and isinstance(payload, dict):
+                    self.put(scope, name, filters, payload, origin=message.tool_call_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._observed.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "shared_versions": self._shared is not None,
+            }
+
+
+entity_cache = EntityCache()
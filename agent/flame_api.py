@@ -0,0 +1,205 @@
+"""
+Pooled async access to the Flame REST API (the Next.js `/api/*` routes).
+
+Backend read tools (see api_tools.py) and bulk write tools (see bulk_tools.py) call the
+API directly instead of round-tripping through the browser. All calls share one
+`httpx.AsyncClient` per event loop, so TCP/TLS connections are reused across tool calls,
+hops and threads. Requests have a total timeout and are retried with exponential backoff:
+GETs on connection errors, 429 and 5xx; POSTs only when the request cannot have been
+processed (connect errors and 429), so a retry never creates a duplicate record.
+
+Configuration:
+- `FLAME_API_BASE_URL`: e.g. `http://localhost:3000` (unset disables the API tools)
+- `FLAME_API_TIMEOUT`, `FLAME_API_RETRIES`, `FLAME_API_MAX_CONNECTIONS`
+
+Every call is made as the user the run belongs to. Their own `flame_ak_...` key arrives
+with the run (`ApiCredential` in `config["configurable"]["flame_credential"]`, set by
+server.py from the web app's `X-Flame-Api-Key` header) and is sent as
+`Authorization: Bearer`. There is no process-wide key. A run without a credential gets no
+API tools bound (see agent.py), and any call made anyway fails.
+"""
+
+import asyncio
+import os
+import random
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import httpx
+
+API_BASE_URL = os.getenv("FLAME_API_BASE_URL", "").rstrip("/")
+API_TIMEOUT = float(os.getenv("FLAME_API_TIMEOUT", "10"))
+API_RETRIES = int(os.getenv("FLAME_API_RETRIES", "2"))
+API_MAX_CONNECTIONS = int(os.getenv("FLAME_API_MAX_CONNECTIONS", "20"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# A POST that reached the server may have written; only retry what was certainly rejected
+POST_RETRY_STATUSES = {429}
+POST_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class FlameApiError(Exception):
+    """A Flame API call failed after retries or returned an error payload."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiCredential(NamedTuple):
+    """
+    The calling user's Flame API key. Not a str, so LangGraph does not copy it from
+    `configurable` into checkpoint metadata.
+    """
+
+    key: str
+
+    @property
+    def principal(self) -> str:
+        # "flame_ak_<prefix>_<secret>": the prefix names the key (one user, one
+        # organization) without revealing it
+        return "ak:" + self.key.split("_")[2]
+
+    def __repr__(self) -> str:
+        return f"ApiCredential(principal={self.principal!r})"
+
+
+def parse_api_key(value: Any) -> Optional[ApiCredential]:
+    """An `ApiCredential` for a well-formed `flame_ak_<prefix>_<secret>` key, else None."""
+    if not isinstance(value, str):
+        return None
+    parts = value.strip().split("_")
+    if len(parts) < 4 or parts[0] != "flame" or parts[1] != "ak" or not parts[2] or not "_".join(parts[3:]):
+        return None
+    return ApiCredential(value.strip())
+
+
+def caller_credential(config: Optional[Dict[str, Any]]) -> Optional[ApiCredential]:
+    """The run's per-user credential, or None when the run has none."""
+    credential = ((config or {}).get("configurable") or {}).get("flame_credential")
+    return credential if isinstance(credential, ApiCredential) else None
+
+
+class FlameApiClient:
+    """Shared, connection-pooled client for the Flame REST API."""
+
+    def __init__(
+        self,
+        base_url: str = API_BASE_URL,
+        timeout: float = API_TIMEOUT,
+        retries: int = API_RETRIES,
+        max_connections: int = API_MAX_CONNECTIONS,
+        backoff: float = 0.2,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.max_connections = max_connections
+        self.backoff = backoff
+        self._clients: Dict[int, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.base_url)
+
+    def _client(self) -> httpx.AsyncClient:
+        # An AsyncClient is bound to the loop it first ran on; keep one per running loop
+        loop = asyncio.get_running_loop()
+        key = id(loop)
+        with self._lock:
+            # forget clients of loops that have since closed (e.g. repeated asyncio.run)
+            for stale in [k for k, (l, _) in self._clients.items() if l.is_closed()]:
+                del self._clients[stale]
+            client = self._clients.get(key, (None, None))[1]
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                    headers={"Accept": "application/json"},
+                )
+                self._clients[key] = (loop, client)
+            return client
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None, api_key: Optional[str] = None) -> Dict[str, Any]:
+        """GET `path` as the owner of `api_key` and return the decoded JSON body; raises FlameApiError."""
+        query = {k: v for k, v in (params or {}).items() if v is not None and v != ""}
+        return await self._request("GET", path, api_key, RETRY_STATUSES, (httpx.TransportError,), params=query)
+
+    async def post(self, path: str, body: Dict[str, Any], api_key: Optional[str] = None) -> Dict[str, Any]:
+        """POST a JSON `body` to `path` as the owner of `api_key`; raises FlameApiError."""
+        return await self._request("POST", path, api_key, POST_RETRY_STATUSES, POST_RETRY_ERRORS, json=body)
+
+    async def _request(self, method: str, path: str, api_key: Optional[str], retry_statuses, retry_errors, **kwargs: Any) -> Dict[str, Any]:
+        if not self.enabled:
+            raise FlameApiError("FLAME_API_BASE_URL is not configured")
+        if not api_key:
+            # never fall back to some other account's access
+            raise FlameApiError("no Flame API key for this user; the assistant cannot read or write their data", 401)
+        headers = {"Authorization": f"Bearer {api_key}"}
+        client = self._client()
+
+        attempt = 0
+        while True:
+            with self._lock:
+                self.requests += 1
+            try:
+                response = await client.request(method, path, headers=headers, **kwargs)
+                if response.status_code in retry_statuses and attempt < self.retries:
+                    raise _Retry(f"HTTP {response.status_code}")
+            except (*retry_errors, _Retry) as exc:
+                if attempt >= self.retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise FlameApiError(f"{method} {path} failed: {exc}") from exc
+                attempt += 1
+                with self._lock:
+                    self.retried += 1
+                await asyncio.sleep(self.backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+                continue
+            except httpx.TransportError as exc:
+                with self._lock:
+                    self.failures += 1
+                raise FlameApiError(f"{method} {path} failed: {exc}") from exc
+
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            if response.status_code >= 400 or (isinstance(body, dict) and body.get("status") == "error"):
+                with self._lock:
+                    self.failures += 1
+                message = body.get("message") if isinstance(body, dict) else None
+                raise FlameApiError(message or f"{method} {path} returned HTTP {response.status_code}", response.status_code)
+            return body if isinstance(body, dict) else {"data": body}
+
+    async def aclose(self) -> None:
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for loop, client in clients:
+            if loop is asyncio.get_running_loop():
+                await client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "requests": self.requests,
+                "retried": self.retried,
+                "failures": self.failures,
+                "clients": len(self._clients),
+            }
+
+
+class _Retry(Exception):
+    pass
+
+
+flame_api = FlameApiClient()
@@ -0,0 +1,171 @@
+"""
+Token-budget-aware history compaction for the Flame Assistant.
+
+Replaces a fixed "last N messages" trim. The newest turns are kept until a token budget
+is spent, oversized tool results are truncated, and AIMessage tool calls always travel
+together with their ToolMessage results so the provider never sees an orphaned pair.
+Evicted turns are folded into a short rolling summary that is cached in graph state.
+"""
+
+import json
+import os
+from typing import List, NamedTuple, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("FLAME_HISTORY_TOKEN_BUDGET", "6000"))
+TOOL_MESSAGE_TOKEN_LIMIT = int(os.getenv("FLAME_TOOL_MESSAGE_TOKEN_LIMIT", "1500"))
+SUMMARY_TOKEN_LIMIT = int(os.getenv("FLAME_HISTORY_SUMMARY_TOKENS", "600"))
+
+# Rough chars-per-token ratio for English/JSON with Groq-hosted tokenizers
+CHARS_PER_TOKEN = 4
+# Fixed per-message framing cost (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_LINE_CHARS = 160
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _content_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and isinstance(part.get("text"), str):
+            parts.append(part["text"])
+    return "\n".join(parts)
+
+
+def message_tokens(message: BaseMessage) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(_content_text(message))
+    for tc in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(tc.get("name", "")) + estimate_tokens(json.dumps(tc.get("args", {}), default=str))
+    return tokens
+
+
+def truncate_tool_message(message: ToolMessage, max_tokens: int) -> ToolMessage:
+    """Return `message` with its content cut to roughly `max_tokens`, keeping the tool_call_id."""
+    text = _content_text(message)
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return message
+    omitted = len(text) - max_chars
+    return message.model_copy(update={"content": f"{text[:max_chars]}\n...[truncated {omitted} chars]"})
+
+
+def _group_units(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """
+    Split history into units that must be kept or dropped together: an AIMessage with
+    tool calls plus the ToolMessages answering it. ToolMessages with no matching call are dropped.
+    """
+    units: List[List[BaseMessage]] = []
+    open_call_ids: set = set()
+    for message in messages:
+        if isinstance(message, ToolMessage):
+            if message.tool_call_id in open_call_ids and units:
+                units[-1].append(message)
+            continue
+        units.append([message])
+        if isinstance(message, AIMessage) and message.tool_calls:
+            open_call_ids = {tc.get("id") for tc in message.tool_calls}
+        else:
+            open_call_ids = set()
+    return units
+
+
+def _summary_line(message: BaseMessage) -> Optional[str]:
+    text = " ".join(_content_text(message).split())
+    if isinstance(message, HumanMessage):
+        return f"User: {text[:SUMMARY_LINE_CHARS]}" if text else None
+    if isinstance(message, AIMessage):
+        calls = [tc.get("name", "?") for tc in message.tool_calls or []]
+        if calls:
+            return f"Assistant called: {', '.join(calls)}"
+        return f"Assistant: {text[:SUMMARY_LINE_CHARS]}" if text else None
+    if isinstance(message, ToolMessage):
+        name = message.name or "tool"
+        return f"{name} result: {text[:SUMMARY_LINE_CHARS // 2]}" if text else None
+    return None
+
+
+def summarize_messages(messages: Sequence[BaseMessage], previous_summary: str = "", max_tokens: int = SUMMARY_TOKEN_LIMIT) -> str:
+    """Extend `previous_summary` with one line per evicted message, keeping the newest lines within budget."""
+    lines = [line for line in previous_summary.splitlines() if line]
+    lines.extend(line for line in (_summary_line(m) for m in messages) if line)
+    budget = max_tokens * CHARS_PER_TOKEN
+    kept: List[str] = []
+    used = 0
+    for line in reversed(lines):
+        used += len(line) + 1
+        if used > budget:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+
+class CompactedHistory(NamedTuple):
+    messages: List[BaseMessage]
+    summary: str
+    summarized_count: int
+
+
+def compact_history(
+    messages: Sequence[BaseMessage],
+    *,
+    previous_summary: str = "",
+    summarized_count: int = 0,
+    budget_tokens: int = HISTORY_TOKEN_BUDGET,
+    max_tool_message_tokens: int = TOOL_MESSAGE_TOKEN_LIMIT,
+) -> CompactedHistory:
+    """
+    Select the newest messages that fit in `budget_tokens`.
+
+    `summarized_count` is the number of leading messages already folded into
+    `previous_summary`; only messages evicted since then are summarized again.
+    """
+    messages = list(messages)
+    if summarized_count > len(messages):
+        # History was reset or rewritten; the cached summary no longer applies
+        previous_summary, summarized_count = "", 0
+
+    units = _group_units(messages[summarized_count:])
+    kept_units: List[List[BaseMessage]] = []
+    used = 0
+    for unit in reversed(units):
+        unit = [truncate_tool_message(m, max_tool_message_tokens) if isinstance(m, ToolMessage) else m for m in unit]
+        cost = sum(message_tokens(m) for m in unit)
+        if kept_units and used + cost > budget_tokens:
+            break
+        kept_units.append(unit)
+        used += cost
+    kept_units.reverse()
+
+    kept = [m for unit in kept_units for m in unit]
+    evicted_units = units[: len(units) - len(kept_units)]
+    evicted = [m for unit in evicted_units for m in unit]
+    if not evicted:
+        return CompactedHistory(kept, previous_summary, summarized_count)
+
+    first_kept = kept[0] if kept else None
+    new_count = len(messages)
+    if first_kept is not None:
+        new_count = next(i for i in range(summarized_count, len(messages)) if messages[i] is first_kept)
+    summary = summarize_messages(evicted, previous_summary)
+    return CompactedHistory(kept, summary, new_count)
+
+
+def summary_message(summary: str) -> Optional[SystemMessage]:
+    if not summary:
+        return None
+    return SystemMessage(
+        content=(
+            "EARLIER CONVERSATION (summary of older turns no longer shown verbatim):\n"
+            f"{summary}"
+        )
+    )
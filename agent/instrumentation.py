@@ -0,0 +1,310 @@
+"""
+Structured instrumentation for the Flame Assistant graph.
+
+Each `chat_node` hop gets a `Hop` with timing spans (prompt build, tool binding, LLM call,
+plan prediction), token counts, TTFT and the routing decision. Finished hops feed
+Prometheus-style counters/histograms and, when sampled, one JSON log line.
+
+Enable with `FLAME_METRICS=1`. `FLAME_METRICS_SAMPLE_RATE` (0..1) controls how many hops
+are logged; `FLAME_METRICS_PORT` starts a local `/metrics` endpoint in text format. With
+`FLAME_METRICS_PORT_SPAN=N` a process takes the first free port of PORT..PORT+N-1, so
+each of N server workers gets its own endpoint (server.py sets it to the worker count).
+When disabled, `hop()` returns a shared no-op object and nothing is measured.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("flame.agent")
+
+METRICS_ENABLED = os.getenv("FLAME_METRICS", "0") not in ("0", "false", "False", "")
+SAMPLE_RATE = float(os.getenv("FLAME_METRICS_SAMPLE_RATE", "1.0"))
+
+# Seconds; covers local overhead (ms) up to slow LLM generations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = [*key, *(extra or {}).items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    """Minimal counter/histogram store rendered in Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def inc(self, name: str, value: float = 1.0, help: str = "", **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+            if help:
+                self._help.setdefault(name, help)
+
+    def set(self, name: str, value: float, help: str = "", **labels: Any) -> None:
+        """Set a labelled gauge (collectors cover unlabelled ones)."""
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name: str, value: float, help: str = "", **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # bucket counts..., +Inf count, sum
+            buckets = series.get(key)
+            if buckets is None:
+                buckets = series[key] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            buckets[-2] += 1
+            buckets[-1] += value
+            if help:
+                self._help.setdefault(name, help)
+
+    def register_collector(self, name: str, collect: Callable[[], Dict[str, Any]]) -> None:
+        """Export a component's numeric `stats()` as gauges named `flame_<name>_<key>`."""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, buckets in series.items():
+                    for bound, count in zip(LATENCY_BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{_format_labels(key, {'le': str(bound)})} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {buckets[-2]}")
+                    lines.append(f"{name}_count{_format_labels(key)} {buckets[-2]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {buckets[-1]}")
+            for name, series in sorted(self._gauges.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            collectors = list(self._collectors.items())
+        for component, collect in collectors:
+            try:
+                stats = collect()
+            except Exception as exc:
+                logger.warning("metrics collector %s failed: %s", component, exc)
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f"flame_{component}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class _Span:
+    __slots__ = ("hop", "name", "started")
+
+    def __init__(self, hop: "Hop", name: str):
+        self.hop = hop
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hop.spans[self.name] = self.hop.spans.get(self.name, 0.0) + (time.perf_counter() - self.started)
+        return False
+
+
+class Hop:
+    """Measurements for a single node execution."""
+
+    def __init__(self, node: str, sampled: bool, export: bool = True):
+        self.node = node
+        self.sampled = sampled
+        self.export = export
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.attributes: Dict[str, Any] = {}
+
+    def span(self, name: str) -> _Span:
+        return _Span(self, name)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def record_response(self, response: Any, ttft: Optional[float] = None) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.attributes["tokens_in"] = usage.get("input_tokens")
+        self.attributes["tokens_out"] = usage.get("output_tokens")
+        if ttft is not None:
+            self.attributes["ttft"] = ttft
+
+    def finish(self, route: Any = None) -> None:
+        if not self.export:
+            return
+        duration = time.perf_counter() - self.started
+        route = str(route) if route is not None else "unknown"
+        metrics.observe("flame_node_duration_seconds", duration, "Graph node wall time", node=self.node)
+        metrics.inc("flame_route_total", 1, "Routing decisions taken by a node", node=self.node, route=route)
+        for name, seconds in self.spans.items():
+            metrics.observe("flame_span_duration_seconds", seconds, "Time spent in a chat_node phase", node=self.node, span=name)
+        if self.attributes.get("ttft") is not None:
+            metrics.observe("flame_llm_ttft_seconds", self.attributes["ttft"], "LLM time to first token")
+        for direction in ("in", "out"):
+            tokens = self.attributes.get(f"tokens_{direction}")
+            if tokens:
+                metrics.inc("flame_llm_tokens_total", tokens, "LLM tokens", direction=direction)
+        if self.sampled:
+            logger.info(json.dumps({
+                "event": "node_hop",
+                "node": self.node,
+                "route": route,
+                "duration_ms": round(duration * 1000, 3),
+                "spans_ms": {k: round(v * 1000, 3) for k, v in self.spans.items()},
+                **{k: v for k, v in self.attributes.items() if v is not None},
+            }, default=str))
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullHop:
+    """Shared no-op stand-in used when instrumentation is disabled."""
+
+    __slots__ = ()
+    sampled = False
+
+    def span(self, name: str) -> _NullSpan:
+        return _NULL_SPAN
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def record_response(self, response: Any, ttft: Optional[float] = None) -> None:
+        pass
+
+    def finish(self, route: Any = None) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+NULL_HOP = _NullHop()
+
+
+def hop(node: str, measure: bool = False):
+    """
+    Start measuring one node execution; returns `NULL_HOP` when metrics are disabled, unless
+    `measure` asks for the spans anyway (trace recording), in which case nothing is exported.
+    """
+    if not METRICS_ENABLED:
+        return Hop(node, sampled=False, export=False) if measure else NULL_HOP
+    return Hop(node, sampled=SAMPLE_RATE >= 1.0 or random.random() < SAMPLE_RATE)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def metrics_port() -> Optional[int]:
+    """Port of this process's `/metrics` endpoint, if it serves one."""
+    return _server.server_address[1] if _server is not None else None
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve `/metrics` from a daemon thread (idempotent)."""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="flame-metrics", daemon=True).start()
+    return _server
+
+
+def stop_metrics_server() -> None:
+    """Release this process's `/metrics` port (the server's supervisor hands it to a worker)."""
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+
+
+if METRICS_ENABLED and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+if METRICS_ENABLED and os.getenv("FLAME_METRICS_PORT"):
+    _base_port = int(os.environ["FLAME_METRICS_PORT"])
+    for _port in range(_base_port, _base_port + max(1, int(os.getenv("FLAME_METRICS_PORT_SPAN", "1")))):
+        try:
+            start_metrics_server(_port, os.getenv("FLAME_METRICS_HOST", "127.0.0.1"))
+            break
+        except OSError as exc:
+            # taken by another worker of this server: try the next port of the span
+            _bind_error = exc
+    else:
+        logger.warning("metrics endpoint not started: %s", _bind_error)
@@ -0,0 +1,283 @@
+"""
+Local fast path for trivial UI requests ("open the expense form", "go to sales",
+"show this project").
+
+`IntentRouter.classify` matches the latest user message against a keyword/regex table
+and returns the single frontend tool call it maps to, with a confidence score. The
+`intent_router` graph node emits high-confidence `open*Form`, `navigateWorkspace` and
+`view*Details` calls directly, with no LLM round trip, and sends everything else to
+`chat_node`. An optional local classifier (any `text -> IntentMatch | None` callable,
+e.g. a small on-box model) is consulted when no rule matches.
+
+Configure with `FLAME_INTENT_ROUTER` (on/off) and `FLAME_INTENT_THRESHOLD` (0..1).
+"""
+
+import json
+import os
+import re
+import threading
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+INTENT_ROUTER_ENABLED = os.getenv("FLAME_INTENT_ROUTER", "1") not in ("0", "false", "False", "")
+INTENT_THRESHOLD = float(os.getenv("FLAME_INTENT_THRESHOLD", "0.85"))
+
+# A match covering the whole message scores FULL; one embedded in a longer message scores PARTIAL
+FULL_MATCH_CONFIDENCE = 0.95
+PARTIAL_MATCH_CONFIDENCE = 0.6
+# Several clauses ("... and log 3 expenses") usually mean more than one intent
+MULTI_CLAUSE_PENALTY = 0.35
+
+_POLITE = re.compile(r"(?:please\s+|pls\s+|can you\s+|could you\s+|would you\s+|kindly\s+|hey\s+|flame,?\s+)*", re.IGNORECASE)
+_TRAILER = re.compile(r"(?:\s+(?:please|pls|for me|now|thanks|thank you))*[\s.!?]*", re.IGNORECASE)
+_MULTI_CLAUSE = re.compile(r"\b(?:and|then|also|after that)\b|[,;]", re.IGNORECASE)
+_NUMBER = re.compile(r"#?\b(\d+)\b")
+_OPEN = r"(?:open|show|bring up|pull up|start|launch)"
+
+
+class LazyPattern:
+    """
+    Case-insensitive regex compiled on first use. The rule table has a few dozen patterns,
+    and compiling them all at import was a noticeable part of the agent's cold start.
+    """
+
+    __slots__ = ("source", "_compiled")
+
+    def __init__(self, source: str):
+        self.source = source
+        self._compiled: Optional[Pattern[str]] = None
+
+    def search(self, text: str) -> Optional["re.Match[str]"]:
+        if self._compiled is None:
+            self._compiled = re.compile(self.source, re.IGNORECASE)
+        return self._compiled.search(text)
+
+
+class IntentMatch(NamedTuple):
+    tool: str
+    args: Dict[str, Any]
+    confidence: float
+    rule: str
+
+
+class IntentRule(NamedTuple):
+    name: str
+    tool: str
+    pattern: LazyPattern
+    # builds tool args from the regex match and shared state; None means the rule cannot apply
+    build_args: Callable[["re.Match[str]", Dict[str, Any]], Optional[Dict[str, Any]]]
+    confirmation: str
+
+
+def _form_rule(name: str, tool: str, target: str, confirmation: str) -> IntentRule:
+    pattern = LazyPattern(rf"{_OPEN}\s+(?:up\s+)?(?:the\s+|a\s+|an\s+|new\s+|my\s+)*{target}")
+    return IntentRule(name, tool, pattern, lambda match, state: {}, confirmation)
+
+
+FORM_RULES: List[IntentRule] = [
+    _form_rule("expense_form", "openExpenseForm", r"expense\s+form\b", "I've opened the expense form for you."),
+    _form_rule("vendor_form", "openVendorForm", r"vendor\s+form\b", "I've opened the vendor form for you."),
+    _form_rule("payment_method_form", "openPaymentMethodForm", r"payment[\s-]+method\s+form\b", "I've opened the payment method form for you."),
+    _form_rule("sale_form", "openSaleForm", r"sales?\s+form\b", "I've opened the sale form for you."),
+    _form_rule("invoice_form", "openInvoiceForm", r"invoice\s+form\b", "I've opened the invoice form for you."),
+    _form_rule("customer_form", "openCustomerForm", r"customer\s+form\b", "I've opened the customer form for you."),
+    _form_rule("project_form", "openProjectForm", r"project\s+form\b", "I've opened the project form for you."),
+    _form_rule("organization_form", "openOrganizationForm", r"(?:organi[sz]ation|org)\s+form\b", "I've opened the organization form for you."),
+    _form_rule("cycle_form", "openCycleForm", r"cycle\s+form\b", "I've opened the cycle form for you."),
+    _form_rule("inventory_form", "openInventoryForm", r"inventory(?:\s+item)?\s+form\b", "I've opened the inventory form for you."),
+]
+
+# path, label
+NAVIGATION_TARGETS: Dict[str, Tuple[str, str]] = {
+    r"(?:the\s+)?(?:dashboard|home(?:\s*page)?)": ("/", "the dashboard"),
+    r"(?:the\s+)?sales(?:\s+(?:management|page|section))?": ("/sales-management", "sales"),
+    r"(?:the\s+)?expenses?(?:\s+(?:management|page|section))?": ("/expense-management", "expenses"),
+    r"(?:the\s+)?reports?(?:\s+(?:page|section))?": ("/reports", "reports"),
+    r"(?:the\s+)?inventory(?:\s+(?:page|section))?": ("/inventory", "inventory"),
+    r"(?:the\s+)?customers?(?:\s+(?:page|section))?": ("/customers", "customers"),
+    r"(?:the\s+)?receipts?(?:\s+(?:page|section))?": ("/receipts", "receipts"),
+    r"(?:the\s+)?teams?(?:\s+(?:page|section))?": ("/teams", "teams"),
+    r"(?:the\s+)?settings(?:\s+page)?": ("/settings", "settings"),
+    r"(?:the\s+)?workspace(?:\s+management)?": ("/workspace-management", "workspace management"),
+}
+
+NAVIGATION_RULES: List[IntentRule] = [
+    IntentRule(
+        f"navigate:{path}",
+        "navigateWorkspace",
+        LazyPattern(rf"(?:go|navigate|take me|bring me|switch|jump)\s+(?:back\s+)?to\s+{target}\b"),
+        lambda match, state, path=path: {"path": path},
+        f"Done, you're now on {label}.",
+    )
+    for target, (path, label) in NAVIGATION_TARGETS.items()
+]
+
+
+def _detail_args(entity: str, state_key: Optional[str]):
+    def build(match, state):
+        number = _NUMBER.search(match.group(0))
+        if number:
+            return {"id": int(number.group(1))}
+        if match.group("this") and state_key:
+            active = str(state.get(state_key) or "")
+            if active.isdigit():
+                return {"id": int(active)}
+        return None
+    return build
+
+
+# (entity word, tool, active-state key usable for "this <entity>")
+DETAIL_ENTITIES: List[Tuple[str, str, Optional[str]]] = [
+    (r"project", "viewProjectDetails", "activeProjectId"),
+    (r"cycle", "viewCycleDetails", "activeCycleId"),
+    (r"(?:organi[sz]ation|org)", "viewOrganizationDetails", "activeOrganizationId"),
+    (r"sale", "viewSaleDetails", None),
+    (r"expense", "viewExpenseDetails", None),
+    (r"customer", "viewCustomerDetails", None),
+]
+
+DETAIL_RULES: List[IntentRule] = [
+    IntentRule(
+        f"details:{tool}",
+        tool,
+        LazyPattern(
+            rf"(?:show|view|open|display|see)\s+(?:me\s+)?(?:the\s+)?(?:details\s+(?:of|for)\s+)?"
+            rf"(?:(?P<this>this|current|active)\s+{entity}|{entity}\s+(?:id\s+|number\s+|no\.?\s*)?#?\d+)(?:'?s)?(?:\s+details)?\b"
+        ),
+        _detail_args(entity, state_key),
+        "Here are the details.",
+    )
+    for entity, tool, state_key in DETAIL_ENTITIES
+]
+
+INTENT_RULES: List[IntentRule] = [*FORM_RULES, *NAVIGATION_RULES, *DETAIL_RULES]
+
+# Tool call ids issued by the router carry this prefix, so the follow-up run can recognise them
+CALL_ID_PREFIX = "intent_"
+
+
+def intent_tool_call(match: IntentMatch) -> Dict[str, Any]:
+    """LangChain-style tool call for `match`."""
+    return {"name": match.tool, "args": match.args, "id": f"{CALL_ID_PREFIX}{uuid.uuid4().hex[:24]}", "type": "tool_call"}
+
+
+def confirmation_for(call: Dict[str, Any]) -> str:
+    """Canned reply once the client has run a router-issued call."""
+    name, args = call.get("name"), call.get("args") or {}
+    for rule in INTENT_RULES:
+        if rule.tool != name:
+            continue
+        if name == "navigateWorkspace" and rule.name != f"navigate:{args.get('path')}":
+            continue
+        return rule.confirmation
+    return "Done."
+
+
+def answered_router_calls(messages: List[Any]) -> Optional[List[Tuple[Dict[str, Any], Any]]]:
+    """
+    (call, ToolMessage) pairs when the messages end with client answers to every call of a
+    router-issued AIMessage; None otherwise.
+    """
+    results: Dict[str, Any] = {}
+    for message in reversed(messages):
+        if getattr(message, "type", "") == "tool":
+            results[message.tool_call_id] = message
+            continue
+        calls = (getattr(message, "tool_calls", None) or []) if getattr(message, "type", "") == "ai" else []
+        if not calls or not all(str(tc.get("id", "")).startswith(CALL_ID_PREFIX) and tc.get("id") in results for tc in calls):
+            return None
+        return [(tc, results[tc["id"]]) for tc in calls]
+    return None
+
+
+def tool_result_succeeded(message: Any) -> bool:
+    """Frontend actions return {"success": bool, ...}; anything unparseable counts as failure."""
+    if getattr(message, "status", "success") == "error":
+        return False
+    try:
+        payload = json.loads(message.content) if isinstance(message.content, str) else message.content
+    except ValueError:
+        return False
+    return isinstance(payload, dict) and payload.get("success", True) is not False
+
+
+class IntentRouter:
+    """Rule table plus optional local classifier, with counters of what it handled."""
+
+    def __init__(self, rules: List[IntentRule] = INTENT_RULES, threshold: float = INTENT_THRESHOLD):
+        self.rules = rules
+        self.threshold = threshold
+        self._classifier: Optional[Callable[[str], Optional[IntentMatch]]] = None
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.handled = 0
+        self.low_confidence = 0
+        self.by_tool: Counter = Counter()
+
+    def set_classifier(self, classifier: Optional[Callable[[str], Optional[IntentMatch]]]) -> None:
+        """Install a local model consulted when no rule matches (None removes it)."""
+        self._classifier = classifier
+
+    def classify(self, text: str, state: Optional[Dict[str, Any]] = None) -> Optional[IntentMatch]:
+        """Best single-tool interpretation of `text`, or None."""
+        text = (text or "").strip()
+        if not text or len(text) > 200:
+            return None
+        state = state or {}
+        candidates: List[IntentMatch] = []
+        for rule in self.rules:
+            match = rule.pattern.search(text)
+            if not match:
+                continue
+            args = rule.build_args(match, state)
+            if args is None:
+                continue
+            # only politeness before the match and a polite trailer after it
+            whole = _POLITE.fullmatch(text, 0, match.start()) and _TRAILER.fullmatch(text, match.end())
+            confidence = FULL_MATCH_CONFIDENCE if whole else PARTIAL_MATCH_CONFIDENCE
+            if not whole and _MULTI_CLAUSE.search(text):
+                confidence -= MULTI_CLAUSE_PENALTY
+            candidates.append(IntentMatch(rule.tool, args, confidence, rule.name))
+        if not candidates and self._classifier is not None:
+            try:
+                predicted = self._classifier(text)
+            except Exception:
+                predicted = None
+            if predicted is not None:
+                candidates.append(predicted)
+        if not candidates:
+            return None
+        candidates.sort(key=lambda m: m.confidence, reverse=True)
+        best = candidates[0]
+        if len(candidates) > 1 and candidates[1].tool != best.tool and candidates[1].confidence >= best.confidence:
+            # two different tools fit equally well; let the LLM decide
+            return None
+        return best
+
+    def route(self, text: str, state: Optional[Dict[str, Any]], available: Optional[set] = None) -> Optional[IntentMatch]:
+        """Classify and apply the threshold; counts every decision."""
+        match = self.classify(text, state)
+        with self._lock:
+            self.turns += 1
+            if match is None:
+                return None
+            if match.confidence < self.threshold or (available is not None and match.tool not in available):
+                self.low_confidence += 1
+                return None
+            self.handled += 1
+            self.by_tool[match.tool] += 1
+        return match
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "handled": self.handled,
+                "low_confidence": self.low_confidence,
+                "handled_rate": (self.handled / self.turns) if self.turns else 0.0,
+                **{f"handled_{tool}": count for tool, count in self.by_tool.items()},
+            }
+
+
+intent_router = IntentRouter()
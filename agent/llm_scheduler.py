@@ -0,0 +1,377 @@
+"""
+Process-wide scheduler for LLM calls.
+
+Every `chat_node` model call goes through `llm_scheduler.run`, which:
+
+- keeps request and token budgets per model. Limits come from `FLAME_LLM_RPM` /
+  `FLAME_LLM_TPM` and are otherwise learned from the provider's `x-ratelimit-*` headers,
+  which every response carries (model_registry feeds them in from an httpx response hook;
+  a failed call's are read from its error). A 429's `retry-after` / reset headers pause
+  the model until the window resets.
+- queues calls while a budget is exhausted (or `FLAME_LLM_MAX_CONCURRENCY` is reached) and
+  grants them by priority, so interactive user turns go ahead of auto-continue plan hops
+  and tool summaries; FIFO within a priority
+- retries 429, 5xx, timeouts and connection errors with jittered exponential backoff
+  (`FLAME_LLM_RETRIES`)
+
+Token usage is estimated before the call and corrected from `usage_metadata` afterwards.
+Queue depth, waits and retries are exported through `stats()` and the metrics registry.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Mapping, Optional
+
+import instrumentation
+
+SCHEDULER_ENABLED = os.getenv("FLAME_LLM_SCHEDULER", "1") not in ("0", "false", "False", "")
+LLM_RPM = int(os.getenv("FLAME_LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("FLAME_LLM_TPM", "0"))
+LLM_MAX_CONCURRENCY = int(os.getenv("FLAME_LLM_MAX_CONCURRENCY", "0"))
+LLM_RETRIES = int(os.getenv("FLAME_LLM_RETRIES", "3"))
+# completion tokens reserved up front, corrected once usage is known
+OUTPUT_TOKEN_ESTIMATE = int(os.getenv("FLAME_LLM_OUTPUT_TOKEN_ESTIMATE", "400"))
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+# calls are logged slightly before the provider sees them; keep them a little longer than the window
+WINDOW_MARGIN = 1.02
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: Any) -> Optional[float]:
+    """Seconds from a header value: `12`, `1.5`, `7.66s`, `2m59.56s`, `120ms`."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(text)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status of a provider error (groq/openai/httpx style), if any."""
+    for candidate in (error, getattr(error, "response", None)):
+        status = getattr(candidate, "status_code", None) or getattr(candidate, "status", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def error_headers(error: BaseException) -> Mapping[str, str]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    return headers if headers is not None else {}
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = error_status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    name = type(error).__name__
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+class _Budget:
+    """
+    Request/token usage of one model over the last `window` seconds (a limit of 0 is
+    unlimited). A sliding log, like the provider's own accounting, so a full budget at
+    the start of a window cannot be spent twice.
+    """
+
+    def __init__(self, rpm: int, tpm: int, window: float):
+        self.window = window
+        self.rpm = rpm
+        self.tpm = tpm
+        self.log: Deque[List[float]] = deque()  # [started, tokens]
+        self.used_tokens = 0.0
+        self.paused_until = 0.0
+        self.inflight = 0
+
+    def _expire(self, now: float) -> None:
+        while self.log and self.log[0][0] <= now - self.window * WINDOW_MARGIN:
+            self.used_tokens -= self.log.popleft()[1]
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until a call of `tokens` fits; 0 when it fits now."""
+        self._expire(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.rpm and len(self.log) >= self.rpm:
+            wait = max(wait, self.log[len(self.log) - self.rpm][0] + self.window * WINDOW_MARGIN - now)
+        if self.tpm:
+            excess = self.used_tokens + min(tokens, self.tpm) - self.tpm
+            for started, used in self.log:
+                if excess <= 0:
+                    break
+                excess -= used
+                wait = max(wait, started + self.window * WINDOW_MARGIN - now)
+        return wait
+
+    def take(self, tokens: int) -> List[float]:
+        entry = [time.monotonic(), float(min(tokens, self.tpm) if self.tpm else tokens)]
+        self.log.append(entry)
+        self.used_tokens += entry[1]
+        self.inflight += 1
+        return entry
+
+    def settle(self, entry: Optional[List[float]], actual: Optional[int]) -> None:
+        """Replace a call's estimate with its real token usage."""
+        if entry is not None and actual is not None and any(e is entry for e in self.log):
+            self.used_tokens += actual - entry[1]
+            entry[1] = float(actual)
+
+
+class _Waiter:
+    __slots__ = ("model", "tokens", "priority", "future", "loop", "enqueued", "granted")
+
+    def __init__(self, model: str, tokens: int, priority: int, loop: asyncio.AbstractEventLoop):
+        self.model = model
+        self.tokens = tokens
+        self.priority = priority
+        self.loop = loop
+        self.future: asyncio.Future = loop.create_future()
+        self.enqueued = time.monotonic()
+        self.granted: Optional[List[float]] = None
+
+
+class LLMScheduler:
+    """Budgeted, prioritized admission and retry for model calls, shared by all threads."""
+
+    def __init__(
+        self,
+        rpm: int = LLM_RPM,
+        tpm: int = LLM_TPM,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        retries: int = LLM_RETRIES,
+        backoff: float = 0.5,
+        max_backoff: float = 20.0,
+        window: float = 60.0,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.window = window
+        self._budgets: Dict[str, _Budget] = {}
+        self._queues: Dict[str, List[Any]] = {}
+        self._timers: Dict[str, Any] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.queued = 0
+        self.retried = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def configure(self, **limits: Any) -> None:
+        """Change limits/retry settings at runtime and reset learned budgets."""
+        with self._lock:
+            for key, value in limits.items():
+                setattr(self, key, value)
+            self._budgets.clear()
+
+    def _budget(self, model: str) -> _Budget:
+        budget = self._budgets.get(model)
+        if budget is None:
+            budget = self._budgets[model] = _Budget(self.rpm, self.tpm, self.window)
+        return budget
+
+    # -- admission -------------------------------------------------------------------
+
+    async def acquire(self, model: str, tokens: int, priority: int = INTERACTIVE) -> List[float]:
+        """Wait until `model` has budget for a call of `tokens`; pass the result to `release`."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            budget = self._budget(model)
+            queue = self._queues.setdefault(model, [])
+            if not queue and self._fits(budget, tokens):
+                return budget.take(tokens)
+            waiter = _Waiter(model, tokens, priority, loop)
+            heapq.heappush(queue, (priority, next(self._seq), waiter))
+            self.queued += 1
+        self._pump(model)
+        try:
+            await waiter.future
+        except BaseException:
+            # cancelled while queued: give back budget that was granted in the meantime
+            with self._lock:
+                granted = waiter.granted
+                waiter.future.cancel()
+            if granted is not None:
+                self.release(model, granted)
+            self._pump(model)
+            raise
+        waited = time.monotonic() - waiter.enqueued
+        with self._lock:
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        instrumentation.metrics.observe(
+            "flame_llm_queue_wait_seconds", waited, "Time LLM calls spent queued for rate-limit budget",
+            priority=PRIORITY_NAMES.get(priority, str(priority)),
+        )
+        return waiter.granted
+
+    def _fits(self, budget: _Budget, tokens: int) -> bool:
+        if self.max_concurrency and budget.inflight >= self.max_concurrency:
+            return False
+        return budget.wait_time(tokens, time.monotonic()) <= 0
+
+    def release(self, model: str, lease: Optional[List[float]] = None, actual: Optional[int] = None) -> None:
+        """End a call started with `acquire`, correcting its token estimate when usage is known."""
+        with self._lock:
+            budget = self._budget(model)
+            budget.inflight = max(0, budget.inflight - 1)
+            budget.settle(lease, actual)
+        self._pump(model)
+
+    def _pump(self, model: str) -> None:
+        """Grant queued calls in priority order while budget lasts; schedule a retry otherwise."""
+        with self._lock:
+            queue = self._queues.get(model) or []
+            budget = self._budget(model)
+            while queue:
+                waiter: _Waiter = queue[0][2]
+                if waiter.future.cancelled():
+                    heapq.heappop(queue)
+                    continue
+                if self.max_concurrency and budget.inflight >= self.max_concurrency:
+                    return  # the next release pumps again
+                wait = budget.wait_time(waiter.tokens, time.monotonic())
+                if wait > 0:
+                    if model not in self._timers:
+                        self._timers[model] = waiter.loop.call_soon_threadsafe(self._arm_timer, model, waiter.loop, wait)
+                    return
+                heapq.heappop(queue)
+                waiter.granted = budget.take(waiter.tokens)
+                waiter.loop.call_soon_threadsafe(_grant, waiter.future)
+
+    def _arm_timer(self, model: str, loop: asyncio.AbstractEventLoop, wait: float) -> None:
+        def fire():
+            with self._lock:
+                self._timers.pop(model, None)
+            self._pump(model)
+
+        with self._lock:
+            self._timers[model] = loop.call_later(wait, fire)
+
+    # -- provider feedback -----------------------------------------------------------
+
+    def observe_headers(self, model: str, headers: Mapping[str, Any]) -> None:
+        """Learn limits from `x-ratelimit-*` headers and pause on exhausted windows / retry-after."""
+        if not headers:
+            return
+        get = lambda name: headers.get(name) if hasattr(headers, "get") else None  # noqa: E731
+        now = time.monotonic()
+        with self._lock:
+            budget = self._budget(model)
+            # Groq reports tokens per minute but requests per day; only the token limit is adopted
+            limit = get("x-ratelimit-limit-tokens")
+            if not self.tpm and limit and str(limit).isdigit():
+                budget.tpm = int(limit)
+            for kind in ("requests", "tokens"):
+                remaining = get(f"x-ratelimit-remaining-{kind}")
+                reset = parse_duration(get(f"x-ratelimit-reset-{kind}"))
+                if remaining is not None and str(remaining).isdigit() and reset:
+                    if int(remaining) == 0:
+                        budget.paused_until = max(budget.paused_until, now + reset)
+                    elif kind == "tokens" and budget.tpm:
+                        # usage from other processes sharing the API key
+                        budget._expire(now)
+                        unseen = (budget.tpm - budget.used_tokens) - int(remaining)
+                        if unseen > 0:
+                            budget.log.append([now, float(unseen)])
+                            budget.used_tokens += unseen
+            retry_after = parse_duration(get("retry-after"))
+            if retry_after:
+                budget.paused_until = max(budget.paused_until, now + retry_after)
+
+    # -- calls -----------------------------------------------------------------------
+
+    async def run(
+        self,
+        model: str,
+        call: Callable[[], Awaitable[Any]],
+        tokens: int = 0,
+        priority: int = INTERACTIVE,
+    ) -> Any:
+        """
+        Run `call` (one model request) under the model's budget, retrying transient failures.
+        `tokens` is the prompt estimate; expected completion tokens are added to it.
+        """
+        if not SCHEDULER_ENABLED:
+            return await call()
+        estimate = tokens + OUTPUT_TOKEN_ESTIMATE
+        label = PRIORITY_NAMES.get(priority, str(priority))
+        attempt = 0
+        while True:
+            lease = await self.acquire(model, estimate, priority)
+            with self._lock:
+                self.calls += 1
+            try:
+                result = await call()
+            except Exception as error:
+                self.release(model, lease)
+                status = error_status(error)
+                self.observe_headers(model, error_headers(error))
+                if not is_retryable(error) or attempt >= self.retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                attempt += 1
+                with self._lock:
+                    self.retried += 1
+                    if status == 429:
+                        self.rate_limited += 1
+                instrumentation.metrics.inc("flame_llm_retries_total", 1, "LLM calls retried after a transient failure",
+                                            status=str(status or type(error).__name__), priority=label)
+                delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1))) * random.uniform(0.5, 1.5)
+                if status == 429 and parse_duration(error_headers(error).get("retry-after")):
+                    delay = 0  # the budget pause already covers the provider's retry-after
+                await asyncio.sleep(delay)
+                continue
+            usage = getattr(result, "usage_metadata", None) or {}
+            self.release(model, lease, usage.get("total_tokens"))
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            depth = sum(sum(1 for _, _, w in q if not w.future.cancelled()) for q in self._queues.values())
+            return {
+                "calls": self.calls,
+                "queued": self.queued,
+                "queue_depth": depth,
+                "inflight": sum(b.inflight for b in self._budgets.values()),
+                "retried": self.retried,
+                "rate_limited": self.rate_limited,
+                "failures": self.failures,
+                "wait_seconds": self.wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,146 @@
+"""
+Process-wide registry of chat models for the Flame Assistant.
+
+Building a `ChatGroq` instance creates a fresh HTTP client, and `bind_tools` converts
+every tool schema again. `chat_node` runs several times per user request (tool hops,
+plan auto-continue), so both are cached here:
+
+- one pooled client per (model name, settings)
+- an LRU of bound models keyed by a fingerprint of the bound tool set
+
+The default `ChatGroq` clients carry an httpx response hook that hands every response's
+headers to `llm_scheduler.observe_headers`, so the scheduler learns the provider's
+`x-ratelimit-*` budget from successful calls, not only from failed ones.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_GROQ_MODEL = "moonshotai/kimi-k2-instruct-0905"
+
+
+def _default_model_factory(model_name: str, **settings: Any) -> Any:
+    from groq import DefaultAsyncHttpxClient, DefaultHttpxClient
+    from langchain_groq import ChatGroq
+
+    from llm_scheduler import llm_scheduler
+
+    def observe(response: Any) -> None:
+        llm_scheduler.observe_headers(model_name, response.headers)
+
+    async def observe_async(response: Any) -> None:
+        observe(response)
+
+    # the SDK's own client defaults (timeouts, pool limits), plus the hook
+    return ChatGroq(
+        model=model_name,
+        http_client=DefaultHttpxClient(event_hooks={"response": [observe]}),
+        http_async_client=DefaultAsyncHttpxClient(event_hooks={"response": [observe_async]}),
+        **settings,
+    )
+
+
+def _tool_fingerprint_part(tool: Any) -> str:
+    """Stable string for a single tool: full spec for dicts, name for LangChain tools."""
+    if isinstance(tool, dict):
+        return json.dumps(tool, sort_keys=True, separators=(",", ":"), default=str)
+    return f"tool:{getattr(tool, 'name', repr(tool))}"
+
+
+def tools_fingerprint(tools: Sequence[Any], **bind_kwargs: Any) -> str:
+    """
+    Fingerprint an ordered tool list plus bind options.
+    Order matters because it is what the provider sees.
+    """
+    digest = hashlib.sha1()
+    for tool in tools:
+        digest.update(_tool_fingerprint_part(tool).encode("utf-8"))
+        digest.update(b"\x00")
+    digest.update(json.dumps(bind_kwargs, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    Caches chat model clients and tool-bound models for reuse across graph hops and threads.
+    """
+
+    def __init__(self, max_bound_models: int = 64, model_factory: Optional[Callable[..., Any]] = None):
+        self.max_bound_models = max_bound_models
+        self._model_factory = model_factory or _default_model_factory
+        self._models: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Any] = {}
+        self._bound: "OrderedDict[Tuple[int, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.model_hits = 0
+        self.model_misses = 0
+        self.bind_hits = 0
+        self.bind_misses = 0
+
+    def set_model_factory(self, factory: Optional[Callable[..., Any]]) -> None:
+        """Swap the model constructor (e.g. a scripted fake model) and drop cached models."""
+        with self._lock:
+            self._model_factory = factory or _default_model_factory
+            self._models.clear()
+            self._bound.clear()
+
+    def get_model(self, model_name: Optional[str] = None, **settings: Any) -> Any:
+        """Return the shared client for (model name, settings), creating it on first use."""
+        model_name = model_name or os.getenv("GROQ_MODEL", DEFAULT_GROQ_MODEL)
+        key = (model_name, tuple(sorted((k, repr(v)) for k, v in settings.items())))
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.model_hits += 1
+                return model
+            self.model_misses += 1
+            model = self._model_factory(model_name, **settings)
+            self._models[key] = model
+            return model
+
+    def get_bound_model(self, model: Any, tools: List[Any], **bind_kwargs: Any) -> Any:
+        """
+        Return `model.bind_tools(tools, **bind_kwargs)`, reusing a cached binding when the
+        same model was already bound to an identical tool list.
+        """
+        key = (id(model), tools_fingerprint(tools, **bind_kwargs))
+        with self._lock:
+            bound = self._bound.get(key)
+            if bound is not None:
+                self._bound.move_to_end(key)
+                self.bind_hits += 1
+                return bound
+            self.bind_misses += 1
+
+        bound = model.bind_tools(tools, **bind_kwargs)
+
+        with self._lock:
+            self._bound[key] = bound
+            self._bound.move_to_end(key)
+            while len(self._bound) > self.max_bound_models:
+                self._bound.popitem(last=False)
+        return bound
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._bound.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "models": len(self._models),
+                "model_hits": self.model_hits,
+                "model_misses": self.model_misses,
+                "bound_models": len(self._bound),
+                "bind_hits": self.bind_hits,
+                "bind_misses": self.bind_misses,
+            }
+
+
+model_registry = ModelRegistry(
+    max_bound_models=int(os.getenv("FLAME_BOUND_MODEL_CACHE_SIZE", "64")),
+)
@@ -0,0 +1,184 @@
+"""
+Model tier routing for `chat_node`.
+
+Two tiers are configured: `large` (`GROQ_MODEL`, used for everything before this module)
+and `fast` (`GROQ_FAST_MODEL`, a small low-latency model). `TierRouter.choose` classifies
+each hop by turn type, prompt size and plan state:
+
+- user_request: a fresh human message. Runs on large, except for short small talk
+  ("thanks", "ok") when no plan is active.
+- plan_continuation: an auto-continue hop of an active plan. These mostly just call
+  `update_plan_progress` and the next tool, so they run on fast.
+- post_tool: the model summarising tool results. Runs on fast when every result succeeded.
+
+Any hop whose prompt exceeds `FLAME_FAST_TIER_MAX_TOKENS` goes to large. A fast response
+that fails to produce valid tool calls (provider parse error, `invalid_tool_calls`, or a
+tool name that was not bound) is retried once on large, and the thread stays on large for
+the next `FLAME_TIER_ESCALATION_HOPS` hops. Without `GROQ_FAST_MODEL` every hop uses large.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
+
+from history import message_tokens
+from model_registry import DEFAULT_GROQ_MODEL
+
+FAST_TIER = "fast"
+LARGE_TIER = "large"
+
+FAST_TIER_MAX_TOKENS = int(os.getenv("FLAME_FAST_TIER_MAX_TOKENS", "4000"))
+ESCALATION_HOPS = int(os.getenv("FLAME_TIER_ESCALATION_HOPS", "3"))
+
+_SMALL_TALK = re.compile(
+    r"^\W*(?:thanks?(?: you)?|thx|ty|ok(?:ay)?|cool|great|nice|perfect|awesome|got it|hi|hello|hey|"
+    r"good (?:morning|afternoon|evening)|bye|goodbye|yes|no|sure)(?:[\s,!.]+(?:so much|a lot|flame|again|there))*\W*$",
+    re.IGNORECASE,
+)
+
+
+class TierChoice(NamedTuple):
+    tier: str
+    model_name: str
+    turn_type: str
+    reason: str
+
+
+def model_tiers() -> Dict[str, str]:
+    """Configured tier -> model name; `fast` is absent when no fast model is set."""
+    tiers = {LARGE_TIER: os.getenv("GROQ_MODEL", DEFAULT_GROQ_MODEL)}
+    fast = os.getenv("GROQ_FAST_MODEL", "").strip()
+    if fast and os.getenv("FLAME_MODEL_ROUTING", "1") not in ("0", "false", "False"):
+        tiers[FAST_TIER] = fast
+    return tiers
+
+
+def turn_type(messages: Sequence[BaseMessage], plan_status: str) -> str:
+    """user_request | plan_continuation | post_tool for the hop about to run."""
+    last = messages[-1] if messages else None
+    if last is None or isinstance(last, HumanMessage):
+        return "user_request"
+    if plan_status == "in_progress":
+        return "plan_continuation"
+    return "post_tool" if isinstance(last, ToolMessage) else "user_request"
+
+
+def _trailing_tool_results(messages: Sequence[BaseMessage]) -> List[ToolMessage]:
+    results: List[ToolMessage] = []
+    for message in reversed(messages):
+        if not isinstance(message, ToolMessage):
+            break
+        results.append(message)
+    return results
+
+
+def _failed(result: ToolMessage) -> bool:
+    if getattr(result, "status", "success") == "error":
+        return True
+    content = result.content if isinstance(result.content, str) else ""
+    return '"success": false' in content or '"success":false' in content or content.startswith("Error")
+
+
+def invalid_tool_calls(response: Any, bound_tool_names: Iterable[str]) -> List[str]:
+    """Reasons the response's tool calls cannot be executed; empty when they are fine."""
+    problems = [f"unparsed:{tc.get('name')}" for tc in getattr(response, "invalid_tool_calls", None) or []]
+    names = set(bound_tool_names)
+    for tc in getattr(response, "tool_calls", None) or []:
+        if tc.get("name") not in names:
+            problems.append(f"unknown:{tc.get('name')}")
+    return problems
+
+
+class TierRouter:
+    """Chooses a tier per hop and keeps per-tier latency/token counters."""
+
+    def __init__(self, max_threads: int = 4096):
+        self.max_threads = max_threads
+        self._escalated: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.escalations = 0
+
+    def choose(
+        self,
+        messages: Sequence[BaseMessage],
+        plan_status: str,
+        thread_id: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+    ) -> TierChoice:
+        """Tier for the hop answering `messages`; `prompt_tokens` defaults to their estimate."""
+        tiers = model_tiers()
+        kind = turn_type(messages, plan_status)
+
+        def large(reason: str) -> TierChoice:
+            return TierChoice(LARGE_TIER, tiers[LARGE_TIER], kind, reason)
+
+        if FAST_TIER not in tiers:
+            return large("no_fast_tier")
+        if thread_id and self._consume_escalation(thread_id):
+            return large("escalated")
+        if prompt_tokens is None:
+            prompt_tokens = sum(message_tokens(m) for m in messages)
+        if prompt_tokens > FAST_TIER_MAX_TOKENS:
+            return large("long_history")
+        if kind == "plan_continuation":
+            return TierChoice(FAST_TIER, tiers[FAST_TIER], kind, "plan_continuation")
+        if kind == "post_tool":
+            if any(_failed(r) for r in _trailing_tool_results(messages)):
+                return large("tool_failure")
+            return TierChoice(FAST_TIER, tiers[FAST_TIER], kind, "tool_summary")
+        last = messages[-1] if messages else None
+        text = last.content if isinstance(last, HumanMessage) and isinstance(last.content, str) else ""
+        if plan_status != "in_progress" and len(text) <= 60 and _SMALL_TALK.match(text):
+            return TierChoice(FAST_TIER, tiers[FAST_TIER], kind, "small_talk")
+        return large("user_request")
+
+    def escalate(self, choice: TierChoice, thread_id: Optional[str] = None) -> TierChoice:
+        """Large-tier choice replacing a failed fast attempt; keeps the thread on large for a few hops."""
+        with self._lock:
+            self.escalations += 1
+            self._stats[choice.tier]["escalations"] += 1
+            if thread_id and ESCALATION_HOPS > 0:
+                self._escalated[thread_id] = ESCALATION_HOPS
+                self._escalated.move_to_end(thread_id)
+                while len(self._escalated) > self.max_threads:
+                    self._escalated.popitem(last=False)
+        return TierChoice(LARGE_TIER, model_tiers()[LARGE_TIER], choice.turn_type, "escalated")
+
+    def _consume_escalation(self, thread_id: str) -> bool:
+        with self._lock:
+            remaining = self._escalated.get(thread_id)
+            if not remaining:
+                return False
+            if remaining <= 1:
+                del self._escalated[thread_id]
+            else:
+                self._escalated[thread_id] = remaining - 1
+            return True
+
+    def record(self, choice: TierChoice, response: Optional[BaseMessage], seconds: float) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        with self._lock:
+            tier = self._stats[choice.tier]
+            tier["calls"] += 1
+            tier["seconds"] += seconds
+            tier["tokens_in"] += usage.get("input_tokens") or 0
+            tier["tokens_out"] += usage.get("output_tokens") or 0
+            tier[f"turn_{choice.turn_type}"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {"escalations": self.escalations, "escalated_threads": len(self._escalated)}
+            for tier, values in self._stats.items():
+                calls = values.get("calls", 0)
+                for key, value in values.items():
+                    out[f"{tier}_{key}"] = value
+                out[f"{tier}_mean_seconds"] = (values.get("seconds", 0) / calls) if calls else 0.0
+            return out
+
+
+tier_router = TierRouter()
@@ -0,0 +1,279 @@
+"""
+Plan state machine for `chat_node`.
+
+`PlanMachine` applies the plan tools of a model response (`set_plan`,
+`update_plan_progress`, `complete_plan`) in emission order. It then settles the overall
+status and promotes the next step, exactly as the inline prediction did.
+
+The state arrives as a list of step dicts. The machine reads those dicts but does not
+copy them. It counts statuses once, then keeps the counters, the active steps and the
+last completed step up to date on every transition. Only steps that change get a
+`PlanStep` record (`__slots__`). `updates()` returns the minimal Command changes:
+`planSteps` is a `{index: fields}` patch for `plan_steps_reducer` (a full list only after
+`set_plan`), plus `currentStepIndex` / `planStatus` when they move. A hop on a plan of
+hundreds of steps costs one status pass instead of repeated copies and scans.
+"""
+
+import json
+from collections import Counter
+from enum import Enum
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class StepStatus(str, Enum):
+    PENDING = "pending"
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+    BLOCKED = "blocked"
+    FAILED = "failed"
+
+
+PENDING = StepStatus.PENDING.value
+IN_PROGRESS = StepStatus.IN_PROGRESS.value
+COMPLETED = StepStatus.COMPLETED.value
+BLOCKED = StepStatus.BLOCKED.value
+FAILED = StepStatus.FAILED.value
+
+PLAN_TOOL_NAMES = frozenset({"set_plan", "update_plan_progress", "complete_plan"})
+
+
+# Marks a field the source step did not have, so records round-trip to the same dict
+_ABSENT: Any = object()
+
+
+class PlanStep:
+    """A step the current hop changed (or created); untouched steps stay as the state's dicts."""
+
+    __slots__ = ("title", "status", "note", "extra")
+
+    def __init__(self, title: Any, status: str, note: Any = _ABSENT, extra: Optional[Dict[str, Any]] = None):
+        self.title = title
+        self.status = status
+        self.note = note
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, step: Dict[str, Any]) -> "PlanStep":
+        extra = {k: v for k, v in step.items() if k not in ("title", "status", "note")} or None
+        return cls(step.get("title", _ABSENT), step.get("status", ""), step.get("note", _ABSENT), extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        step: Dict[str, Any] = dict(self.extra) if self.extra else {}
+        if self.title is not _ABSENT:
+            step["title"] = self.title
+        step["status"] = self.status
+        if self.note is not _ABSENT:
+            step["note"] = self.note
+        return step
+
+
+_STATUS = itemgetter("status")
+
+
+def _indices(values: List[Any], value: Any, count: int) -> List[int]:
+    """Positions of the `count` occurrences of `value`, found with list.index (C speed)."""
+    found: List[int] = []
+    start = 0
+    for _ in range(count):
+        start = values.index(value, start)
+        found.append(start)
+        start += 1
+    return found
+
+
+def _tool_call_parts(call: Any):
+    name = call.get("name") if isinstance(call, dict) else getattr(call, "name", None)
+    args = call.get("args") if isinstance(call, dict) else getattr(call, "args", {})
+    if isinstance(args, str):
+        # some providers hand back the arguments as a JSON string
+        try:
+            args = json.loads(args)
+        except ValueError:
+            args = {}
+    return name, args if isinstance(args, dict) else {}
+
+
+class PlanMachine:
+    """Incremental plan transitions over the state's step list."""
+
+    __slots__ = (
+        "_original", "_source", "_records", "_replaced", "_statuses", "_counts", "_in_progress", "_last_completed",
+        "_start_index", "_start_status", "current_index", "status",
+    )
+
+    def __init__(self, plan_steps: Optional[List[Any]] = None, current_step_index: int = -1, plan_status: str = ""):
+        self._original: List[Any] = plan_steps or []
+        self._source: List[Any] = self._original
+        self._records: Dict[int, PlanStep] = {}
+        self._replaced = False
+        self._start_index = current_step_index
+        self._start_status = plan_status
+        self.current_index = current_step_index
+        self.status = plan_status
+        # the one pass over the plan; everything after it is incremental
+        try:
+            self._statuses: List[Any] = list(map(_STATUS, self._source))
+        except (KeyError, TypeError):
+            self._statuses = [s.get("status", "") if isinstance(s, dict) else "" for s in self._source]
+        self._counts: Dict[Any, int] = Counter(self._statuses)
+        self._in_progress = set(_indices(self._statuses, IN_PROGRESS, self._counts[IN_PROGRESS]))
+        self._last_completed = -1
+        if self._counts[COMPLETED]:
+            self._last_completed = len(self._statuses) - 1 - self._statuses[::-1].index(COMPLETED)
+
+    def __len__(self) -> int:
+        return len(self._source)
+
+    # -- step access -----------------------------------------------------------------
+
+    def step_status(self, index: int) -> Any:
+        return self._statuses[index]
+
+    def _record(self, index: int) -> PlanStep:
+        record = self._records.get(index)
+        if record is None:
+            step = self._source[index]
+            record = self._records[index] = PlanStep.from_dict(step if isinstance(step, dict) else {})
+        return record
+
+    def _set_status(self, index: int, status: str) -> None:
+        old = self._statuses[index]
+        if old == status:
+            return
+        self._statuses[index] = status
+        self._record(index).status = status
+        self._counts[old] -= 1
+        self._counts[status] += 1
+        if old == IN_PROGRESS:
+            self._in_progress.discard(index)
+        elif status == IN_PROGRESS:
+            self._in_progress.add(index)
+        if status == COMPLETED:
+            self._last_completed = max(self._last_completed, index)
+        elif old == COMPLETED and index == self._last_completed:
+            # rare: a completed step was reopened; walk back to the previous completed one
+            self._last_completed = next((i for i in range(index - 1, -1, -1) if self._statuses[i] == COMPLETED), -1)
+
+    # -- transitions -----------------------------------------------------------------
+
+    def set_plan(self, titles: Iterable[Any]) -> None:
+        """Replace the plan; the first step starts in progress."""
+        steps = [PlanStep(t if isinstance(t, str) else str(t), PENDING) for t in titles or []]
+        self._source = [{}] * len(steps)
+        self._records = dict(enumerate(steps))
+        self._replaced = True
+        self._statuses = [PENDING] * len(steps)
+        self._counts = Counter(self._statuses)
+        self._in_progress = set()
+        self._last_completed = -1
+        if steps:
+            self._set_status(0, IN_PROGRESS)
+            self.current_index = 0
+            self.status = IN_PROGRESS
+        else:
+            self.current_index = -1
+            self.status = ""
+
+    def update_progress(self, index: Any, status: Any, note: Optional[str] = None) -> None:
+        if not isinstance(index, int) or not 0 <= index < len(self._source) or not isinstance(status, str):
+            return
+        if note:
+            self._record(index).note = note
+        self._set_status(index, status)
+        if status == IN_PROGRESS:
+            self.current_index = index
+            self.status = IN_PROGRESS
+        if status == COMPLETED and index >= self.current_index:
+            self.current_index = index
+
+    def complete(self) -> None:
+        if self._counts[COMPLETED] != len(self._source):
+            for index, status in enumerate(self._statuses):
+                if status != COMPLETED:
+                    self._set_status(index, COMPLETED)
+        self.status = COMPLETED
+
+    def apply(self, tool_call: Any) -> None:
+        name, args = _tool_call_parts(tool_call)
+        if name == "set_plan":
+            self.set_plan(args.get("steps") or [])
+        elif name == "update_plan_progress":
+            self.update_progress(args.get("step_index"), args.get("status"), args.get("note"))
+        elif name == "complete_plan":
+            self.complete()
+
+    def apply_all(self, tool_calls: Iterable[Any]) -> "PlanMachine":
+        """Apply the plan tools among `tool_calls` in order, then settle status and promotion."""
+        for call in tool_calls or []:
+            self.apply(call)
+        self.settle()
+        return self
+
+    def settle(self) -> None:
+        """Aggregate the overall status and promote the next step when none is active."""
+        if not self._source:
+            return
+        # The overall plan is only marked completed by complete_plan; failure still shows
+        if self._counts[FAILED]:
+            self.status = FAILED
+        elif self._in_progress:
+            self.status = IN_PROGRESS
+        elif self._counts[BLOCKED]:
+            self.status = BLOCKED
+        if self._in_progress or not self._counts[PENDING]:
+            return
+        # Prefer the step right after the last completed one, else the first pending step
+        statuses = self._statuses
+        try:
+            promote = statuses.index(PENDING, self._last_completed + 1)
+        except ValueError:
+            promote = statuses.index(PENDING)
+        self._set_status(promote, IN_PROGRESS)
+        self.current_index = promote
+        self.status = IN_PROGRESS
+
+    # -- queries ---------------------------------------------------------------------
+
+    def has_remaining(self) -> bool:
+        """Any step neither completed nor failed."""
+        return len(self._source) - self._counts[COMPLETED] - self._counts[FAILED] > 0
+
+    def all_completed(self) -> bool:
+        return bool(self._source) and self._counts[COMPLETED] == len(self._source)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Full step list (for UI emission); untouched steps are the state's own dicts."""
+        return [self._records[i].to_dict() if i in self._records else step for i, step in enumerate(self._source)]
+
+    def steps_patch(self) -> Any:
+        """planSteps update: None when unchanged, `{index: fields}`, or a full list after set_plan."""
+        if self._replaced:
+            steps = self.to_list()
+            return None if steps == self._original else steps
+        patch: Dict[int, Dict[str, Any]] = {}
+        for index, record in self._records.items():
+            before = self._source[index]
+            if not isinstance(before, dict):
+                return self.to_list()
+            changed = {k: v for k, v in record.to_dict().items() if before.get(k, _ABSENT) != v}
+            if changed:
+                patch[index] = changed
+        return patch or None
+
+    def updates(self) -> Dict[str, Any]:
+        """Changed plan keys for `state_update`."""
+        changes: Dict[str, Any] = {}
+        patch = self.steps_patch()
+        if patch is not None:
+            changes["planSteps"] = patch
+        if self.current_index != self._start_index:
+            changes["currentStepIndex"] = self.current_index
+        if self.status != self._start_status:
+            changes["planStatus"] = self.status
+        return changes
+
+
+def predict_plan_updates(plan_steps: List[Dict[str, Any]], current_step_index: int, plan_status: str, tool_calls: List[Any]) -> Dict[str, Any]:
+    """Plan keys that change once `tool_calls` run, for rendering progress before they execute."""
+    return PlanMachine(plan_steps, current_step_index, plan_status).apply_all(tool_calls).updates()
@@ -0,0 +1,300 @@
+"""
+Speculative context prefetch: backend reads a `chat_node` hop will probably make, started
+while its model call is in flight.
+
+The active organization/project/cycle, `currentView` and the latest user message usually
+say which data the model asks for next: the current cycle's expenses, the project's
+expense categories, its cycles. The entities the message names (or else the page's) pick
+the reads, most likely first. `ContextPrefetcher.start` runs up to
+`FLAME_PREFETCH_MAX_READS` of those reads (the `fetch_*` tools of api_tools.py, with their
+default filters) as tasks next to the model call. Their results are kept per thread for
+`FLAME_PREFETCH_TTL` seconds. When the model then calls one of them with the same
+normalized filters, `claim` hands over the result, or waits for a read still in flight,
+and the tool does not call the API again.
+
+- Reads the entity cache already answers are not prefetched, and prefetched results only
+  enter the entity cache when a tool call claims them.
+- `settle`, called with the model's response, cancels reads still in flight that none of
+  its tool calls asked for.
+- A result whose resources were mutated since the read started is stale and not used
+  (same versions as entity_cache.py).
+
+`stats()` reports started reads, hits (and how many were joined in flight), the API time
+they saved, and the wasted ones: cancelled, expired unclaimed, stale or failed.
+Disable with `FLAME_PREFETCH=0`; it only runs when the API tools are registered
+(`FLAME_API_BASE_URL`) and the run carries its user's API key.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from entity_cache import READ_TOOLS, CacheScope, cache_scope, entity_cache, read_filters
+from flame_api import caller_credential
+from tool_selection import text_signals
+
+PREFETCH_ENABLED = os.getenv("FLAME_PREFETCH", "1") not in ("0", "false", "False", "")
+PREFETCH_TTL = float(os.getenv("FLAME_PREFETCH_TTL", "30"))
+PREFETCH_MAX_READS = int(os.getenv("FLAME_PREFETCH_MAX_READS", "2"))
+
+MAX_THREADS = 1024
+
+# Entity named by the user or the view -> reads that answer questions about it, best first
+ENTITY_READS: Dict[str, Tuple[str, ...]] = {
+    "expense": ("fetch_expenses",),
+    "sale": ("fetch_sales",),
+    "report": ("fetch_report_summary", "fetch_expenses_by_category"),
+    "category": ("fetch_expense_categories", "fetch_expenses_by_category"),
+    "cycle": ("fetch_cycles",),
+    "project": ("fetch_projects", "fetch_cycles"),
+    "vendor": ("fetch_vendors",),
+    "payment_method": ("fetch_payment_methods",),
+    "organization": ("fetch_organizations",),
+}
+# ... when the user is creating one: the ids the new record needs
+CREATE_READS: Dict[str, Tuple[str, ...]] = {
+    "expense": ("fetch_expense_categories", "fetch_payment_methods", "fetch_vendors"),
+    "sale": ("fetch_sales",),
+}
+# Nothing more specific named, but a cycle is active
+DEFAULT_READS = ("fetch_expenses", "fetch_expense_categories", "fetch_cycles")
+
+# Set inside prefetch tasks, so the tool they run skips the caches (see api_tools._fetch)
+_prefetching: contextvars.ContextVar[bool] = contextvars.ContextVar("flame_prefetching", default=False)
+
+
+def predict_reads(state: Dict[str, Any], messages: Sequence[BaseMessage]) -> List[str]:
+    """Read tools the next model call will probably use, most likely first."""
+    last_user = next((m for m in reversed(messages) if isinstance(m, HumanMessage)), None)
+    user_entities, user_verbs = text_signals(str(last_user.content) if last_user is not None else "")
+    view_entities, view_verbs = text_signals((state.get("currentView") or "").replace("_", " "))
+    # the page only counts when the message names nothing itself ("what's the total?")
+    entities = user_entities or view_entities
+    creating = "create" in (user_verbs if user_entities else user_verbs | view_verbs)
+    names: List[str] = []
+    for entity, reads in ENTITY_READS.items():
+        if entity in entities:
+            names.extend(CREATE_READS.get(entity, reads) if creating else reads)
+    if not names and state.get("activeCycleId") not in (None, "", "None"):
+        names.extend(DEFAULT_READS)
+    return list(dict.fromkeys(names))
+
+
+def _answering_reads(messages: Sequence[BaseMessage]) -> bool:
+    """Whether the hop follows read results, i.e. the model is about to use data it has."""
+    results = set()
+    for message in reversed(messages):
+        if isinstance(message, ToolMessage):
+            results.add(message.tool_call_id)
+            continue
+        if isinstance(message, AIMessage):
+            return any(tc.get("id") in results and tc.get("name") in READ_TOOLS for tc in message.tool_calls or [])
+        return False
+    return False
+
+
+def _thread(config: Optional[Dict[str, Any]]) -> str:
+    return str(((config or {}).get("configurable") or {}).get("thread_id") or "")
+
+
+class _Prefetch:
+    __slots__ = ("task", "scope", "versions", "started", "finished", "expires", "failed")
+
+    def __init__(self, task: "asyncio.Task", scope: CacheScope, versions: Tuple[int, ...], started: float, expires: float):
+        self.task = task
+        self.scope = scope
+        self.versions = versions
+        self.started = started
+        self.finished = 0.0
+        self.expires = expires
+        self.failed = False
+
+
+class ContextPrefetcher:
+    """Per-thread speculative reads with TTL, cancellation and hit/waste accounting."""
+
+    def __init__(self, ttl: float = PREFETCH_TTL, max_reads: int = PREFETCH_MAX_READS, enabled: bool = PREFETCH_ENABLED):
+        self.ttl = ttl
+        self.max_reads = max_reads
+        self._enabled = enabled
+        self._reads: Dict[str, Any] = {}
+        self._threads: "OrderedDict[str, Dict[Tuple, _Prefetch]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        self.started = 0
+        self.hits = 0
+        self.joined = 0
+        self.cancelled = 0
+        self.expired = 0
+        self.stale = 0
+        self.failed = 0
+        self.skipped_cached = 0
+        self.saved_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and self.ttl > 0 and self.max_reads > 0 and bool(self._reads)
+
+    def set_enabled(self, enabled: bool) -> None:
+        self._enabled = enabled
+
+    def register(self, tools: Iterable[Any]) -> None:
+        """Make read tools (`fetch_*` from api_tools.py) available for prefetching."""
+        for tool in tools:
+            if tool.name in READ_TOOLS and getattr(tool, "coroutine", None) is not None:
+                self._reads[tool.name] = tool
+
+    @staticmethod
+    def prefetching() -> bool:
+        """True inside a prefetch task."""
+        return _prefetching.get()
+
+    def start(self, state: Dict[str, Any], config: Optional[Dict[str, Any]], messages: Sequence[BaseMessage]) -> int:
+        """Start the reads predicted for this hop; returns how many were started."""
+        if not self.enabled or _answering_reads(messages):
+            return 0
+        thread = _thread(config)
+        if not thread or state.get("activeOrganizationId") in (None, "", "None") or caller_credential(config) is None:
+            return 0
+        scope = cache_scope(state, config)
+        names = [name for name in predict_reads(state, messages) if name in self._reads][:self.max_reads]
+        if not names:
+            return 0
+        now = time.monotonic()
+        started = 0
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            entries = self._threads.setdefault(thread, {})
+            self._threads.move_to_end(thread)
+            for name in names:
+                filters = read_filters(name, {}, state) or {}
+                key = (name, tuple(sorted(filters.items())))
+                current = entries.get(key)
+                if current is not None and current.scope == scope and current.expires > now:
+                    continue
+                if entity_cache.peek(scope, name, filters):
+                    self.skipped_cached += 1
+                    continue
+                if current is not None:
+                    self._discard(current, now)
+                task = asyncio.ensure_future(self._read(name, state, config))
+                prefetch = _Prefetch(task, scope, entity_cache.versions(scope.organization, READ_TOOLS[name].depends), now, now + self.ttl)
+                task.add_done_callback(lambda done, p=prefetch: self._finished(p))
+                entries[key] = prefetch
+                started += 1
+            self.started += started
+            while len(self._threads) > MAX_THREADS:
+                _, evicted = self._threads.popitem(last=False)
+                for prefetch in evicted.values():
+                    self._discard(prefetch, now)
+        return started
+
+    async def _read(self, name: str, state: Dict[str, Any], config: Optional[Dict[str, Any]]) -> Any:
+        # runs in its own task (a copy of the context), so the flag stays local to it
+        _prefetching.set(True)
+        return await self._reads[name].coroutine(state=state, config=config, tool_call_id=None)
+
+    def _finished(self, prefetch: _Prefetch) -> None:
+        prefetch.finished = time.monotonic()
+        if prefetch.task.cancelled():
+            return
+        result = None if prefetch.task.exception() is not None else prefetch.task.result()
+        if not isinstance(result, dict) or result.get("success") is False:
+            prefetch.failed = True
+            with self._lock:
+                self.failed += 1
+
+    def _discard(self, prefetch: _Prefetch, now: float) -> None:
+        # caller holds the lock; failed reads were counted when they finished
+        if not prefetch.task.done():
+            prefetch.task.cancel()
+            self.cancelled += 1
+        elif not prefetch.failed:
+            self.expired += 1
+
+    def _sweep(self, now: float) -> None:
+        for thread in list(self._threads):
+            entries = self._threads[thread]
+            for key in [key for key, prefetch in entries.items() if prefetch.expires <= now]:
+                self._discard(entries.pop(key), now)
+            if not entries:
+                del self._threads[thread]
+        self._next_sweep = now + self.ttl / 2
+
+    async def claim(self, config: Optional[Dict[str, Any]], scope: CacheScope, tool_name: str, filters: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """The prefetched result of this read for the thread, waiting for it if still in flight; None if there is none."""
+        if _prefetching.get():
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entries = self._threads.get(_thread(config))
+            prefetch = entries.pop((tool_name, tuple(sorted(filters.items()))), None) if entries else None
+            if prefetch is None:
+                return None
+            if prefetch.scope != scope or prefetch.expires <= now:
+                self._discard(prefetch, now)
+                return None
+        joined = not prefetch.task.done()
+        if joined:
+            # not awaited directly: cancelling this tool call must not cancel the shared read
+            await asyncio.wait((prefetch.task,))
+        result = None if prefetch.task.cancelled() or prefetch.task.exception() is not None else prefetch.task.result()
+        if not isinstance(result, dict) or result.get("success") is False:
+            return None
+        with self._lock:
+            if entity_cache.versions(scope.organization, READ_TOOLS[tool_name].depends) != prefetch.versions:
+                self.stale += 1
+                return None
+            self.hits += 1
+            self.joined += joined
+            self.saved_seconds += (prefetch.finished or time.monotonic() if not joined else now) - prefetch.started
+        return result
+
+    def settle(self, config: Optional[Dict[str, Any]], response: Any) -> None:
+        """Cancel the thread's reads still in flight that the model's response did not call."""
+        called = {tc.get("name") for tc in getattr(response, "tool_calls", None) or []}
+        now = time.monotonic()
+        with self._lock:
+            entries = self._threads.get(_thread(config))
+            if not entries:
+                return
+            for key in [key for key, prefetch in entries.items() if not prefetch.task.done() and key[0] not in called]:
+                self._discard(entries.pop(key), now)
+
+    def clear(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for entries in self._threads.values():
+                for prefetch in entries.values():
+                    self._discard(prefetch, now)
+            self._threads.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            wasted = self.cancelled + self.expired + self.stale + self.failed
+            return {
+                "enabled": self.enabled,
+                "threads": len(self._threads),
+                "pending": sum(len(entries) for entries in self._threads.values()),
+                "started": self.started,
+                "hits": self.hits,
+                "joined_in_flight": self.joined,
+                "hit_rate": (self.hits / self.started) if self.started else 0.0,
+                "wasted": wasted,
+                "cancelled": self.cancelled,
+                "expired": self.expired,
+                "stale": self.stale,
+                "failed": self.failed,
+                "skipped_cached": self.skipped_cached,
+                "saved_seconds": self.saved_seconds,
+            }
+
+
+context_prefetcher = ContextPrefetcher()
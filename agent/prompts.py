@@ -0,0 +1,214 @@
+"""
+Prompt construction for the Flame Assistant.
+
+Providers with automatic prompt caching (Groq, OpenAI) only reuse a prompt prefix that is
+byte-identical across requests. The system prompt is therefore split in two:
+
+- `STATIC_SYSTEM_MESSAGE`: identity, domain and policies. Built once at import and shared
+  by every thread, it always leads the prompt.
+- `build_ground_truth_message`: the volatile context (user, active IDs, plan, post-tool
+  guidance), placed after the chat history.
+
+`prompt_cache_stats` records cached-token hit rate, latency and time-to-first-token per call.
+Time-to-first-token counts from the start of the attempt that produced the response, so
+it reflects prompt processing (what caching speeds up); the wait for admission, the rate
+limit budget and earlier failed attempts is reported separately as queue wait.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import BaseMessage, SystemMessage
+
+STATIC_SYSTEM_PROMPT = (
+    "IDENTITY & PURPOSE:\n"
+    "You are Flame, an elite AI financial assistant integrated deeply into the Flame Sales and Expense Tracker application. "
+    "Your singular goal is to help your User efficiently manage their workspaces, track sales, log expenses, monitor inventory, and analyze financial data. "
+    "You communicate concisely, professionally, and always prioritize completing the user's financial tasks quickly.\n\n"
+
+    "GLOBAL CONTEXT:\n"
+    "The user's current context (User Context, Active Organization/Project/Cycle IDs, Current Dashboard URL/View, "
+    "Last Action Completed and the current plan) is provided in the LATEST GROUND TRUTH message at the end of the conversation.\n\n"
+
+    "APPLICATION DOMAIN & ARCHITECTURE:\n"
+    "The Flame app is a hierarchical CRM and financial tracker organized as follows:\n"
+    "1. WORKSPACES: Organizations contain Projects. Projects contain Cycles (time-bound periods like 'Q1 2026'). All financial data belongs to a Cycle.\n"
+    "2. SALES & INVOICING: Users input Sales (tied to Customers, Products, Variants) and generate Invoices. Sales must track payment methods and amounts.\n"
+    "3. EXPENSES: Users log Expenses (tied to Vendors and Expense Categories) with dates, amounts, and descriptions. Includes receipt tracking.\n"
+    "4. INVENTORY: The system tracks Items (Finished Goods vs Raw Materials), current stock levels, and production orders. Inventory decreases when Sales occur.\n"
+    "5. ANALYTICS & REPORTS: The app generates real-time dashboards (Total Sales, Net Profit) and downloadable reports for chosen Cycles/Projects.\n\n"
+
+    "TOOL EXECUTION POLICY:\n"
+    "- You have access to specialized tools (e.g., `createProject`, `logExpense`, `recordSale`).\n"
+    "- You must ALWAYS use these tools to perform actions requested by the user. "
+    "Never tell the user you 'updated their data' if you did not successfully call a tool.\n"
+    "- If a user makes a vague request (e.g., 'Log $50 for supplies'), use the specific `open...Form` tools (e.g. `openExpenseForm`, `openSaleForm`) to open the relevant creation form for them to fill out themselves, OR if you have a direct API tool and only need one or two pieces of missing data, ask for it and then execute the API tool.\n"
+    "- You do NOT manage a generic 'Canvas' of cards. You are managing real financial database records.\n"
+    "- When backend data tools (`fetch_...`, e.g. `fetch_expenses`, `fetch_report_summary`, `fetch_expense_categories`) are available, "
+    "prefer them over the `list...` tools to answer questions about the data or to look up IDs; use `list...` tools when the user wants to see the records in the app. "
+    "A `fetch_...` result marked `unchanged` points to an identical earlier result; reuse that one.\n"
+    "- For totals, breakdowns, trends and rankings (\"net profit by month\", \"top 5 expense categories\") use `analyze_sales_expenses` when available "
+    "instead of fetching rows and adding them up; quote its numbers as returned.\n"
+    "- To log or record more than a few expenses or sales at once (a receipt, a pasted list), use `bulk_log_expenses` / `bulk_record_sales` "
+    "when available: one call with all rows instead of repeated `logExpense` / `recordSale` calls. Report the created count and any row errors.\n"
+    "- Only the tools relevant to the current request may be attached. If the one you need is missing, call `load_tools` with its name "
+    "(its description lists every tool) and use it in your next step; never claim an action is impossible because its tool is not attached.\n"
+    "- Do not loop the same tool call. Execute the tool, summarize the result based on the Ground Truth update, and wait for the user.\n\n"
+
+    "PLANNING POLICY (MULTI-STEP REQUESTS):\n"
+    "- If the user makes a complex request ('Set up a new Org, create a Project, and log 3 initial expenses'), you must propose a plan.\n"
+    "- Call the `set_plan` tool to outline the steps.\n"
+    "- Use `update_plan_progress` as you execute the required Tools for each step (e.g., calling `createOrganization`).\n"
+    "- Call `complete_plan` only when every step is successfully executed against the database.\n\n"
+
+    "STRICT GROUNDING RULES:\n"
+    "1. ALWAYS read the LATEST GROUND TRUTH to know what the user is currently looking at.\n"
+    "2. If the user says 'Delete this project', use `activeProjectId`. If it is 'None', ask the user which project they mean.\n"
+    "3. If you lack required information to execute a financial log (e.g., missing an Expense Category ID), ask the user for it or use a tool to fetch available categories.\n"
+    "4. NEVER invent or hallucinate financial quantities, prices, or IDs. Only use data provided in the Ground Truth or via Tool outputs.\n"
+    "5. If a user asks a question entirely unrelated to financial tracking, inventory, or CRM management, politely remind them you are Flame, the Sales and Expense Tracker assistant.\n"
+)
+
+STATIC_SYSTEM_MESSAGE = SystemMessage(content=STATIC_SYSTEM_PROMPT)
+
+
+def build_ground_truth_message(state: Dict[str, Any]) -> SystemMessage:
+    """
+    The authoritative, per-turn context. Placed after the chat history so it takes
+    priority over stale mentions and keeps the cached prompt prefix stable.
+    """
+    post_tool_guidance = state.get("__last_tool_guidance", None)
+    plan_steps = state.get("planSteps", []) or []
+    return SystemMessage(
+        content=(
+            "LATEST GROUND TRUTH (authoritative):\n"
+            f"- User Context: {state.get('userContext', 'Unknown User Context')}\n"
+            f"- Active Organization ID: {state.get('activeOrganizationId', 'None')}\n"
+            f"- Active Project ID: {state.get('activeProjectId', 'None')}\n"
+            f"- Active Cycle ID: {state.get('activeCycleId', 'None')}\n"
+            f"- Current Dashboard URL/View: {state.get('currentView', 'Unknown')}\n"
+            f"- Last Action Completed: {state.get('lastAction', 'None')}\n\n"
+            f"- planStatus: {state.get('planStatus', '')}\n"
+            f"- currentStepIndex: {state.get('currentStepIndex', -1)}\n"
+            f"- planSteps: {[s.get('title', s) for s in plan_steps]}\n\n"
+            "Resolution policy: If ANY prior message mentions values that conflict with the above,\n"
+            "those earlier mentions are obsolete and MUST be ignored.\n"
+            "When asked 'what is it now', ALWAYS read from this LATEST GROUND TRUTH.\n"
+            + (
+                f"\nPOST-TOOL POLICY:\n{post_tool_guidance}\n"
+                "If the last tool result indicated success (e.g., 'deleted:ID'), confirm the action rather than re-stating absence."
+                if post_tool_guidance else ""
+            )
+        )
+    )
+
+
+def _cached_prompt_tokens(response: BaseMessage) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    if details.get("cache_read") is not None:
+        return int(details["cache_read"])
+    metadata = getattr(response, "response_metadata", None) or {}
+    for raw in (metadata.get("token_usage"), (metadata.get("x_groq") or {}).get("usage")):
+        if isinstance(raw, dict):
+            cached = (raw.get("prompt_tokens_details") or {}).get("cached_tokens")
+            if cached is not None:
+                return int(cached)
+    return None
+
+
+class FirstTokenTimer(AsyncCallbackHandler):
+    """
+    Captures the time to the first streamed token of a model call, from the start of its
+    latest attempt, and how long the call waited before that attempt started.
+    """
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.started: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        # first chunk with text (tool-call chunks carry none)
+        self.first_text_at: Optional[float] = None
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], **kwargs: Any) -> None:
+        # every attempt (retries included) starts the clock again
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.first_text_at = None
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        if token and self.first_text_at is None:
+            self.first_text_at = time.perf_counter()
+
+    @property
+    def ttft(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - (self.started if self.started is not None else self.created)
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        """Admission, rate-limit and retry time before the latest attempt started."""
+        return None if self.started is None else self.started - self.created
+
+
+class PromptCacheStats:
+    """Aggregates provider prompt-cache hits, latency and TTFT across model calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.calls_with_cache_info = 0
+        self.latency_total = 0.0
+        self.ttft_total = 0.0
+        self.ttft_samples = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_samples = 0
+
+    def record(self, response: BaseMessage, latency: float, ttft: Optional[float] = None, queue_wait: Optional[float] = None) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        cached = _cached_prompt_tokens(response)
+        with self._lock:
+            self.calls += 1
+            self.latency_total += latency
+            if ttft is not None:
+                self.ttft_total += ttft
+                self.ttft_samples += 1
+            if queue_wait is not None:
+                self.queue_wait_total += queue_wait
+                self.queue_wait_samples += 1
+            if cached is not None:
+                self.calls_with_cache_info += 1
+                self.prompt_tokens += int(usage.get("input_tokens", 0) or 0)
+                self.cached_tokens += cached
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cache_hit_rate": (self.cached_tokens / self.prompt_tokens) if self.prompt_tokens else 0.0,
+                "avg_latency": (self.latency_total / self.calls) if self.calls else 0.0,
+                "avg_ttft": (self.ttft_total / self.ttft_samples) if self.ttft_samples else None,
+                "avg_queue_wait": (self.queue_wait_total / self.queue_wait_samples) if self.queue_wait_samples else None,
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+def prompt_messages(history: List[BaseMessage], state: Dict[str, Any], summary: Optional[SystemMessage] = None) -> List[BaseMessage]:
+    """Assemble the model input: static prefix, optional history summary, history, ground truth."""
+    return [
+        STATIC_SYSTEM_MESSAGE,
+        *([summary] if summary else []),
+        *history,
+        build_ground_truth_message(state),
+    ]
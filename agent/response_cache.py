@@ -0,0 +1,319 @@
+"""
+Opt-in cache of final answers to repeated read-only questions.
+
+Keyed by the normalized question, the calling user and the active organization /
+project / cycle; runs without a per-user credential are not cached (see entity_cache.py). Each entry stores the entity-cache versions of the resources its turn read
+(see entity_cache.py), so a successful mutating tool in that organization (`logExpense`,
+`recordSale`, `update*`, ...) makes it stale, the same way cached reads go stale.
+
+Lookups try the exact normalized question first, then a local similarity match: hashed
+word/bigram/character-trigram vectors compared by cosine, among questions in the same
+scope. A similar question only matches when it has exactly the same content words
+(synonyms folded): same numbers, negations, entities, statuses and ordering terms. So
+"unpaid sales" never answers "paid sales", nor "fuel" "travel", nor "descending"
+"ascending". Numbers must also come in the same order, and a question with an operator
+or comparison word ("minus", "over", "than", "to", ...) must keep its whole word order,
+since its operands are not interchangeable. So "sales minus expenses" never answers
+"expenses minus sales", nor "cycle 3 vs 4" "cycle 4 vs 3"; similarity only forgives
+filler, synonyms and the order of the words in a plain lookup ("expenses by category,
+total" for "total expenses by category").
+
+Only turns whose tool calls were all reads (READ_TOOLS, getCurrentContext) are stored.
+Turns with mutations, UI actions or an active plan are not.
+
+Configure with `FLAME_RESPONSE_CACHE` (off by default), `FLAME_RESPONSE_CACHE_TTL`,
+`FLAME_RESPONSE_CACHE_SIZE` and `FLAME_RESPONSE_CACHE_SIMILARITY`. Requires the entity
+cache (its versions are the invalidation signal).
+"""
+
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from entity_cache import READ_TOOLS, cache_scope, entity_cache
+
+RESPONSE_CACHE_ENABLED = os.getenv("FLAME_RESPONSE_CACHE", "0") not in ("0", "false", "False", "")
+RESPONSE_CACHE_TTL = float(os.getenv("FLAME_RESPONSE_CACHE_TTL", "180"))
+RESPONSE_CACHE_SIZE = int(os.getenv("FLAME_RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("FLAME_RESPONSE_CACHE_SIMILARITY", "0.86"))
+
+# Non-mutating tools besides READ_TOOLS that may appear in a cacheable turn
+PASSIVE_TOOLS = {"getCurrentContext"}
+# Resources an answer depends on when its turn read nothing (it came from context alone)
+ALL_RESOURCES: Tuple[str, ...] = tuple(sorted({r for spec in READ_TOOLS.values() for r in spec.depends}))
+
+EMBEDDING_DIMENSIONS = 512
+
+_CONTRACTIONS = {"what's": "what is", "whats": "what is", "how's": "how is", "i've": "i have", "i'm": "i am", "it's": "it is"}
+_FILLER = {
+    "please", "pls", "can", "could", "would", "you", "tell", "me", "show", "give", "the", "a", "an", "my", "our",
+    "for", "of", "us", "kindly", "hey", "flame", "so", "far", "what", "is", "are", "i", "we",
+    "do", "does", "did", "have", "has", "in", "on",
+}
+_SYNONYMS = {
+    "spend": "expenses", "spending": "expenses", "spent": "expenses", "costs": "expenses", "cost": "expenses", "expense": "expenses",
+    "revenue": "sales", "income": "sales", "sale": "sales", "earnings": "sales",
+    "profits": "profit", "categories": "category",
+    "totals": "total", "sum": "total",
+    "current": "this", "active": "this",
+}
+# Words whose operands are not interchangeable: "a minus b" is not "b minus a"
+_ORDERED = {
+    "minus", "plus", "less", "over", "divided", "times", "than", "vs", "versus", "against",
+    "per", "to", "from", "into", "after", "before", "without", "excluding", "except",
+}
+_NUMBER = re.compile(r"[0-9]+(?:\.[0-9]+)?")
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def normalize_question(text: str) -> str:
+    """Lowercased content words with synonyms folded; order is kept."""
+    text = (text or "").lower()
+    for contraction, expanded in _CONTRACTIONS.items():
+        text = text.replace(contraction, expanded)
+    words = [_SYNONYMS.get(w, w) for w in _TOKEN.findall(text)]
+    return " ".join(w for w in words if w not in _FILLER)
+
+
+def content_words(normalized: str) -> FrozenSet[str]:
+    """What a similar question must share exactly: every content word, numbers included."""
+    return frozenset(normalized.split())
+
+
+def ordered_terms(normalized: str) -> Tuple[str, ...]:
+    """What a similar question must share in order: every word if it has an operator, else its numbers."""
+    words = normalized.split()
+    if _ORDERED.intersection(words):
+        return tuple(words)
+    return tuple(w for w in words if _NUMBER.fullmatch(w))
+
+
+def _bucket(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest(), "big") % EMBEDDING_DIMENSIONS
+
+
+def embed(normalized: str) -> Dict[int, float]:
+    """Sparse, L2-normalized hashed embedding of a normalized question."""
+    words = normalized.split()
+    features: List[Tuple[str, float]] = [(f"w:{w}", 1.0) for w in words]
+    features += [(f"b:{a}_{b}", 0.7) for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features += [(f"c:{padded[i:i + 3]}", 0.25) for i in range(len(padded) - 2)]
+    vector: Dict[int, float] = {}
+    for feature, weight in features:
+        index = _bucket(feature)
+        vector[index] = vector.get(index, 0.0) + weight
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {k: v / norm for k, v in vector.items()}
+
+
+def cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class _Entry(NamedTuple):
+    answer: str
+    vector: Dict[int, float]
+    words: FrozenSet[str]
+    ordered: Tuple[str, ...]
+    expires: float
+    depends: Tuple[str, ...]
+    versions: Tuple[int, ...]
+    cost: float
+
+
+def _turn_since_last_human(messages: Sequence[BaseMessage]) -> Tuple[Optional[HumanMessage], List[BaseMessage]]:
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return messages[index], list(messages[index + 1:])
+    return None, []
+
+
+class ResponseCache:
+    """Scoped LRU/TTL store of final answers with exact and similarity lookup."""
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_SIZE,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._enabled = enabled
+        self._entries: "OrderedDict[Tuple[Tuple[str, ...], str], _Entry]" = OrderedDict()
+        self._turn_costs: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.stores = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self.hit_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and self.ttl > 0 and entity_cache.enabled
+
+    def set_enabled(self, enabled: bool) -> None:
+        self._enabled = enabled
+
+    @staticmethod
+    def _scope(state: Dict[str, Any], config: Optional[Dict[str, Any]]) -> Tuple[str, ...]:
+        scope = cache_scope(state, config)
+        return (scope.principal, scope.organization, str(state.get("activeProjectId") or ""), str(state.get("activeCycleId") or ""))
+
+    @staticmethod
+    def _thread(config: Optional[Dict[str, Any]]) -> str:
+        return str(((config or {}).get("configurable") or {}).get("thread_id") or "")
+
+    def add_cost(self, config: Optional[Dict[str, Any]], seconds: float) -> None:
+        """Account model time spent on the current turn of a thread (what a later hit saves)."""
+        if not self.enabled:
+            return
+        thread = self._thread(config)
+        with self._lock:
+            self._turn_costs[thread] = self._turn_costs.get(thread, 0.0) + seconds
+            self._turn_costs.move_to_end(thread)
+            while len(self._turn_costs) > self.max_entries:
+                self._turn_costs.popitem(last=False)
+
+    def lookup(self, messages: Sequence[BaseMessage], state: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Cached answer for a fresh user question, or None."""
+        if not self.enabled or not messages or not isinstance(messages[-1], HumanMessage):
+            return None
+        if state.get("planStatus", "") == "in_progress":
+            return None
+        started = time.perf_counter()
+        question = messages[-1].content if isinstance(messages[-1].content, str) else ""
+        normalized = normalize_question(question)
+        scope = self._scope(state, config)
+        with self._lock:
+            self._turn_costs.pop(self._thread(config), None)
+        if not normalized or not scope[0]:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._valid(scope, normalized, now)
+            kind = "exact"
+            if entry is None:
+                kind = "similar"
+                vector, words, ordered = embed(normalized), content_words(normalized), ordered_terms(normalized)
+                best_key, best_score = None, self.similarity
+                for key, candidate in self._entries.items():
+                    if key[0] != scope or candidate.words != words or candidate.ordered != ordered:
+                        continue
+                    score = cosine(vector, candidate.vector)
+                    if score >= best_score:
+                        best_key, best_score = key, score
+                entry = self._valid(scope, best_key[1], now) if best_key else None
+            if entry is None:
+                self.misses += 1
+                return None
+            if kind == "exact":
+                self.exact_hits += 1
+            else:
+                self.similar_hits += 1
+            self.saved_seconds += entry.cost
+            self.hit_seconds += time.perf_counter() - started
+            return entry.answer
+
+    def _valid(self, scope: Tuple[str, ...], normalized: str, now: float) -> Optional[_Entry]:
+        key = (scope, normalized)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires < now or entry.versions != entity_cache.versions(scope[1], entry.depends):
+            del self._entries[key]
+            self.stale += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def store(self, messages: Sequence[BaseMessage], response: BaseMessage, state: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> bool:
+        """Remember `response` as the answer to the turn's question if the turn only read data."""
+        if not self.enabled or getattr(response, "tool_calls", None):
+            return False
+        answer = response.content if isinstance(response.content, str) else ""
+        human, turn = _turn_since_last_human(messages)
+        if not answer.strip() or human is None or not isinstance(human.content, str):
+            return False
+        depends: set = set()
+        for message in turn:
+            calls = (getattr(message, "tool_calls", None) or []) if isinstance(message, AIMessage) else []
+            for call in calls:
+                name = call.get("name", "")
+                if name in READ_TOOLS:
+                    depends.update(READ_TOOLS[name].depends)
+                elif name not in PASSIVE_TOOLS:
+                    with self._lock:
+                        self.uncacheable += 1
+                    return False
+        if state.get("planStatus", "") == "in_progress":
+            with self._lock:
+                self.uncacheable += 1
+            return False
+        normalized = normalize_question(human.content)
+        scope = self._scope(state, config)
+        if not normalized or not scope[0]:
+            return False
+        resources = tuple(sorted(depends)) or ALL_RESOURCES
+        with self._lock:
+            cost = self._turn_costs.pop(self._thread(config), 0.0)
+            self._entries[(scope, normalized)] = _Entry(
+                answer,
+                embed(normalized),
+                content_words(normalized),
+                ordered_terms(normalized),
+                time.monotonic() + self.ttl,
+                resources,
+                entity_cache.versions(scope[1], resources),
+                cost,
+            )
+            self._entries.move_to_end((scope, normalized))
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._turn_costs.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+                "stale": self.stale,
+                "stores": self.stores,
+                "uncacheable": self.uncacheable,
+                "evictions": self.evictions,
+                "saved_seconds": self.saved_seconds,
+                "mean_hit_seconds": (self.hit_seconds / hits) if hits else 0.0,
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,341 @@
+"""
+Production serving for the Flame Assistant graph: FastAPI under uvicorn with several workers.
+
+`langgraph dev` is one process with an in-memory runtime. `python server.py` runs
+`FLAME_SERVER_WORKERS` uvicorn worker processes, each serving `graph` over the AG-UI
+protocol (`POST /`), which is what CopilotKit's `LangGraphHttpAgent` speaks; the web app
+switches to it when `FLAME_AGENT_URL` is set. Workers share thread state through the SQLite
+checkpointer (`FLAME_CHECKPOINTER` defaults to `sqlite` here), so consecutive runs of a
+thread may land on different workers.
+
+Each worker:
+- runs at most `FLAME_SERVER_MAX_CONCURRENCY` graph runs at once; up to
+  `FLAME_SERVER_MAX_QUEUE` more wait, each for at most `FLAME_SERVER_QUEUE_TIMEOUT`
+  seconds, and anything beyond that gets 503 with `Retry-After`
+- grants slots fairly between organizations, and caps runs and queued runs per organization
+  (429 with `Retry-After` past its queue cap); see admission.py
+- runs each request as the user whose API key the web app forwards in `X-Flame-Api-Key`
+  (`flame_credential` in the run config, see flame_api.py); without one the run gets no
+  Flame API tools
+- answers `GET /healthz` (liveness: the event loop responds) and `GET /readyz`
+  (readiness: 503 while draining or while its queue is full; reports its metrics port)
+- serves its own `/metrics` on the first free port from `FLAME_METRICS_PORT` up (one
+  port per worker; see instrumentation.py)
+- sees the other workers' mutations: cache invalidation versions live in the checkpoint
+  SQLite file (`FLAME_CACHE_VERSIONS_PATH`, see entity_cache.py), so no worker keeps
+  serving reads, answers or ledgers another worker's write made stale
+- on SIGTERM/SIGINT turns new runs away with 503, reports not-ready, and waits up to
+  `FLAME_SERVER_DRAIN_TIMEOUT` seconds for running and queued runs before closing the
+  checkpointer
+
+    python server.py --workers 4 --port 8123
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import signal
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+# Workers are separate processes: thread state has to live somewhere they all can read
+if not os.getenv("FLAME_CHECKPOINTER"):
+    os.environ["FLAME_CHECKPOINTER"] = "sqlite"
+
+import agent
+import instrumentation
+from admission import FairScheduler, TenantShed, Ticket, tenant_from_body
+from checkpointer import DEFAULT_CHECKPOINT_PATH
+from flame_api import flame_api, parse_api_key
+from tracing import trace_recorder
+
+AGENT_NAME = "flame_assistant"
+RUN_PATH = "/"
+# The calling user's own `flame_ak_...` key, forwarded by the web app's CopilotKit route
+API_KEY_HEADER = "X-Flame-Api-Key"
+
+SERVER_WORKERS = int(os.getenv("FLAME_SERVER_WORKERS", "0")) or (os.cpu_count() or 1)
+MAX_CONCURRENCY = int(os.getenv("FLAME_SERVER_MAX_CONCURRENCY", "16"))
+MAX_QUEUE = int(os.getenv("FLAME_SERVER_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("FLAME_SERVER_QUEUE_TIMEOUT", "30"))
+DRAIN_TIMEOUT = float(os.getenv("FLAME_SERVER_DRAIN_TIMEOUT", "60"))
+
+
+class Overloaded(Exception):
+    """A run was not admitted; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int, status: int = 503):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.status = status
+
+
+class RunGate:
+    """
+    Per-worker concurrency limit with a bounded wait queue and a drain switch. Slots go to
+    waiting runs by weighted fair queuing over their organizations (`FairScheduler`).
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_queue: int = MAX_QUEUE, queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.scheduler = FairScheduler(self.max_concurrency)
+        self._idle: Optional[asyncio.Event] = None
+        self.draining = False
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.run_seconds = 0.0
+
+    def _primitives(self):
+        # created lazily so it binds to the worker's event loop, not the importing one
+        if self._idle is None:
+            self._idle = asyncio.Event()
+            self._idle.set()
+        return self._idle
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= self.max_concurrency and self.waiting >= self.max_queue
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: queued work spread over the slots."""
+        average = self.run_seconds / self.completed if self.completed else 1.0
+        return max(1, math.ceil(average * (self.waiting + 1) / self.max_concurrency))
+
+    async def acquire(self, tenant: str = "") -> Ticket:
+        idle = self._primitives()
+        if self.draining:
+            self.rejected += 1
+            raise Overloaded("draining", 1)
+        try:
+            self.scheduler.check(tenant)
+        except TenantShed as exc:
+            self.rejected += 1
+            raise Overloaded(str(exc), exc.retry_after, status=429) from None
+        if self.saturated:
+            self.rejected += 1
+            raise Overloaded("queue full", self.retry_after())
+        self.waiting += 1
+        idle.clear()
+        ticket = None
+        try:
+            ticket = await asyncio.wait_for(self.scheduler.acquire(tenant), self.queue_timeout)
+            return ticket
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded("queue timeout", self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+            # runs queued when draining began still run: they were already accepted
+            if ticket is not None:
+                self.in_flight += 1
+                self.admitted += 1
+            self._update_idle()
+
+    def release(self, ticket: Ticket, seconds: float) -> None:
+        self.in_flight -= 1
+        self.completed += 1
+        self.run_seconds += seconds
+        self.scheduler.release(ticket, seconds)
+        self._update_idle()
+
+    def _update_idle(self) -> None:
+        if self.in_flight == 0 and self.waiting == 0:
+            self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Wait for running and queued runs to finish; False if some were left at `timeout`."""
+        idle = self._primitives()
+        try:
+            await asyncio.wait_for(idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "draining": self.draining,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "max_runs_per_tenant": self.scheduler.max_runs,
+            "tenants_backlogged": self.scheduler.backlogged,
+            "metrics_port": instrumentation.metrics_port(),
+        }
+
+
+class RunAdmission:
+    """
+    ASGI middleware holding a `RunGate` slot for the whole run request, including the
+    streamed response, so the limit covers graph execution rather than just the handler.
+    The request body is read first for the organization the run is queued under, then
+    handed to the app as received.
+    """
+
+    def __init__(self, app, gate: RunGate, path: str = RUN_PATH):
+        self.app = app
+        self.gate = gate
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        received: List[Dict[str, Any]] = []
+        while True:
+            message = await receive()
+            received.append(message)
+            if message["type"] != "http.request" or not message.get("more_body"):
+                break
+        tenant = tenant_from_body(b"".join(m.get("body", b"") for m in received))
+
+        async def replay():
+            return received.pop(0) if received else await receive()
+
+        try:
+            ticket = await self.gate.acquire(tenant)
+        except Overloaded as exc:
+            from fastapi.responses import JSONResponse
+
+            if exc.status == 429:
+                message = "Your organization has too many assistant requests in progress; retry shortly"
+            else:
+                message = f"Agent worker overloaded ({exc}); retry shortly"
+            response = JSONResponse(
+                {"status": "error", "message": message},
+                status_code=exc.status,
+                # close the connection so the retry is accepted afresh, likely by a less busy worker
+                headers={"Retry-After": str(exc.retry_after), "Connection": "close"},
+            )
+            await response(scope, replay, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, replay, send)
+        finally:
+            self.gate.release(ticket, time.perf_counter() - started)
+
+
+def _drain_on_signals(gate: RunGate) -> None:
+    """Flip the gate to draining as soon as uvicorn is told to exit, then let uvicorn proceed."""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            gate.draining = True
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+def create_app(graph=None, gate: Optional[RunGate] = None):
+    """The worker app: the AG-UI run endpoint behind `RunAdmission`, plus health probes."""
+    from ag_ui.core.types import RunAgentInput
+    from ag_ui.encoder import EventEncoder
+    from copilotkit import LangGraphAGUIAgent
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    graph = agent.graph if graph is None else graph
+    if graph.checkpointer is None:
+        raise RuntimeError("server.py needs a checkpointer; set FLAME_CHECKPOINTER=sqlite (or memory for one worker)")
+    gate = gate or RunGate()
+    instrumentation.metrics.register_collector("server", gate.stats)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        _drain_on_signals(gate)
+        yield
+        gate.draining = True
+        if not await gate.wait_idle(DRAIN_TIMEOUT):
+            instrumentation.logger.warning("server: %d runs still in flight after %.0fs drain", gate.in_flight, DRAIN_TIMEOUT)
+        await flame_api.aclose()
+        # drained: every recorded run has finished, write out the last traces
+        await asyncio.to_thread(trace_recorder.close)
+        close = getattr(graph.checkpointer, "close", None)
+        if close is not None:
+            close()
+
+    app = FastAPI(title="Flame Assistant agent", lifespan=lifespan)
+    app.state.gate = gate
+
+    @app.post(RUN_PATH)
+    async def run(input_data: RunAgentInput, request: Request):
+        encoder = EventEncoder(accept=request.headers.get("accept"))
+        # The AG-UI agent keeps the active run's bookkeeping on the instance, so concurrent
+        # runs cannot share one; construction is a handful of attribute assignments
+        credential = parse_api_key(request.headers.get(API_KEY_HEADER))
+        runner = LangGraphAGUIAgent(
+            name=AGENT_NAME,
+            description="Flame sales and expense assistant",
+            graph=graph,
+            config={"configurable": {"flame_credential": credential}} if credential is not None else None,
+        )
+
+        async def events():
+            async for event in runner.run(input_data):
+                yield encoder.encode(event)
+
+        return StreamingResponse(events(), media_type=encoder.get_content_type(), headers={"X-Flame-Worker": str(os.getpid())})
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok", "pid": os.getpid()}
+
+    @app.get("/readyz")
+    async def readyz():
+        ready = not gate.draining and not gate.saturated
+        return JSONResponse({"status": "ready" if ready else "unavailable", **gate.stats()}, status_code=200 if ready else 503)
+
+    return RunAdmission(app, gate)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8123")))
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--app", default="server:create_app", help="app factory to serve (import string)")
+    args = parser.parse_args(argv)
+
+    if args.workers > 1 and os.environ["FLAME_CHECKPOINTER"].strip().lower() == "memory":
+        parser.error("FLAME_CHECKPOINTER=memory cannot share threads between workers; use sqlite")
+    if args.workers > 1:
+        # read by the worker processes at import: shared cache versions, one metrics port each
+        os.environ.setdefault("FLAME_CACHE_VERSIONS_PATH", os.getenv("FLAME_CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH))
+        os.environ.setdefault("FLAME_METRICS_PORT_SPAN", str(args.workers))
+        # this supervisor imported the app too; its port belongs to a worker
+        instrumentation.stop_metrics_server()
+    uvicorn.run(
+        args.app,
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=DRAIN_TIMEOUT,
+        log_level=os.getenv("FLAME_SERVER_LOG_LEVEL", "info"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Minimal state updates for `chat_node` Commands.
+
+Every key written in a Command bumps that channel's version, so LangGraph re-serializes
+and checkpoints it even when the value is unchanged. `state_update` therefore emits only
+the keys that actually changed. UI-synced fields the node did not touch are left out, so
+an edit made in the frontend meanwhile is not overwritten with a stale echo.
+
+`planSteps` uses `plan_steps_reducer`: an update is either a full list (replace, as the
+frontend sends it) or a patch `{index: {field: value}}` touching only the changed steps.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+# Keys the graph used to echo back on every Command, with their defaults
+SHARED_STATE_DEFAULTS: Dict[str, Any] = {
+    "userContext": "",
+    "activeOrganizationId": "",
+    "activeProjectId": "",
+    "activeCycleId": "",
+    "currentView": "",
+    "lastAction": "",
+    "itemsCreated": 0,
+    "planSteps": [],
+    "currentStepIndex": -1,
+    "planStatus": "",
+}
+
+# Benchmarks flip this to reproduce the old full-echo updates for comparison
+ECHO_UNCHANGED = False
+
+_UNSET = object()
+
+
+def plan_steps_reducer(current: Optional[List[Dict[str, Any]]], update: Any) -> List[Dict[str, Any]]:
+    """Apply a full planSteps list (replace) or a `{index: {field: value}}` patch."""
+    if update is None:
+        return list(current or [])
+    if isinstance(update, dict):
+        steps = list(current or [])
+        for index, fields in update.items():
+            try:
+                i = int(index)
+            except (TypeError, ValueError):
+                continue
+            if 0 <= i < len(steps) and isinstance(fields, dict):
+                steps[i] = {**steps[i], **fields} if isinstance(steps[i], dict) else dict(fields)
+        return steps
+    return list(update)
+
+
+def plan_steps_patch(old: List[Any], new: List[Any]) -> Any:
+    """
+    Smallest update turning `old` into `new`: None when equal, a per-step patch when only
+    fields of existing steps changed, otherwise the full list.
+    """
+    old = old or []
+    new = new or []
+    if old == new:
+        return None
+    if len(old) != len(new) or not all(isinstance(s, dict) for s in (*old, *new)):
+        return list(new)
+    patch: Dict[int, Dict[str, Any]] = {}
+    for i, (before, after) in enumerate(zip(old, new)):
+        if before == after:
+            continue
+        if any(key not in after for key in before):
+            # a removed field cannot be expressed as a merge
+            return list(new)
+        patch[i] = {k: v for k, v in after.items() if before.get(k, _UNSET) != v}
+    return patch
+
+
+def state_update(
+    state: Dict[str, Any],
+    messages: Optional[Iterable[Any]] = None,
+    guidance: Any = _UNSET,
+    **changes: Any,
+) -> Dict[str, Any]:
+    """
+    Build a Command update containing only new messages and keys whose value differs
+    from `state`. `guidance` sets the transient post-tool guidance for the next hop.
+    """
+    update: Dict[str, Any] = {}
+    messages = list(messages or [])
+    if messages:
+        update["messages"] = messages
+
+    for key, value in changes.items():
+        current = state.get(key, SHARED_STATE_DEFAULTS.get(key))
+        if key == "planSteps":
+            # a `{index: fields}` patch (from plan_state.PlanMachine) is already minimal
+            patch = (value or None) if isinstance(value, dict) else plan_steps_patch(current, value)
+            if patch is not None:
+                update[key] = patch
+        elif key not in state or value != current:
+            update[key] = value
+
+    if ECHO_UNCHANGED:
+        for key, default in SHARED_STATE_DEFAULTS.items():
+            if key not in update:
+                update[key] = state.get(key, default)
+            elif key == "planSteps":
+                update[key] = plan_steps_reducer(state.get(key, default), update[key])
+
+    if guidance is not _UNSET:
+        update["__last_tool_guidance"] = guidance
+    return update
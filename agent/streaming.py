@@ -0,0 +1,154 @@
+"""
+Streaming model calls for `chat_node`.
+
+`stream_model_response` consumes `astream` instead of awaiting `ainvoke`. Text and tool
+call chunks reach CopilotKit through the LangGraph callbacks as soon as the provider
+sends them, which covers frontend tool calls too. The chunks are also parsed here, and
+each tool call is handed to `on_tool_call` once its JSON arguments are complete. The
+node uses this to emit predicted plan state while the model is still generating.
+
+Only output the node will use reaches the client live. A fast-tier attempt may be
+escalated, so it runs quietly under `quiet_config`, with CopilotKit's message and
+tool-call events off, and `emit_response` sends it in one piece once accepted. An attempt
+with a partial tool selection may be rejected for calling a tool left out of it; its text
+still streams (`quiet_config(config, text=True)`) and only its tool calls wait for the
+provider to accept the response. If that rejection comes after text reached the client,
+the retry with the full set runs quietly and only its tool calls are emitted (the run's
+final messages snapshot carries its text). Any other failure of a stream that reached the
+client is raised as `StreamInterrupted`, which llm_scheduler does not retry.
+"""
+
+import json
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks.manager import adispatch_custom_event
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_chunk_to_message
+
+ToolCallCallback = Callable[[Dict[str, Any], List[Dict[str, Any]]], Awaitable[None]]
+
+# Custom event CopilotKit treats as intermediate agent state (see copilotkit_emit_state)
+INTERMEDIATE_STATE_EVENT = "copilotkit_manually_emit_intermediate_state"
+# Custom event CopilotKit turns into tool call start/args/end events (see copilotkit_emit_tool_call)
+TOOL_CALL_EVENT = "copilotkit_manually_emit_tool_call"
+# Custom event CopilotKit turns into text message start/content/end events (see copilotkit_emit_message)
+MESSAGE_EVENT = "copilotkit_manually_emit_message"
+
+
+class StreamInterrupted(Exception):
+    """A live model stream failed after output reached the client; retrying would show it twice."""
+
+
+def quiet_config(config: Dict[str, Any], text: bool = False) -> Dict[str, Any]:
+    """
+    `config` with the model's streamed tool calls (and, unless `text`, its text) kept from
+    the client: the metadata `copilotkit_customize_config(emit_messages=..., emit_tool_calls=False)`
+    sets, plus LangGraph's `nostream` tag for `stream_mode="messages"` consumers when nothing streams.
+    """
+    if text:
+        return {**config, "metadata": {**(config.get("metadata") or {}), "copilotkit:emit-tool-calls": False}}
+    return {
+        **config,
+        "metadata": {**(config.get("metadata") or {}), "copilotkit:emit-messages": False, "copilotkit:emit-tool-calls": False},
+        "tags": [*(config.get("tags") or []), "nostream"],
+    }
+
+
+async def emit_intermediate_state(config: Dict[str, Any], state: Dict[str, Any]) -> None:
+    """
+    Same event as `copilotkit_emit_state`, without its trailing 20 ms sleep, which would
+    otherwise stall the token stream every time plan state is emitted mid-generation.
+    """
+    await adispatch_custom_event(INTERMEDIATE_STATE_EVENT, state, config=config)
+
+
+async def emit_tool_call(config: Dict[str, Any], call: Dict[str, Any]) -> None:
+    """
+    Deliver a tool call that did not come from a model stream (same event as
+    `copilotkit_emit_tool_call`, without the sleep). The call id is kept, so the client's
+    ToolMessage answers the AIMessage stored in state.
+    """
+    await adispatch_custom_event(TOOL_CALL_EVENT, {"name": call["name"], "args": call.get("args") or {}, "id": call["id"]}, config=config)
+
+
+async def emit_response(config: Dict[str, Any], response: AIMessage, text: bool = True) -> None:
+    """
+    Deliver a response generated under `quiet_config` once it is accepted: its text (unless
+    it already streamed), then its tool calls.
+    """
+    content = response.content if isinstance(response.content, str) else ""
+    if text and content:
+        await adispatch_custom_event(
+            MESSAGE_EVENT, {"message": content, "message_id": response.id or str(uuid.uuid4()), "role": "assistant"}, config=config
+        )
+    for call in response.tool_calls or []:
+        await emit_tool_call(config, call)
+
+
+class ToolCallStreamTracker:
+    """Assembles streamed tool call chunks and reports each call once its arguments parse."""
+
+    def __init__(self):
+        self._calls: Dict[int, Dict[str, Any]] = {}
+        self._done: set = set()
+        self.completed: List[Dict[str, Any]] = []
+
+    def feed(self, chunk: AIMessageChunk) -> List[Dict[str, Any]]:
+        """Add one chunk; return the tool calls that became complete with it."""
+        if not isinstance(chunk, AIMessageChunk):
+            # models without native streaming yield the whole message at once
+            ready = [dict(tc) for tc in getattr(chunk, "tool_calls", None) or []]
+            self.completed.extend(ready)
+            return ready
+        for part in getattr(chunk, "tool_call_chunks", None) or []:
+            index = part.get("index")
+            if index is None:
+                index = len(self._calls)
+            call = self._calls.setdefault(index, {"name": "", "id": None, "args": ""})
+            if part.get("name"):
+                call["name"] += part["name"]
+            if part.get("id"):
+                call["id"] = part["id"]
+            if part.get("args"):
+                call["args"] += part["args"]
+
+        ready: List[Dict[str, Any]] = []
+        for index in sorted(self._calls):
+            if index in self._done:
+                continue
+            call = self._calls[index]
+            args = call["args"].strip()
+            # a JSON object only parses once it is closed, so this detects the end of the arguments
+            if not call["name"] or not args.endswith("}"):
+                continue
+            try:
+                parsed = json.loads(args)
+            except ValueError:
+                continue
+            if not isinstance(parsed, dict):
+                continue
+            self._done.add(index)
+            complete = {"name": call["name"], "args": parsed, "id": call["id"], "type": "tool_call"}
+            self.completed.append(complete)
+            ready.append(complete)
+        return ready
+
+
+async def stream_model_response(
+    model: Any,
+    messages: Sequence[BaseMessage],
+    config: Optional[Dict[str, Any]] = None,
+    on_tool_call: Optional[ToolCallCallback] = None,
+) -> AIMessage:
+    """Stream `model` and return the aggregated AIMessage, reporting complete tool calls early."""
+    tracker = ToolCallStreamTracker()
+    aggregate: Optional[AIMessageChunk] = None
+    async for chunk in model.astream(messages, config):
+        aggregate = chunk if aggregate is None else aggregate + chunk
+        if on_tool_call is not None:
+            for call in tracker.feed(chunk):
+                await on_tool_call(call, tracker.completed)
+    if aggregate is None:
+        return AIMessage(content="")
+    message = message_chunk_to_message(aggregate)
+    return message if isinstance(message, AIMessage) else AIMessage(content=str(message.content))
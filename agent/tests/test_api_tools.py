@@ -0,0 +1,81 @@
+"""
+Unit tests for the cached-read pointer in api_tools: a repeat read only points at an earlier
+result the model still has whole in its prompt; a row-capped, truncated, evicted or old
+result is returned again.
+
+    python -m pytest tests          (from agent/)
+    python -m tests.test_api_tools  (without pytest)
+"""
+
+import json
+import sys
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from api_tools import POINTER_WINDOW, _shown_whole
+from history import HISTORY_TOKEN_BUDGET
+from tool_results import TOOL_RESULT_CONFIG
+
+TOOL = "fetch_expenses"
+CALL_ID = "call_expenses"
+
+
+def _expenses(rows, note=""):
+    expenses = [{"id": i, "expense_name": f"Expense {i}{note}", "amount": 10 + i, "category": "Fuel"} for i in range(rows)]
+    return json.dumps({"success": True, "expenses": expenses, "count": rows})
+
+
+def _state(content, after=()):
+    return {
+        "messages": [
+            HumanMessage(content="What did I spend?"),
+            AIMessage(content="", tool_calls=[{"name": TOOL, "args": {}, "id": CALL_ID, "type": "tool_call"}]),
+            ToolMessage(content=content, tool_call_id=CALL_ID, name=TOOL),
+            AIMessage(content="You spent on fuel."),
+            *after,
+        ]
+    }
+
+
+def test_small_recent_result_gets_pointer():
+    assert _shown_whole(_state(_expenses(5)), TOOL, CALL_ID)
+
+
+def test_unknown_or_missing_origin_gets_rows():
+    assert not _shown_whole(_state(_expenses(5)), TOOL, None)
+    assert not _shown_whole(_state(_expenses(5)), TOOL, "call_other")
+
+
+def test_row_capped_result_gets_rows():
+    rows = TOOL_RESULT_CONFIG[TOOL].max_rows + 1
+    assert not _shown_whole(_state(_expenses(rows)), TOOL, CALL_ID)
+    assert _shown_whole(_state(_expenses(rows - 1)), TOOL, CALL_ID)
+
+
+def test_truncated_result_gets_rows():
+    # under the row cap, but long enough for history.py to cut the message
+    assert not _shown_whole(_state(_expenses(30, note=" " + "x" * 400)), TOOL, CALL_ID)
+
+
+def test_evicted_result_gets_rows():
+    filler = "y" * (HISTORY_TOKEN_BUDGET * 4)
+    later = [HumanMessage(content="And now?"), AIMessage(content=filler)]
+    assert not _shown_whole(_state(_expenses(5), after=later), TOOL, CALL_ID)
+
+
+def test_old_result_gets_rows():
+    later = [m for i in range(POINTER_WINDOW) for m in (HumanMessage(content=f"q{i}"), AIMessage(content=f"a{i}"))]
+    assert not _shown_whole(_state(_expenses(5), after=later), TOOL, CALL_ID)
+
+
+if __name__ == "__main__":
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_") and callable(fn)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+        except Exception as exc:
+            failed += 1
+            print(f"FAIL {name}: {exc!r}")
+    print(f"{len(tests) - failed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,237 @@
+"""
+Unit tests for checkpointer.SQLiteCheckpointer compaction and thread deletion: pruning,
+delta folding, blob cleanup, rollback after a failure, and a second worker committing a
+checkpoint on the same file while compaction runs.
+
+    python -m pytest tests          (from agent/)
+    python -m tests.test_checkpointer (without pytest)
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from langchain_core.messages import HumanMessage
+
+from checkpointer import SQLiteCheckpointer
+
+THREAD = "thread-1"
+
+
+def _saver(path, **settings):
+    settings.setdefault("keep_checkpoints", 3)
+    settings.setdefault("compact_interval_seconds", 0)
+    return SQLiteCheckpointer(path, **settings)
+
+
+def _put(saver, step, thread_id=THREAD, previous=None):
+    """Checkpoint `step` of a thread: messages 0..step, appended one per step (a delta blob)."""
+    messages = [HumanMessage(content=f"message {i}", id=f"{thread_id}-m{i}") for i in range(step + 1)]
+    version = f"{step + 1:08d}"
+    checkpoint = {
+        "v": 1,
+        "id": f"{step:08d}",
+        "ts": "",
+        "channel_values": {"messages": messages},
+        "channel_versions": {"messages": version},
+        "versions_seen": {},
+        "pending_sends": [],
+    }
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": previous}}
+    return saver.put(config, checkpoint, {"step": step}, {"messages": version})
+
+
+def _fill(saver, steps, thread_id=THREAD):
+    previous = None
+    for step in range(steps):
+        previous = _put(saver, step, thread_id, previous)["configurable"]["checkpoint_id"]
+    return previous
+
+
+def _messages(saver, thread_id=THREAD, checkpoint_id=None):
+    configurable = {"thread_id": thread_id, "checkpoint_ns": ""}
+    if checkpoint_id:
+        configurable["checkpoint_id"] = checkpoint_id
+    found = saver.get_tuple({"configurable": configurable})
+    return None if found is None else [m.content for m in found.checkpoint["channel_values"].get("messages", [])]
+
+
+def _count(path, table, thread_id=THREAD):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+
+class _FailingConnection:
+    """Wraps the saver's connection and raises on the first statement matching `fail_on`."""
+
+    def __init__(self, conn, fail_on):
+        self._conn = conn
+        self.fail_on = fail_on
+
+    def execute(self, sql, *args):
+        if self.fail_on and sql.startswith(self.fail_on):
+            self.fail_on = None
+            raise sqlite3.OperationalError("disk I/O error")
+        return self._conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _tmp_path(directory):
+    return os.path.join(directory, "checkpoints.sqlite")
+
+
+# -- prune / fold / delete ---------------------------------------------------------------
+
+
+def test_compact_prunes_to_keep_and_folds_deltas():
+    with tempfile.TemporaryDirectory() as directory:
+        path = _tmp_path(directory)
+        saver = _saver(path)
+        _fill(saver, 8)
+        assert saver.delta_blobs == 7
+
+        result = saver.compact()
+        assert result["pruned_checkpoints"] == 5
+        # the oldest retained delta lost its base and was folded into a full blob
+        assert result["folded_deltas"] == 1
+        assert result["removed_blobs"] == 5
+        assert _count(path, "checkpoints") == 3
+        assert _count(path, "blobs") == 3
+
+        # a fresh process (no hot cache) still reads every retained checkpoint whole
+        reader = _saver(path)
+        assert _messages(reader) == [f"message {i}" for i in range(8)]
+        assert _messages(reader, checkpoint_id=f"{5:08d}") == [f"message {i}" for i in range(6)]
+        assert _messages(reader, checkpoint_id=f"{4:08d}") is None
+
+
+def test_compact_below_keep_is_no_op():
+    with tempfile.TemporaryDirectory() as directory:
+        path = _tmp_path(directory)
+        saver = _saver(path)
+        _fill(saver, 3)
+        assert saver.compact()["pruned_checkpoints"] == 0
+        assert _count(path, "checkpoints") == 3 and _count(path, "blobs") == 3
+
+
+def test_writes_after_compaction_stay_readable():
+    with tempfile.TemporaryDirectory() as directory:
+        path = _tmp_path(directory)
+        saver = _saver(path)
+        last = _fill(saver, 6)
+        saver.compact()
+        _put(saver, 6, previous=last)
+        assert _messages(_saver(path)) == [f"message {i}" for i in range(7)]
+
+
+def test_delete_thread_removes_only_that_thread():
+    with tempfile.TemporaryDirectory() as directory:
+        path = _tmp_path(directory)
+        saver = _saver(path)
+        _fill(saver, 2)
+        _fill(saver, 2, thread_id="thread-2")
+        saver.delete_thread(THREAD)
+        for table in ("checkpoints", "blobs"):
+            assert _count(path, table) == 0
+            assert _count(path, table, "thread-2") == 2
+        assert _messages(saver) is None
+        assert _messages(saver, "thread-2") == ["message 0", "message 1"]
+
+
+# -- failures roll back ------------------------------------------------------------------
+
+
+def test_failed_compaction_rolls_back():
+    with tempfile.TemporaryDirectory() as directory:
+        path = _tmp_path(directory)
+        saver = _saver(path)
+        last = _fill(saver, 6)
+        saver._conn = _FailingConnection(saver._conn, "DELETE FROM blobs")
+        try:
+            saver.compact()
+            raise AssertionError("compact should have failed")
+        except sqlite3.OperationalError:
+            pass
+        # nothing half-done, and the connection is out of the transaction
+        assert _count(path, "checkpoints") == 6
+        _put(saver, 6, previous=last)
+        assert _messages(_saver(path)) == [f"message {i}" for i in range(7)]
+        assert saver.compact()["pruned_checkpoints"] == 4
+
+
+def test_failed_delete_thread_rolls_back():
+    with tempfile.TemporaryDirectory() as directory:
+        path = _tmp_path(directory)
+        saver = _saver(path)
+        last = _fill(saver, 2)
+        saver._conn = _FailingConnection(saver._conn, "DELETE FROM blobs")
+        try:
+            saver.delete_thread(THREAD)
+            raise AssertionError("delete_thread should have failed")
+        except sqlite3.OperationalError:
+            pass
+        assert _count(path, "checkpoints") == 2
+        _put(saver, 2, previous=last)
+        assert _messages(saver) == ["message 0", "message 1", "message 2"]
+
+
+# -- two workers on one file -------------------------------------------------------------
+
+
+def test_checkpoint_committed_during_compaction_keeps_its_blobs():
+    with tempfile.TemporaryDirectory() as directory:
+        path = _tmp_path(directory)
+        compactor = _saver(path)
+        worker = _saver(path)
+        last = _fill(worker, 6)
+
+        # once compaction has read the thread's checkpoints, the other worker commits one more
+        done = threading.Event()
+        failures = []
+
+        def other_worker():
+            try:
+                _put(worker, 6, previous=last)
+            except Exception as exc:
+                failures.append(exc)
+            done.set()
+
+        class _Interleaving(_FailingConnection):
+            def execute(self, sql, *args):
+                result = self._conn.execute(sql, *args)
+                if self.fail_on and sql.startswith(self.fail_on):
+                    self.fail_on = None
+                    threading.Thread(target=other_worker, daemon=True).start()
+                    # give it the chance to commit before the deletes, if nothing holds it back
+                    done.wait(0.3)
+                return result
+
+        compactor._conn = _Interleaving(compactor._conn, "SELECT checkpoint_id, type, checkpoint FROM checkpoints")
+        started = time.monotonic()
+        compactor.compact()
+        assert done.wait(10), "the other worker never committed"
+        assert not failures, failures
+        assert time.monotonic() - started < 10
+
+        reader = _saver(path)
+        assert _messages(reader) == [f"message {i}" for i in range(7)]
+        for step in range(3, 7):
+            assert _messages(reader, checkpoint_id=f"{step:08d}") is not None
+
+
+if __name__ == "__main__":
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_") and callable(fn)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+        except Exception as exc:
+            failed += 1
+            print(f"FAIL {name}: {exc!r}")
+    print(f"{len(tests) - failed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
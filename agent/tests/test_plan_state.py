@@ -0,0 +1,199 @@
+"""
+Unit tests for plan_state.PlanMachine: the set_plan / update_plan_progress / complete_plan
+transitions, out-of-range arguments, and the minimal patch `updates()` returns for each.
+
+    python -m pytest tests          (from agent/)
+    python -m tests.test_plan_state (without pytest)
+"""
+
+import copy
+import sys
+
+from plan_state import COMPLETED, FAILED, IN_PROGRESS, PENDING, PlanMachine, predict_plan_updates
+from state_updates import plan_steps_reducer
+
+
+def _steps(*statuses):
+    return [{"title": f"Step {i}", "status": status} for i, status in enumerate(statuses)]
+
+
+def _call(name, **args):
+    return {"name": name, "args": args, "id": f"call-{name}"}
+
+
+def _run(steps, index, status, *calls):
+    return PlanMachine(steps, index, status).apply_all(calls).updates()
+
+
+# -- set_plan ------------------------------------------------------------------------
+
+
+def test_set_plan_starts_first_step():
+    updates = _run([], -1, "", _call("set_plan", steps=["Create project", "Log expense"]))
+    assert updates == {
+        "planSteps": [{"title": "Create project", "status": IN_PROGRESS}, {"title": "Log expense", "status": PENDING}],
+        "currentStepIndex": 0,
+        "planStatus": IN_PROGRESS,
+    }
+
+
+def test_set_plan_stringifies_titles():
+    updates = _run([], -1, "", _call("set_plan", steps=[3, "Four"]))
+    assert [step["title"] for step in updates["planSteps"]] == ["3", "Four"]
+
+
+def test_set_plan_replaces_existing_plan():
+    updates = _run(_steps(COMPLETED, IN_PROGRESS), 1, IN_PROGRESS, _call("set_plan", steps=["Only step"]))
+    # a replaced plan is sent whole, never as a patch over the old indices
+    assert updates == {"planSteps": [{"title": "Only step", "status": IN_PROGRESS}], "currentStepIndex": 0}
+
+
+def test_set_plan_identical_plan_is_no_change():
+    steps = [{"title": "A", "status": IN_PROGRESS}, {"title": "B", "status": PENDING}]
+    assert _run(steps, 0, IN_PROGRESS, _call("set_plan", steps=["A", "B"])) == {}
+
+
+def test_set_plan_empty_clears_plan():
+    updates = _run(_steps(IN_PROGRESS, PENDING), 0, IN_PROGRESS, _call("set_plan", steps=[]))
+    assert updates == {"planSteps": [], "currentStepIndex": -1, "planStatus": ""}
+
+
+# -- update_plan_progress ------------------------------------------------------------
+
+
+def test_completing_step_promotes_next():
+    steps = _steps(IN_PROGRESS, PENDING, PENDING)
+    updates = _run(steps, 0, IN_PROGRESS, _call("update_plan_progress", step_index=0, status=COMPLETED))
+    # only the two steps that moved, only their status; planStatus stays in_progress
+    assert updates == {"planSteps": {0: {"status": COMPLETED}, 1: {"status": IN_PROGRESS}}, "currentStepIndex": 1}
+    assert plan_steps_reducer(steps, updates["planSteps"]) == _steps(COMPLETED, IN_PROGRESS, PENDING)
+
+
+def test_promotion_prefers_step_after_last_completed():
+    steps = _steps(PENDING, COMPLETED, IN_PROGRESS, PENDING)
+    updates = _run(steps, 2, IN_PROGRESS, _call("update_plan_progress", step_index=2, status=COMPLETED))
+    assert updates == {"planSteps": {2: {"status": COMPLETED}, 3: {"status": IN_PROGRESS}}, "currentStepIndex": 3}
+
+
+def test_note_is_patched_with_status():
+    updates = _run(
+        _steps(IN_PROGRESS, PENDING), 0, IN_PROGRESS,
+        _call("update_plan_progress", step_index=1, status=IN_PROGRESS, note="started early"),
+    )
+    assert updates == {"planSteps": {1: {"status": IN_PROGRESS, "note": "started early"}}, "currentStepIndex": 1}
+
+
+def test_unchanged_status_is_no_change():
+    steps = _steps(IN_PROGRESS, PENDING)
+    assert _run(steps, 0, IN_PROGRESS, _call("update_plan_progress", step_index=0, status=IN_PROGRESS)) == {}
+
+
+def test_failed_step_moves_on_to_next_pending():
+    updates = _run(_steps(IN_PROGRESS, PENDING), 0, IN_PROGRESS, _call("update_plan_progress", step_index=0, status=FAILED))
+    assert updates == {"planSteps": {0: {"status": FAILED}, 1: {"status": IN_PROGRESS}}, "currentStepIndex": 1}
+
+
+def test_failed_last_step_fails_plan():
+    updates = _run(_steps(COMPLETED, IN_PROGRESS), 1, IN_PROGRESS, _call("update_plan_progress", step_index=1, status=FAILED))
+    assert updates == {"planSteps": {1: {"status": FAILED}}, "planStatus": FAILED}
+
+
+def test_out_of_range_indices_are_ignored():
+    steps = _steps(IN_PROGRESS, PENDING)
+    for index in (-1, 2, 99, "1", None, 1.0):
+        updates = _run(steps, 0, IN_PROGRESS, _call("update_plan_progress", step_index=index, status=COMPLETED))
+        assert updates == {}, index
+
+
+def test_invalid_status_is_ignored():
+    assert _run(_steps(IN_PROGRESS, PENDING), 0, IN_PROGRESS, _call("update_plan_progress", step_index=0, status=None)) == {}
+
+
+def test_update_without_plan_is_ignored():
+    assert _run([], -1, "", _call("update_plan_progress", step_index=0, status=COMPLETED)) == {}
+
+
+def test_json_string_args():
+    call = {"name": "update_plan_progress", "args": '{"step_index": 0, "status": "completed"}', "id": "call-1"}
+    updates = _run(_steps(IN_PROGRESS, PENDING), 0, IN_PROGRESS, call)
+    assert updates["planSteps"] == {0: {"status": COMPLETED}, 1: {"status": IN_PROGRESS}}
+
+
+# -- complete_plan -------------------------------------------------------------------
+
+
+def test_complete_plan_patches_only_open_steps():
+    steps = _steps(COMPLETED, IN_PROGRESS, PENDING)
+    updates = _run(steps, 1, IN_PROGRESS, _call("complete_plan"))
+    assert updates == {"planSteps": {1: {"status": COMPLETED}, 2: {"status": COMPLETED}}, "planStatus": COMPLETED}
+    assert plan_steps_reducer(steps, updates["planSteps"]) == _steps(COMPLETED, COMPLETED, COMPLETED)
+
+
+def test_complete_plan_on_completed_plan_is_no_change():
+    assert _run(_steps(COMPLETED, COMPLETED), 1, COMPLETED, _call("complete_plan")) == {}
+
+
+def test_all_completed_without_complete_plan_keeps_status():
+    # only complete_plan marks the plan itself completed
+    machine = PlanMachine(_steps(COMPLETED, IN_PROGRESS), 1, IN_PROGRESS)
+    machine.apply_all([_call("update_plan_progress", step_index=1, status=COMPLETED)])
+    assert machine.all_completed() and not machine.has_remaining()
+    assert machine.updates() == {"planSteps": {1: {"status": COMPLETED}}}
+
+
+# -- sequences and inputs ------------------------------------------------------------
+
+
+def test_transitions_apply_in_emission_order():
+    calls = [
+        _call("set_plan", steps=["A", "B", "C"]),
+        _call("update_plan_progress", step_index=0, status=COMPLETED),
+        _call("update_plan_progress", step_index=1, status=IN_PROGRESS),
+    ]
+    updates = _run([], -1, "", *calls)
+    assert updates == {
+        "planSteps": [
+            {"title": "A", "status": COMPLETED},
+            {"title": "B", "status": IN_PROGRESS},
+            {"title": "C", "status": PENDING},
+        ],
+        "currentStepIndex": 1,
+        "planStatus": IN_PROGRESS,
+    }
+
+
+def test_non_plan_calls_are_ignored():
+    assert _run(_steps(IN_PROGRESS), 0, IN_PROGRESS, _call("listExpenses"), _call("logExpense", amount=4)) == {}
+
+
+def test_state_steps_are_not_mutated():
+    steps = _steps(IN_PROGRESS, PENDING, PENDING)
+    before = copy.deepcopy(steps)
+    _run(steps, 0, IN_PROGRESS, _call("update_plan_progress", step_index=0, status=COMPLETED, note="done"), _call("complete_plan"))
+    assert steps == before
+
+
+def test_extra_step_fields_round_trip():
+    steps = [{"title": "A", "status": IN_PROGRESS, "owner": "ops"}, {"title": "B", "status": PENDING}]
+    machine = PlanMachine(steps, 0, IN_PROGRESS).apply_all([_call("update_plan_progress", step_index=0, status=COMPLETED)])
+    assert machine.to_list()[0] == {"title": "A", "status": COMPLETED, "owner": "ops"}
+    assert machine.to_list()[1] == {"title": "B", "status": IN_PROGRESS}
+
+
+def test_predict_plan_updates_matches_machine():
+    steps = _steps(IN_PROGRESS, PENDING)
+    calls = [_call("update_plan_progress", step_index=0, status=COMPLETED)]
+    assert predict_plan_updates(steps, 0, IN_PROGRESS, calls) == PlanMachine(steps, 0, IN_PROGRESS).apply_all(calls).updates()
+
+
+if __name__ == "__main__":
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_") and callable(fn)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+        except AssertionError as exc:
+            failed += 1
+            print(f"FAIL {name}: {exc!r}")
+    print(f"{len(tests) - failed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
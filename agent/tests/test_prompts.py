@@ -0,0 +1,76 @@
+"""
+Unit tests for prompts.FirstTokenTimer: time-to-first-token counts from the start of the
+attempt, and the wait before it is reported as queue wait.
+
+    python -m pytest tests        (from agent/)
+    python -m tests.test_prompts  (without pytest)
+"""
+
+import asyncio
+import sys
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.fake_model import ScriptedChatModel, text_reply
+from prompts import FirstTokenTimer, PromptCacheStats
+from streaming import stream_model_response
+
+QUEUED = 0.3
+
+
+def _model():
+    return ScriptedChatModel(responder=lambda *args: text_reply("hello there, friend"), latency=0.1, stream_chunks=4)
+
+
+async def _streamed_after_queue(timer):
+    await asyncio.sleep(QUEUED)
+    await stream_model_response(_model().with_config(callbacks=[timer]), [HumanMessage(content="hi")], {})
+
+
+def test_ttft_excludes_queue_wait():
+    timer = FirstTokenTimer()
+    asyncio.run(_streamed_after_queue(timer))
+    assert timer.queue_wait >= QUEUED
+    assert timer.ttft < QUEUED
+
+
+def test_each_attempt_restarts_the_clock():
+    async def two_attempts(timer):
+        model = _model().with_config(callbacks=[timer])
+        await stream_model_response(model, [HumanMessage(content="hi")], {})
+        first_started = timer.started
+        await asyncio.sleep(QUEUED)
+        await stream_model_response(model, [HumanMessage(content="hi")], {})
+        return first_started
+
+    timer = FirstTokenTimer()
+    first_started = asyncio.run(two_attempts(timer))
+    assert timer.started - first_started >= QUEUED
+    assert timer.queue_wait >= QUEUED and timer.ttft < QUEUED
+
+
+def test_not_started_reports_nothing():
+    timer = FirstTokenTimer()
+    assert timer.ttft is None and timer.queue_wait is None
+
+
+def test_stats_average_queue_wait_separately():
+    stats = PromptCacheStats()
+    stats.record(text_reply("a"), latency=1.0, ttft=0.2, queue_wait=0.6)
+    stats.record(text_reply("b"), latency=0.5, ttft=0.1)
+    result = stats.stats()
+    assert abs(result["avg_ttft"] - 0.15) < 1e-9
+    assert abs(result["avg_queue_wait"] - 0.6) < 1e-9
+
+
+if __name__ == "__main__":
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_") and callable(fn)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+        except Exception as exc:
+            failed += 1
+            print(f"FAIL {name}: {exc!r}")
+    print(f"{len(tests) - failed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,66 @@
+"""
+Unit tests for response_cache similarity matching: paraphrases and reordered plain lookups
+reuse a cached answer; questions with swapped operands or numbers do not.
+
+    python -m pytest tests              (from agent/)
+    python -m tests.test_response_cache (without pytest)
+"""
+
+import sys
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.stub_api import STUB_API_KEY
+from flame_api import parse_api_key
+from response_cache import ResponseCache
+
+STATE = {"activeOrganizationId": "org-1", "activeCycleId": "3"}
+CONFIG = {"configurable": {"thread_id": "t-1", "flame_credential": parse_api_key(STUB_API_KEY)}}
+
+
+def _cache_with(question):
+    cache = ResponseCache(enabled=True)
+    assert cache.store([HumanMessage(content=question)], AIMessage(content=f"Answer to: {question}"), STATE, CONFIG)
+    return cache
+
+
+def _answer(cache, question):
+    return cache.lookup([HumanMessage(content=question)], STATE, CONFIG)
+
+
+def test_paraphrase_hits():
+    cache = _cache_with("Total expenses by category")
+    assert _answer(cache, "Tell me the total spending by category please") == "Answer to: Total expenses by category"
+    assert _answer(cache, "Expenses by category, total please") == "Answer to: Total expenses by category"
+
+
+def test_swapped_operands_miss():
+    cache = _cache_with("What is sales minus expenses this cycle across all projects and customers")
+    assert _answer(cache, "What is expenses minus sales this cycle across all projects and customers") is None
+    cache = _cache_with("Compare sales this cycle to sales last cycle broken down by customer")
+    assert _answer(cache, "Compare sales last cycle to sales this cycle broken down by customer") is None
+
+
+def test_swapped_numbers_miss():
+    cache = _cache_with("How much did expenses grow from cycle 3 to cycle 4 for each project")
+    assert _answer(cache, "How much did expenses grow from cycle 4 to cycle 3 for each project") is None
+    cache = _cache_with("Show expenses of cycle 3 and cycle 4 by category")
+    assert _answer(cache, "Show expenses of cycle 4 and cycle 3 by category") is None
+
+
+def test_operator_question_with_filler_still_hits():
+    cache = _cache_with("What is sales minus expenses this cycle")
+    assert _answer(cache, "Please tell me my sales minus expenses for this cycle") is not None
+
+
+if __name__ == "__main__":
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_") and callable(fn)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+        except Exception as exc:
+            failed += 1
+            print(f"FAIL {name}: {exc!r}")
+    print(f"{len(tests) - failed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,65 @@
+"""
+Unit tests for the compact tool-result tables: money footers add up the organization
+currency, not project amounts in mixed currencies.
+
+    python -m pytest tests            (from agent/)
+    python -m tests.test_tool_results (without pytest)
+"""
+
+import json
+import sys
+
+from tool_results import compact_tool_content
+
+
+def _totals(tool_name, records_key, records):
+    content = json.dumps({"success": True, records_key: records * 10, "count": len(records) * 10})
+    encoded = compact_tool_content(tool_name, content)
+    return next(line for line in encoded.splitlines() if line.startswith("totals: "))
+
+
+def test_expense_sum_is_in_org_currency():
+    expenses = [
+        {"id": 1, "expense_name": "Fuel", "amount": "3700.00", "amount_org_ccy": "1.00", "project_id": 4},
+        {"id": 2, "expense_name": "Seeds", "amount": "10.00", "amount_org_ccy": "10.00", "project_id": 3},
+    ]
+    totals = _totals("fetch_expenses", "expenses", expenses)
+    assert "sum_amount_org_ccy=110.0" in totals
+    assert "sum_amount=" not in totals
+
+
+def test_missing_org_amount_falls_back_to_amount():
+    # no org-currency value: the project's currency is the organization's
+    expenses = [{"id": 1, "expense_name": "Fuel", "amount": "5.00", "amount_org_ccy": None, "project_id": 3}]
+    assert "sum_amount_org_ccy=50.0" in _totals("listExpenses", "expenses", expenses)
+
+
+def test_org_amount_column_is_kept():
+    content = json.dumps({"success": True, "count": 20, "sales": [
+        {"id": i, "customer_name": "Ann", "amount": "3700.00", "amount_org_ccy": "1.00", "quantity": 2} for i in range(20)
+    ]})
+    encoded = compact_tool_content("listSales", content)
+    assert "amount_org_ccy" in encoded.splitlines()[1].split("columns: ")[1].split("|")
+    totals = encoded.splitlines()[-2]
+    assert "sum_amount_org_ccy=20.0" in totals and "sum_quantity=40.0" in totals
+
+
+def test_cycle_budget_sum_is_in_org_currency():
+    cycles = [
+        {"id": 7, "cycle_name": "Q1", "budget_allotment": "370000.00", "budget_allotment_org_ccy": "100.00"},
+        {"id": 8, "cycle_name": "Q2", "budget_allotment": "50.00", "budget_allotment_org_ccy": "50.00"},
+    ]
+    assert "sum_budget_allotment_org_ccy=1500.0" in _totals("listCycles", "cycles", cycles)
+
+
+if __name__ == "__main__":
+    tests = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("test_") and callable(fn)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+        except Exception as exc:
+            failed += 1
+            print(f"FAIL {name}: {exc!r}")
+    print(f"{len(tests) - failed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
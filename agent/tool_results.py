@@ -0,0 +1,241 @@
+"""
+Compact encoding of large list* tool results before they are sent back to the model.
+
+Frontend read tools (listExpenses, listSales, ...) return full JSON row dumps. The
+ToolMessage stays in history and is re-sent on every later hop, so each result is
+rewritten for the prompt (state is left untouched) as a table: columns once, one
+row per line, empty/unused fields dropped, rows capped with an aggregate footer.
+
+Amounts are in the project's currency, so a list spanning projects can mix currencies.
+Footer sums of money therefore add up the organization-currency column
+(`amount_org_ccy`, `budget_allotment_org_ccy`), falling back to the project amount only
+where the row has none (the project's currency is the organization's), as analytics.py does.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from history import estimate_tokens
+
+TOOL_RESULT_COMPACTION = os.getenv("FLAME_TOOL_RESULT_COMPACTION", "1") not in ("0", "false", "False", "")
+
+
+class ToolResultConfig(NamedTuple):
+    records_key: str
+    drop_fields: Tuple[str, ...] = ("organization_id", "created_by")
+    amount_fields: Tuple[str, ...] = ()
+    date_fields: Tuple[str, ...] = ()
+    max_rows: int = 40
+    # (amount field, its organization-currency field): the footer sums the latter
+    org_currency_fields: Tuple[Tuple[str, str], ...] = ()
+
+
+TOOL_RESULT_CONFIG: Dict[str, ToolResultConfig] = {
+    "listExpenses": ToolResultConfig(
+        records_key="expenses",
+        amount_fields=("amount",),
+        date_fields=("date_time_created",),
+        org_currency_fields=(("amount", "amount_org_ccy"),),
+    ),
+    "listSales": ToolResultConfig(
+        records_key="sales",
+        amount_fields=("amount", "quantity"),
+        date_fields=("sale_date",),
+        org_currency_fields=(("amount", "amount_org_ccy"),),
+    ),
+    "listProjects": ToolResultConfig(records_key="projects"),
+    "listCycles": ToolResultConfig(
+        records_key="cycles",
+        amount_fields=("budget_allotment",),
+        date_fields=("start_date", "end_date"),
+        org_currency_fields=(("budget_allotment", "budget_allotment_org_ccy"),),
+    ),
+    "listOrganizations": ToolResultConfig(records_key="organizations"),
+}
+# Backend API tools (api_tools.py) return the same shapes as their frontend counterparts
+TOOL_RESULT_CONFIG["fetch_expenses"] = TOOL_RESULT_CONFIG["listExpenses"]
+TOOL_RESULT_CONFIG["fetch_sales"] = TOOL_RESULT_CONFIG["listSales"]
+TOOL_RESULT_CONFIG["fetch_cycles"] = TOOL_RESULT_CONFIG["listCycles"]
+TOOL_RESULT_CONFIG["fetch_projects"] = TOOL_RESULT_CONFIG["listProjects"]
+TOOL_RESULT_CONFIG["fetch_organizations"] = TOOL_RESULT_CONFIG["listOrganizations"]
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, separators=(",", ":"), default=str)
+    return str(value).replace("\\", "\\\\").replace("|", "\\|").replace("\n", " ")
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_records(tool_name: str, records: List[Dict[str, Any]], config: ToolResultConfig, extra: Dict[str, Any]) -> str:
+    """Encode homogeneous records as a pipe-separated table with an aggregate footer."""
+    columns: List[str] = []
+    seen = set()
+    for record in records:
+        for key, value in record.items():
+            if key in seen or key in config.drop_fields:
+                continue
+            if value is None or value == "":
+                continue
+            seen.add(key)
+            columns.append(key)
+
+    shown = records[: config.max_rows]
+    lines = [
+        f"{tool_name}: {len(records)} rows" + (f" (showing first {len(shown)})" if len(shown) < len(records) else ""),
+        "columns: " + "|".join(columns),
+    ]
+    lines.extend("|".join(_cell(record.get(column)) for column in columns) for record in shown)
+
+    totals = [f"count={len(records)}"]
+    org_currency = dict(config.org_currency_fields)
+    for field in config.amount_fields:
+        org_field = org_currency.get(field)
+        if org_field:
+            amounts = (_number(r.get(org_field) if r.get(org_field) not in (None, "") else r.get(field)) for r in records)
+        else:
+            amounts = (_number(r.get(field)) for r in records)
+        values = [n for n in amounts if n is not None]
+        if values:
+            totals.append(f"sum_{org_field or field}={round(sum(values), 2)}")
+    for field in config.date_fields:
+        dates = sorted(str(r[field])[:10] for r in records if r.get(field))
+        if dates:
+            totals.append(f"{field}={dates[0]}..{dates[-1]}")
+    lines.append("totals: " + "; ".join(totals))
+
+    other = [f"{k}={_cell(v)}" for k, v in extra.items() if k not in ("count", config.records_key) and v is not None]
+    if other:
+        lines.append("other: " + "; ".join(other))
+    return "\n".join(lines)
+
+
+def _records(config: ToolResultConfig, content: str) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    """(records, rest of the payload) of a JSON list result, or None if it is not one."""
+    try:
+        payload = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(payload, list):
+        records, extra = payload, {}
+    elif isinstance(payload, dict) and isinstance(payload.get(config.records_key), list):
+        records, extra = payload[config.records_key], payload
+    else:
+        return None
+    if not records or not all(isinstance(r, dict) for r in records):
+        return None
+    return records, extra
+
+
+def compact_tool_content(tool_name: str, content: str) -> Optional[str]:
+    """Return the compact encoding for a configured tool's JSON result, or None to leave it as is."""
+    config = TOOL_RESULT_CONFIG.get(tool_name)
+    parsed = _records(config, content) if config is not None else None
+    if parsed is None:
+        return None
+    encoded = encode_records(tool_name, parsed[0], config, parsed[1])
+    return encoded if len(encoded) < len(content) else None
+
+
+def shows_all_rows(tool_name: str, content: str) -> bool:
+    """Whether the prompt form of a tool result keeps every row (the encoding caps them at `max_rows`)."""
+    config = TOOL_RESULT_CONFIG.get(tool_name)
+    if not TOOL_RESULT_COMPACTION or config is None or compact_tool_content(tool_name, content) is None:
+        return True
+    return len(_records(config, content)[0]) <= config.max_rows
+
+
+class ToolResultCompactor:
+    """Rewrites ToolMessages in a prompt window and tracks bytes/tokens saved."""
+
+    def __init__(self, max_cached: int = 512):
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[Tuple[str, int], Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.compacted = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tokens_saved = 0
+
+    def _compact(self, tool_name: str, message: ToolMessage, record: bool = True) -> Optional[str]:
+        content = message.content if isinstance(message.content, str) else None
+        if content is None:
+            return None
+        key = (message.tool_call_id, len(content))
+        with self._lock:
+            cached = key in self._cache
+            if cached:
+                self._cache.move_to_end(key)
+                self.cache_hits += record
+                compacted = self._cache[key]
+
+        if not cached:
+            compacted = compact_tool_content(tool_name, content)
+
+        with self._lock:
+            if not cached:
+                self._cache[key] = compacted
+                while len(self._cache) > self.max_cached:
+                    self._cache.popitem(last=False)
+            # Savings are counted per prompt, since the result is re-sent on every hop
+            if compacted is not None and record:
+                self.compacted += 1
+                self.bytes_in += len(content)
+                self.bytes_out += len(compacted)
+                self.tokens_saved += estimate_tokens(content) - estimate_tokens(compacted)
+        return compacted
+
+    def compact_messages(self, messages: Sequence[BaseMessage], record: bool = True) -> List[BaseMessage]:
+        """
+        Return `messages` with configured tool results replaced by their compact form.
+        `record=False` leaves the savings counters alone (for checks outside the prompt build).
+        """
+        if not TOOL_RESULT_COMPACTION:
+            return list(messages)
+        call_names: Dict[str, str] = {}
+        result: List[BaseMessage] = []
+        for message in messages:
+            if isinstance(message, AIMessage):
+                for tc in message.tool_calls or []:
+                    if tc.get("id"):
+                        call_names[tc["id"]] = tc.get("name", "")
+            elif isinstance(message, ToolMessage):
+                tool_name = message.name or call_names.get(message.tool_call_id, "")
+                if tool_name in TOOL_RESULT_CONFIG:
+                    compacted = self._compact(tool_name, message, record)
+                    if compacted is not None:
+                        message = message.model_copy(update={"content": compacted})
+            result.append(message)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "compacted": self.compacted,
+                "cache_hits": self.cache_hits,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+tool_result_compactor = ToolResultCompactor()
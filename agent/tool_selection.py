@@ -0,0 +1,425 @@
+"""
+Per-hop tool subsetting for `chat_node`.
+
+Binding every allowlisted frontend action plus the backend tools sends several thousand
+schema tokens with every model call. `ToolSelector.select` ranks the deduplicated tools
+against three signals and binds only the best `FLAME_TOOL_TOP_K`:
+
+- the latest user message (and, more weakly, the exchange before it): the entities it
+  names (expenses, sales, cycles, ...) and what it wants done (read, create, edit, delete)
+- the active plan step's title
+- `currentView`, the page the user is on (`/expense-management?action=add-expense`)
+
+Tool names carry the same information (`deleteExpense`, `fetch_sales`, `openCycleForm`), so
+each tool is tagged once from its name. Context/navigation tools, the plan tools and any
+tool already called in the current turn are always bound. The always-bound core leads the
+list in a fixed order and the ranked tools follow it, so the schema prefix the provider can
+cache stays the same from hop to hop while only the tail varies. Tools can still be reached
+when the ranking misses them:
+
+- the model can call `load_tools(names)`, whose (static) description lists every tool;
+  the next hop binds what it asked for, as long as the run's full binding has it (the
+  client sent it, or the caller may use it)
+- if the provider rejects a call to a tool that was not bound, the hop is retried with the
+  full set (`expand`); if the provider accepted it, the call stands and the tool stays
+  bound for the rest of the turn
+
+`stats()` reports schema tokens bound vs. the full set, how many of them are the stable
+prefix, and the recall misses. Disable with
+`FLAME_TOOL_SELECTION=0`.
+"""
+
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from typing_extensions import Annotated
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool
+from langgraph.prebuilt import InjectedState
+
+from history import estimate_tokens
+
+TOOL_SELECTION_ENABLED = os.getenv("FLAME_TOOL_SELECTION", "1") not in ("0", "false", "False", "")
+TOOL_TOP_K = int(os.getenv("FLAME_TOOL_TOP_K", "12"))
+
+LOAD_TOOLS_NAME = "load_tools"
+# Cheap, generally useful, and what the model reaches for when it is unsure
+ALWAYS_BOUND = frozenset({"getCurrentContext", "navigateWorkspace", "set_plan", "update_plan_progress", "complete_plan", LOAD_TOOLS_NAME})
+
+# Signal weights: what the user just said dominates; the page they are on breaks ties
+INTENT_WEIGHT = 4.0
+CONTEXT_WEIGHT = 1.5
+PLAN_WEIGHT = 3.0
+VIEW_WEIGHT = 2.0
+# Extra weight when the tool's action (verb) also matches, e.g. "delete" + deleteExpense
+VERB_BONUS = 0.75
+# ... and per further entity both name, e.g. "expense categories" + fetch_expenses_by_category
+ENTITY_BONUS = 0.25
+
+# Entity tags, matched against tool names (lowercased, underscores removed) ...
+_NAME_ENTITIES: Tuple[Tuple[str, str], ...] = (
+    ("organization", "organization"),
+    ("project", "project"),
+    ("cycle", "cycle"),
+    ("sale", "sale"),
+    ("expense", "expense"),
+    ("customer", "customer"),
+    ("vendor", "vendor"),
+    ("paymentmethod", "payment_method"),
+    ("invoice", "invoice"),
+    ("inventory", "inventory"),
+    ("categor", "category"),
+    ("report", "report"),
+    ("bycategory", "report"),
+    ("analy", "report"),
+    ("workspace", "workspace"),
+    ("context", "workspace"),
+)
+# ... and against user text and view paths
+_TEXT_ENTITIES: Tuple[Tuple[str, "re.Pattern[str]"], ...] = tuple(
+    (entity, re.compile(pattern, re.IGNORECASE))
+    for entity, pattern in (
+        ("expense", r"\bexpens|\bspen[dt]|\bcosts?\b|\breceipts?\b|\bbills?\b|\bpurchas"),
+        ("sale", r"\bsales?\b|\bsold\b|\bsell|\brevenue|\bincome\b"),
+        ("project", r"\bprojects?\b"),
+        ("cycle", r"\bcycles?\b|\bperiods?\b|\bquarters?\b|\bq[1-4]\b"),
+        ("organization", r"\borg(?:anization|anisation)?s?\b|\bcompan(?:y|ies)\b|\bbusiness"),
+        ("customer", r"\bcustomers?\b|\bclients?\b|\bbuyers?\b"),
+        ("vendor", r"\bvendors?\b|\bsuppliers?\b"),
+        ("payment_method", r"\bpayment[ -]?methods?\b|\bpay(?:ing)? (?:by|with)\b"),
+        ("invoice", r"\binvoic"),
+        ("inventory", r"\binventory\b|\bstock\b|\bitems?\b|\bproducts?\b"),
+        ("category", r"\bcategor"),
+        ("report", r"\breports?\b|\bsummary\b|\bprofit\b|\bdashboard\b|\btotals?\b|\bbreakdown\b|\btop \d|\bby (?:month|week|day|year)\b|\bmonthly\b|\btrends?\b|\baverages?\b"),
+    )
+)
+
+# Action tags: tool-name prefix -> verb, and the phrases that ask for each verb
+_NAME_VERBS: Tuple[Tuple[str, str], ...] = (
+    ("list", "read"), ("view", "read"), ("get", "read"), ("fetch", "read"), ("analy", "read"),
+    ("edit", "edit"), ("update", "edit"),
+    ("open", "create"), ("create", "create"), ("record", "create"), ("log", "create"), ("generate", "create"), ("bulk", "create"),
+    ("delete", "delete"),
+    ("navigate", "navigate"),
+)
+_TEXT_VERBS: Tuple[Tuple[str, "re.Pattern[str]"], ...] = tuple(
+    (verb, re.compile(pattern, re.IGNORECASE))
+    for verb, pattern in (
+        ("delete", r"\b(?:delete|remove|erase|drop|get rid of)\b"),
+        ("edit", r"\b(?:edit|update|change|rename|modify|correct|fix)\b"),
+        ("create", r"\b(?:add|create|log|record|new|make|generate|enter|register|open)\b"),
+        ("read", r"\b(?:show|list|view|see|find|how (?:many|much)|what|which|details?)\b"),
+        ("navigate", r"\b(?:go to|navigate|take me|switch to)\b"),
+    )
+)
+
+
+class ToolTags(NamedTuple):
+    entities: FrozenSet[str]
+    verb: str
+
+
+def tool_tags(name: str) -> ToolTags:
+    """Entities and action a tool works on, read from its name (`deleteExpense`, `fetch_sales`)."""
+    flat = name.replace("_", "").lower()
+    entities = frozenset(entity for key, entity in _NAME_ENTITIES if key in flat)
+    verb = next((verb for prefix, verb in _NAME_VERBS if flat.startswith(prefix)), "")
+    return ToolTags(entities, verb)
+
+
+def text_signals(text: str) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """(entities, verbs) a piece of user text or a view path refers to."""
+    if not text:
+        return frozenset(), frozenset()
+    return (
+        frozenset(entity for entity, pattern in _TEXT_ENTITIES if pattern.search(text)),
+        frozenset(verb for verb, pattern in _TEXT_VERBS if pattern.search(text)),
+    )
+
+
+def _view_text(view: str) -> str:
+    # "/expense-management?action=add-expense" -> "expense management action add expense"
+    return re.sub(r"[-_/?&=]+", " ", view or "")
+
+
+def _tool_name(tool: Any) -> str:
+    if isinstance(tool, dict):
+        function = tool.get("function") if isinstance(tool.get("function"), dict) else {}
+        return function.get("name") or tool.get("name") or ""
+    return getattr(tool, "name", "") or ""
+
+
+def _schema_tokens(tool: Any) -> int:
+    """Rough token size of a tool's schema as sent to the provider."""
+    if isinstance(tool, dict):
+        return estimate_tokens(json.dumps(tool, separators=(",", ":"), default=str))
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+
+    return estimate_tokens(json.dumps(convert_to_openai_tool(tool), separators=(",", ":"), default=str))
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content or "")
+
+
+def turn_signals(messages: Sequence[BaseMessage]) -> Tuple[str, str, FrozenSet[str]]:
+    """
+    (latest user text, the exchange before it, tools called or loaded since that user
+    message). Short follow-ups ("yes, delete it") take their subject from the exchange.
+    """
+    pinned: set = set()
+    latest = ""
+    context: List[str] = []
+    for i in range(len(messages) - 1, -1, -1):
+        message = messages[i]
+        if isinstance(message, HumanMessage):
+            latest = _message_text(message)
+            for earlier in reversed(messages[:i]):
+                if isinstance(earlier, ToolMessage):
+                    continue
+                context.append(_message_text(earlier))
+                if isinstance(earlier, HumanMessage) or len(context) >= 2:
+                    break
+            break
+        if isinstance(message, AIMessage):
+            for call in getattr(message, "tool_calls", None) or []:
+                name = call.get("name")
+                if name == LOAD_TOOLS_NAME:
+                    pinned.update(n for n in (call.get("args") or {}).get("names") or [] if isinstance(n, str))
+                elif name:
+                    pinned.add(name)
+    return latest, " ".join(context), frozenset(pinned)
+
+
+def active_step_title(state: Dict[str, Any]) -> str:
+    if state.get("planStatus", "") != "in_progress":
+        return ""
+    steps = state.get("planSteps", []) or []
+    index = state.get("currentStepIndex", -1)
+    if not (isinstance(index, int) and 0 <= index < len(steps)):
+        index = next((i for i, s in enumerate(steps) if isinstance(s, dict) and s.get("status") == "in_progress"), -1)
+    step = steps[index] if 0 <= index < len(steps) else None
+    return str(step.get("title", "")) if isinstance(step, dict) else ""
+
+
+class ToolSelection(NamedTuple):
+    tools: List[Any]
+    names: FrozenSet[str]
+    # every tool of the full binding, which the model may legitimately call
+    known_names: FrozenSet[str]
+    partial: bool
+    full_tokens: int
+    bound_tokens: int
+    # schema tokens of the always-bound core that leads `tools` on every hop
+    prefix_tokens: int
+
+
+class ToolSelector:
+    """Ranks tools per hop and binds the top-K; counts tokens saved and recall misses."""
+
+    def __init__(self, top_k: int = TOOL_TOP_K, enabled: bool = TOOL_SELECTION_ENABLED, max_cached: int = 256):
+        self.top_k = top_k
+        self.enabled = enabled
+        self.max_cached = max_cached
+        self._tags: Dict[str, ToolTags] = {}
+        self._tokens: Dict[str, int] = {}
+        self._selections: "OrderedDict[Tuple[Any, ...], Tuple[Any, ToolSelection]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.selections = 0
+        self.partial_selections = 0
+        self.full_tokens = 0
+        self.bound_tokens = 0
+        self.prefix_tokens = 0
+        self.recall_misses = 0
+        self.load_requests = 0
+        self.expansions = 0
+
+    def _tags_for(self, name: str) -> ToolTags:
+        tags = self._tags.get(name)
+        if tags is None:
+            tags = self._tags[name] = tool_tags(name)
+        return tags
+
+    def _tokens_for(self, name: str, tool: Any) -> int:
+        # Sized once per tool name: a client sends fresh but identical action specs every
+        # run, and serializing them all again cost more than the rest of the selection
+        tokens = self._tokens.get(name)
+        if tokens is None:
+            tokens = self._tokens[name] = _schema_tokens(tool)
+        return tokens
+
+    def score(self, name: str, intent: Tuple[FrozenSet[str], FrozenSet[str]], context: Tuple[FrozenSet[str], FrozenSet[str]],
+              plan: Tuple[FrozenSet[str], FrozenSet[str]], view: Tuple[FrozenSet[str], FrozenSet[str]]) -> float:
+        tags = self._tags_for(name)
+        total = 0.0
+        for (entities, verbs), weight in ((intent, INTENT_WEIGHT), (context, CONTEXT_WEIGHT), (plan, PLAN_WEIGHT), (view, VIEW_WEIGHT)):
+            shared = len(tags.entities & entities)
+            if shared:
+                total += weight * (1.0 + (VERB_BONUS if tags.verb in verbs else 0.0) + ENTITY_BONUS * (shared - 1))
+        # "delete it" / "show me" with the subject only on the page: verb + view entity
+        if tags.verb in intent[1] and not intent[0] and tags.entities & view[0]:
+            total += INTENT_WEIGHT * VERB_BONUS
+        return total
+
+    def select(self, tools: List[Any], state: Dict[str, Any], messages: Sequence[BaseMessage], extra: Sequence[Any] = ()) -> ToolSelection:
+        """
+        The tools to bind this hop: the always-bound core (and `extra`, the `load_tools`
+        tool, with any partial selection), then pinned tools and the top-K by score. Both
+        parts keep the client's order, so the core is a fixed prefix and the same request
+        binds the same list.
+        """
+        latest, context, pinned = turn_signals(messages)
+        view = str(state.get("currentView", "") or "")
+        step = active_step_title(state)
+        key = (id(tools), latest, context, pinned, view, step)
+        with self._lock:
+            cached = self._selections.get(key)
+            if cached is not None and cached[0] is tools:
+                self._selections.move_to_end(key)
+                selection = cached[1]
+            else:
+                selection = self._select(tools, latest, context, pinned, view, step, extra)
+                self._selections[key] = (tools, selection)
+                while len(self._selections) > self.max_cached:
+                    self._selections.popitem(last=False)
+            self.selections += 1
+            self.partial_selections += selection.partial
+            self.full_tokens += selection.full_tokens
+            self.bound_tokens += selection.bound_tokens
+            self.prefix_tokens += selection.prefix_tokens
+            self.load_requests += sum(1 for m in messages[-1:] if isinstance(m, ToolMessage) and m.name == LOAD_TOOLS_NAME)
+        return selection
+
+    def _select(self, tools: List[Any], latest: str, context: str, pinned: FrozenSet[str], view: str, step: str, extra: Sequence[Any]) -> ToolSelection:
+        names = [_tool_name(t) for t in tools]
+        known = frozenset(names)
+        full_tokens = sum(self._tokens_for(n, t) for n, t in zip(names, tools))
+        core = [(t, n) for t, n in zip(tools, names) if n in ALWAYS_BOUND]
+        if not self.enabled or len(tools) <= self.top_k + len(ALWAYS_BOUND):
+            ordered = [*(t for t, n in core), *(t for t, n in zip(tools, names) if n not in ALWAYS_BOUND)]
+            return ToolSelection(ordered, known, known, False, full_tokens, full_tokens, self._prefix_tokens(core))
+
+        intent, context_signals = text_signals(latest), text_signals(context)
+        plan, view_signals = text_signals(step), text_signals(_view_text(view))
+        ranked = sorted(
+            (
+                (-self.score(name, intent, context_signals, plan, view_signals), position)
+                for position, name in enumerate(names)
+                if name not in ALWAYS_BOUND and name not in pinned
+            )
+        )
+        chosen = {position for neg_score, position in ranked[:self.top_k] if neg_score < 0}
+        core.extend((t, _tool_name(t)) for t in extra if _tool_name(t) not in known)
+        variable = [
+            (t, name)
+            for position, (t, name) in enumerate(zip(tools, names))
+            if name not in ALWAYS_BOUND and (name in pinned or position in chosen)
+        ]
+        selected = [*core, *variable]
+        return ToolSelection(
+            [t for t, n in selected],
+            frozenset(n for t, n in selected),
+            known | frozenset(n for t, n in core),
+            True,
+            full_tokens,
+            sum(self._tokens_for(n, t) for t, n in selected),
+            self._prefix_tokens(core),
+        )
+
+    def _prefix_tokens(self, core: Sequence[Tuple[Any, str]]) -> int:
+        return sum(self._tokens_for(n, t) for t, n in core)
+
+    def unbound_calls(self, response: Any, selection: ToolSelection) -> List[str]:
+        """Tools the model called that exist but were not bound (the provider let them through)."""
+        missed = [
+            tc.get("name")
+            for tc in getattr(response, "tool_calls", None) or []
+            if tc.get("name") not in selection.names and tc.get("name") in selection.known_names
+        ]
+        if missed:
+            with self._lock:
+                self.recall_misses += len(missed)
+        return missed
+
+    def expand(self, tools: List[Any], selection: ToolSelection, extra: Sequence[Any] = ()) -> ToolSelection:
+        """Bind the full set after the provider rejected a call to an unbound tool."""
+        with self._lock:
+            self.recall_misses += 1
+            self.expansions += 1
+            self.bound_tokens += selection.full_tokens - selection.bound_tokens
+        names = [_tool_name(t) for t in tools]
+        core = [(t, n) for t, n in zip(tools, names) if n in ALWAYS_BOUND]
+        core.extend((t, _tool_name(t)) for t in extra if _tool_name(t) not in selection.known_names)
+        full = [*(t for t, n in core), *(t for t, n in zip(tools, names) if n not in ALWAYS_BOUND)]
+        bound = frozenset(_tool_name(t) for t in full)
+        return ToolSelection(
+            full, bound, selection.known_names | bound, False, selection.full_tokens, selection.full_tokens, self._prefix_tokens(core)
+        )
+
+    def load_tools_tool(
+        self, catalog: Iterable[str], bound_names: Callable[[Dict[str, Any], Optional[RunnableConfig]], FrozenSet[str]]
+    ) -> StructuredTool:
+        """
+        The `load_tools` backend tool; its description lists `catalog`, fixed at startup.
+        `bound_names(state, config)` is the run's full binding: a catalog tool the client did
+        not send (or the caller may not use) is reported unavailable rather than loaded.
+        """
+        names = sorted(set(catalog) - ALWAYS_BOUND)
+        available = frozenset(names)
+
+        def load_tools(
+            names: List[str],
+            state: Annotated[Dict[str, Any], InjectedState] = None,
+            config: RunnableConfig = None,
+        ) -> Dict[str, Any]:
+            requested = [n for n in names if isinstance(n, str)]
+            bound = bound_names(state or {}, config)
+            return {
+                "loaded": [n for n in requested if n in available and n in bound],
+                "unavailable": [n for n in requested if n in available and n not in bound],
+                "unknown": [n for n in requested if n not in available],
+            }
+
+        return StructuredTool.from_function(
+            load_tools,
+            name=LOAD_TOOLS_NAME,
+            description=(
+                "Only the tools relevant to the current request are attached. If you need one that is "
+                "not, call this with its name(s); it is available from your next step. Tools: " + ", ".join(names)
+            ),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "top_k": self.top_k,
+                "selections": self.selections,
+                "partial_selections": self.partial_selections,
+                "schema_tokens_full": self.full_tokens,
+                "schema_tokens_bound": self.bound_tokens,
+                "schema_tokens_saved": self.full_tokens - self.bound_tokens,
+                "schema_tokens_stable_prefix": self.prefix_tokens,
+                "saved_ratio": round(1 - self.bound_tokens / self.full_tokens, 3) if self.full_tokens else 0.0,
+                "recall_misses": self.recall_misses,
+                "load_requests": self.load_requests,
+                "expansions": self.expansions,
+            }
+
+
+def is_unbound_tool_error(exc: BaseException) -> bool:
+    """Whether a provider error means the model called a tool that was not in the request."""
+    message = str(exc).lower()
+    return "not in request.tools" in message or "unknown tool" in message or "tool_use_failed" in message
+
+
+tool_selector = ToolSelector()
@@ -0,0 +1,623 @@
+"""
+Opt-in record and replay of graph runs, so performance work can be checked against real traffic.
+
+With `FLAME_TRACE=1`, every sampled graph run (one turn: `intent_router` -> `chat_node` ->
+`tool_node` -> ... -> END) becomes one JSON line in an append-only, gzip-compressed file in
+`FLAME_TRACE_DIR` (`trace-<time>-<pid>.jsonl.gz`, a new file past `FLAME_TRACE_MAX_BYTES`).
+A trace holds:
+
+- the run's input state. Messages already written for the thread earlier in the same file
+  are referenced by count, not repeated. CopilotKit action lists, and message contents
+  over `BLOB_MIN_CHARS`, are written once per file under their hash.
+- per node: wall time, spans (prompt build, LLM call, ...), the `Command` routing and the
+  plan state it set
+- per model call: the response, its latency, the tier/model, and the fingerprint and names
+  of the bound tools
+- the backend tool results, so a replay needs neither the Flame API nor the browser
+
+Strings are redacted unless `FLAME_TRACE_REDACT=0`: emails, phone and card numbers, API
+keys and bearer tokens. Thread ids are hashed. `FLAME_TRACE_SAMPLE_RATE` (0..1) picks which
+runs are recorded. Serialization, compression and writes run on a background thread; a
+run whose thread has no id (no checkpointer) is not recorded.
+
+`benchmarks/replay.py` re-executes traces against the current `graph`, substituting the
+recorded model responses and tool results, and reports per-node timing deltas and any
+routing or plan-state divergence. It records the replayed runs with `capture()`.
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage, message_to_dict, messages_from_dict
+
+from model_registry import tools_fingerprint
+
+TRACE_ENABLED = os.getenv("FLAME_TRACE", "0") not in ("0", "false", "False", "")
+TRACE_DIR = os.getenv("FLAME_TRACE_DIR", ".flame_traces")
+TRACE_SAMPLE_RATE = float(os.getenv("FLAME_TRACE_SAMPLE_RATE", "1.0"))
+TRACE_REDACT = os.getenv("FLAME_TRACE_REDACT", "1") not in ("0", "false", "False", "")
+TRACE_MAX_BYTES = int(os.getenv("FLAME_TRACE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+TRACE_VERSION = 1
+END = "__end__"
+PLAN_KEYS = ("planSteps", "currentStepIndex", "planStatus")
+# How a run that raised ended; `interrupt()` pauses it for the client (resumed runs start at chat_node)
+OUTCOMES = {"CancelledError": "cancelled", "GraphInterrupt": "interrupted", "NodeInterrupt": "interrupted"}
+# Runs in progress per process; a thread whose run never finished is forgotten past this
+MAX_OPEN_RUNS = 1024
+# Finished runs waiting for the writer; beyond this new ones are dropped, not queued
+MAX_PENDING = 1000
+# Redacted copies of long strings kept by the writer
+MEMO_MIN_CHARS = 512
+MEMO_SIZE = 512
+# Message contents at least this long are written once per file and referenced by hash
+BLOB_MIN_CHARS = 4096
+
+# (cheap test that the pattern can match, pattern, replacement): most strings skip the regexes.
+# The number patterns share one test (None): a run of six digits.
+_NUMBER_RUN = re.compile(r"\d{3}[ .()-]{0,2}\d{3}")
+_REDACTIONS: Tuple[Tuple[Any, "re.Pattern[str]", str], ...] = tuple(
+    (guard, re.compile(pattern), replacement)
+    for guard, pattern, replacement in (
+        (lambda text: "Bearer" in text, r"\bBearer\s+[\w.~+/=-]+", "Bearer <secret>"),
+        (lambda text: "k_" in text or "k-" in text, r"\b(?:flame_ak|gsk|sk|pk|rk)[_-][A-Za-z0-9_-]{8,}", "<secret>"),
+        (lambda text: "@" in text, r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+", "<email>"),
+        (None, r"\b(?:\d[ -]?){12,18}\d\b", "<card>"),
+        (None, r"(?<![\w-])\+?(?:\d{1,3}[ .-]?)?\(?\d{3}\)?[ .-]?\d{3}[ .-]?\d{3,4}(?![\w-])", "<phone>"),
+    )
+)
+
+
+def redact(text: str) -> str:
+    """`text` with secrets and personal contact details replaced by placeholders."""
+    numbers = None
+    for guard, pattern, replacement in _REDACTIONS:
+        if guard is None:
+            if numbers is None:
+                numbers = _NUMBER_RUN.search(text) is not None
+            if not numbers:
+                continue
+        elif not guard(text):
+            continue
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _redacted(value: Any, memo: "OrderedDict[str, str]") -> Any:
+    if isinstance(value, str):
+        if len(value) < MEMO_MIN_CHARS:
+            return redact(value)
+        # the same tool results and long messages come back in every run of a thread
+        cleaned = memo.get(value)
+        if cleaned is None:
+            cleaned = memo[value] = redact(value)
+            if len(memo) > MEMO_SIZE:
+                memo.popitem(last=False)
+        else:
+            memo.move_to_end(value)
+        return cleaned
+    if isinstance(value, dict):
+        return {k: _redacted(v, memo) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redacted(v, memo) for v in value]
+    return value
+
+
+def _thread_id(config: Optional[Dict[str, Any]]) -> Optional[str]:
+    thread = ((config or {}).get("configurable") or {}).get("thread_id")
+    return str(thread) if thread not in (None, "") else None
+
+
+def _jsonable(value: Any) -> Any:
+    return json.loads(json.dumps(value, default=str))
+
+
+class RunTrace:
+    """One graph run being recorded; encoded to JSON only once it has finished."""
+
+    __slots__ = ("id", "thread", "entry", "started", "wall", "state", "events", "pending_llm", "outcome", "seconds")
+
+    def __init__(self, thread: str, entry: str, state: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:16]
+        self.thread = thread
+        self.entry = entry
+        self.started = time.perf_counter()
+        self.wall = time.time()
+        # shallow copy: nodes may set keys on their state dict; messages are never mutated
+        self.state = dict(state)
+        self.events: List[Dict[str, Any]] = []
+        self.pending_llm: List[Tuple[Any, float, str, str, List[Any]]] = []
+        self.outcome = ""
+        self.seconds = 0.0
+
+
+class _NodeRecord:
+    """Context manager timing one node execution; `route()` records what it returned."""
+
+    __slots__ = ("recorder", "run", "thread", "node", "hop", "started", "result", "goto")
+
+    def __init__(self, recorder: "TraceRecorder", run: Optional[RunTrace], thread: str, node: str, hop: Any):
+        self.recorder = recorder
+        self.run = run
+        self.thread = thread
+        self.node = node
+        self.hop = hop
+        self.result: Any = None
+        self.goto: Any = None
+
+    def __enter__(self) -> "_NodeRecord":
+        self.started = time.perf_counter()
+        return self
+
+    def route(self, result: Any, goto: Any = None) -> None:
+        """A `Command`, or a plain update dict together with the edge it takes (`goto`)."""
+        self.result = result
+        self.goto = getattr(result, "goto", goto)
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.recorder._finish_node(self, time.perf_counter() - self.started, exc_type)
+        return False
+
+
+class _NullNodeRecord:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullNodeRecord":
+        return self
+
+    def route(self, result: Any, goto: Any = None) -> None:
+        pass
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+NULL_RECORD = _NullNodeRecord()
+
+
+class Capture:
+    """Runs recorded in memory by `TraceRecorder.capture()`, and tool results to substitute."""
+
+    def __init__(self):
+        self.runs: List[Dict[str, Any]] = []
+        self.tool_results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def substitute(self, thread_id: str, results: Dict[str, Dict[str, Any]]) -> None:
+        """Serve `results` ({tool_call_id: message dict}) instead of running those tool calls."""
+        self.tool_results[thread_id] = results
+
+
+class _FileState:
+    """What the current file already holds: action lists, and each thread's last messages."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.bytes = 0
+        self.tool_lists: set = set()
+        self.blobs: set = set()
+        self.threads: Dict[str, Tuple[str, List[Any]]] = {}
+
+
+class TraceRecorder:
+    """Records sampled graph runs to compressed trace files from a background writer thread."""
+
+    def __init__(self, enabled: bool = TRACE_ENABLED, directory: str = TRACE_DIR, sample_rate: float = TRACE_SAMPLE_RATE,
+                 redact: bool = TRACE_REDACT, max_bytes: int = TRACE_MAX_BYTES):
+        self.enabled = enabled
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.redact = redact
+        self.max_bytes = max_bytes
+        self._open: "OrderedDict[str, Optional[RunTrace]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[RunTrace]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._file: Optional[_FileState] = None
+        self._capture: Optional[Capture] = None
+        self._memo: "OrderedDict[str, str]" = OrderedDict()
+        self._digests: "OrderedDict[str, str]" = OrderedDict()
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.abandoned = 0
+        self.errors = 0
+        self.bytes_written = 0
+        self.files = 0
+        self.write_seconds = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.enabled or self._capture is not None
+
+    # -- recording (graph nodes) --
+
+    def node(self, name: str, state: Dict[str, Any], config: Optional[Dict[str, Any]], hop: Any = None, entry: bool = False):
+        """
+        Record one node execution. `entry` marks the graph's entry node, which starts a new
+        run; another node starts one only when its thread has none open (a resumed run).
+        """
+        if not self.active:
+            return NULL_RECORD
+        thread = _thread_id(config)
+        if thread is None:
+            return NULL_RECORD
+        with self._lock:
+            if entry or thread not in self._open:
+                if self._open.pop(thread, None) is not None:
+                    self.abandoned += 1
+                sampled = self._capture is not None or self.sample_rate >= 1.0 or random.random() < self.sample_rate
+                self._open[thread] = RunTrace(thread, name, state) if sampled else None
+                while len(self._open) > MAX_OPEN_RUNS:
+                    self._open.popitem(last=False)
+                    self.abandoned += 1
+            run = self._open[thread]
+        return _NodeRecord(self, run, thread, name, hop)
+
+    def model_call(self, config: Optional[Dict[str, Any]], response: Any, seconds: float, model: str, tier: str, tools: List[Any]) -> None:
+        """A model response of the current node (`tools` is the bound list, fingerprinted later)."""
+        if not self.active:
+            return
+        run = self._open.get(_thread_id(config) or "")
+        if run is not None:
+            run.pending_llm.append((response, seconds, model, tier, tools))
+
+    def replayed_tool_results(self, config: Optional[Dict[str, Any]]) -> Dict[str, ToolMessage]:
+        """Recorded results to serve instead of executing tool calls (only while replaying)."""
+        if self._capture is None:
+            return {}
+        results = self._capture.tool_results.get(_thread_id(config) or "")
+        if not results:
+            return {}
+        return {call_id: messages_from_dict([message])[0] for call_id, message in results.items()}
+
+    def _finish_node(self, record: _NodeRecord, seconds: float, exc_type: Any) -> None:
+        goto = record.goto
+        ended = exc_type is not None or goto == END
+        run = record.run
+        if run is not None:
+            event: Dict[str, Any] = {"node": record.node, "seconds": seconds, "goto": None if goto is None else str(goto)}
+            spans = getattr(record.hop, "spans", None)
+            if spans:
+                event["spans"] = dict(spans)
+            update = getattr(record.result, "update", record.result)
+            if isinstance(update, dict):
+                event["update"] = sorted(update)
+                plan = {key: update[key] for key in PLAN_KEYS if key in update}
+                if plan:
+                    event["plan"] = plan
+                results = [m for m in update.get("messages") or [] if isinstance(m, ToolMessage)]
+                if results:
+                    event["results"] = results
+            if run.pending_llm:
+                event["llm"], run.pending_llm = run.pending_llm, []
+            if exc_type is not None:
+                event["error"] = exc_type.__name__
+            run.events.append(event)
+        if not ended:
+            return
+        with self._lock:
+            if self._open.get(record.thread) is run:
+                del self._open[record.thread]
+        if run is None:
+            return
+        run.outcome = "end" if exc_type is None else OUTCOMES.get(exc_type.__name__, "error")
+        run.seconds = time.perf_counter() - run.started
+        self._finish_run(run)
+
+    def _finish_run(self, run: RunTrace) -> None:
+        capture = self._capture
+        if capture is not None:
+            capture.runs.append(self._encode_run(run, None))
+            return
+        with self._lock:
+            self.recorded += 1
+            if self._queue.qsize() >= MAX_PENDING:
+                self.dropped += 1
+                return
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="flame-trace-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.close)
+        self._queue.put(run)
+
+    @contextmanager
+    def capture(self) -> Iterator[Capture]:
+        """Record runs in memory, unsampled and regardless of `FLAME_TRACE`, for a replay."""
+        previous, self._capture = self._capture, Capture()
+        try:
+            yield self._capture
+        finally:
+            self._capture = previous
+
+    # -- encoding and writing (writer thread) --
+
+    def _clean(self, value: Any) -> Any:
+        return _redacted(value, self._memo) if self.redact else value
+
+    def _message(self, message: BaseMessage, definitions: List[Dict[str, Any]], file: Optional[_FileState]) -> Dict[str, Any]:
+        encoded = self._clean(message_to_dict(message))
+        content = encoded["data"].get("content")
+        if file is not None and isinstance(content, str) and len(content) >= BLOB_MIN_CHARS:
+            digest = self._digests.get(content)
+            if digest is None:
+                digest = self._digests[content] = hashlib.sha1(content.encode("utf-8")).hexdigest()
+                if len(self._digests) > MEMO_SIZE:
+                    self._digests.popitem(last=False)
+            if digest not in file.blobs:
+                definitions.append({"kind": "blob", "h": digest, "text": content})
+                file.blobs.add(digest)
+            encoded["data"]["content"] = {"$blob": digest}
+        return encoded
+
+    def _tool_list(self, tools: Any, definitions: List[Dict[str, Any]], file: Optional[_FileState]) -> Optional[str]:
+        if not tools:
+            return None
+        fingerprint = tools_fingerprint(tools)
+        if file is None or fingerprint not in file.tool_lists:
+            definitions.append({"kind": "tools", "fp": fingerprint, "tools": _jsonable(tools)})
+            if file is not None:
+                file.tool_lists.add(fingerprint)
+        return fingerprint
+
+    def _encode_input(self, run: RunTrace, definitions: List[Dict[str, Any]], file: Optional[_FileState]) -> Dict[str, Any]:
+        state = run.state
+        messages = list(state.get("messages") or [])
+        ids = [getattr(m, "id", None) for m in messages]
+        encoded: Dict[str, Any] = {}
+        previous = file.threads.get(run.thread) if file is not None else None
+        start = 0
+        if previous is not None and None not in previous[1] and ids[:len(previous[1])] == previous[1]:
+            start = len(previous[1])
+            encoded["history"] = {"trace": previous[0], "count": start}
+        if file is not None:
+            file.threads[run.thread] = (run.id, ids)
+        encoded["messages"] = [self._message(m, definitions, file) for m in messages[start:]]
+        copilotkit = state.get("copilotkit")
+        if isinstance(copilotkit, dict):
+            encoded["copilotkit"] = {
+                **self._clean(_jsonable({k: v for k, v in copilotkit.items() if k != "actions"})),
+                "actions": self._tool_list(copilotkit.get("actions"), definitions, file),
+            }
+        if state.get("tools"):
+            encoded["tools"] = self._tool_list(state.get("tools"), definitions, file)
+        for key, value in state.items():
+            if key not in ("messages", "copilotkit", "tools"):
+                encoded[key] = self._clean(_jsonable(value))
+        return encoded
+
+    def _encode_run(self, run: RunTrace, file: Optional[_FileState]) -> Any:
+        """The run's JSON line; with a file, also the action lists and blobs that file still lacks."""
+        definitions: List[Dict[str, Any]] = []
+        events = []
+        for event in run.events:
+            encoded = {
+                "node": event["node"],
+                "ms": round(event["seconds"] * 1000, 3),
+                "goto": event["goto"],
+            }
+            if "spans" in event:
+                encoded["spans"] = {k: round(v * 1000, 3) for k, v in event["spans"].items()}
+            for key in ("update", "error"):
+                if key in event:
+                    encoded[key] = event[key]
+            if "plan" in event:
+                encoded["plan"] = self._clean(_jsonable(event["plan"]))
+            if "llm" in event:
+                encoded["llm"] = [
+                    {
+                        "ms": round(seconds * 1000, 3),
+                        "model": model,
+                        "tier": tier,
+                        "tools": tools_fingerprint(tools),
+                        "tool_names": [_tool_name(t) for t in tools],
+                        "response": self._message(response, definitions, file),
+                    }
+                    for response, seconds, model, tier, tools in event["llm"]
+                ]
+            if "results" in event:
+                encoded["results"] = [self._message(m, definitions, file) for m in event["results"]]
+            events.append(encoded)
+        line = {
+            "kind": "run",
+            "v": TRACE_VERSION,
+            "id": run.id,
+            "thread": hashlib.sha1(run.thread.encode("utf-8")).hexdigest()[:16],
+            "at": round(run.wall, 3),
+            "entry": run.entry,
+            "outcome": run.outcome,
+            "ms": round(run.seconds * 1000, 3),
+            "events": events,
+        }
+        if file is None:
+            return line
+        line["input"] = self._encode_input(run, definitions, file)
+        return definitions, line
+
+    def _next_file(self) -> _FileState:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"trace-{stamp}-{os.getpid()}-{uuid.uuid4().hex[:6]}.jsonl.gz")
+        self.files += 1
+        return _FileState(path)
+
+    def _write_loop(self) -> None:
+        while True:
+            run = self._queue.get()
+            if run is None:
+                self._queue.task_done()
+                return
+            batch = [run]
+            while len(batch) < 64:
+                try:
+                    queued = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if queued is None:
+                    # put the stop marker back for after this batch
+                    self._queue.task_done()
+                    self._queue.put(None)
+                    break
+                batch.append(queued)
+            try:
+                self._write(batch)
+            except Exception:
+                with self._lock:
+                    self.errors += len(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: Sequence[RunTrace]) -> None:
+        started = time.perf_counter()
+        if self._file is None or self._file.bytes >= self.max_bytes:
+            self._file = self._next_file()
+        lines: List[str] = []
+        for run in batch:
+            try:
+                definitions, line = self._encode_run(run, self._file)
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                continue
+            lines.extend(json.dumps(d, separators=(",", ":")) for d in definitions)
+            lines.append(json.dumps(line, separators=(",", ":"), default=str))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        # one gzip member per batch: readers see a multi-member stream, and a crash loses at most the last batch
+        with open(self._file.path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=3) as compressed:
+                compressed.write(data)
+            size = raw.tell()
+        with self._lock:
+            self.bytes_written += size - self._file.bytes
+            self._file.bytes = size
+            self.written += len(batch)
+            self.write_seconds += time.perf_counter() - started
+
+    def flush(self) -> None:
+        """Wait until every finished run has been written."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "open_runs": len(self._open),
+                "recorded": self.recorded,
+                "written": self.written,
+                "pending": self._queue.qsize(),
+                "dropped": self.dropped,
+                "abandoned": self.abandoned,
+                "errors": self.errors,
+                "files": self.files,
+                "bytes_written": self.bytes_written,
+                "bytes_per_run": (self.bytes_written / self.written) if self.written else 0.0,
+                "write_ms": (self.write_seconds / self.written * 1000) if self.written else 0.0,
+            }
+
+
+def _tool_name(tool: Any) -> str:
+    if isinstance(tool, dict):
+        function = tool.get("function") if isinstance(tool.get("function"), dict) else {}
+        return function.get("name") or tool.get("name") or ""
+    return getattr(tool, "name", "") or ""
+
+
+trace_recorder = TraceRecorder()
+
+
+# -- reading --
+
+def read_traces(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Recorded runs in file order, each with `input.messages` expanded to the full history
+    and `input.copilotkit.actions` / `input.tools` resolved to the recorded lists.
+    """
+    tool_lists: Dict[str, Any] = {}
+    for path in paths:
+        histories: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+        blobs: Dict[str, str] = {}
+        with gzip.open(path, "rt", encoding="utf-8") as lines:
+            for raw in lines:
+                if not raw.strip():
+                    continue
+                line = json.loads(raw)
+                if line.get("kind") == "tools":
+                    tool_lists[line["fp"]] = line["tools"]
+                    continue
+                if line.get("kind") == "blob":
+                    blobs[line["h"]] = line["text"]
+                    continue
+                if line.get("kind") != "run" or line.get("v") != TRACE_VERSION:
+                    continue
+                state = line.get("input") or {}
+                messages = [_expand(m, blobs) for m in state.get("messages") or []]
+                for event in line.get("events", []):
+                    for call in event.get("llm", []):
+                        call["response"] = _expand(call["response"], blobs)
+                    event["results"] = [_expand(m, blobs) for m in event.get("results", [])]
+                history = state.pop("history", None)
+                if history:
+                    trace_id, earlier = histories.get(line["thread"], ("", []))
+                    if trace_id != history["trace"]:
+                        # the run it builds on was not written (dropped); nothing to replay from
+                        continue
+                    messages = earlier[:history["count"]] + messages
+                state["messages"] = messages
+                histories[line["thread"]] = (line["id"], messages)
+                if isinstance(state.get("copilotkit"), dict):
+                    state["copilotkit"]["actions"] = tool_lists.get(state["copilotkit"].get("actions"), [])
+                if state.get("tools"):
+                    state["tools"] = tool_lists.get(state["tools"], [])
+                yield line
+
+
+def _expand(message: Dict[str, Any], blobs: Dict[str, str]) -> Dict[str, Any]:
+    content = message["data"].get("content")
+    if isinstance(content, dict) and "$blob" in content:
+        message["data"]["content"] = blobs.get(content["$blob"], "")
+    return message
+
+
+def trace_input(run: Dict[str, Any]) -> Dict[str, Any]:
+    """The recorded input state of a run, ready to pass to the graph."""
+    state = dict(run.get("input") or {})
+    state["messages"] = messages_from_dict(state.get("messages") or [])
+    return state
+
+
+def trace_responses(run: Dict[str, Any]) -> List[AIMessage]:
+    """The model responses of a run, in call order."""
+    return [
+        messages_from_dict([call["response"]])[0]
+        for event in run.get("events", [])
+        for call in event.get("llm", [])
+    ]
+
+
+def trace_tool_results(run: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """{tool_call_id: recorded ToolMessage dict} of a run's backend tool calls."""
+    return {
+        result["data"].get("tool_call_id"): result
+        for event in run.get("events", [])
+        for result in event.get("results", [])
+    }
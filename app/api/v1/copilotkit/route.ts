@@ -4,28 +4,60 @@ import {
     copilotRuntimeNextJSAppRouterEndpoint,
 } from "@copilotkit/runtime";
 
-import { LangGraphAgent } from "@copilotkit/runtime/langgraph";
+import { LangGraphAgent, LangGraphHttpAgent } from "@copilotkit/runtime/langgraph";
 import { NextRequest } from "next/server";
 
+import { getApiOrSessionUser } from "@/lib/api-auth-keys";
+import { getOrCreateAssistantMcpApiKey } from "@/lib/assistant-api-key";
+
 // 1. You can use any service adapter here for multi-agent support. We use
 //    the empty adapter since we're only using one agent.
 const serviceAdapter = new ExperimentalEmptyAdapter();
 
-// 2. Create the CopilotRuntime instance and utilize the LangGraph plugin.
-const runtime = new CopilotRuntime({
-    agents: {
-        "flame_assistant": new LangGraphAgent({
+// 2. The agent calls the Flame API as the signed-in user: their own assistant API key
+//    goes with every run (agent/server.py reads it from X-Flame-Api-Key), so its server-side
+//    tools see exactly the organizations and projects that user may see. A request without a
+//    user gets no key, and the agent then binds no Flame API tools.
+async function userApiKeyHeaders(req: NextRequest): Promise<Record<string, string>> {
+    const user = await getApiOrSessionUser(req);
+    if (!user?.id) {
+        return {};
+    }
+    try {
+        const key = await getOrCreateAssistantMcpApiKey({
+            userId: user.id,
+            organizationId: user.organizationId ?? null,
+        });
+        return { "X-Flame-Api-Key": key };
+    } catch (error) {
+        console.error("copilotkit: no assistant API key for user", user.id, error);
+        return {};
+    }
+}
+
+// 3. Create the CopilotRuntime instance and utilize the LangGraph plugin.
+//    FLAME_AGENT_URL points at the multi-worker agent server (agent/server.py, AG-UI over
+//    HTTP), built per request to carry the user's key; otherwise talk to a LangGraph API
+//    deployment (`langgraph dev`), which gets no user key and so runs without the Flame API tools.
+async function runtimeFor(req: NextRequest): Promise<CopilotRuntime> {
+    const agent = process.env.FLAME_AGENT_URL
+        ? new LangGraphHttpAgent({ url: process.env.FLAME_AGENT_URL, headers: await userApiKeyHeaders(req) })
+        : new LangGraphAgent({
             deploymentUrl: process.env.LANGGRAPH_DEPLOYMENT_URL || "http://localhost:8123",
             graphId: "flame_assistant",
             langsmithApiKey: process.env.LANGSMITH_API_KEY || "",
-        }) as any,
-    }
-});
+        });
+    return new CopilotRuntime({
+        agents: {
+            "flame_assistant": agent as any,
+        }
+    });
+}
 
-// 3. Build a Next.js API route that handles the CopilotKit runtime requests.
+// 4. Build a Next.js API route that handles the CopilotKit runtime requests.
 const handler = async (req: NextRequest) => {
     const { handleRequest } = copilotRuntimeNextJSAppRouterEndpoint({
-        runtime,
+        runtime: await runtimeFor(req),
         serviceAdapter,
         endpoint: "/api/v1/copilotkit",
     });
@@ -0,0 +1,139 @@
+import { db } from '@/lib/database'
+import { generateApiKey } from '@/lib/api-keys'
+
+// The assistant's per-user Flame API key: created on first use, stored encrypted
+// (ASSISTANT_MCP_KEY_ENCRYPTION_SECRET) and reused. Both the MCP UI route and the
+// CopilotKit route act as the signed-in user with it, never with a shared key.
+
+function bytesToBase64(bytes: Uint8Array): string {
+  if (typeof Buffer !== 'undefined') {
+    return Buffer.from(bytes).toString('base64')
+  }
+  let binary = ''
+  for (let i = 0; i < bytes.length; i++) binary += String.fromCharCode(bytes[i])
+  return btoa(binary)
+}
+
+function base64ToBytes(base64: string): Uint8Array {
+  if (typeof Buffer !== 'undefined') {
+    return new Uint8Array(Buffer.from(base64, 'base64'))
+  }
+  const binary = atob(base64)
+  const bytes = new Uint8Array(binary.length)
+  for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i)
+  return bytes
+}
+
+function getCrypto(): Crypto {
+  const c = (globalThis as any).crypto as Crypto | undefined
+  if (!c?.subtle) throw new Error('WebCrypto is not available in this runtime')
+  return c
+}
+
+function toArrayBuffer(bytes: Uint8Array): ArrayBuffer {
+  return new Uint8Array(bytes).buffer
+}
+
+async function sha256Bytes(input: Uint8Array): Promise<Uint8Array> {
+  const digest = await getCrypto().subtle.digest('SHA-256', toArrayBuffer(input))
+  return new Uint8Array(digest)
+}
+
+async function deriveAesGcmKey(secret: string): Promise<CryptoKey> {
+  const secretBytes = new TextEncoder().encode(secret)
+  const keyBytes = await sha256Bytes(secretBytes)
+  return getCrypto().subtle.importKey('raw', toArrayBuffer(keyBytes), { name: 'AES-GCM' }, false, [
+    'encrypt',
+    'decrypt',
+  ])
+}
+
+async function encryptWithAesGcm(plaintext: string, secret: string): Promise<string> {
+  const key = await deriveAesGcmKey(secret)
+  const iv = getCrypto().getRandomValues(new Uint8Array(12))
+  const data = new TextEncoder().encode(plaintext)
+  const encrypted = await getCrypto().subtle.encrypt(
+    { name: 'AES-GCM', iv: toArrayBuffer(iv) },
+    key,
+    toArrayBuffer(data),
+  )
+
+  const payload = {
+    v: 1,
+    iv: bytesToBase64(iv),
+    data: bytesToBase64(new Uint8Array(encrypted)),
+  }
+
+  const payloadJson = JSON.stringify(payload)
+  return bytesToBase64(new TextEncoder().encode(payloadJson))
+}
+
+async function decryptWithAesGcm(encrypted: string, secret: string): Promise<string> {
+  const key = await deriveAesGcmKey(secret)
+  const payloadJson = new TextDecoder().decode(base64ToBytes(encrypted))
+  const payload = JSON.parse(payloadJson) as { iv: string; data: string }
+  const iv = base64ToBytes(payload.iv)
+  const data = base64ToBytes(payload.data)
+
+  const decrypted = await getCrypto().subtle.decrypt(
+    { name: 'AES-GCM', iv: toArrayBuffer(iv) },
+    key,
+    toArrayBuffer(data),
+  )
+  return new TextDecoder().decode(new Uint8Array(decrypted))
+}
+
+export async function getOrCreateAssistantMcpApiKey(opts: {
+  userId: number
+  organizationId: number | null
+}): Promise<string> {
+  const encryptionSecret = process.env.ASSISTANT_MCP_KEY_ENCRYPTION_SECRET
+  if (!encryptionSecret) {
+    throw new Error('ASSISTANT_MCP_KEY_ENCRYPTION_SECRET environment variable is not set')
+  }
+
+  const existing = await db.query(
+    `
+    SELECT encrypted_key
+      FROM assistant_mcp_keys
+     WHERE user_id = $1
+       AND revoked_at IS NULL
+     LIMIT 1
+    `,
+    [opts.userId],
+  )
+
+  const encryptedExisting = existing.rows[0]?.encrypted_key
+  if (typeof encryptedExisting === 'string' && encryptedExisting.trim()) {
+    return await decryptWithAesGcm(encryptedExisting, encryptionSecret)
+  }
+
+  const { fullKey, prefix, hash } = generateApiKey('read_write')
+
+  const created = await db.query(
+    `
+    INSERT INTO api_keys (user_id, organization_id, name, key_prefix, key_hash, scope, expires_at)
+    VALUES ($1, $2, $3, $4, $5, $6, NULL)
+    RETURNING id
+    `,
+    [opts.userId, opts.organizationId, 'Assistant MCP', prefix, hash, 'read_write'],
+  )
+
+  const apiKeyId = created.rows[0]?.id
+  const encrypted = await encryptWithAesGcm(fullKey, encryptionSecret)
+
+  await db.query(
+    `
+    INSERT INTO assistant_mcp_keys (user_id, api_key_id, encrypted_key, created_at, updated_at, revoked_at)
+    VALUES ($1, $2, $3, NOW(), NOW(), NULL)
+    ON CONFLICT (user_id)
+    DO UPDATE SET api_key_id = EXCLUDED.api_key_id,
+                  encrypted_key = EXCLUDED.encrypted_key,
+                  updated_at = NOW(),
+                  revoked_at = NULL
+    `,
+    [opts.userId, apiKeyId ?? null, encrypted],
+  )
+
+  return fullKey
+}